@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+商品目录同步引擎
+从 CSV/JSONL 商品数据源流式读取，按 SKU + 内容哈希与 Milvus 集合做差异比对，
+仅对新增/变更的商品批量生成 embedding 并 upsert，对下架商品执行删除。
+
+Usage:
+    python catalog_sync.py data/product_feed.jsonl
+    python catalog_sync.py feed.csv --batch-size 128 --checkpoint .sync_checkpoint.json
+"""
+
+import os
+import csv
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Iterator
+
+# 数据源中不会写入 product_info 正文的保留字段
+RESERVED_FIELDS = ("sku", "name")
+
+
+def sku_to_id(sku: str) -> int:
+    """将 SKU 映射为稳定的 int64 主键（取 blake2b 摘要的低 63 位）"""
+    digest = hashlib.blake2b(sku.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") & 0x7FFFFFFFFFFFFFFF
+
+
+def format_product_info(row: Dict[str, Any]) -> str:
+    """将一条数据源记录格式化为与示例数据一致的 product_info 文本"""
+    lines = [str(row["name"]).strip()]
+    for key, value in row.items():
+        if key in RESERVED_FIELDS or value is None or value == "":
+            continue
+        if isinstance(value, (list, tuple)):
+            value = "、".join(str(v) for v in value)
+        lines.append(f"{key}：{str(value).strip()}")
+    return "\n".join(lines)
+
+
+def content_hash(text: str) -> str:
+    """计算 product_info 的内容哈希"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def iter_feed(feed_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    流式读取商品数据源，逐条产出 {sku, product_info, content_hash}
+
+    Args:
+        feed_path: .csv 或 .jsonl 文件路径
+    """
+    path = Path(feed_path)
+    suffix = path.suffix.lower()
+
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if suffix == ".csv":
+            rows = csv.DictReader(f)
+        elif suffix in (".jsonl", ".ndjson"):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            raise ValueError(f"不支持的数据源格式: {suffix}，请使用 .csv 或 .jsonl")
+
+        for line_no, row in enumerate(rows, 1):
+            sku = str(row.get("sku") or "").strip()
+            if not sku or not row.get("name"):
+                raise ValueError(f"{path.name} 第 {line_no} 条记录缺少 sku 或 name 字段")
+
+            product_info = format_product_info(row)
+            yield {
+                "sku": sku,
+                "product_info": product_info,
+                "content_hash": content_hash(product_info)
+            }
+
+
+def feed_fingerprint(feed_path: str) -> str:
+    """数据源指纹（路径 + 大小 + 修改时间），用于判断检查点是否仍然有效"""
+    stat = os.stat(feed_path)
+    return f"{os.path.abspath(feed_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class CatalogSync:
+    """商品目录增量同步器"""
+
+    def __init__(self, product_rag, batch_size: int = 64, checkpoint_path: Optional[str] = None,
+                 delete_missing: bool = True, dry_run: bool = False):
+        """
+        Args:
+            product_rag: ProductRAG 实例（复用其 embedding 模型和 Milvus 集合）
+            batch_size: 每批生成 embedding 并写入的商品数
+            checkpoint_path: 检查点文件路径，默认为 .<集合名>.sync_checkpoint.json
+            delete_missing: 是否删除数据源中已不存在的 SKU
+            dry_run: 只比对差异，不写入集合
+        """
+        self.embedding_model = product_rag.embedding_model
+        self.milvus_client = product_rag.milvus_client
+        self.collection_name = product_rag.collection_name
+        self.batch_size = batch_size
+        self.checkpoint_path = Path(checkpoint_path or f".{self.collection_name}.sync_checkpoint.json")
+        self.delete_missing = delete_missing
+        self.dry_run = dry_run
+
+    def run(self, feed_path: str) -> Dict[str, Any]:
+        """
+        执行一次同步
+
+        Returns:
+            同步统计信息
+        """
+        fingerprint = feed_fingerprint(feed_path)
+        checkpoint = self._load_checkpoint(fingerprint)
+        resume_from = checkpoint["rows_done"] if checkpoint else 0
+        stats = checkpoint["stats"] if checkpoint else self._new_stats()
+
+        if resume_from:
+            print(f"⏩ 从检查点恢复，跳过前 {resume_from} 条已同步记录")
+
+        print(f"📥 读取集合现有索引: {self.collection_name}")
+        existing = self._load_existing_index()
+        print(f"📊 集合中已有 {len(existing)} 个带 SKU 的商品")
+
+        start_time = time.time()
+        base_elapsed = stats["elapsed_seconds"]
+        seen_skus = set()
+        pending: List[Dict[str, Any]] = []
+        rows_done = 0
+
+        for record in iter_feed(feed_path):
+            rows_done += 1
+            sku = record["sku"]
+            if sku in seen_skus:
+                print(f"⚠️ 重复 SKU 已忽略: {sku}")
+                continue
+            seen_skus.add(sku)
+
+            # 检查点之前的记录已经写入，只需登记 SKU 以便后续计算删除集
+            if rows_done <= resume_from:
+                continue
+
+            stats["scanned"] += 1
+            old_hash = existing.get(sku)
+            if old_hash == record["content_hash"]:
+                stats["unchanged"] += 1
+                continue
+
+            record["is_new"] = old_hash is None
+            pending.append(record)
+            if len(pending) >= self.batch_size:
+                self._flush(pending, stats)
+                pending = []
+                stats["elapsed_seconds"] = base_elapsed + (time.time() - start_time)
+                self._save_checkpoint(fingerprint, rows_done, stats)
+
+        if pending:
+            self._flush(pending, stats)
+            stats["elapsed_seconds"] = base_elapsed + (time.time() - start_time)
+            self._save_checkpoint(fingerprint, rows_done, stats)
+
+        # 数据源中已不存在的 SKU 视为下架
+        if self.delete_missing:
+            stale_skus = [sku for sku in existing if sku not in seen_skus]
+            self._delete(stale_skus, stats)
+
+        stats["elapsed_seconds"] = base_elapsed + (time.time() - start_time)
+        self._clear_checkpoint()
+        self.print_summary(stats)
+        return stats
+
+    def _new_stats(self) -> Dict[str, Any]:
+        """初始化统计信息"""
+        return {
+            "scanned": 0,
+            "unchanged": 0,
+            "inserted": 0,
+            "updated": 0,
+            "deleted": 0,
+            "batches": 0,
+            "embed_seconds": 0.0,
+            "write_seconds": 0.0,
+            "elapsed_seconds": 0.0
+        }
+
+    def _load_existing_index(self) -> Dict[str, str]:
+        """流式读取集合中已有的 {sku: content_hash}，未带 SKU 的示例数据不参与同步"""
+        index = {}
+        iterator = self.milvus_client.query_iterator(
+            collection_name=self.collection_name,
+            batch_size=1000,
+            filter="id >= 0",
+            output_fields=["sku", "content_hash"]
+        )
+        try:
+            while True:
+                batch = iterator.next()
+                if not batch:
+                    break
+                for row in batch:
+                    if row.get("sku"):
+                        index[row["sku"]] = row.get("content_hash")
+        finally:
+            iterator.close()
+        return index
+
+    def _flush(self, records: List[Dict[str, Any]], stats: Dict[str, Any]):
+        """批量生成 embedding 并 upsert"""
+        stats["batches"] += 1
+        for record in records:
+            stats["inserted" if record["is_new"] else "updated"] += 1
+
+        if self.dry_run:
+            return
+
+        embed_start = time.time()
+        embeddings = self.embedding_model.encode_documents([r["product_info"] for r in records])
+        stats["embed_seconds"] += time.time() - embed_start
+
+        data = [
+            {
+                "id": sku_to_id(record["sku"]),
+                "vector": embedding,
+                "product_info": record["product_info"],
+                "sku": record["sku"],
+                "content_hash": record["content_hash"]
+            }
+            for record, embedding in zip(records, embeddings)
+        ]
+
+        write_start = time.time()
+        self.milvus_client.upsert(collection_name=self.collection_name, data=data)
+        stats["write_seconds"] += time.time() - write_start
+        print(f"✅ 第 {stats['batches']} 批已写入 {len(data)} 个商品")
+
+    def _delete(self, skus: List[str], stats: Dict[str, Any]):
+        """删除已下架的 SKU"""
+        if not skus:
+            return
+
+        stats["deleted"] += len(skus)
+        if self.dry_run:
+            return
+
+        write_start = time.time()
+        for i in range(0, len(skus), self.batch_size):
+            chunk = skus[i:i + self.batch_size]
+            self.milvus_client.delete(
+                collection_name=self.collection_name,
+                ids=[sku_to_id(sku) for sku in chunk]
+            )
+        stats["write_seconds"] += time.time() - write_start
+        print(f"🗑️ 已删除 {len(skus)} 个下架商品")
+
+    def _load_checkpoint(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """读取检查点，数据源已变化时丢弃"""
+        if not self.checkpoint_path.exists():
+            return None
+
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ 检查点读取失败，将重新同步: {e}")
+            return None
+
+        if checkpoint.get("fingerprint") != fingerprint or checkpoint.get("collection") != self.collection_name:
+            print("⚠️ 数据源已变化，忽略旧检查点")
+            return None
+        return checkpoint
+
+    def _save_checkpoint(self, fingerprint: str, rows_done: int, stats: Dict[str, Any]):
+        """原子写入检查点（先写临时文件再替换）"""
+        if self.dry_run:
+            return
+
+        checkpoint = {
+            "fingerprint": fingerprint,
+            "collection": self.collection_name,
+            "rows_done": rows_done,
+            "stats": stats
+        }
+        tmp_path = self.checkpoint_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _clear_checkpoint(self):
+        """同步完成后删除检查点"""
+        if self.checkpoint_path.exists():
+            self.checkpoint_path.unlink()
+
+    @staticmethod
+    def print_summary(stats: Dict[str, Any]):
+        """打印吞吐量汇总"""
+        elapsed = stats["elapsed_seconds"] or 1e-9
+        changed = stats["inserted"] + stats["updated"]
+
+        print(f"\n{'='*50}")
+        print("📊 同步完成")
+        print(f"{'='*50}")
+        print(f"扫描记录: {stats['scanned']}  未变化: {stats['unchanged']}")
+        print(f"新增: {stats['inserted']}  更新: {stats['updated']}  删除: {stats['deleted']}")
+        print(f"批次数: {stats['batches']}")
+        print(f"Embedding 耗时: {stats['embed_seconds']:.2f}s  写入耗时: {stats['write_seconds']:.2f}s")
+        print(f"总耗时: {elapsed:.2f}s")
+        print(f"扫描吞吐: {stats['scanned'] / elapsed:.1f} 条/秒  写入吞吐: {changed / elapsed:.1f} 条/秒")
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="从 CSV/JSONL 商品数据源增量同步 ProductRAG 知识库")
+    parser.add_argument("feed", help="商品数据源文件（.csv 或 .jsonl）")
+    parser.add_argument("--db", default="./product_knowledge.db", help="Milvus 数据库路径")
+    parser.add_argument("--collection", default="product_collection", help="集合名称")
+    parser.add_argument("--batch-size", type=int, default=64, help="每批 embedding 的商品数")
+    parser.add_argument("--checkpoint", default=None, help="检查点文件路径")
+    parser.add_argument("--no-delete", action="store_true", help="不删除数据源中缺失的 SKU")
+    parser.add_argument("--dry-run", action="store_true", help="只比对差异，不写入")
+    args = parser.parse_args()
+
+    from rednoteV2 import ProductRAG
+
+    try:
+        product_rag = ProductRAG(
+            os.getenv("DEEPSEEK_API_KEY", ""),
+            uri=args.db,
+            collection_name=args.collection,
+            seed_sample_data=False
+        )
+        product_rag.sync_catalog(
+            args.feed,
+            batch_size=args.batch_size,
+            checkpoint_path=args.checkpoint,
+            delete_missing=not args.no_delete,
+            dry_run=args.dry_run
+        )
+    except KeyboardInterrupt:
+        print("\n⏸️ 同步已中断，重新运行相同命令即可从检查点继续")
+        return 130
+    except Exception as e:
+        print(f"❌ 同步失败: {e}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,424 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+可插拔的 Embedding 后端
+统一 encode_queries / encode_documents 接口（与 milvus_model 的 EmbeddingFunction 一致），
+支持加载中文优化的本地模型，基于 ONNX Runtime 多线程 CPU 推理，
+并通过 MicroBatcher 把并发调用方的请求动态合并成小批次。
+
+Usage:
+    python embedding_backends.py --backends default bge-small-zh
+    python embedding_backends.py --backends default bge-small-zh multilingual-e5-small --with-recall --recall-target 0.8
+"""
+
+import os
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Any
+
+import numpy as np
+
+# 可选后端注册表：名称 → 加载参数
+BACKEND_REGISTRY: Dict[str, Dict[str, Any]] = {
+    "default": {
+        "type": "milvus_default",
+        "description": "milvus_model 默认模型（paraphrase-albert-small-v2，英文为主）"
+    },
+    "bge-small-zh": {
+        "type": "onnx",
+        "repo_id": "Xenova/bge-small-zh-v1.5",
+        "pooling": "cls",
+        "query_instruction": "为这个句子生成表示以用于检索相关文章：",
+        "description": "BAAI bge-small-zh-v1.5，中文检索优化，512 维"
+    },
+    "bge-base-zh": {
+        "type": "onnx",
+        "repo_id": "Xenova/bge-base-zh-v1.5",
+        "pooling": "cls",
+        "query_instruction": "为这个句子生成表示以用于检索相关文章：",
+        "description": "BAAI bge-base-zh-v1.5，中文检索优化，768 维"
+    },
+    "multilingual-e5-small": {
+        "type": "onnx",
+        "repo_id": "Xenova/multilingual-e5-small",
+        "pooling": "mean",
+        "query_instruction": "query: ",
+        "document_instruction": "passage: ",
+        "description": "intfloat multilingual-e5-small，中英混合查询，384 维"
+    },
+    "text2vec-zh": {
+        "type": "sentence_transformer",
+        "model_name": "shibing624/text2vec-base-chinese",
+        "description": "text2vec-base-chinese（需要额外安装 sentence-transformers）"
+    }
+}
+
+
+class EmbeddingBackend:
+    """Embedding 后端基类"""
+
+    name = "base"
+
+    def encode_queries(self, texts: List[str]) -> List[np.ndarray]:
+        raise NotImplementedError
+
+    def encode_documents(self, texts: List[str]) -> List[np.ndarray]:
+        raise NotImplementedError
+
+    @property
+    def dim(self) -> int:
+        return len(self.encode_queries(["test"])[0])
+
+
+class MilvusModelBackend(EmbeddingBackend):
+    """包装 milvus_model 自带的 EmbeddingFunction"""
+
+    def __init__(self, name: str, embedding_function):
+        self.name = name
+        self.embedding_function = embedding_function
+
+    def encode_queries(self, texts: List[str]) -> List[np.ndarray]:
+        return self.embedding_function.encode_queries(texts)
+
+    def encode_documents(self, texts: List[str]) -> List[np.ndarray]:
+        return self.embedding_function.encode_documents(texts)
+
+    @property
+    def dim(self) -> int:
+        return self.embedding_function.dim
+
+
+def load_onnx_model(repo_id: str, onnx_file: str = "onnx/model.onnx", num_threads: Optional[int] = None):
+    """
+    加载 ONNX 模型和对应的 tokenizer（embedding 后端与 cross-encoder 重排共用）
+
+    Args:
+        repo_id: HuggingFace 模型仓库（或本地目录），需包含 ONNX 模型和 tokenizer
+        onnx_file: 仓库内 ONNX 模型文件路径
+        num_threads: ONNX Runtime 算子内线程数，默认为 CPU 核数
+
+    Returns:
+        (tokenizer, session, 模型输入名集合)
+    """
+    import onnxruntime as ort
+    from transformers import AutoTokenizer
+
+    if os.path.isdir(repo_id):
+        model_path = os.path.join(repo_id, onnx_file)
+    else:
+        from huggingface_hub import hf_hub_download
+        model_path = hf_hub_download(repo_id=repo_id, filename=onnx_file)
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = num_threads or os.cpu_count() or 1
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+    tokenizer = AutoTokenizer.from_pretrained(repo_id)
+    session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+    return tokenizer, session, {i.name for i in session.get_inputs()}
+
+
+class OnnxBackend(EmbeddingBackend):
+    """ONNX Runtime CPU 推理后端"""
+
+    def __init__(self, name: str, repo_id: str, onnx_file: str = "onnx/model.onnx", pooling: str = "cls",
+                 query_instruction: str = "", document_instruction: str = "",
+                 num_threads: Optional[int] = None, max_length: int = 512):
+        """
+        Args:
+            name: 后端名称
+            repo_id: HuggingFace 模型仓库（或本地目录），需包含 ONNX 模型和 tokenizer
+            onnx_file: 仓库内 ONNX 模型文件路径
+            pooling: 句向量池化方式，cls 或 mean
+            query_instruction: 查询前缀（bge/e5 系列检索模型需要）
+            document_instruction: 文档前缀
+            num_threads: ONNX Runtime 算子内线程数，默认为 CPU 核数
+            max_length: 最大序列长度
+        """
+        self.name = name
+        self.pooling = pooling
+        self.query_instruction = query_instruction
+        self.document_instruction = document_instruction
+        self.max_length = max_length
+        self.tokenizer, self.session, self.input_names = load_onnx_model(repo_id, onnx_file, num_threads)
+
+    def _encode(self, texts: List[str]) -> List[np.ndarray]:
+        encoded = self.tokenizer(texts, padding=True, truncation=True,
+                                 max_length=self.max_length, return_tensors="np")
+        feed = {k: v for k, v in encoded.items() if k in self.input_names}
+        if "token_type_ids" in self.input_names and "token_type_ids" not in feed:
+            feed["token_type_ids"] = np.zeros_like(encoded["input_ids"])
+
+        hidden = self.session.run(None, feed)[0]
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+        pooled = pooled / np.linalg.norm(pooled, axis=1, keepdims=True)
+        return list(pooled.astype(np.float32))
+
+    def encode_queries(self, texts: List[str]) -> List[np.ndarray]:
+        return self._encode([self.query_instruction + t for t in texts])
+
+    def encode_documents(self, texts: List[str]) -> List[np.ndarray]:
+        return self._encode([self.document_instruction + t for t in texts])
+
+
+class MicroBatcher(EmbeddingBackend):
+    """
+    动态微批处理：并发调用方各自提交少量文本，后台线程在 max_wait_ms 内
+    把请求合并到不超过 max_batch_size 条后一次推理，再按原顺序分发结果。
+    """
+
+    def __init__(self, backend: EmbeddingBackend, max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0, workers: int = 1):
+        self.backend = backend
+        self.name = f"{backend.name}+batched"
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.stats = {"batches": 0, "items": 0}
+        self._stats_lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._threads = [
+            threading.Thread(target=self._worker, daemon=True, name=f"embed-batcher-{i}")
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def encode_queries(self, texts: List[str]) -> List[np.ndarray]:
+        return self._submit("query", texts)
+
+    def encode_documents(self, texts: List[str]) -> List[np.ndarray]:
+        return self._submit("document", texts)
+
+    @property
+    def dim(self) -> int:
+        return self.backend.dim
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.stats["items"] / max(self.stats["batches"], 1)
+
+    def close(self):
+        """停止后台线程"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _submit(self, kind: str, texts: List[str]) -> List[np.ndarray]:
+        future: Future = Future()
+        self._queue.put((kind, list(texts), future))
+        return future.result()
+
+    def _collect(self, first) -> List[tuple]:
+        """从第一个请求开始，在等待窗口内继续收集请求直到批次填满"""
+        batch = [first]
+        size = len(first[1])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # 把停止信号放回去，处理完当前批次再退出
+                self._queue.put(None)
+                break
+            batch.append(item)
+            size += len(item[1])
+        return batch
+
+    def _worker(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            batch = self._collect(first)
+            for kind in ("query", "document"):
+                requests = [item for item in batch if item[0] == kind]
+                if requests:
+                    self._run(kind, requests)
+
+    def _run(self, kind: str, requests: List[tuple]):
+        texts = [text for _, request_texts, _ in requests for text in request_texts]
+        encode = self.backend.encode_queries if kind == "query" else self.backend.encode_documents
+
+        try:
+            vectors = encode(texts)
+        except Exception as e:
+            for _, _, future in requests:
+                future.set_exception(e)
+            return
+
+        with self._stats_lock:
+            self.stats["batches"] += 1
+            self.stats["items"] += len(texts)
+
+        offset = 0
+        for _, request_texts, future in requests:
+            future.set_result(list(vectors[offset:offset + len(request_texts)]))
+            offset += len(request_texts)
+
+
+def load_backend(name: str, batched: bool = False, **kwargs) -> EmbeddingBackend:
+    """
+    按名称加载 Embedding 后端
+
+    Args:
+        name: BACKEND_REGISTRY 中的名称
+        batched: 是否包装为 MicroBatcher
+        **kwargs: 覆盖注册表中的加载参数；batched 时 max_batch_size/max_wait_ms/workers 传给 MicroBatcher
+    """
+    if name not in BACKEND_REGISTRY:
+        raise ValueError(f"未知的 Embedding 后端: {name}，可选: {', '.join(BACKEND_REGISTRY)}")
+
+    batch_options = {k: kwargs.pop(k) for k in ("max_batch_size", "max_wait_ms", "workers") if k in kwargs}
+    spec = {k: v for k, v in BACKEND_REGISTRY[name].items() if k not in ("type", "description")}
+    spec.update(kwargs)
+    backend_type = BACKEND_REGISTRY[name]["type"]
+
+    if backend_type == "milvus_default":
+        from pymilvus import model as milvus_model
+        backend = MilvusModelBackend(name, milvus_model.DefaultEmbeddingFunction())
+    elif backend_type == "onnx":
+        backend = OnnxBackend(name, **spec)
+    elif backend_type == "sentence_transformer":
+        from pymilvus.model.dense import SentenceTransformerEmbeddingFunction
+        backend = MilvusModelBackend(name, SentenceTransformerEmbeddingFunction(device="cpu", **spec))
+    else:
+        raise ValueError(f"未知的后端类型: {backend_type}")
+
+    return MicroBatcher(backend, **batch_options) if batched else backend
+
+
+def profile_backend(backend: EmbeddingBackend, texts: List[str], batch_sizes=(1, 8, 32),
+                    concurrency: int = 8) -> Dict[str, Any]:
+    """
+    测量后端的延迟与吞吐
+
+    Returns:
+        {dim, query_p50_ms, query_p99_ms, docs_per_sec@N..., concurrent_qps, concurrent_mean_batch}
+    """
+    backend.encode_queries(texts[:1])  # 预热
+
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        backend.encode_queries([text])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    profile = {
+        "backend": backend.name,
+        "dim": backend.dim,
+        "query_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "query_p99_ms": round(float(np.percentile(latencies, 99)), 3)
+    }
+
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            backend.encode_documents(texts[i:i + batch_size])
+        profile[f"docs_per_sec@{batch_size}"] = round(len(texts) / (time.perf_counter() - start), 1)
+
+    # 并发单条查询经过微批处理后的吞吐
+    batcher = backend if isinstance(backend, MicroBatcher) else MicroBatcher(backend)
+    start_stats = dict(batcher.stats)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda t: batcher.encode_queries([t]), texts))
+    elapsed = time.perf_counter() - start
+    batches = batcher.stats["batches"] - start_stats["batches"]
+    profile["concurrent_qps"] = round(len(texts) / elapsed, 1)
+    profile["concurrent_mean_batch"] = round(len(texts) / max(batches, 1), 2)
+    if batcher is not backend:
+        batcher.close()
+
+    return profile
+
+
+def evaluate_recall(backend: EmbeddingBackend, feed_path: str) -> float:
+    """用 rag_benchmark 的标注查询集评估后端的 recall@2（每个后端单独建集合）"""
+    from rednoteV2 import ProductRAG
+    from catalog_sync import iter_feed
+    from rag_benchmark import DEFAULT_QUERIES, LocalSynthesizer, load_queries, run_benchmark
+
+    collection_name = f"benchmark_{backend.name.replace('-', '_').replace('+', '_')}"
+    product_rag = ProductRAG(
+        "offline",
+        uri="./benchmark_knowledge.db",
+        collection_name=collection_name,
+        seed_sample_data=False,
+        synthesizer=LocalSynthesizer(),
+        embedding_model=backend
+    )
+    product_rag.sync_catalog(feed_path, checkpoint_path=f".{collection_name}.sync_checkpoint.json")
+    sku_by_text = {record["product_info"]: record["sku"] for record in iter_feed(feed_path)}
+    report = run_benchmark(product_rag, load_queries(DEFAULT_QUERIES), sku_by_text, ks=[2], limit=2)
+    return report["metrics"]["recall@2"]
+
+
+def main():
+    """命令行入口：对比各后端的速度，可选结合基准查询集评估召回"""
+    parser = argparse.ArgumentParser(description="Embedding 后端性能对比")
+    parser.add_argument("--backends", nargs="+", default=["default", "bge-small-zh"], help="要对比的后端")
+    parser.add_argument("--feed", default="data/product_feed.jsonl", help="用于生成测试文本的商品数据源")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发调用方数量")
+    parser.add_argument("--with-recall", action="store_true", help="同时运行 rag_benchmark 评估召回")
+    parser.add_argument("--recall-target", type=float, default=0.8, help="recall@2 目标值")
+    args = parser.parse_args()
+
+    from catalog_sync import iter_feed
+
+    documents = [record["product_info"] for record in iter_feed(args.feed)]
+    # 用文档的每一行作为短查询，凑足有代表性的样本量
+    texts = [line.strip() for doc in documents for line in doc.splitlines() if line.strip()]
+
+    profiles = []
+    for name in args.backends:
+        print(f"\n⏳ 加载后端: {name} - {BACKEND_REGISTRY.get(name, {}).get('description', '')}")
+        try:
+            start = time.perf_counter()
+            backend = load_backend(name)
+            load_seconds = time.perf_counter() - start
+        except Exception as e:
+            print(f"❌ 加载失败: {e}")
+            continue
+
+        profile = profile_backend(backend, texts, concurrency=args.concurrency)
+        profile["load_seconds"] = round(load_seconds, 2)
+
+        if args.with_recall:
+            profile["recall@2"] = evaluate_recall(backend, args.feed)
+        profiles.append(profile)
+
+    if not profiles:
+        return 1
+
+    print(f"\n{'后端':<24}" + "".join(f"{k:>20}" for k in profiles[0] if k != "backend"))
+    for profile in profiles:
+        print(f"{profile['backend']:<24}" + "".join(f"{str(v):>20}" for k, v in profile.items() if k != "backend"))
+
+    if args.with_recall:
+        qualified = [p for p in profiles if p.get("recall@2", 0) >= args.recall_target]
+        if qualified:
+            best = min(qualified, key=lambda p: p["query_p50_ms"])
+            print(f"\n🏆 满足 recall@2 ≥ {args.recall_target} 的最快后端: {best['backend']}")
+        else:
+            print(f"\n⚠️ 没有后端达到 recall@2 ≥ {args.recall_target}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ProductRAG 检索质量与延迟基准测试
+使用带标注的查询集（产品名、错别字、同义描述、英文名 → 期望 SKU），
+统计 recall@k、MRR 以及 embed / search / synthesis 三段延迟的 p50/p99，
+并输出可跨版本对比的 JSON 结果。
+
+信息整合环节使用本地替身（LocalSynthesizer），全程无需联网。
+首次运行时 DefaultEmbeddingFunction 需要本地已缓存模型文件。
+
+Usage:
+    python rag_benchmark.py
+    python rag_benchmark.py --storage-mode sq8 --compare output/benchmark/baseline.json
+"""
+
+import re
+import json
+import math
+import time
+import argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Any
+
+DEFAULT_FEED = "data/product_feed.jsonl"
+DEFAULT_QUERIES = "data/benchmark_queries.jsonl"
+PHASES = ("embed", "search", "rerank", "synthesis")
+
+
+def load_queries(path: str) -> List[Dict[str, Any]]:
+    """读取标注查询集，每行 {query, category, expected_skus}"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：每个中日韩字符计 1，其余按每 4 个字符计 1"""
+    cjk = len(re.findall(r"[\u3000-\u9fff\uff00-\uffef]", text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近秩百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def recall_at_k(ranked: List[str], expected: List[str], k: int) -> float:
+    """前 k 个结果覆盖期望 SKU 的比例"""
+    if not expected:
+        return 0.0
+    return len(set(ranked[:k]) & set(expected)) / len(expected)
+
+
+def context_precision(context: List[str], expected: List[str]) -> float:
+    """送入 LLM 的上下文中相关产品的占比，上下文为空时记为 0"""
+    if not context:
+        return 0.0
+    return sum(1 for sku in context if sku in expected) / len(context)
+
+
+def reciprocal_rank(ranked: List[str], expected: List[str]) -> float:
+    """第一个命中结果排名的倒数，未命中为 0"""
+    for rank, sku in enumerate(ranked, 1):
+        if sku in expected:
+            return 1.0 / rank
+    return 0.0
+
+
+class LocalSynthesizer:
+    """LLM 信息整合的本地替身：按提示词抽取上下文要点，不发起网络请求"""
+
+    def __call__(self, system_prompt: str, user_prompt: str) -> str:
+        lines = [line.strip() for line in user_prompt.splitlines() if "：" in line]
+        return "\n".join(lines[:8])
+
+
+def summarize(per_query: List[Dict[str, Any]], ks: List[int]) -> Dict[str, Any]:
+    """汇总单个查询结果为整体指标"""
+    n = max(len(per_query), 1)
+    metrics = {f"recall@{k}": round(sum(q["recall"][str(k)] for q in per_query) / n, 4) for k in ks}
+    metrics["mrr"] = round(sum(q["rr"] for q in per_query) / n, 4)
+    metrics["context_precision"] = round(sum(q["context_precision"] for q in per_query) / n, 4)
+    metrics["context_size_mean"] = round(sum(len(q["context_skus"]) for q in per_query) / n, 2)
+    metrics["prompt_tokens_mean"] = round(sum(q["prompt_tokens"] for q in per_query) / n, 1)
+
+    for phase in PHASES + ("total",):
+        values = [q["latency_ms"][phase] for q in per_query]
+        metrics[f"{phase}_p50_ms"] = round(percentile(values, 50), 3)
+        metrics[f"{phase}_p99_ms"] = round(percentile(values, 99), 3)
+    return metrics
+
+
+def run_benchmark(product_rag, queries: List[Dict[str, Any]], sku_by_text: Dict[str, str],
+                  ks: List[int] = (1, 2, 5), limit: int = 2, reranker=None,
+                  rerank_candidates: int = 10) -> Dict[str, Any]:
+    """
+    运行基准测试
+
+    Args:
+        product_rag: 已同步好基准数据的 ProductRAG 实例
+        queries: 标注查询集
+        sku_by_text: product_info 文本到 SKU 的映射
+        ks: 统计 recall 的 k 值
+        limit: 传给信息整合环节的结果数（与 query_product_database 保持一致）
+        reranker: 可选重排器，排序指标按重排后的顺序计算，上下文按阈值筛选
+        rerank_candidates: 使用重排器时的向量召回数
+
+    Returns:
+        基准测试结果
+    """
+    ks = sorted(set(ks))
+    depth = max(max(ks), limit, rerank_candidates if reranker else 0)
+
+    # 预热，避免模型首次加载计入延迟
+    product_rag._search(product_rag.embedding_model.encode_queries(["预热"]), limit=depth)
+
+    per_query = []
+    for item in queries:
+        timings = {}
+
+        start = time.perf_counter()
+        query_vectors = product_rag.embedding_model.encode_queries([item["query"]])
+        timings["embed"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        hits = product_rag._search(query_vectors, limit=depth)
+        timings["search"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        if reranker is not None:
+            hits = reranker.rerank(item["query"], hits)
+            context_hits = reranker.select(hits, limit)
+        else:
+            context_hits = hits[:limit]
+        timings["rerank"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        product_rag._synthesize(item["query"], context_hits)
+        timings["synthesis"] = (time.perf_counter() - start) * 1000
+        timings["total"] = sum(timings[phase] for phase in PHASES)
+
+        system_prompt, user_prompt = product_rag._build_synthesis_prompt(item["query"], context_hits)
+        ranked = [sku_by_text.get(info, "?") for info, _ in hits]
+        context = [sku_by_text.get(info, "?") for info, _ in context_hits]
+        expected = item["expected_skus"]
+
+        per_query.append({
+            "query": item["query"],
+            "category": item.get("category", "default"),
+            "expected_skus": expected,
+            "ranked_skus": ranked,
+            "recall": {str(k): recall_at_k(ranked, expected, k) for k in ks},
+            "rr": reciprocal_rank(ranked, expected),
+            "context_skus": context,
+            "context_precision": context_precision(context, expected),
+            "prompt_tokens": estimate_tokens(system_prompt + user_prompt),
+            "latency_ms": {phase: round(value, 3) for phase, value in timings.items()}
+        })
+
+    categories = sorted({q["category"] for q in per_query})
+    return {
+        "metrics": summarize(per_query, ks),
+        "per_category": {
+            category: summarize([q for q in per_query if q["category"] == category], ks)
+            for category in categories
+        },
+        "per_query": per_query
+    }
+
+
+def compare_reports(current: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """对比两次运行的整体指标，返回 {指标: {baseline, current, delta}}"""
+    comparison = {}
+    for key, value in current["metrics"].items():
+        if key in baseline.get("metrics", {}):
+            old = baseline["metrics"][key]
+            comparison[key] = {"baseline": old, "current": value, "delta": round(value - old, 4)}
+    return comparison
+
+
+def print_report(report: Dict[str, Any], comparison: Optional[Dict[str, Dict[str, float]]] = None):
+    """打印基准测试结果"""
+    print(f"\n{'='*60}")
+    print("📊 ProductRAG 基准测试结果")
+    print(f"{'='*60}")
+    print(f"配置: {json.dumps(report['config'], ensure_ascii=False)}")
+
+    print(f"\n{'指标':<24}{'数值':>12}")
+    print("-" * 36)
+    for key, value in report["metrics"].items():
+        print(f"{key:<24}{value:>12}")
+
+    print(f"\n{'类别':<14}{'MRR':>8}" + "".join(f"{k:>12}" for k in report["metrics"] if k.startswith("recall@")))
+    for category, metrics in report["per_category"].items():
+        recalls = "".join(f"{v:>12}" for k, v in metrics.items() if k.startswith("recall@"))
+        print(f"{category:<14}{metrics['mrr']:>8}{recalls}")
+
+    misses = [q for q in report["per_query"] if q["rr"] == 0]
+    if misses:
+        print(f"\n⚠️ 未命中查询 ({len(misses)}):")
+        for q in misses:
+            print(f"   {q['query']} → {q['ranked_skus']} (期望 {q['expected_skus']})")
+
+    if comparison:
+        print(f"\n{'指标':<24}{'基线':>12}{'本次':>12}{'变化':>12}")
+        print("-" * 60)
+        for key, row in comparison.items():
+            print(f"{key:<24}{row['baseline']:>12}{row['current']:>12}{row['delta']:>+12}")
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="ProductRAG 检索质量与延迟基准测试")
+    parser.add_argument("--feed", default=DEFAULT_FEED, help="基准商品数据源")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES, help="标注查询集")
+    parser.add_argument("--db", default="./benchmark_knowledge.db", help="基准测试专用 Milvus 数据库")
+    parser.add_argument("--collection", default="benchmark_collection", help="基准测试集合名称")
+    parser.add_argument("--storage-mode", default="float32", help="向量存储模式：float32 / sq8 / pq")
+    parser.add_argument("--embedding-backend", default="default", help="embedding_backends 中的后端名称")
+    parser.add_argument("--limit", type=int, default=2, help="传给信息整合环节的结果数")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 2, 5], help="统计 recall@k 的 k 值")
+    parser.add_argument("--reranker", default=None, help="reranker 中的重排模型名称，同时输出与不重排的对比")
+    parser.add_argument("--rerank-threshold", type=float, default=0.3, help="重排后保留候选的最低分数")
+    parser.add_argument("--rerank-candidates", type=int, default=10, help="重排前的向量召回数")
+    parser.add_argument("--output", default=None, help="JSON 结果路径，默认 output/benchmark/rag_benchmark_<时间>.json")
+    parser.add_argument("--compare", default=None, help="与之前的 JSON 结果对比")
+    args = parser.parse_args()
+
+    from rednoteV2 import ProductRAG
+    from catalog_sync import iter_feed
+    from embedding_backends import load_backend
+
+    product_rag = ProductRAG(
+        "offline",
+        uri=args.db,
+        collection_name=args.collection,
+        seed_sample_data=False,
+        storage_mode=args.storage_mode,
+        synthesizer=LocalSynthesizer(),
+        embedding_model=load_backend(args.embedding_backend)
+    )
+    product_rag.sync_catalog(args.feed, checkpoint_path=f".{args.collection}.sync_checkpoint.json")
+    sku_by_text = {record["product_info"]: record["sku"] for record in iter_feed(args.feed)}
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "config": {
+            "embedding_model": args.embedding_backend,
+            "metric_type": "IP",
+            "storage_mode": args.storage_mode,
+            "limit": args.limit,
+            "reranker": args.reranker,
+            "rerank_threshold": args.rerank_threshold if args.reranker else None,
+            "rerank_candidates": args.rerank_candidates if args.reranker else None,
+            "feed": args.feed,
+            "queries": args.queries
+        }
+    }
+    queries = load_queries(args.queries)
+    reranker = None
+    if args.reranker:
+        from reranker import load_reranker
+        reranker = load_reranker(args.reranker, threshold=args.rerank_threshold)
+
+    report.update(run_benchmark(product_rag, queries, sku_by_text, ks=args.k, limit=args.limit,
+                                reranker=reranker, rerank_candidates=args.rerank_candidates))
+
+    comparison = None
+    baseline = None
+    if reranker is not None:
+        # 同一进程内跑一遍不重排的基线，与重排结果一起写入 JSON，直接给出提示词 token 和上下文精度的变化
+        baseline = run_benchmark(product_rag, queries, sku_by_text, ks=args.k, limit=args.limit)
+        comparison = compare_reports(report, baseline)
+        report["no_rerank_baseline"] = {"metrics": baseline["metrics"], "per_category": baseline["per_category"]}
+        report["rerank_vs_baseline"] = comparison
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            comparison = compare_reports(report, json.load(f))
+
+    output_path = Path(args.output or f"output/benchmark/rag_benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print_report(report, comparison)
+    if baseline is not None:
+        saved = baseline["metrics"]["prompt_tokens_mean"] - report["metrics"]["prompt_tokens_mean"]
+        precision_delta = report["metrics"]["context_precision"] - baseline["metrics"]["context_precision"]
+        print(f"\n✂️ 重排后平均每次查询节省提示词约 {saved:.0f} tokens "
+              f"({saved / max(baseline['metrics']['prompt_tokens_mean'], 1):.0%})，"
+              f"上下文精度变化 {precision_delta:+.2%}")
+    print(f"\n💾 结果已保存: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
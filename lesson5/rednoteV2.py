@@ -30,26 +30,50 @@ load_dotenv()
 class ProductRAG:
     """产品知识库RAG系统"""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, uri: str = "./product_knowledge.db",
+                 collection_name: str = "product_collection", seed_sample_data: bool = True,
+                 storage_mode: str = "float32", synthesizer=None, embedding_model=None,
+                 reranker=None, rerank_candidates: int = 10, store_dir: Optional[str] = None):
         self.api_key = api_key
-        self.embedding_model = milvus_model.DefaultEmbeddingFunction()
-        self.milvus_client = MilvusClient(uri="./product_knowledge.db")
-        self.collection_name = "product_collection"
+        # 可传入 embedding_backends 中的任意后端，默认使用 milvus_model 自带模型
+        self.embedding_model = embedding_model or milvus_model.DefaultEmbeddingFunction()
+        self.milvus_client = MilvusClient(uri=uri)
+        self.collection_name = collection_name
         self.client = OpenAI(
             api_key=api_key,
             base_url="https://api.deepseek.com/v1"
         )
         
+        # 向量存储模式：float32 直接检索 Milvus；sq8/pq 使用进程内量化存储，
+        # 量化存储落盘到 store_dir（默认与数据库同目录），原始向量以 memmap 打开不占常驻内存
+        self.storage_mode = storage_mode
+        self.store_dir = store_dir or f"{Path(uri).with_suffix('')}_{storage_mode}"
+        self.quantized_store = None
+        
+        # 信息整合函数 (system_prompt, user_prompt) -> str，为空时调用 DeepSeek
+        self.synthesizer = synthesizer
+        
+        # 可选重排阶段：先召回 rerank_candidates 个候选，再由 cross-encoder 按阈值筛选
+        self.reranker = reranker
+        self.rerank_candidates = rerank_candidates
+        
         # 初始化时检查并创建产品知识库
-        self._init_product_knowledge()
+        self._init_product_knowledge(seed_sample_data)
+        self.refresh_quantized_store()
     
-    def _init_product_knowledge(self):
+    def _init_product_knowledge(self, seed_sample_data: bool = True):
         """初始化产品知识库"""
         # 如果集合已存在，直接返回
         if self.milvus_client.has_collection(self.collection_name):
             print("✅ 产品知识库已存在")
             return
         
+        # 由商品数据源同步的知识库只建空集合，不写入示例数据
+        if not seed_sample_data:
+            self._create_collection()
+            print("✅ 已创建空的产品知识库")
+            return
+        
         print("🔧 正在初始化产品知识库...")
         
         # 创建示例产品数据
@@ -129,8 +153,8 @@ class ProductRAG:
             热门话题：硬核防晒、户外必备、防晒不泛白"""
         ]
     
-    def _build_knowledge_base(self, product_data: List[str]):
-        """构建产品知识库"""
+    def _create_collection(self):
+        """创建产品集合（动态字段用于保存 sku / content_hash 等同步信息）"""
         # 生成测试embedding获取维度
         test_embedding = self.embedding_model.encode_queries(["test"])[0]
         embedding_dim = len(test_embedding)
@@ -142,6 +166,10 @@ class ProductRAG:
             metric_type="IP",  # 内积距离
             consistency_level="Strong"
         )
+    
+    def _build_knowledge_base(self, product_data: List[str]):
+        """构建产品知识库"""
+        self._create_collection()
         
         # 生成embeddings并插入数据
         print("🔄 正在生成产品数据embeddings...")
@@ -172,54 +200,12 @@ class ProductRAG:
         
         try:
             # 使用embedding搜索相关产品
-            search_res = self.milvus_client.search(
-                collection_name=self.collection_name,
-                data=self.embedding_model.encode_queries([product_name]),
-                limit=2,  # 返回最相关的2个结果
-                search_params={"metric_type": "IP", "params": {}},
-                output_fields=["product_info"]
-            )
+            retrieved_products = self._retrieve(product_name, limit=2)  # 返回最相关的2个结果
             
-            if not search_res[0]:
+            if not retrieved_products:
                 return f"未找到关于'{product_name}'的产品信息"
             
-            # 提取检索到的产品信息
-            retrieved_products = [
-                (res["entity"]["product_info"], res["distance"]) 
-                for res in search_res[0]
-            ]
-            
-            # 使用LLM进行信息整合和生成
-            context = "\n\n".join([info for info, _ in retrieved_products])
-            
-            system_prompt = """
-            你是一个产品信息专家。请根据提供的产品信息，为用户查询的产品生成详细、准确的介绍。
-            重点突出产品的核心卖点、适用人群和使用体验。语言要专业但易懂。
-            """
-            
-            user_prompt = f"""
-            基于以下产品信息，为'{product_name}'生成详细介绍：
-
-            {context}
-
-            请生成包含以下要点的产品介绍：
-            1. 核心成分和功效
-            2. 适用肌肤类型
-            3. 使用方法和体验
-            4. 用户反馈亮点
-            5. 推荐理由
-            """
-            
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7
-            )
-            
-            result = response.choices[0].message.content
+            result = self._synthesize(product_name, retrieved_products)
             print(f"📋 RAG查询结果: {result[:100]}...")
             return result
             
@@ -227,6 +213,102 @@ class ProductRAG:
             print(f"❌ RAG查询错误: {e}")
             return f"查询产品'{product_name}'时发生错误，请稍后重试"
     
+    def _retrieve(self, product_name: str, limit: int = 2) -> List[tuple]:
+        """检索产品信息，配置了重排器时先扩大召回再重排筛选"""
+        query_vectors = self.embedding_model.encode_queries([product_name])
+        
+        if self.reranker is None:
+            return self._search(query_vectors, limit=limit)
+        
+        candidates = self._search(query_vectors, limit=max(limit, self.rerank_candidates))
+        return self.reranker.select(self.reranker.rerank(product_name, candidates), limit)
+    
+    def _search(self, query_vectors, limit: int = 2) -> List[tuple]:
+        """
+        向量检索
+        
+        Returns:
+            [(product_info, distance)] 按相似度降序
+        """
+        if self.quantized_store is not None:
+            hits = self.quantized_store.search(query_vectors[0], limit=limit)
+            return [(hit["payload"], hit["distance"]) for hit in hits]
+        
+        search_res = self.milvus_client.search(
+            collection_name=self.collection_name,
+            data=query_vectors,
+            limit=limit,
+            search_params={"metric_type": "IP", "params": {}},
+            output_fields=["product_info"]
+        )
+        
+        # 提取检索到的产品信息
+        return [
+            (res["entity"]["product_info"], res["distance"]) 
+            for res in search_res[0]
+        ]
+    
+    def _synthesize(self, product_name: str, retrieved_products: List[tuple]) -> str:
+        """使用LLM对检索到的产品信息进行整合和生成"""
+        system_prompt, user_prompt = self._build_synthesis_prompt(product_name, retrieved_products)
+        
+        if self.synthesizer is not None:
+            return self.synthesizer(system_prompt, user_prompt)
+        
+        response = self.client.chat.completions.create(
+            model="deepseek-chat",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.7
+        )
+        
+        return response.choices[0].message.content
+    
+    def _build_synthesis_prompt(self, product_name: str, retrieved_products: List[tuple]) -> tuple:
+        """构建信息整合的系统提示词和用户提示词"""
+        context = "\n\n".join([info for info, _ in retrieved_products])
+        
+        system_prompt = """
+        你是一个产品信息专家。请根据提供的产品信息，为用户查询的产品生成详细、准确的介绍。
+        重点突出产品的核心卖点、适用人群和使用体验。语言要专业但易懂。
+        """
+        
+        user_prompt = f"""
+        基于以下产品信息，为'{product_name}'生成详细介绍：
+
+        {context}
+
+        请生成包含以下要点的产品介绍：
+        1. 核心成分和功效
+        2. 适用肌肤类型
+        3. 使用方法和体验
+        4. 用户反馈亮点
+        5. 推荐理由
+        """
+        
+        return system_prompt, user_prompt
+    
+    def refresh_quantized_store(self):
+        """
+        按当前集合内容重建量化存储（float32 模式下不做任何事）
+        
+        已有量化存储且集合增长不多时沿用已训练的量化器只做编码，不重新训练
+        """
+        if self.storage_mode == "float32":
+            self.quantized_store = None
+            return
+        
+        from vector_quant import QuantizedStore
+        
+        self.quantized_store = QuantizedStore.from_milvus(
+            self.milvus_client, self.collection_name, self.storage_mode,
+            directory=self.store_dir, previous=self.quantized_store
+        )
+        print(f"🗜️ 已构建 {self.storage_mode} 量化存储，每向量 {self.quantized_store.bytes_per_vector:.0f} 字节，"
+              f"常驻 {self.quantized_store.resident_bytes / 1024:.1f} KB")
+    
     def add_product(self, product_info: str):
         """添加新产品到知识库"""
         try:
@@ -252,9 +334,28 @@ class ProductRAG:
             
             self.milvus_client.insert(collection_name=self.collection_name, data=data)
             print(f"✅ 已添加新产品到知识库，ID: {new_id}")
+            if self.quantized_store is not None:
+                self.quantized_store.add([embedding], [new_id], [product_info])
             
         except Exception as e:
             print(f"❌ 添加产品失败: {e}")
+    
+    def sync_catalog(self, feed_path: str, **kwargs) -> Dict[str, Any]:
+        """
+        从 CSV/JSONL 商品数据源增量同步知识库
+        
+        Args:
+            feed_path: 商品数据源文件路径
+            **kwargs: 透传给 CatalogSync 的参数（batch_size、checkpoint_path 等）
+            
+        Returns:
+            同步统计信息
+        """
+        from catalog_sync import CatalogSync
+        
+        stats = CatalogSync(self, **kwargs).run(feed_path)
+        self.refresh_quantized_store()
+        return stats
 
 
 class Config:
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本地 Cross-Encoder 重排
+向量检索先召回较宽的候选集，再用小型 cross-encoder 对 (查询, 候选) 成对打分，
+只保留分数高于阈值的候选送入 LLM，缩短提示词并减少无关产品的干扰。
+"""
+
+from typing import Dict, List, Optional, Any
+
+import numpy as np
+
+from embedding_backends import load_onnx_model
+
+# 可选重排模型注册表：名称 → 加载参数
+RERANKER_REGISTRY: Dict[str, Dict[str, Any]] = {
+    "bge-reranker-base": {
+        "repo_id": "Xenova/bge-reranker-base",
+        "description": "BAAI bge-reranker-base，中英双语"
+    },
+    "ms-marco-minilm": {
+        "repo_id": "Xenova/ms-marco-MiniLM-L-6-v2",
+        "description": "ms-marco-MiniLM-L-6-v2，英文，体积最小"
+    }
+}
+
+
+class Reranker:
+    """重排器基类：子类只需实现 score"""
+
+    name = "base"
+
+    def __init__(self, threshold: float = 0.3):
+        self.threshold = threshold
+
+    def score(self, query: str, documents: List[str]) -> np.ndarray:
+        """返回每个文档与查询的相关度，取值 0-1"""
+        raise NotImplementedError
+
+    def rerank(self, query: str, hits: List[tuple]) -> List[tuple]:
+        """
+        按 cross-encoder 分数重新排序
+
+        Args:
+            hits: 向量检索结果 [(product_info, distance)]
+
+        Returns:
+            [(product_info, rerank_score)] 按分数降序
+        """
+        if not hits:
+            return []
+        scores = self.score(query, [info for info, _ in hits])
+        order = np.argsort(-scores, kind="stable")
+        return [(hits[i][0], float(scores[i])) for i in order]
+
+    def select(self, ranked: List[tuple], limit: int) -> List[tuple]:
+        """保留分数不低于阈值的前 limit 个候选"""
+        return [hit for hit in ranked if hit[1] >= self.threshold][:limit]
+
+
+class CrossEncoderReranker(Reranker):
+    """基于 ONNX Runtime 的 cross-encoder，按批打分"""
+
+    def __init__(self, name: str, repo_id: str, onnx_file: str = "onnx/model.onnx",
+                 threshold: float = 0.3, batch_size: int = 16,
+                 num_threads: Optional[int] = None, max_length: int = 512):
+        """
+        Args:
+            name: 重排器名称
+            repo_id: HuggingFace 模型仓库（或本地目录），需包含 ONNX 模型和 tokenizer
+            onnx_file: 仓库内 ONNX 模型文件路径
+            threshold: 保留候选的最低分数（sigmoid 后）
+            batch_size: 每批打分的 (查询, 候选) 对数
+            num_threads: ONNX Runtime 算子内线程数，默认为 CPU 核数
+            max_length: 最大序列长度
+        """
+        super().__init__(threshold)
+        self.name = name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.tokenizer, self.session, self.input_names = load_onnx_model(repo_id, onnx_file, num_threads)
+
+    def score(self, query: str, documents: List[str]) -> np.ndarray:
+        logits = []
+        for i in range(0, len(documents), self.batch_size):
+            batch = documents[i:i + self.batch_size]
+            encoded = self.tokenizer([query] * len(batch), batch, padding=True, truncation="only_second",
+                                     max_length=self.max_length, return_tensors="np")
+            feed = {k: v for k, v in encoded.items() if k in self.input_names}
+            logits.append(self.session.run(None, feed)[0].reshape(-1))
+
+        return 1 / (1 + np.exp(-np.concatenate(logits)))
+
+
+def load_reranker(name: str, **kwargs) -> Reranker:
+    """按名称加载重排器，kwargs 可覆盖 threshold、batch_size 等参数"""
+    if name not in RERANKER_REGISTRY:
+        raise ValueError(f"未知的重排模型: {name}，可选: {', '.join(RERANKER_REGISTRY)}")
+
+    spec = {k: v for k, v in RERANKER_REGISTRY[name].items() if k != "description"}
+    spec.update(kwargs)
+    return CrossEncoderReranker(name, **spec)
@@ -0,0 +1,148 @@
+"""
+商品目录同步引擎的单元测试
+"""
+
+import io
+import json
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from catalog_sync import CatalogSync, iter_feed, sku_to_id
+
+
+class FakeEmbedding:
+    """以文本长度作为向量的假 embedding 模型"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode_documents(self, texts):
+        self.calls += 1
+        return [[float(len(t))] for t in texts]
+
+
+class FakeIterator:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def next(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeMilvus:
+    """只实现同步引擎用到的接口的内存集合"""
+
+    def __init__(self):
+        self.rows = {}
+
+    def query_iterator(self, collection_name, batch_size, filter, output_fields):
+        return FakeIterator([dict(r) for r in self.rows.values()])
+
+    def upsert(self, collection_name, data):
+        for row in data:
+            self.rows[row["id"]] = row
+
+    def delete(self, collection_name, ids):
+        for i in ids:
+            self.rows.pop(i, None)
+
+
+class FakeProductRAG:
+    def __init__(self):
+        self.embedding_model = FakeEmbedding()
+        self.milvus_client = FakeMilvus()
+        self.collection_name = "test_collection"
+
+
+class TestCatalogSync(unittest.TestCase):
+    """测试增量同步"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.feed = self.dir / "feed.jsonl"
+        self.checkpoint = self.dir / "checkpoint.json"
+        self.rag = FakeProductRAG()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_feed(self, rows):
+        with open(self.feed, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def sync(self, **kwargs):
+        syncer = CatalogSync(self.rag, batch_size=2, checkpoint_path=str(self.checkpoint), **kwargs)
+        with redirect_stdout(io.StringIO()):
+            return syncer.run(str(self.feed))
+
+    def test_iter_feed_csv(self):
+        """测试 CSV 数据源解析"""
+        csv_path = self.dir / "feed.csv"
+        csv_path.write_text("sku,name,品牌\nA1,面膜,海洋之谜\n", encoding="utf-8")
+        records = list(iter_feed(str(csv_path)))
+        self.assertEqual(records[0]["sku"], "A1")
+        self.assertEqual(records[0]["product_info"], "面膜\n品牌：海洋之谜")
+
+    def test_initial_sync_inserts_all(self):
+        """测试首次同步全部写入"""
+        self.write_feed([{"sku": f"S{i}", "name": f"商品{i}"} for i in range(5)])
+        stats = self.sync()
+        self.assertEqual(stats["inserted"], 5)
+        self.assertEqual(stats["batches"], 3)
+        self.assertEqual(len(self.rag.milvus_client.rows), 5)
+        self.assertFalse(self.checkpoint.exists())
+
+    def test_resync_only_changed(self):
+        """测试再次同步只处理变化的商品"""
+        self.write_feed([{"sku": "S1", "name": "商品1"}, {"sku": "S2", "name": "商品2"}, {"sku": "S3", "name": "商品3"}])
+        self.sync()
+        calls_before = self.rag.embedding_model.calls
+
+        self.write_feed([{"sku": "S1", "name": "商品1"}, {"sku": "S2", "name": "商品2", "功效": "补水"}])
+        stats = self.sync()
+
+        self.assertEqual(stats["unchanged"], 1)
+        self.assertEqual(stats["updated"], 1)
+        self.assertEqual(stats["deleted"], 1)
+        self.assertEqual(self.rag.embedding_model.calls, calls_before + 1)
+        self.assertNotIn(sku_to_id("S3"), self.rag.milvus_client.rows)
+
+    def test_resume_from_checkpoint(self):
+        """测试中断后从检查点恢复"""
+        self.write_feed([{"sku": f"S{i}", "name": f"商品{i}"} for i in range(6)])
+
+        # 第二批写入时模拟中断
+        original_upsert = self.rag.milvus_client.upsert
+        calls = []
+
+        def flaky_upsert(collection_name, data):
+            calls.append(len(data))
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            original_upsert(collection_name, data)
+
+        self.rag.milvus_client.upsert = flaky_upsert
+        with self.assertRaises(KeyboardInterrupt):
+            self.sync()
+        self.assertTrue(self.checkpoint.exists())
+
+        self.rag.milvus_client.upsert = original_upsert
+        embed_calls = self.rag.embedding_model.calls
+        stats = self.sync()
+
+        self.assertEqual(len(self.rag.milvus_client.rows), 6)
+        self.assertEqual(stats["inserted"], 6)
+        self.assertEqual(stats["deleted"], 0)
+        self.assertEqual(self.rag.embedding_model.calls, embed_calls + 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
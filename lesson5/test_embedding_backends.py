@@ -0,0 +1,101 @@
+"""
+Embedding 后端与微批处理的单元测试
+"""
+
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from embedding_backends import EmbeddingBackend, MicroBatcher, load_backend, profile_backend
+
+
+class FakeBackend(EmbeddingBackend):
+    """以文本长度作为向量、记录每次调用批大小的假后端"""
+
+    name = "fake"
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.batch_sizes = []
+        self.lock = threading.Lock()
+
+    def _encode(self, texts, sign):
+        with self.lock:
+            self.batch_sizes.append(len(texts))
+        time.sleep(self.delay)
+        return [np.array([sign * len(t)], dtype=np.float32) for t in texts]
+
+    def encode_queries(self, texts):
+        return self._encode(texts, 1)
+
+    def encode_documents(self, texts):
+        return self._encode(texts, -1)
+
+
+class TestMicroBatcher(unittest.TestCase):
+    """测试动态微批处理"""
+
+    def setUp(self):
+        self.backend = FakeBackend()
+        self.batcher = MicroBatcher(self.backend, max_batch_size=16, max_wait_ms=20)
+
+    def tearDown(self):
+        self.batcher.close()
+
+    def test_results_keep_caller_order(self):
+        """测试结果按调用方顺序返回"""
+        vectors = self.batcher.encode_queries(["a", "bbb", "cc"])
+        self.assertEqual([float(v[0]) for v in vectors], [1.0, 3.0, 2.0])
+
+    def test_concurrent_calls_are_coalesced(self):
+        """测试并发单条请求被合并为更少的批次"""
+        texts = ["x" * i for i in range(1, 33)]
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(lambda t: self.batcher.encode_queries([t]), texts))
+
+        self.assertEqual([float(r[0][0]) for r in results], [float(len(t)) for t in texts])
+        self.assertLess(len(self.backend.batch_sizes), len(texts))
+        self.assertLessEqual(max(self.backend.batch_sizes), 16)
+
+    def test_queries_and_documents_are_not_mixed(self):
+        """测试查询和文档请求分开推理"""
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            query = pool.submit(self.batcher.encode_queries, ["ab"])
+            document = pool.submit(self.batcher.encode_documents, ["ab"])
+            self.assertEqual(float(query.result()[0][0]), 2.0)
+            self.assertEqual(float(document.result()[0][0]), -2.0)
+
+    def test_errors_propagate_to_callers(self):
+        """测试后端异常传递给所有调用方"""
+        class FailingBackend(FakeBackend):
+            def encode_queries(self, texts):
+                raise RuntimeError("boom")
+
+        batcher = MicroBatcher(FailingBackend())
+        try:
+            with self.assertRaises(RuntimeError):
+                batcher.encode_queries(["a"])
+        finally:
+            batcher.close()
+
+
+class TestProfile(unittest.TestCase):
+    """测试性能剖析与加载"""
+
+    def test_profile_backend(self):
+        profile = profile_backend(FakeBackend(delay=0), ["a", "bb", "ccc", "dddd"], batch_sizes=(1, 2), concurrency=2)
+        self.assertEqual(profile["backend"], "fake")
+        self.assertEqual(profile["dim"], 1)
+        for key in ("query_p50_ms", "query_p99_ms", "docs_per_sec@1", "docs_per_sec@2", "concurrent_qps"):
+            self.assertIn(key, profile)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            load_backend("no-such-model")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+ProductRAG 基准测试工具的单元测试
+"""
+
+import unittest
+
+import numpy as np
+
+from rag_benchmark import (
+    LocalSynthesizer, compare_reports, context_precision, estimate_tokens,
+    percentile, recall_at_k, reciprocal_rank, run_benchmark
+)
+from reranker import Reranker
+
+
+class FakeEmbedding:
+    def encode_queries(self, texts):
+        return [[0.0] for _ in texts]
+
+
+class FakeProductRAG:
+    """对任何查询都返回固定排序结果的假 RAG"""
+
+    def __init__(self, ranking):
+        self.embedding_model = FakeEmbedding()
+        self.ranking = ranking
+        self.synthesizer = LocalSynthesizer()
+
+    def _search(self, query_vectors, limit=2):
+        return [(text, 1.0) for text in self.ranking][:limit]
+
+    def _build_synthesis_prompt(self, product_name, retrieved_products):
+        return "系统", "\n".join(info for info, _ in retrieved_products)
+
+    def _synthesize(self, product_name, retrieved_products):
+        return self.synthesizer(*self._build_synthesis_prompt(product_name, retrieved_products))
+
+
+class KeywordReranker(Reranker):
+    """查询文本出现在候选中得 1 分，否则 0 分"""
+
+    def score(self, query, documents):
+        return np.array([1.0 if query in doc else 0.0 for doc in documents])
+
+
+class TestMetrics(unittest.TestCase):
+    """测试指标计算"""
+
+    def test_recall_at_k(self):
+        self.assertEqual(recall_at_k(["A", "B", "C"], ["B"], 1), 0.0)
+        self.assertEqual(recall_at_k(["A", "B", "C"], ["B"], 2), 1.0)
+        self.assertEqual(recall_at_k(["A", "B"], ["B", "D"], 2), 0.5)
+
+    def test_reciprocal_rank(self):
+        self.assertEqual(reciprocal_rank(["A", "B"], ["A"]), 1.0)
+        self.assertEqual(reciprocal_rank(["A", "B", "C"], ["C"]), 1 / 3)
+        self.assertEqual(reciprocal_rank(["A"], ["Z"]), 0.0)
+
+    def test_context_precision(self):
+        self.assertEqual(context_precision(["A", "B"], ["A"]), 0.5)
+        self.assertEqual(context_precision([], ["A"]), 0.0)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([5.0], 99), 5.0)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens("补水面膜"), 4)
+        self.assertEqual(estimate_tokens("mask"), 1)
+
+
+class TestRunBenchmark(unittest.TestCase):
+    """测试基准测试流程"""
+
+    def test_run_and_compare(self):
+        rag = FakeProductRAG(["面膜\n品牌：A", "精华\n品牌：B"])
+        sku_by_text = {"面膜\n品牌：A": "SKU-1", "精华\n品牌：B": "SKU-2"}
+        queries = [
+            {"query": "面膜", "category": "name", "expected_skus": ["SKU-1"]},
+            {"query": "精华", "category": "synonym", "expected_skus": ["SKU-2"]},
+        ]
+
+        report = run_benchmark(rag, queries, sku_by_text, ks=[1, 2], limit=2)
+
+        self.assertEqual(report["metrics"]["recall@1"], 0.5)
+        self.assertEqual(report["metrics"]["recall@2"], 1.0)
+        self.assertEqual(report["metrics"]["mrr"], 0.75)
+        self.assertEqual(set(report["per_category"]), {"name", "synonym"})
+        self.assertIn("synthesis_p99_ms", report["metrics"])
+
+        baseline = {"metrics": dict(report["metrics"], mrr=0.5)}
+        self.assertEqual(compare_reports(report, baseline)["mrr"]["delta"], 0.25)
+
+    def test_rerank_trims_context(self):
+        """测试重排后只保留相关候选，上下文更短、精度更高"""
+        rag = FakeProductRAG(["精华\n品牌：B", "面膜\n品牌：A"])
+        sku_by_text = {"面膜\n品牌：A": "SKU-1", "精华\n品牌：B": "SKU-2"}
+        queries = [{"query": "面膜", "category": "name", "expected_skus": ["SKU-1"]}]
+
+        baseline = run_benchmark(rag, queries, sku_by_text, ks=[1], limit=2)
+        reranked = run_benchmark(rag, queries, sku_by_text, ks=[1], limit=2,
+                                 reranker=KeywordReranker(threshold=0.5), rerank_candidates=2)
+
+        self.assertEqual(baseline["metrics"]["context_precision"], 0.5)
+        self.assertEqual(reranked["metrics"]["context_precision"], 1.0)
+        self.assertEqual(reranked["metrics"]["recall@1"], 1.0)
+        self.assertLess(reranked["metrics"]["prompt_tokens_mean"], baseline["metrics"]["prompt_tokens_mean"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+向量量化存储的单元测试
+"""
+
+import tempfile
+import unittest
+
+import numpy as np
+
+from vector_quant import QuantizedStore, ScalarQuantizer, evaluate_modes
+
+
+def make_vectors(n=500, dim=64, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class TestQuantizers(unittest.TestCase):
+    """测试量化器"""
+
+    def setUp(self):
+        self.vectors = make_vectors()
+
+    def test_sq8_roundtrip_error(self):
+        """测试 SQ8 解码误差不超过半个量化步长"""
+        quantizer = ScalarQuantizer().fit(self.vectors)
+        decoded = quantizer.decode(quantizer.encode(self.vectors))
+        self.assertTrue(np.all(np.abs(decoded - self.vectors) <= quantizer.scale / 2 + 1e-6))
+
+    def test_sq8_scores_match_decoded(self):
+        """测试 SQ8 近似内积与解码后内积一致"""
+        quantizer = ScalarQuantizer().fit(self.vectors)
+        codes = quantizer.encode(self.vectors)
+        query = self.vectors[0]
+        np.testing.assert_allclose(quantizer.scores(codes, query), quantizer.decode(codes) @ query, rtol=1e-4, atol=1e-4)
+
+    def test_pq_bytes_per_vector(self):
+        """测试落盘后 PQ 每向量占用 m 字节码 + 8 字节主键，未落盘时如实计入 float32 原始向量"""
+        ids, payloads = np.arange(len(self.vectors)), [""] * len(self.vectors)
+        in_memory = QuantizedStore.build("pq", self.vectors, ids, payloads, pq_m=8)
+        self.assertEqual(in_memory.bytes_per_vector, 16 + 64 * 4)
+        with tempfile.TemporaryDirectory() as tmp:
+            store = QuantizedStore.build("pq", self.vectors, ids, payloads, pq_m=8, directory=tmp)
+            self.assertIsInstance(store.raw_vectors, np.memmap)
+            self.assertEqual(store.codes.shape, (len(self.vectors), 8))
+            self.assertEqual(store.bytes_per_vector, 16)
+            self.assertEqual(store.resident_bytes, 16 * len(self.vectors) + store.quantizer.codebooks.nbytes)
+
+
+class TestQuantizedStore(unittest.TestCase):
+    """测试量化存储检索"""
+
+    def setUp(self):
+        self.vectors = make_vectors()
+        self.ids = np.arange(100, 100 + len(self.vectors))
+        self.payloads = [f"产品{i}" for i in range(len(self.vectors))]
+
+    def test_search_with_rerank_returns_exact_top1(self):
+        """测试精确重排后自身向量排第一，且距离为精确内积"""
+        store = QuantizedStore.build("sq8", self.vectors, self.ids, self.payloads)
+        hits = store.search(self.vectors[7], limit=2)
+        self.assertEqual(hits[0]["id"], 107)
+        self.assertEqual(hits[0]["payload"], "产品7")
+        self.assertAlmostEqual(hits[0]["distance"], 1.0, places=5)
+
+    def test_save_and_load(self):
+        """测试保存后以 memmap 加载，检索结果不变"""
+        store = QuantizedStore.build("pq", self.vectors, self.ids, self.payloads, pq_m=8)
+        with tempfile.TemporaryDirectory() as tmp:
+            store.save(tmp)
+            loaded = QuantizedStore.load(tmp)
+            self.assertIsInstance(loaded.raw_vectors, np.memmap)
+            self.assertEqual(store.search(self.vectors[3], limit=3), loaded.search(self.vectors[3], limit=3))
+
+    def test_add_encodes_with_existing_quantizer(self):
+        """测试新增向量沿用已训练的码本编码并追加到磁盘上的原始向量，重新打开后可检索到"""
+        with tempfile.TemporaryDirectory() as tmp:
+            store = QuantizedStore.build("pq", self.vectors[:400], self.ids[:400], self.payloads[:400],
+                                         pq_m=8, directory=tmp)
+            codebooks = store.quantizer.codebooks
+            store.add(self.vectors[400:], self.ids[400:], self.payloads[400:])
+            self.assertIs(store.quantizer.codebooks, codebooks)
+            self.assertIsInstance(store.raw_vectors, np.memmap)
+            self.assertEqual(store.raw_vectors.shape, self.vectors.shape)
+
+            loaded = QuantizedStore.load(tmp)
+            self.assertEqual(loaded.trained_rows, 400)
+            self.assertEqual(loaded.search(self.vectors[450], limit=1)[0]["id"], 550)
+
+    def test_empty_collection(self):
+        """测试空集合不训练量化器、检索返回空列表，第一次新增时训练并可检索到"""
+        with tempfile.TemporaryDirectory() as tmp:
+            for mode in ("sq8", "pq"):
+                store = QuantizedStore.build(mode, np.array([]), np.array([]), [], pq_m=8, directory=f"{tmp}/{mode}")
+                self.assertIsNone(store.quantizer)
+                self.assertEqual(store.search(self.vectors[0]), [])
+                self.assertIsNone(QuantizedStore.load(f"{tmp}/{mode}").quantizer)
+
+                store.add(self.vectors[:3], self.ids[:3], self.payloads[:3])
+                self.assertEqual(store.search(self.vectors[1], limit=1)[0]["id"], 101)
+                self.assertEqual(QuantizedStore.load(f"{tmp}/{mode}").search(self.vectors[2], limit=1)[0]["id"], 102)
+
+    def test_evaluate_modes_report(self):
+        """测试对比报告包含各模式且 float32 召回为 1"""
+        report = evaluate_modes(self.vectors, self.vectors[:20], k=5)
+        self.assertEqual([row["mode"] for row in report], ["float32", "sq8", "pq"])
+        self.assertEqual(report[0]["recall@5"], 1.0)
+        self.assertGreater(report[1]["recall@5"], 0.9)
+        self.assertLess(report[2]["bytes_per_vector"], report[1]["bytes_per_vector"])
+
+
+if __name__ == "__main__":
+    unittest.main()
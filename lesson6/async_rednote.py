@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+小红书文案生成器 - asyncio 版本
+基于 AsyncOpenAI 客户端，同一轮中模型请求的多个工具调用并发执行，
+同步工具放到线程池中运行，一轮的耗时取决于最慢的工具而不是所有工具之和。
+
+示例:
+    async with AsyncRedNoteGenerator(Config(provider="deepseek")) as generator:
+        result = await generator.generate("深海蓝藻保湿面膜", style="活泼甜美")
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Any, Callable
+
+from openai import AsyncOpenAI
+
+from generation_trace import note_rate_limit_wait, record_llm_call, record_tool, start_iteration
+from rednote import Config, RedNoteGenerator, FileManager
+from search_backend import get_search_service
+from tool_memo import ToolMemo, memo_key
+from tool_registry import ToolTimeout
+
+
+class AsyncRedNoteGenerator(RedNoteGenerator):
+    """
+    小红书文案生成器的异步版本
+
+    提示词、工具定义、JSON 解析等逻辑与 RedNoteGenerator 共用，
+    generate / generate_batch 改为协程，available_tools 中既可以放普通函数也可以放协程函数。
+    """
+
+    def __init__(self, config: Config, tool_workers: int = 8, **kwargs):
+        """
+        Args:
+            config: 配置对象
+            tool_workers: 运行同步工具的线程池大小
+            kwargs: 传给 RedNoteGenerator 的其他参数，如 response_cache
+        """
+        self.tool_executor = ThreadPoolExecutor(max_workers=tool_workers, thread_name_prefix="rednote-tool")
+        super().__init__(config, **kwargs)
+        self.available_tools["search_web"] = self.search_web
+
+    def _init_client(self) -> AsyncOpenAI:
+        """初始化异步客户端（Ollama 连接测试见 test_connection）"""
+        timeout_settings = 60.0 if self.config.provider == "ollama" else 30.0
+        print(f"🔗 连接到 {self.config.provider.upper()}: {self.config.base_url}")
+        return AsyncOpenAI(
+            api_key=self.config.api_key,
+            base_url=self.config.base_url,
+            timeout=timeout_settings
+        )
+
+    async def test_connection(self) -> bool:
+        """发送一个简单请求测试服务是否可用"""
+        try:
+            await asyncio.to_thread(self._warm_up_models)
+            print(f"🧪 测试 {self.config.provider.upper()} 连接...")
+            response = await self.client.chat.completions.create(
+                model=self.config.model,
+                messages=[{"role": "user", "content": "你好，请回复'连接成功'"}],
+                max_tokens=50,
+                temperature=0.1
+            )
+            ok = bool(response.choices[0].message.content)
+            print("✅ 连接测试成功！" if ok else "⚠️ 连接测试返回空内容")
+            return ok
+        except Exception as e:
+            print(f"❌ 连接测试失败: {e}")
+            return False
+
+    def switch_model(self, model_name: str):
+        """切换 Ollama 模型（异步版本不做同步连接测试，可随后调用 test_connection）"""
+        if self.config.provider == "ollama":
+            print(f"🔄 Ollama 模型已切换: {self.config.model} → {model_name}")
+            self.config.ollama_model = model_name
+            self.config.model = model_name
+            self.system_prompt = self._get_system_prompt()
+            self.prefix = self._static_prefix()
+        else:
+            print("⚠️ 只有在使用 Ollama 时才能切换模型")
+
+    async def generate(self, product_name: str, style: str = None, target_audience: str = None,
+                       key_features: List[str] = None, use_cache: bool = True) -> Dict[str, Any]:
+        """生成小红书文案，参数与返回值同 RedNoteGenerator.generate"""
+        messages = self._start_generation(product_name, style, target_audience, key_features)
+
+        cache_key = None
+        if self.response_cache and use_cache:
+            cache_key = self._cache_key(product_name, style, target_audience, key_features)
+            cached = await asyncio.to_thread(self.response_cache.get, cache_key)
+            if cached:
+                print("🗄️ 命中响应缓存")
+                response = self._finish_generation(cached, product_name, style, target_audience, key_features,
+                                                   {"llm_calls": 0})
+                response["metadata"]["cached"] = True
+                return response
+
+        stats = {"llm_calls": 0}
+        result = await self._generation_loop(messages, stats)
+        if result and cache_key:
+            await asyncio.to_thread(self.response_cache.put, cache_key, result)
+        return self._finish_generation(result, product_name, style, target_audience, key_features, stats)
+
+    async def generate_batch(self, items: List[Dict[str, Any]], concurrency: int = None,
+                             on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+        """并发批量生成文案，参数与返回值同 RedNoteGenerator.generate_batch"""
+        concurrency = max(1, concurrency or self.config.batch_concurrency)
+        semaphore = asyncio.Semaphore(concurrency)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        print(f"\n📦 批量生成 {len(items)} 条文案，并发数: {concurrency}")
+        start_time = time.time()
+
+        async def run(index: int, item: Dict[str, Any]):
+            async with semaphore:
+                try:
+                    result = await self.generate(**item)
+                except Exception as e:
+                    result = {"success": False, "error": f"{type(e).__name__}: {e}"}
+            results[index] = result
+            if on_result:
+                on_result(index, result)
+
+        pinned = await asyncio.to_thread(self._pin_batch_models)
+        try:
+            await asyncio.gather(*(run(index, item) for index, item in enumerate(items)))
+        finally:
+            await asyncio.to_thread(self._release_batch_models, pinned)
+
+        success_count = sum(1 for result in results if result["success"])
+        print(f"🏁 批量生成完成: 成功 {success_count}/{len(items)}，耗时 {time.time() - start_time:.1f}s")
+        return results
+
+    async def _generation_loop(self, messages: List[Dict], stats: Optional[Dict[str, Any]] = None) -> Optional[Dict]:
+        """执行生成循环（ReAct模式），流程同 RedNoteGenerator._generation_loop"""
+        stats = stats if stats is not None else {}
+        stats.setdefault("llm_calls", 0)
+        stats.setdefault("parse_retries", 0)
+        memo = self._new_tool_memo()
+        iteration_count = 0
+
+        while iteration_count < self.config.max_iterations:
+            iteration_count += 1
+            print(f"\n--- 第 {iteration_count} 轮推理 ---")
+            record = start_iteration(stats, iteration_count)
+
+            try:
+                request_kwargs = self._build_request_kwargs(messages)
+                stats["llm_calls"] += 1
+                async with self._scheduled_async(request_kwargs, record):
+                    call_start = time.time()
+                    response = await self._chat_completion(record, **request_kwargs)
+                    response_message = response.choices[0].message
+                    usage = getattr(response, "usage", None)
+                    record_llm_call(stats, record, time.time() - call_start, usage)
+                    self._record_reasoning(stats, record, response_message, usage=usage)
+
+                if self._uses_tools() and response_message.tool_calls:
+                    record["outcome"] = "tool_calls"
+                    self._append_tool_call_message(messages, response_message)
+                    messages.extend(await self._execute_tool_calls(response_message.tool_calls, record["tools"], memo))
+
+                elif response_message.content:
+                    result = self._handle_content(messages, response_message.content, stats)
+                    if result:
+                        return result
+                    if record.get("decision") == "stop":
+                        return None
+
+                else:
+                    print("❓ 未知响应类型")
+                    record["outcome"] = "empty"
+                    break
+
+            except Exception as e:
+                self._report_api_error(e)
+                record["outcome"] = "error"
+                break
+
+        print(f"\n⚠️ 达到最大迭代次数 ({self.config.max_iterations})，生成失败")
+        return None
+
+    @asynccontextmanager
+    async def _scheduled_async(self, request_kwargs: Dict[str, Any], record: Dict[str, Any]):
+        """_scheduled 的协程版本，排队期间不阻塞事件循环"""
+        scheduler = self._ollama_scheduler()
+        if scheduler is None:
+            yield
+            return
+        kind, predicted = self._predict_output(scheduler, request_kwargs)
+        ticket = await scheduler.acquire_async(predicted)
+        try:
+            self._note_queue_wait(record, ticket, predicted)
+            yield
+        finally:
+            scheduler.release(ticket)
+        scheduler.predictor.observe(request_kwargs["model"], kind, self._observed_tokens(record))
+
+    async def _chat_completion(self, record: Optional[Dict[str, Any]] = None, **kwargs):
+        """发送一次对话请求，按当前服务商的速率限制排队，排队时间记入本轮的 rate_limit_seconds"""
+        limiter = self._rate_limiter()
+        estimated_tokens = self._estimate_request_tokens(kwargs)
+        waited = await limiter.acquire_async(estimated_tokens)
+        note_rate_limit_wait(record, waited)
+
+        response = await self.client.chat.completions.create(**kwargs)
+        self._settle_usage(limiter, getattr(response, "usage", None), estimated_tokens)
+        return response
+
+    async def _execute_tool_calls(self, tool_calls, timings: Optional[List[Dict]] = None,
+                                  memo: Optional[ToolMemo] = None) -> List[Dict]:
+        """并发执行同一轮的所有工具调用，结果顺序与 tool_calls 一致；timings 记录每个工具的耗时"""
+        start_time = time.time()
+        tool_outputs = await asyncio.gather(*(self._execute_tool_call(tool_call, timings, memo)
+                                              for tool_call in tool_calls))
+        if len(tool_calls) > 1:
+            print(f"⚡ 并发执行 {len(tool_calls)} 个工具，耗时 {time.time() - start_time:.2f}s")
+        return list(tool_outputs)
+
+    async def _execute_tool_call(self, tool_call, timings: Optional[List[Dict]] = None,
+                                 memo: Optional[ToolMemo] = None) -> Dict:
+        """
+        执行单个工具调用：协程工具直接 await，同步工具放到线程池，超过声明的超时返回降级结果
+
+        memo 中已有的结果直接复用；同一轮并发的相同调用只执行一次，其余等待同一个任务
+        """
+        try:
+            function_name, function_args = self._parse_tool_call(tool_call)
+        except ValueError as e:
+            error_msg = f"工具参数解析错误: {e}"
+            print(f"❌ {error_msg}")
+            return self._tool_output(tool_call, error_msg)
+
+        if function_name not in self.tool_registry:
+            error_msg = f"未知工具: {function_name}"
+            print(f"❌ {error_msg}")
+            return self._tool_output(tool_call, error_msg)
+
+        cached = memo.lookup(function_name, function_args) if memo else None
+        if cached:
+            tool_result, saved_seconds, source = cached
+            print(f"♻️ 复用工具结果（{source}），省下 {saved_seconds:.2f}s")
+            record_tool(timings, function_name, 0.0, True, cached=source, saved_seconds=saved_seconds)
+            return self._tool_output(tool_call, tool_result)
+
+        task, owner = None, True
+        if memo and memo.cacheable(function_name):
+            key = memo_key(function_name, function_args)
+            task = memo.inflight.get(key)
+            owner = task is None
+            if owner:
+                task = asyncio.ensure_future(self._run_tool(function_name, function_args))
+                memo.inflight[key] = task
+                task.add_done_callback(lambda _: memo.inflight.pop(key, None))
+
+        tool_start = time.time()
+        try:
+            if task is None:
+                tool_result = await self._run_tool(function_name, function_args)
+            else:
+                tool_result = await asyncio.shield(task)
+            elapsed = time.time() - tool_start
+            if owner:
+                print(f"📤 工具结果: {tool_result}")
+                record_tool(timings, function_name, elapsed, True)
+                if memo:
+                    memo.store(function_name, function_args, str(tool_result), elapsed)
+            else:
+                print(f"♻️ 复用同一轮的工具调用: {function_name}")
+                record_tool(timings, function_name, 0.0, True, cached="generation", saved_seconds=elapsed)
+            return self._tool_output(tool_call, str(tool_result))
+        except ToolTimeout as e:
+            print(f"⏰ {e}，返回降级结果")
+            record_tool(timings, function_name, time.time() - tool_start, False, timed_out=True)
+            return self._tool_output(tool_call, e.degraded)
+        except Exception as e:
+            error_msg = f"工具执行错误: {e}"
+            print(f"❌ {error_msg}")
+            record_tool(timings, function_name, time.time() - tool_start, False)
+            return self._tool_output(tool_call, error_msg)
+
+    async def _run_tool(self, function_name: str, function_args: Dict[str, Any]):
+        """按注册表的声明执行工具，同步工具使用本实例的线程池"""
+        return await self.tool_registry.acall(function_name, function_args, self.tool_executor)
+
+    @staticmethod
+    async def search_web(query: str) -> str:
+        """搜索工具的协程版本，不占用线程池"""
+        print(f"🔍 [Tool] 搜索网页: {query}")
+        return await get_search_service().search(query)
+
+    async def aclose(self):
+        """关闭 HTTP 客户端和工具线程池"""
+        await self.client.close()
+        self.tool_executor.shutdown(wait=False)
+        self.tool_registry.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+
+async def main():
+    """异步批量生成示例"""
+    config = Config()
+    file_manager = FileManager(config)
+    products = [
+        {"product_name": "深海蓝藻保湿面膜", "style": "活泼甜美", "key_features": ["深层补水", "修护屏障"]},
+        {"product_name": "美白精华", "style": "知性温柔"},
+        {"product_name": "玻尿酸原液", "style": "专业科普"}
+    ]
+
+    async with AsyncRedNoteGenerator(config) as generator:
+        if config.provider == "ollama" and not await generator.test_connection():
+            return 1
+        results = await generator.generate_batch(products)
+
+    for result in results:
+        if result["success"]:
+            file_manager.save_to_markdown(result)
+    return 0 if any(result["success"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    exit(asyncio.run(main()))
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+小红书文案批量生成
+从 JSONL 读取产品列表（每行一个 generate 参数字典），并发生成文案，
+每完成一条立即追加写入结果 JSONL，中途中断也不会丢失已完成的结果。
+
+示例:
+    python batch_generate.py data/batch_products.jsonl --provider deepseek --concurrency 8 --rpm 60
+"""
+
+import argparse
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any
+
+from generation_trace import print_summary_table, write_trace
+from prompt_prefix import summarize_usage
+from rednote import Config, RedNoteGenerator, FileManager
+
+GENERATE_FIELDS = ("product_name", "style", "target_audience", "key_features")
+
+
+def load_items(path: str) -> List[Dict[str, Any]]:
+    """读取产品列表 JSONL，只保留 generate 接受的字段"""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                spec = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path} 第 {line_no} 行不是合法 JSON: {e}")
+            if not spec.get("product_name"):
+                raise ValueError(f"{path} 第 {line_no} 行缺少 product_name")
+            items.append({k: spec[k] for k in GENERATE_FIELDS if k in spec})
+    return items
+
+
+class ResultWriter:
+    """线程安全地逐条追加写入结果"""
+
+    def __init__(self, path: Path, items: List[Dict[str, Any]], file_manager: FileManager = None):
+        self.path = path
+        self.items = items
+        self.file_manager = file_manager
+        self.completed = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "w", encoding="utf-8")
+
+    def __call__(self, index: int, result: Dict[str, Any]):
+        record = {"index": index, "input": self.items[index], **result}
+        if self.file_manager and result.get("success"):
+            record["markdown_path"] = self.file_manager.save_to_markdown(result, index)
+
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self.completed += 1
+            status = "✅" if result.get("success") else "❌"
+            print(f"{status} [{self.completed}/{len(self.items)}] {self.items[index]['product_name']}")
+
+    def close(self):
+        self._file.close()
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="从 JSONL 产品列表并发批量生成小红书文案")
+    parser.add_argument("input", help="产品列表 JSONL，每行如 {\"product_name\": ..., \"style\": ...}")
+    parser.add_argument("--output", default=None, help="结果 JSONL 路径，默认 output/<日期>/batch_<时间>.jsonl")
+    parser.add_argument("--provider", choices=["deepseek", "ollama"], default=None, help="服务提供商")
+    parser.add_argument("--model", default=None, help="Ollama 模型名称")
+    parser.add_argument("--concurrency", type=int, default=None, help="最大并发数")
+    parser.add_argument("--rpm", type=int, default=None, help="每分钟最大请求数")
+    parser.add_argument("--tpm", type=int, default=None, help="每分钟最大 token 数")
+    parser.add_argument("--structured", action="store_true", help="使用结构化输出（response_format）")
+    parser.add_argument("--cache-dir", default=None, help="响应缓存目录，多个批量任务可共享")
+    parser.add_argument("--cache-variations", type=int, default=None, help="每个请求缓存的样本数")
+    parser.add_argument("--cache-ttl-hours", type=float, default=None, help="缓存过期时间（小时）")
+    parser.add_argument("--save-markdown", action="store_true", help="同时将成功的文案保存为 Markdown")
+    parser.add_argument("--trace", default=None, help="每篇文案逐轮统计的 JSONL 路径，默认与结果同名的 .trace.jsonl")
+    args = parser.parse_args()
+
+    try:
+        items = load_items(args.input)
+    except (OSError, ValueError) as e:
+        print(f"❌ 读取产品列表失败: {e}")
+        return 1
+
+    if not items:
+        print("⚠️ 产品列表为空")
+        return 0
+
+    try:
+        config = Config(provider=args.provider, ollama_model=args.model)
+        if args.rpm is not None:
+            config.requests_per_minute = args.rpm
+        if args.tpm is not None:
+            config.tokens_per_minute = args.tpm
+        if args.structured:
+            config.structured_output = True
+        if args.cache_dir:
+            config.cache_dir = args.cache_dir
+        if args.cache_variations:
+            config.cache_variations = args.cache_variations
+        if args.cache_ttl_hours:
+            config.cache_ttl_hours = args.cache_ttl_hours
+        generator = RedNoteGenerator(config)
+    except Exception as e:
+        print(f"❌ 初始化生成器失败: {e}")
+        return 1
+
+    output_path = Path(args.output) if args.output else config.daily_dir / f"batch_{datetime.now().strftime('%H%M%S')}.jsonl"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    writer = ResultWriter(output_path, items, FileManager(config) if args.save_markdown else None)
+
+    try:
+        results = generator.generate_batch(items, concurrency=args.concurrency, on_result=writer)
+    except KeyboardInterrupt:
+        print(f"\n⏸️ 已中断，已完成 {writer.completed} 条，结果见: {output_path}")
+        return 130
+    finally:
+        writer.close()
+
+    if generator.response_cache:
+        stats = generator.response_cache.stats()
+        print(f"🗄️ 缓存命中 {stats['hits']}/{stats['hits'] + stats['misses']}")
+
+    print_summary_table(items, results)
+    usage = summarize_usage(results)
+    if usage["cache_reported"]:
+        print(f"♻️ 前缀缓存命中 {usage['cached_tokens']}/{usage['prompt_tokens']} 输入 tokens（{usage['cache_hit_rate']:.0%}）")
+
+    trace_path = Path(args.trace) if args.trace else output_path.with_suffix(".trace.jsonl")
+    write_trace(trace_path, items, results)
+
+    failed = [items[i]["product_name"] for i, result in enumerate(results) if not result["success"]]
+    print(f"📄 结果已保存: {output_path}")
+    print(f"🧾 逐轮统计: {trace_path}")
+    if failed:
+        print(f"⚠️ 失败 {len(failed)} 条: {', '.join(failed)}")
+    return 0 if len(failed) < len(items) else 1
+
+
+if __name__ == "__main__":
+    exit(main())
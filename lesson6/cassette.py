@@ -0,0 +1,396 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+LLM 与工具调用的录制/回放
+录制时把每次 chat.completions.create 的请求摘要、响应（流式则为逐块增量和时间偏移）和耗时，
+以及每次工具调用的参数、结果和耗时写入 cassette 文件（JSONL，路径以 .gz 结尾时压缩）。
+回放时按请求内容的哈希取出录制的响应，工具直接返回录制的结果，
+输入完全相同，可以用来回归测试 JSON 提取，或单独测量生成循环本身的客户端开销。
+
+回放速度: fast 不等待；original 按录制时的耗时（流式按每块的时间偏移）等待。
+匹配方式: 默认按请求哈希严格匹配；strict=False 时找不到就按录制顺序取下一条，
+改了提示词或循环逻辑后仍可回放同一批响应。
+
+目前只支持同步的 RedNoteGenerator。
+
+示例:
+    with use_cassette(generator, "cassettes/masks.jsonl.gz", mode="record"):
+        generator.generate("深海蓝藻保湿面膜", use_cache=False)
+
+命令行:
+    python cassette.py record products.jsonl cassettes/run.jsonl.gz --provider deepseek
+    python cassette.py replay cassettes/run.jsonl.gz --repeat 5
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Any, Iterator
+
+from tool_memo import memo_key
+
+SAMPLING_KEYS = ("model", "messages", "tools", "tool_choice", "temperature", "top_p", "max_tokens",
+                 "response_format", "stream")
+
+
+class CassetteMiss(LookupError):
+    """回放时找不到对应的录制记录"""
+
+
+class _Record(SimpleNamespace):
+    """回放出来的响应对象：录制时省略的 None 字段读取时返回 None"""
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return None
+
+
+def to_data(obj: Any) -> Any:
+    """把 SDK 对象 / SimpleNamespace 转为可序列化的数据，省略 None 字段"""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(exclude_none=True)
+    if isinstance(obj, SimpleNamespace):
+        obj = vars(obj)
+    if isinstance(obj, dict):
+        return {key: to_data(value) for key, value in obj.items() if value is not None}
+    if isinstance(obj, (list, tuple)):
+        return [to_data(item) for item in obj]
+    return obj
+
+
+def to_record(data: Any) -> Any:
+    """把录制的数据还原为可按属性访问的对象"""
+    if isinstance(data, dict):
+        return _Record(**{key: to_record(value) for key, value in data.items()})
+    if isinstance(data, list):
+        return [to_record(item) for item in data]
+    return data
+
+
+def request_key(kwargs: Dict[str, Any]) -> str:
+    """请求哈希：模型、消息、工具和采样参数"""
+    payload = {key: to_data(kwargs[key]) for key in SAMPLING_KEYS if key in kwargs}
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:24]
+
+
+def _summary(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    messages = kwargs.get("messages") or []
+    last = to_data(messages[-1]) if messages else {}
+    return {"model": kwargs.get("model"), "messages": len(messages),
+            "last": f"{last.get('role')}: {str(last.get('content') or '')[:60]}"}
+
+
+class Cassette:
+    """一组录制记录，线程安全"""
+
+    def __init__(self, path: Path, meta: Optional[Dict[str, Any]] = None):
+        self.path = Path(path)
+        self.meta: Dict[str, Any] = meta or {}
+        self.interactions: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._used: List[bool] = []
+        self._by_key: Dict[str, deque] = {}
+
+    @classmethod
+    def load(cls, path: Path) -> "Cassette":
+        path = Path(path)
+        opener = gzip.open if path.suffix == ".gz" else open
+        cassette = cls(path)
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record["kind"] == "meta":
+                    cassette.meta = record["meta"]
+                else:
+                    cassette._append(record)
+        return cassette
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        opener = gzip.open if self.path.suffix == ".gz" else open
+        with opener(self.path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"kind": "meta", "meta": self.meta}, ensure_ascii=False, separators=(",", ":")) + "\n")
+            for record in self.interactions:
+                f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def _append(self, record: Dict[str, Any]):
+        self._by_key.setdefault((record["kind"], record["key"]), deque()).append(len(self.interactions))
+        self.interactions.append(record)
+        self._used.append(False)
+
+    def add(self, record: Dict[str, Any]):
+        with self._lock:
+            self._append(record)
+
+    def take(self, kind: str, key: str, strict: bool = True) -> Dict[str, Any]:
+        """取出下一条匹配的记录；strict=False 时找不到则取录制顺序中下一条未用过的同类记录"""
+        with self._lock:
+            queue = self._by_key.get((kind, key), deque())
+            while queue:
+                index = queue.popleft()
+                if not self._used[index]:
+                    self._used[index] = True
+                    return self.interactions[index]
+            if not strict:
+                for index, record in enumerate(self.interactions):
+                    if not self._used[index] and record["kind"] == kind:
+                        self._used[index] = True
+                        return record
+        raise CassetteMiss(f"cassette 中没有匹配的 {kind} 记录: {key}")
+
+    def rewind(self):
+        """所有记录恢复为未使用，可再次回放"""
+        with self._lock:
+            self._used = [False] * len(self.interactions)
+            self._by_key = {}
+            for index, record in enumerate(self.interactions):
+                self._by_key.setdefault((record["kind"], record["key"]), deque()).append(index)
+
+
+# ======== LLM 客户端 ========
+
+class _RecordingStream:
+    """包装流式响应：逐块转发并记录，迭代结束或 close 时写入 cassette"""
+
+    def __init__(self, stream, on_done):
+        self._stream = stream
+        self._on_done = on_done
+        self._start = time.time()
+        self._chunks: List[Dict[str, Any]] = []
+        self._done = False
+
+    def __iter__(self) -> Iterator:
+        for chunk in self._stream:
+            self._chunks.append({"t": round(time.time() - self._start, 4), "chunk": to_data(chunk)})
+            yield chunk
+        self._finish()
+
+    def _finish(self):
+        if not self._done:
+            self._done = True
+            self._on_done(self._chunks, time.time() - self._start)
+
+    def close(self):
+        if hasattr(self._stream, "close"):
+            self._stream.close()
+        self._finish()
+
+
+class _ReplayStream:
+    def __init__(self, chunks: List[Dict[str, Any]], realtime: bool):
+        self._chunks = chunks
+        self._realtime = realtime
+
+    def __iter__(self) -> Iterator:
+        start = time.time()
+        for item in self._chunks:
+            if self._realtime:
+                time.sleep(max(0.0, item["t"] - (time.time() - start)))
+            yield to_record(item["chunk"])
+
+    def close(self):
+        pass
+
+
+class _Completions:
+    def __init__(self, create):
+        self.create = create
+
+
+class RecordingClient:
+    """包装 OpenAI 客户端，把每次对话请求和响应录入 cassette"""
+
+    def __init__(self, client, cassette: Cassette):
+        self.inner = client
+        self.cassette = cassette
+        self.chat = SimpleNamespace(completions=_Completions(self._create))
+
+    def __getattr__(self, name: str):
+        return getattr(self.inner, name)
+
+    def _create(self, **kwargs):
+        key = request_key(kwargs)
+        start = time.time()
+        response = self.inner.chat.completions.create(**kwargs)
+        if kwargs.get("stream"):
+            def on_done(chunks, seconds):
+                self.cassette.add({"kind": "llm", "key": key, "request": _summary(kwargs),
+                                   "seconds": round(seconds, 4), "chunks": chunks})
+            return _RecordingStream(response, on_done)
+
+        data = to_data(response)
+        compact = {"choices": [{key_: choice.get(key_) for key_ in ("message", "finish_reason") if key_ in choice}
+                               for choice in data.get("choices", [])]}
+        if data.get("usage"):
+            compact["usage"] = data["usage"]
+        self.cassette.add({"kind": "llm", "key": key, "request": _summary(kwargs),
+                           "seconds": round(time.time() - start, 4), "response": compact})
+        return response
+
+
+class ReplayClient:
+    """按请求哈希回放录制的响应，不访问网络"""
+
+    def __init__(self, cassette: Cassette, timing: str = "fast", strict: bool = True):
+        if timing not in ("fast", "original"):
+            raise ValueError(f"不支持的回放速度: {timing}")
+        self.cassette = cassette
+        self.realtime = timing == "original"
+        self.strict = strict
+        self.chat = SimpleNamespace(completions=_Completions(self._create))
+
+    def _create(self, **kwargs):
+        record = self.cassette.take("llm", request_key(kwargs), self.strict)
+        if "chunks" in record:
+            return _ReplayStream(record["chunks"], self.realtime)
+        if self.realtime:
+            time.sleep(record["seconds"])
+        return to_record(record["response"])
+
+    def close(self):
+        pass
+
+
+# ======== 工具 ========
+
+def recording_tool(name: str, function, cassette: Cassette):
+    """包装工具实现，记录参数、结果（或错误）和耗时"""
+    def tool(**kwargs):
+        start = time.time()
+        record = {"kind": "tool", "key": memo_key(name, kwargs), "name": name, "args": kwargs}
+        try:
+            result = function(**kwargs)
+        except Exception as e:
+            cassette.add({**record, "error": f"{type(e).__name__}: {e}", "seconds": round(time.time() - start, 4)})
+            raise
+        cassette.add({**record, "result": to_data(result), "seconds": round(time.time() - start, 4)})
+        return result
+    return tool
+
+
+def replay_tool(name: str, cassette: Cassette, timing: str = "fast", strict: bool = True):
+    """返回录制结果的工具实现，录制时出错的调用再次抛出"""
+    def tool(**kwargs):
+        record = cassette.take("tool", memo_key(name, kwargs), strict)
+        if timing == "original":
+            time.sleep(record["seconds"])
+        if "error" in record:
+            raise RuntimeError(record["error"])
+        return record["result"]
+    return tool
+
+
+@contextmanager
+def use_cassette(generator, path: Path, mode: str = "replay", timing: str = "fast", strict: bool = True,
+                 meta: Optional[Dict[str, Any]] = None):
+    """
+    在 with 块内录制或回放生成器的 LLM 和工具调用
+
+    Args:
+        generator: RedNoteGenerator
+        path: cassette 文件路径
+        mode: record（退出时写入文件）/ replay
+        timing: 回放速度 fast / original
+        strict: 回放时是否严格按请求哈希匹配
+        meta: 录制时写入文件头的附加信息（如产品列表）
+
+    Yields:
+        Cassette 对象
+    """
+    if mode not in ("record", "replay"):
+        raise ValueError(f"不支持的模式: {mode}")
+    original_client = generator.client
+    original_tools = dict(generator.tool_registry.items())
+    if mode == "record":
+        cassette = Cassette(path, {"provider": generator.config.provider, "model": generator.config.model,
+                                   "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"), **(meta or {})})
+        generator.client = RecordingClient(original_client, cassette)
+        generator.available_tools = {name: recording_tool(name, function, cassette)
+                                     for name, function in original_tools.items()}
+    else:
+        cassette = Cassette.load(path)
+        generator.client = ReplayClient(cassette, timing, strict)
+        generator.available_tools = {name: replay_tool(name, cassette, timing, strict) for name in original_tools}
+    try:
+        yield cassette
+    finally:
+        generator.client = original_client
+        generator.available_tools = original_tools
+        if mode == "record":
+            cassette.save()
+
+
+# ======== 命令行 ========
+
+def _replay_generator(meta: Dict[str, Any]):
+    """按 cassette 记录的服务和模型创建生成器，不需要真实密钥或运行中的 Ollama"""
+    from client_pool import mark_connection_verified
+    from rednote import Config, RedNoteGenerator
+
+    os.environ.setdefault("DEEPSEEK_API_KEY", "replay")
+    config = Config(provider=meta["provider"], ollama_model=meta["model"] if meta["provider"] == "ollama" else None)
+    mark_connection_verified(config.base_url, config.model)
+    return RedNoteGenerator(config, response_cache=None)
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="录制/回放 LLM 与工具调用")
+    sub = parser.add_subparsers(dest="command", required=True)
+    record = sub.add_parser("record", help="真实调用并录制")
+    record.add_argument("input", help="产品列表 JSONL（格式同 batch_generate）")
+    record.add_argument("cassette", help="输出的 cassette 路径，以 .gz 结尾时压缩")
+    record.add_argument("--provider", choices=["deepseek", "ollama"], default=None, help="服务提供商")
+    record.add_argument("--model", default=None, help="Ollama 模型名称")
+    replay = sub.add_parser("replay", help="回放并核对结果")
+    replay.add_argument("cassette", help="cassette 路径")
+    replay.add_argument("--timing", choices=["fast", "original"], default="fast", help="回放速度")
+    replay.add_argument("--loose", action="store_true", help="找不到匹配时按录制顺序回放")
+    replay.add_argument("--repeat", type=int, default=1, help="重复回放次数（测量循环开销）")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        from batch_generate import load_items
+        from rednote import Config, RedNoteGenerator
+
+        items = load_items(args.input)
+        generator = RedNoteGenerator(Config(provider=args.provider, ollama_model=args.model))
+        with use_cassette(generator, args.cassette, mode="record", meta={"items": items}) as cassette:
+            results = [generator.generate(**item, use_cache=False) for item in items]
+            cassette.meta["results"] = [result.get("content") for result in results]
+        print(f"📼 已录制 {len(cassette.interactions)} 条记录: {args.cassette}")
+        return 0
+
+    meta = Cassette.load(args.cassette).meta
+    generator = _replay_generator(meta)
+    items, expected = meta.get("items", []), meta.get("results", [])
+    durations = []
+    mismatches = 0
+    for _ in range(args.repeat):
+        with use_cassette(generator, args.cassette, timing=args.timing, strict=not args.loose):
+            start = time.perf_counter()
+            results = [generator.generate(**item, use_cache=False) for item in items]
+            durations.append(time.perf_counter() - start)
+        mismatches = sum(1 for result, content in zip(results, expected) if result.get("content") != content)
+
+    best = min(durations)
+    print(f"\n📼 回放 {len(items)} 篇 × {args.repeat} 次（{args.timing}）")
+    print(f"⏱️ 最快一次 {best:.3f}s，每篇 {best / max(len(items), 1) * 1000:.1f}ms")
+    print("✅ 结果与录制一致" if not mismatches else f"❌ {mismatches} 篇结果与录制不一致")
+    return 0 if not mismatches else 1
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+进程级 HTTP 客户端复用
+按 (base_url, api_key) 复用 OpenAI 客户端及其底层 httpx 连接池（keep-alive，安装了 h2 时启用 HTTP/2），
+同一端点的所有生成器共享连接数上限；Ollama 的 /api/tags 健康检查和连接测试结果也按端点缓存，
+重复创建 Config / RedNoteGenerator 时不再重复探测。
+
+连接池参数可通过环境变量调整：HTTP_MAX_CONNECTIONS、HTTP_MAX_KEEPALIVE、HTTP_KEEPALIVE_EXPIRY、
+OLLAMA_PROBE_TTL（健康检查缓存秒数）。
+"""
+
+import hashlib
+import importlib.util
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import httpx
+import requests
+from openai import OpenAI, DefaultHttpxClient
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_clients: Dict[Tuple[str, str], OpenAI] = {}
+_probes: Dict[str, Tuple[float, requests.Response]] = {}
+_verified: Dict[Tuple[str, str], float] = {}
+_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+    )
+
+
+def _probe_ttl() -> float:
+    return float(os.getenv("OLLAMA_PROBE_TTL", "300"))
+
+
+def _client_key(base_url: str, api_key: str) -> Tuple[str, str]:
+    # 不在内存中以明文作为键保存 api_key
+    return base_url.rstrip("/"), hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+
+
+def get_openai_client(base_url: str, api_key: str, timeout: float = 30.0) -> OpenAI:
+    """
+    获取共享的 OpenAI 客户端
+
+    同一 (base_url, api_key) 只创建一个底层连接池；不同 timeout 通过 with_options 派生，
+    派生出的客户端与原客户端共用连接。
+    """
+    key = _client_key(base_url, api_key)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            http_client = DefaultHttpxClient(limits=_pool_limits(), http2=HTTP2_AVAILABLE)
+            client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+            _clients[key] = client
+    return client.with_options(timeout=timeout)
+
+
+def get_session() -> requests.Session:
+    """共享的 requests 会话，用于 Ollama 原生 API（保持连接）"""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+        return _session
+
+
+def probe_ollama_tags(tags_url: str, timeout: float = 10, refresh: bool = False) -> requests.Response:
+    """
+    请求 Ollama /api/tags，成功的响应在 OLLAMA_PROBE_TTL 秒内复用
+
+    连接失败等异常照常抛出，由调用方处理。
+    """
+    now = time.time()
+    with _lock:
+        cached = _probes.get(tags_url)
+    if cached and not refresh and now - cached[0] < _probe_ttl():
+        return cached[1]
+
+    response = get_session().get(tags_url, timeout=timeout)
+    if response.status_code == 200:
+        with _lock:
+            _probes[tags_url] = (now, response)
+    return response
+
+
+def is_connection_verified(base_url: str, model: str) -> bool:
+    """该端点上的模型是否在缓存期内已通过连接测试"""
+    with _lock:
+        verified_at = _verified.get((base_url.rstrip("/"), model))
+    return verified_at is not None and time.time() - verified_at < _probe_ttl()
+
+
+def mark_connection_verified(base_url: str, model: str):
+    """记录连接测试通过"""
+    with _lock:
+        _verified[(base_url.rstrip("/"), model)] = time.time()
+
+
+def reset():
+    """关闭并清空所有共享客户端和探测缓存"""
+    global _session
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        _probes.clear()
+        _verified.clear()
+        if _session is not None:
+            _session.close()
+            _session = None
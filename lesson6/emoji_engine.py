@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+表情推荐引擎
+词表 data/emoji_lexicon.json 中每个类别有一组关键词和带权重的表情。
+启动时把全部关键词编译成一个 Aho-Corasick 自动机（补全为确定性转移表），
+推荐时对文本只扫描一遍：按命中次数和位置（越靠前权重越高）给类别打分，
+再从得分最高的几个类别中按“类别得分 × 表情权重”不放回加权抽样。
+同一个 seed 下结果确定，便于复现和测试。
+
+命令行:
+    python emoji_engine.py "熬夜急救的补水面膜，第二天上妆不卡粉"
+    python emoji_engine.py --benchmark
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_LEXICON = Path(__file__).parent / "data" / "emoji_lexicon.json"
+
+POSITION_BONUS = 1.0        # 文本开头的命中比结尾多算的权重
+TOP_CATEGORIES = 3          # 参与抽样的类别数
+SEGMENT_CACHE_SIZE = 8192   # 片段 -> 命中结果的缓存上限
+
+
+class KeywordAutomaton:
+    """Aho-Corasick 多模式匹配，转移表预先补全，扫描时不需要回溯失败指针"""
+
+    def __init__(self, keywords: List[str]):
+        self.keywords = keywords
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[int]] = [[]]
+        for keyword_id, keyword in enumerate(keywords):
+            state = 0
+            for ch in keyword:
+                if ch not in goto[state]:
+                    goto.append({})
+                    outputs.append([])
+                    goto[state][ch] = len(goto) - 1
+                state = goto[state][ch]
+            outputs[state].append(keyword_id)
+
+        # 按广度优先计算失败指针，同时把转移补全为确定性自动机
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [{} for _ in goto[1:]]
+        queue = list(goto[0].values())
+        for state in queue:
+            delta[state] = dict(delta[fail[state]])
+            for ch, target in goto[state].items():
+                delta[state][ch] = target
+                fail[target] = delta[fail[state]].get(ch, 0) if state else 0
+                outputs[target] = outputs[target] + outputs[fail[target]]
+                queue.append(target)
+        self._delta = delta
+        self._outputs = outputs
+
+        # 不在任何关键词中的字符会让自动机回到初始状态：只需扫描由关键词字符组成、
+        # 且不短于最短关键词的片段，其余文本交给正则在 C 层跳过
+        alphabet = sorted({ch for keyword in keywords for ch in keyword})
+        min_length = min((len(keyword) for keyword in keywords), default=1)
+        self._segments = re.compile(
+            "[" + "".join(re.escape(ch) for ch in alphabet) + "]{%d,}" % min_length) if alphabet else None
+        # 自然文本中同样的片段反复出现，缓存每个片段的扫描结果
+        self._segment_cache: Dict[str, List[Tuple[int, int]]] = {}
+
+    def _run(self, segment: str) -> List[Tuple[int, int]]:
+        """在一个片段上运行自动机，返回 (片段内结束位置, 关键词序号)"""
+        delta, outputs = self._delta, self._outputs
+        hits = []
+        state = 0
+        for end, ch in enumerate(segment):
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                hits.extend((end, keyword_id) for keyword_id in outputs[state])
+        return hits
+
+    def segments(self, text: str):
+        """可能包含关键词的片段（re.Match 迭代器）"""
+        return self._segments.finditer(text) if self._segments is not None else iter(())
+
+    def scan(self, text: str) -> List[Tuple[int, int]]:
+        """返回所有命中的 (结束位置, 关键词序号)，重叠的关键词都会报告"""
+        matches = []
+        cache = self._segment_cache
+        for segment in self.segments(text):
+            word = segment.group()
+            hits = cache.get(word)
+            if hits is None:
+                hits = self._run(word)
+                if len(cache) < SEGMENT_CACHE_SIZE:
+                    cache[word] = hits
+            if hits:
+                start = segment.start()
+                matches.extend((start + end, keyword_id) for end, keyword_id in hits)
+        return matches
+
+
+class EmojiRecommender:
+    """按关键词类别推荐表情"""
+
+    def __init__(self, path: Path = DEFAULT_LEXICON, seed: Optional[int] = None):
+        with open(path, "r", encoding="utf-8") as f:
+            lexicon = json.load(f)
+        self.categories: Dict[str, Dict[str, float]] = {
+            name: category["emojis"] for name, category in lexicon["categories"].items()
+        }
+        self.default: Dict[str, float] = lexicon["default"]
+
+        # 同一个关键词可以属于多个类别
+        keyword_categories: Dict[str, List[str]] = {}
+        for name, category in lexicon["categories"].items():
+            for keyword in category["keywords"]:
+                keyword_categories.setdefault(keyword.lower(), []).append(name)
+        keywords = list(keyword_categories)
+        self._keyword_categories = [keyword_categories[keyword] for keyword in keywords]
+        self.automaton = KeywordAutomaton(keywords)
+        self.rng = random.Random(seed)
+        # 片段 -> [(类别, 命中次数, 片段内结束位置之和)]，位置加权是线性的，可按片段汇总后缓存
+        self._segment_totals: Dict[str, List[Tuple[str, int, int]]] = {}
+
+    def _totals(self, segment: str) -> List[Tuple[str, int, int]]:
+        totals: Dict[str, List[int]] = {}
+        for end, keyword_id in self.automaton.scan(segment):
+            for name in self._keyword_categories[keyword_id]:
+                total = totals.setdefault(name, [0, 0])
+                total[0] += 1
+                total[1] += end
+        return [(name, count, end_sum) for name, (count, end_sum) in totals.items()]
+
+    def score(self, context: str) -> Dict[str, float]:
+        """
+        一次扫描得到各类别得分：每次命中记 1 分，越靠前额外加分（最多 POSITION_BONUS）
+
+        命中在位置 p 的权重为 1 + B·(1 - p/L)，一个片段的贡献只取决于命中次数和位置之和，
+        所以对每个片段缓存汇总结果，扫描时每个片段只做一次查表。
+        """
+        text = context.lower()
+        length = max(len(text), 1)
+        scale = POSITION_BONUS / length
+        scores: Dict[str, float] = {}
+        segments = self.automaton.segments(text)
+        cache = self._segment_totals
+        for segment in segments:
+            word = segment.group()
+            totals = cache.get(word)
+            if totals is None:
+                totals = self._totals(word)
+                if len(cache) < SEGMENT_CACHE_SIZE:
+                    cache[word] = totals
+            if totals:
+                start = segment.start()
+                for name, count, end_sum in totals:
+                    weight = count * (1.0 + POSITION_BONUS) - scale * (count * start + end_sum)
+                    scores[name] = scores.get(name, 0.0) + weight
+        return scores
+
+    def suggest(self, context: str, k: int = 4, seed: Optional[int] = None) -> List[str]:
+        """推荐 k 个不重复的表情；seed 为 None 时使用实例的随机数生成器"""
+        rng = random.Random(seed) if seed is not None else self.rng
+        scores = self.score(context)
+        top = sorted(scores.items(), key=lambda item: -item[1])[:TOP_CATEGORIES]
+
+        candidates: Dict[str, float] = {}
+        for name, category_score in top:
+            for emoji, weight in self.categories[name].items():
+                candidates[emoji] = candidates.get(emoji, 0.0) + category_score * weight
+        picked = _weighted_sample(candidates, k, rng)
+        if len(picked) < k:
+            rest = {emoji: weight for emoji, weight in self.default.items() if emoji not in picked}
+            picked += _weighted_sample(rest, k - len(picked), rng)
+        return picked
+
+
+def _weighted_sample(weights: Dict[str, float], k: int, rng: random.Random) -> List[str]:
+    """按权重不放回抽样（Efraimidis-Spirakis：键为 u^(1/w)，取最大的 k 个）"""
+    keyed = [(rng.random() ** (1.0 / weight), emoji) for emoji, weight in weights.items() if weight > 0]
+    keyed.sort(reverse=True)
+    return [emoji for _, emoji in keyed[:k]]
+
+
+_recommender: Optional[EmojiRecommender] = None
+_recommender_lock = threading.Lock()
+
+
+def get_emoji_recommender() -> EmojiRecommender:
+    """进程内共享的推荐器，EMOJI_SEED 环境变量可固定随机种子"""
+    global _recommender
+    with _recommender_lock:
+        if _recommender is None:
+            seed = os.getenv("EMOJI_SEED")
+            _recommender = EmojiRecommender(seed=int(seed) if seed else None)
+        return _recommender
+
+
+# ======== 基准对比 ========
+
+LEGACY_MAPPING = {
+    "补水|保湿|水润": ["💦", "💧", "🌊", "✨", "💎"],
+    "美白|提亮|亮白": ["✨", "🌟", "💫", "🤍", "☀️"],
+    "惊喜|爱了|哇塞": ["💖", "😍", "🤩", "💯", "🔥"],
+    "熬夜|疲惫|急救": ["😭", "😮‍💨", "😴", "💡", "🆘"],
+    "推荐|好物|种草": ["✅", "👍", "⭐", "🛍️", "💝"],
+    "修复|舒缓|温和": ["🌿", "🍃", "💚", "🤲", "💆‍♀️"]
+}
+
+
+def legacy_generate_emoji(context: str) -> List[str]:
+    """旧版 generate_emoji 的匹配逻辑（去掉 sleep），仅用于基准对比"""
+    for pattern, emojis in LEGACY_MAPPING.items():
+        if any(keyword in context for keyword in pattern.split("|")):
+            return random.sample(emojis, min(4, len(emojis)))
+    return random.sample(["✨", "🔥", "💖", "💯", "🎉", "👍", "🤩"], 4)
+
+
+def sample_body(repeat: int = 8) -> str:
+    """基准用的长正文（约 150 × repeat 字）"""
+    paragraph = ("姐妹们！最近挖到一款宝藏面膜，熬夜加班后脸又干又暗沉，敷完第二天上妆完全不卡粉，"
+                 "水光感绝了～成分很温和，敏感肌也能用，屏障修复效果肉眼可见。搭配防晒一起用，"
+                 "通勤妆也更服帖。已经回购三盒，真心推荐给干皮和熬夜党！")
+    return paragraph * repeat
+
+
+def naive_scores(recommender: EmojiRecommender, context: str) -> Dict[str, float]:
+    """逐个关键词 count 的朴素打分（同样使用完整词表，不含位置加权），仅用于基准对比"""
+    text = context.lower()
+    scores: Dict[str, float] = {}
+    for keyword, names in zip(recommender.automaton.keywords, recommender._keyword_categories):
+        hits = text.count(keyword)
+        for name in names if hits else ():
+            scores[name] = scores.get(name, 0.0) + hits
+    return scores
+
+
+def run_benchmark(repeat: int = 2000, body_repeat: int = 8) -> List[Dict[str, float]]:
+    """
+    对比长正文上的单次耗时（微秒）：
+    legacy-loop 为旧实现（6 类 18 个关键词，命中第一类即返回），
+    naive-count 与 aho-corasick 使用同一份完整词表
+    """
+    body = sample_body(body_repeat)
+    recommender = EmojiRecommender(seed=0)
+    report = []
+    for name, func in (("legacy-loop", legacy_generate_emoji),
+                       ("naive-count", lambda text: naive_scores(recommender, text)),
+                       ("aho-corasick", recommender.score),
+                       ("ac+sampling", recommender.suggest)):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func(body)
+        report.append({"impl": name, "chars": len(body), "us_per_call": round((time.perf_counter() - start) / repeat * 1e6, 1)})
+    return report
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="表情推荐引擎")
+    parser.add_argument("context", nargs="?", default=None, help="文案内容")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    parser.add_argument("--benchmark", action="store_true", help="运行基准对比")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for row in run_benchmark():
+            print(f"{row['impl']:<14} {row['chars']} 字  {row['us_per_call']}µs/次")
+        return 0
+    if not args.context:
+        parser.print_help()
+        return 1
+
+    recommender = EmojiRecommender(seed=args.seed)
+    scores = recommender.score(args.context)
+    print("📊 类别得分: " + "，".join(f"{name} {score:.2f}" for name, score in sorted(scores.items(), key=lambda x: -x[1])))
+    print("😊 推荐表情: " + " ".join(recommender.suggest(args.context)))
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
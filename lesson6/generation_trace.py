@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+生成过程统计
+记录每一轮推理的 LLM 耗时、token 数（含前缀缓存命中）、工具耗时和结果，
+汇总为每篇文案的统计并写入结果元数据；批量生成时输出汇总表和 JSONL 轨迹。
+
+统计字段（generate 返回值的 metadata，失败时在返回值顶层）:
+    iteration_count   推理轮数
+    llm_calls         LLM 调用次数（命中响应缓存时为 0）
+    parse_retries     JSON 解析失败后追加引导重试的次数
+    llm_seconds       LLM 调用总耗时（不含速率限制排队和 Ollama 调度排队）
+    rate_limit_seconds 请求在速率限制器中排队的总时间（见 rate_limiter）
+    queue_seconds     Ollama 请求在客户端调度器中等待槽位的总时间（见 ollama_scheduler）
+    tool_seconds      工具执行总耗时（异步版本中并发工具按各自耗时累加）
+    tool_cache_hits   复用已有工具结果的次数（见 tool_memo）
+    tool_seconds_saved 复用结果省下的工具耗时（按原调用耗时计）
+    tool_timeouts     超时后返回降级结果的工具次数（见 tool_registry）
+    prompt_tokens / completion_tokens / cached_tokens
+    reasoning_tokens / answer_tokens  输出中推理（<think>）与回答各占的 token 数（见 reasoning_trace）
+    iterations        每轮明细: iteration, outcome, llm_seconds, *_tokens, tools[{name, seconds, ok}]
+                      解析失败的轮次另有 failure / decision（见 iteration_policy）
+                      Ollama 请求另有 queue_seconds / predicted_tokens，被限速的请求另有 rate_limit_seconds
+                      每轮另有 reasoning_tokens / answer_tokens
+                      复用的工具另有 cached（generation/shared）/ saved_seconds，超时的工具另有 timed_out
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Any
+
+from prompt_prefix import add_usage, usage_counts
+
+SUMMARY_FIELDS = ("iteration_count", "llm_calls", "parse_retries", "llm_seconds", "tool_seconds",
+                  "prompt_tokens", "completion_tokens", "cached_tokens", "tool_cache_hits", "tool_seconds_saved",
+                  "tool_timeouts", "queue_seconds", "reasoning_tokens", "answer_tokens", "rate_limit_seconds")
+
+
+def start_iteration(stats: Dict[str, Any], number: int) -> Dict[str, Any]:
+    """新增一轮的记录并返回"""
+    record = {
+        "iteration": number,
+        "outcome": None,
+        "llm_seconds": None,
+        "prompt_tokens": None,
+        "completion_tokens": None,
+        "cached_tokens": None,
+        "tools": []
+    }
+    stats.setdefault("iterations", []).append(record)
+    return record
+
+
+def note_rate_limit_wait(record: Optional[Dict[str, Any]], waited: float):
+    """记录本轮在速率限制器中的排队时间，record 为 None 时只打印"""
+    if waited > 0.5:
+        print(f"⏳ 速率限制，等待 {waited:.1f}s")
+    if record is not None and waited > 0:
+        record["rate_limit_seconds"] = round(record.get("rate_limit_seconds", 0) + waited, 3)
+
+
+def record_llm_call(stats: Dict[str, Any], record: Dict[str, Any], seconds: float, usage=None):
+    """记录本轮 LLM 调用的耗时（扣除速率限制排队）和 token 数，并累加到整篇统计"""
+    record["llm_seconds"] = round(max(seconds - record.get("rate_limit_seconds", 0), 0), 3)
+    record.update(usage_counts(usage))
+    add_usage(stats, usage)
+
+
+def record_tool(timings: Optional[List[Dict[str, Any]]], name: str, seconds: float, ok: bool,
+                cached: Optional[str] = None, saved_seconds: float = 0.0, timed_out: bool = False):
+    """
+    记录一次工具执行，timings 为 None 时不记录
+    cached 为复用结果的来源，saved_seconds 为省下的耗时；timed_out 表示超时后返回了降级结果
+    """
+    if timings is None:
+        return
+    timing = {"name": name, "seconds": round(seconds, 3), "ok": ok}
+    if cached:
+        timing.update(cached=cached, saved_seconds=round(saved_seconds, 3))
+    if timed_out:
+        timing["timed_out"] = True
+    timings.append(timing)
+
+
+def finish_stats(stats: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """根据每轮明细计算总轮数和总耗时"""
+    stats = dict(stats or {})
+    iterations = stats.get("iterations", [])
+    stats["iteration_count"] = len(iterations)
+    stats["llm_seconds"] = round(sum(record["llm_seconds"] or 0 for record in iterations), 3)
+    stats["queue_seconds"] = round(sum(record.get("queue_seconds") or 0 for record in iterations), 3)
+    stats["rate_limit_seconds"] = round(sum(record.get("rate_limit_seconds") or 0 for record in iterations), 3)
+    for field in ("reasoning_tokens", "answer_tokens"):
+        stats[field] = sum(record.get(field) or 0 for record in iterations)
+    tools = [tool for record in iterations for tool in record["tools"]]
+    stats["tool_seconds"] = round(sum(tool["seconds"] for tool in tools), 3)
+    stats["tool_cache_hits"] = sum(1 for tool in tools if tool.get("cached"))
+    stats["tool_seconds_saved"] = round(sum(tool.get("saved_seconds", 0) for tool in tools), 3)
+    stats["tool_timeouts"] = sum(1 for tool in tools if tool.get("timed_out"))
+    return stats
+
+
+def _stats_of(result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """成功结果的统计在 metadata 中，失败结果在顶层"""
+    if not result:
+        return {}
+    return result.get("metadata", result)
+
+
+def summarize_batch(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总一批结果：各统计字段的总和与每篇平均值"""
+    totals = {field: 0 for field in SUMMARY_FIELDS}
+    for result in results:
+        stats = _stats_of(result)
+        for field in SUMMARY_FIELDS:
+            totals[field] += stats.get(field) or 0
+    count = len(results) or 1
+    return {
+        "notes": len(results),
+        "successes": sum(1 for result in results if result and result.get("success")),
+        "totals": {field: round(value, 3) for field, value in totals.items()},
+        "averages": {field: round(value / count, 3) for field, value in totals.items()}
+    }
+
+
+def print_summary_table(items: List[Dict[str, Any]], results: List[Dict[str, Any]]):
+    """打印每篇文案的成本明细和合计"""
+    header = f"{'产品':<16}{'状态':>4}{'轮数':>6}{'调用':>6}{'重试':>6}{'LLM(s)':>9}{'工具(s)':>9}{'输入':>8}{'输出':>8}{'缓存':>8}"
+    print("\n" + header)
+    for item, result in zip(items, results):
+        stats = _stats_of(result)
+        status = "✅" if result and result.get("success") else "❌"
+        row = {field: stats.get(field) or 0 for field in SUMMARY_FIELDS}
+        print(f"{item['product_name'][:14]:<16}{status:>4}{row['iteration_count']:>6}{row['llm_calls']:>6}"
+              f"{row['parse_retries']:>6}{row['llm_seconds']:>9.2f}{row['tool_seconds']:>9.2f}"
+              f"{row['prompt_tokens']:>8}{row['completion_tokens']:>8}{row['cached_tokens']:>8}")
+
+    summary = summarize_batch(results)
+    totals, averages = summary["totals"], summary["averages"]
+    print(f"{'合计':<16}{summary['successes']:>4}{totals['iteration_count']:>6}{totals['llm_calls']:>6}"
+          f"{totals['parse_retries']:>6}{totals['llm_seconds']:>9.2f}{totals['tool_seconds']:>9.2f}"
+          f"{totals['prompt_tokens']:>8}{totals['completion_tokens']:>8}{totals['cached_tokens']:>8}")
+    print(f"📊 平均每篇: {averages['llm_calls']} 次调用，{averages['prompt_tokens'] + averages['completion_tokens']:.0f} tokens，"
+          f"LLM {averages['llm_seconds']:.2f}s，工具 {averages['tool_seconds']:.2f}s")
+    if totals["tool_cache_hits"]:
+        print(f"♻️ 工具结果复用 {totals['tool_cache_hits']} 次，省下 {totals['tool_seconds_saved']:.2f}s")
+    if totals["reasoning_tokens"]:
+        share = totals["reasoning_tokens"] / ((totals["reasoning_tokens"] + totals["answer_tokens"]) or 1)
+        print(f"🧠 推理 {totals['reasoning_tokens']} tokens，回答 {totals['answer_tokens']} tokens（推理占 {share:.0%}）")
+    if totals["queue_seconds"]:
+        print(f"🚦 Ollama 调度排队共 {totals['queue_seconds']:.2f}s，平均每篇 {averages['queue_seconds']:.2f}s")
+    if totals["rate_limit_seconds"]:
+        print(f"⏳ 速率限制排队共 {totals['rate_limit_seconds']:.2f}s（未计入 LLM 耗时）")
+    if totals["tool_timeouts"]:
+        print(f"⏰ 工具超时 {totals['tool_timeouts']} 次，已返回降级结果")
+
+
+def write_trace(path: Path, items: List[Dict[str, Any]], results: List[Dict[str, Any]]):
+    """每篇文案一行：汇总字段 + 每轮明细"""
+    with open(path, "w", encoding="utf-8") as f:
+        for index, (item, result) in enumerate(zip(items, results)):
+            stats = _stats_of(result)
+            line = {
+                "index": index,
+                "product_name": item["product_name"],
+                "success": bool(result and result.get("success")),
+                "cached": bool(stats.get("cached")),
+                **{field: stats.get(field) for field in SUMMARY_FIELDS},
+                "iterations": stats.get("iterations", [])
+            }
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+自适应迭代策略
+JSON 解析失败时不再固定追加同一段引导、一直重试到 max_iterations，而是每轮按失败类型决定：
+- repair: 只差 hashtags/emojis 或字段类型不对，能从已有内容本地补全，不再调用模型
+- retry:  追加针对该失败类型的简短提示（并去掉回显中的 <think> 推理）再试一轮
+- stop:   没有剩余轮次、token 预算不够下一轮、同类失败已重试过，
+          或该模型对这类失败的重试成功率一直很低时提前结束
+
+命令行在同一批产品上对比固定引导与自适应策略的平均耗时、调用次数和成功率:
+    python iteration_policy.py data/batch_products.jsonl --provider ollama --limit 5
+"""
+
+import argparse
+import re
+import threading
+from typing import Dict, List, Optional, Any, Tuple
+
+from json_extractor import REQUIRED_KEYS, THINK_CLOSE, THINK_OPEN, extract_json
+from mode_comparison import compare_modes, print_report
+from rate_limiter import estimate_message_tokens
+
+MAX_SAME_FAILURE_RETRIES = 1  # 同一类失败在一篇文案中最多重试的次数
+MIN_SAMPLES = 5               # 模型成功率至少积累多少次重试后才参与决策
+MIN_RETRY_SUCCESS_RATE = 0.2  # 低于此成功率的失败类型不再重试
+
+JSON_SHAPE = '{"title": "...", "body": "...", "hashtags": ["#...", ...], "emojis": ["✨", ...]}'
+
+FAILURE_PROMPTS = {
+    "think_only": "请不要再分析，直接输出最终 JSON：" + JSON_SHAPE,
+    "truncated": "上次输出被截断了。请只输出完整 JSON，正文控制在 300 字以内，不要输出分析过程。",
+    "missing_keys": "JSON 缺少字段：{missing}。请只输出补全后的完整 JSON。",
+    "invalid_json": "JSON 格式有误，请只输出修正后的完整 JSON，不要附加说明。",
+    "no_json": "请只输出 JSON，不要附加说明，格式为：" + JSON_SHAPE
+}
+
+_EMOJI = re.compile("[\U0001F300-\U0001FAFF\u2600-\u27bf\u2b50\u2b55]")
+_HASHTAG = re.compile(r"#[^\s#，。,.!！?？\"\]]+")
+
+
+class Decision:
+    """一次解析失败后的处理决定"""
+
+    def __init__(self, action: str, failure: str, reason: str = "",
+                 prompt: Optional[str] = None, result: Optional[Dict[str, Any]] = None):
+        self.action = action    # repair / retry / stop
+        self.failure = failure  # 失败类型，见 classify_failure
+        self.reason = reason
+        self.prompt = prompt
+        self.result = result
+
+    def apply(self, messages: List[Dict], content: str):
+        """retry 时把本轮回答（去掉推理）和提示追加到对话历史"""
+        answer = strip_reasoning(content)
+        if answer:
+            messages.append({"role": "assistant", "content": answer})
+        messages.append({"role": "user", "content": self.prompt})
+
+
+def strip_reasoning(content: str) -> str:
+    """去掉 <think> 推理部分，只保留回答"""
+    close = content.rfind(THINK_CLOSE)
+    if close != -1:
+        return content[close + len(THINK_CLOSE):].strip()
+    if THINK_OPEN in content:
+        return ""  # 推理未结束，没有回答
+    return content.strip()
+
+
+def classify_failure(content: str) -> Tuple[str, Optional[Dict[str, Any]], List[str]]:
+    """
+    判断解析失败的类型
+
+    Returns:
+        (失败类型, 部分对象, 缺少的字段)，失败类型为 think_only / truncated / missing_keys /
+        bad_types / invalid_json / no_json 之一
+    """
+    answer = strip_reasoning(content)
+    if not answer:
+        return "think_only", None, list(REQUIRED_KEYS)
+
+    if answer.count("{") > answer.count("}"):
+        return "truncated", None, list(REQUIRED_KEYS)  # 截断的正文不完整，不做本地修复
+
+    partial = extract_json(answer, ("title",)) or extract_json(answer, ("body",))
+    if partial is not None:
+        missing = [key for key in REQUIRED_KEYS if key not in partial]
+        return ("missing_keys" if missing else "bad_types"), partial, missing
+    if "{" in answer:
+        return "invalid_json", None, list(REQUIRED_KEYS)
+    return "no_json", None, list(REQUIRED_KEYS)
+
+
+def _as_list(value: Any) -> Optional[List[str]]:
+    """字段应为列表时，把 "#a #b" / "a,b" 这样的字符串拆开"""
+    if isinstance(value, list):
+        return [str(item) for item in value]
+    if isinstance(value, str) and value.strip():
+        return [item for item in re.split(r"[\s,，、]+", value.strip()) if item]
+    return None
+
+
+def repair_locally(partial: Optional[Dict[str, Any]], missing: List[str]) -> Optional[Dict[str, Any]]:
+    """标题和正文齐全时，从正文中补出 hashtags/emojis 或修正字段类型，无法补全返回 None"""
+    if not partial or not all(isinstance(partial.get(key), str) and partial[key] for key in ("title", "body")):
+        return None
+    repaired = dict(partial)
+    text = f"{partial['title']} {partial['body']}"
+    for key in ("hashtags", "emojis"):
+        value = _as_list(repaired.get(key)) if key not in missing else None
+        if not value:
+            pattern = _HASHTAG if key == "hashtags" else _EMOJI
+            value = list(dict.fromkeys(pattern.findall(text)))
+        if not value:
+            return None
+        repaired[key] = value
+    return repaired
+
+
+def legacy_guidance(provider: str, model: str) -> str:
+    """原先固定追加的引导语，关闭自适应策略时使用"""
+    if provider == "deepseek" or (provider == "ollama" and "deepseek-r1" in model):
+        # 支持多轮推理的模型，提供更详细的引导
+        if "deepseek-r1" in model:
+            return """让我重新分析和生成文案。请按照以下步骤：
+
+1. 分析产品的核心卖点和目标用户
+2. 构思吸引人的标题和生动的内容描述
+3. 选择合适的标签和表情符号
+
+最终请以标准JSON格式输出：
+```json
+{
+  "title": "标题（包含表情符号）",
+  "body": "正文内容（真实体验分享）",
+  "hashtags": ["#标签1", "#标签2", "#标签3", "#标签4", "#标签5"],
+  "emojis": ["✨", "🔥", "💖", "💧"]
+}
+```"""
+        return "请重新分析产品特点，生成更高质量的小红书文案，确保以完整的JSON格式输出。"
+    # 普通 Ollama 模型，简单重新生成
+    return "请确保以完整的JSON格式输出文案，格式为：```json\n{\"title\": \"...\", \"body\": \"...\", \"hashtags\": [...], \"emojis\": [...]}\n```"
+
+
+class ModelStats:
+    """某个模型各类失败的重试次数和成功次数（进程内共享）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, List[int]] = {}
+
+    def record(self, failure: str, success: bool):
+        with self._lock:
+            counts = self._counts.setdefault(failure, [0, 0])
+            counts[0] += 1
+            counts[1] += 1 if success else 0
+
+    def success_rate(self, failure: str) -> Optional[float]:
+        """样本不足 MIN_SAMPLES 时返回 None"""
+        with self._lock:
+            attempts, successes = self._counts.get(failure, (0, 0))
+        return successes / attempts if attempts >= MIN_SAMPLES else None
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {failure: {"retries": a, "successes": s} for failure, (a, s) in self._counts.items()}
+
+
+_model_stats: Dict[tuple, ModelStats] = {}
+_model_stats_lock = threading.Lock()
+
+
+def get_model_stats(provider: str, model: str) -> ModelStats:
+    """获取（或创建）某个模型共享的重试统计"""
+    with _model_stats_lock:
+        return _model_stats.setdefault((provider, model), ModelStats())
+
+
+def reset():
+    """清空所有模型的重试统计（主要用于测试）"""
+    with _model_stats_lock:
+        _model_stats.clear()
+
+
+class IterationPolicy:
+    """按失败类型、剩余轮次/token 预算和模型历史成功率决定下一步"""
+
+    def __init__(self, config):
+        self.config = config
+
+    @property
+    def model_stats(self) -> ModelStats:
+        return get_model_stats(self.config.provider, self.config.model)
+
+    def settle(self, stats: Dict[str, Any], success: bool):
+        """本轮内容解析完毕：若上一次解析失败后选择了重试，记录这次重试是否成功"""
+        for record in reversed(stats.get("iterations", [])[:-1]):
+            if "decision" in record:
+                if record["decision"] == "retry" and "retry_succeeded" not in record:
+                    record["retry_succeeded"] = success
+                    self.model_stats.record(record["failure"], success)
+                return
+
+    def decide(self, content: str, messages: List[Dict], stats: Dict[str, Any]) -> Decision:
+        """解析失败后决定本地修复、重试还是停止"""
+        failure, partial, missing = classify_failure(content)
+        iterations = stats.get("iterations", [])
+        iteration = iterations[-1]["iteration"] if iterations else 1
+
+        if not getattr(self.config, "adaptive_iterations", True):
+            if iteration >= self.config.max_iterations:
+                return Decision("stop", failure, "已达到最大迭代次数")
+            return Decision("retry", failure, "固定引导", legacy_guidance(self.config.provider, self.config.model))
+
+        repaired = repair_locally(partial, missing)
+        if repaired is not None:
+            return Decision("repair", failure, "从标题和正文本地补全", result=repaired)
+
+        if iteration >= self.config.max_iterations:
+            return Decision("stop", failure, "已达到最大迭代次数")
+
+        same_failures = sum(1 for record in iterations[:-1] if record.get("failure") == failure)
+        if same_failures >= MAX_SAME_FAILURE_RETRIES:
+            return Decision("stop", failure, "同类失败已重试过，重试大概率无效")
+
+        rate = self.model_stats.success_rate(failure)
+        if rate is not None and rate < MIN_RETRY_SUCCESS_RATE:
+            return Decision("stop", failure, f"该模型此类失败的重试成功率仅 {rate:.0%}")
+
+        prompt = FAILURE_PROMPTS.get(failure, FAILURE_PROMPTS["invalid_json"]).replace("{missing}", "、".join(missing))
+        budget = getattr(self.config, "token_budget", None)
+        if budget:
+            used = (stats.get("prompt_tokens") or 0) + (stats.get("completion_tokens") or 0)
+            if not used:
+                used = estimate_message_tokens(messages) + estimate_message_tokens([{"content": content}])
+            last = iterations[-1] if iterations else {}
+            next_cost = (last.get("prompt_tokens") or estimate_message_tokens(messages)) \
+                + (last.get("completion_tokens") or estimate_message_tokens([{"content": content}])) \
+                + estimate_message_tokens([{"content": prompt}])
+            if used + next_cost > budget:
+                return Decision("stop", failure, f"token 预算不足（已用 {used}，下一轮约 {next_cost}）")
+
+        return Decision("retry", failure, "追加针对性提示", prompt)
+
+
+def compare(generator, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """分别用固定引导和自适应策略生成同一批文案，统计平均耗时、调用次数和成功率"""
+    return compare_modes(generator, items, "adaptive_iterations", ("fixed", "adaptive"))
+
+
+def main():
+    """命令行入口"""
+    from batch_generate import load_items
+    from rednote import Config, RedNoteGenerator
+
+    parser = argparse.ArgumentParser(description="对比固定引导与自适应迭代策略")
+    parser.add_argument("input", help="产品列表 JSONL")
+    parser.add_argument("--provider", choices=["deepseek", "ollama"], default=None, help="服务提供商")
+    parser.add_argument("--model", default=None, help="Ollama 模型名称")
+    parser.add_argument("--limit", type=int, default=5, help="最多使用的产品数")
+    args = parser.parse_args()
+
+    try:
+        items = load_items(args.input)[:args.limit]
+        generator = RedNoteGenerator(Config(provider=args.provider, ollama_model=args.model))
+    except Exception as e:
+        print(f"❌ 初始化失败: {e}")
+        return 1
+
+    if not items:
+        print("⚠️ 产品列表为空")
+        return 0
+
+    print_report(compare(generator, items))
+    print(f"\n📈 重试统计: {generator.iteration_policy.model_stats.snapshot()}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
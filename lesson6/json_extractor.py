@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+单遍 JSON 提取
+对模型输出只做一次线性扫描：跳过 <think> 推理块，按括号深度和字符串状态跟踪对象，
+对象闭合时若其顶层键包含全部必需字段才尝试解析；解析失败时修复常见问题
+（尾随逗号、中文弯引号作为 JSON 引号、字符串内未转义的换行）后再试。
+输出被截断时会尝试补全未闭合的括号。
+
+命令行在语料和病态输入上对比旧的正则级联与单遍扫描的成功率和耗时:
+    python json_extractor.py --corpus data/json_corpus.jsonl --repeat 200
+"""
+
+import argparse
+import json
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+REQUIRED_KEYS = ("title", "body", "hashtags", "emojis")
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+SMART_OPEN = "\u201c"   # “
+SMART_CLOSE = "\u201d"  # ”
+CLOSERS = {"{": "}", "[": "]"}
+
+
+def _answer_start(text: str) -> int:
+    """R1 的模板有时省略 <think>，只输出 </think>：此时跳过其之前的全部内容"""
+    close = text.find(THINK_CLOSE)
+    if close == -1:
+        return 0
+    open_ = text.find(THINK_OPEN)
+    if open_ == -1 or open_ > close:
+        return close + len(THINK_CLOSE)
+    return 0
+
+
+def repair_json(candidate: str, smart_quotes: Tuple[int, ...] = ()) -> str:
+    """
+    字符串感知的修复：去掉尾随逗号、把作为 JSON 引号的弯引号换成直引号、转义字符串内的换行
+
+    Args:
+        candidate: 对象文本
+        smart_quotes: 扫描时确定的、充当 JSON 引号的弯引号在 candidate 中的位置
+    """
+    smart = set(smart_quotes)
+    out: List[str] = []
+    in_string = False
+    smart_string = False
+    escape = False
+    i = 0
+    n = len(candidate)
+    while i < n:
+        ch = candidate[i]
+        if i in smart:
+            out.append('"')
+            in_string = not in_string
+            smart_string = in_string
+        elif in_string:
+            if escape:
+                escape = False
+                out.append(ch)
+            elif ch == "\\":
+                escape = True
+                out.append(ch)
+            elif ch == '"':
+                if smart_string:
+                    out.append('\\"')  # 弯引号字符串中的直引号需要转义
+                else:
+                    in_string = False
+                    out.append(ch)
+            elif ch == "\n":
+                out.append("\\n")
+            elif ch == "\r":
+                out.append("\\r")
+            elif ch == "\t":
+                out.append("\\t")
+            else:
+                out.append(ch)
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch == ",":
+            j = i + 1
+            while j < n and candidate[j] in " \t\r\n":
+                j += 1
+            if j < n and candidate[j] in "}]":
+                i = j  # 丢弃尾随逗号
+                continue
+            out.append(ch)
+        else:
+            out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def _loads(candidate: str, smart_quotes: Tuple[int, ...]) -> Optional[Any]:
+    try:
+        return json.loads(candidate, strict=False)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(repair_json(candidate, smart_quotes), strict=False)
+    except json.JSONDecodeError:
+        return None
+
+
+class _Frame:
+    """扫描栈中的一层对象/数组"""
+
+    __slots__ = ("char", "start", "keys", "smart", "expect_key")
+
+    def __init__(self, char: str, start: int):
+        self.char = char
+        self.start = start
+        self.keys = set()
+        self.smart: List[int] = []
+        self.expect_key = char == "{"
+
+
+# 各状态下需要关注的字符，其余字符用正则一次跳过
+_OUTSIDE = re.compile(r"[{<]")
+_INSIDE = re.compile(r'[{}\[\]",\u201c]')
+_IN_STRING = re.compile(r'["\\]')
+
+
+def extract_json(text: str, required_keys: Tuple[str, ...] = REQUIRED_KEYS) -> Optional[Dict[str, Any]]:
+    """
+    从模型输出中提取第一个包含全部必需字段的 JSON 对象
+
+    只有顶层键齐全的对象才会被解析，其余大括号（正文里的 {}、推理中的草稿）只参与深度跟踪，
+    因此整体耗时与输出长度成线性关系。
+    """
+    required = set(required_keys)
+    stack: List[_Frame] = []
+    in_string = False
+    string_quote = '"'
+    string_start = 0
+    pos = _answer_start(text)
+    n = len(text)
+
+    while pos < n:
+        if in_string:
+            if string_quote == SMART_OPEN:
+                end = text.find(SMART_CLOSE, pos)
+            else:
+                match = _IN_STRING.search(text, pos)
+                end = match.start() if match else -1
+                if end != -1 and text[end] == "\\":
+                    pos = end + 2  # 跳过转义字符
+                    continue
+            if end == -1:
+                pos = n
+                break
+            in_string = False
+            frame = stack[-1]
+            if string_quote == SMART_OPEN:
+                frame.smart.append(end)
+            if frame.expect_key:
+                frame.keys.add(text[string_start + 1:end])
+                frame.expect_key = False
+            pos = end + 1
+            continue
+
+        if not stack:
+            # 对象外：跳过推理块，寻找下一个 '{'
+            match = _OUTSIDE.search(text, pos)
+            if not match:
+                break
+            pos = match.start()
+            if text[pos] == "<":
+                close = text.find(THINK_CLOSE, pos) if text.startswith(THINK_OPEN, pos) else -1
+                pos = close + len(THINK_CLOSE) if close != -1 else pos + 1
+                continue
+            stack.append(_Frame("{", pos))
+            pos += 1
+            continue
+
+        match = _INSIDE.search(text, pos)
+        if not match:
+            pos = n
+            break
+        pos = match.start()
+        ch = text[pos]
+        frame = stack[-1]
+        if ch == '"' or ch == SMART_OPEN:
+            in_string = True
+            string_quote = ch
+            string_start = pos
+            if ch == SMART_OPEN:
+                frame.smart.append(pos)
+        elif ch in "{[":
+            stack.append(_Frame(ch, pos))
+        elif ch in "}]":
+            closed = stack.pop()
+            if stack:
+                stack[-1].smart.extend(closed.smart)  # 外层对象修复时也需要这些位置
+            if closed.char == "{" and required <= closed.keys:
+                result = _parse_candidate(text, closed, pos + 1, required)
+                if result is not None:
+                    return result
+        elif frame.char == "{":  # ','
+            frame.expect_key = True
+        pos += 1
+
+    # 输出被截断：尝试补全最外层未闭合的对象
+    for frame in stack:
+        if frame.char == "{" and required <= frame.keys:
+            smart = [p - frame.start for f in stack for p in f.smart if p >= frame.start]
+            tail = ""
+            if in_string:
+                tail = SMART_CLOSE if string_quote == SMART_OPEN else '"'
+                if string_quote == SMART_OPEN:
+                    smart.append(n - frame.start)
+            closers = "".join(CLOSERS[f.char] for f in reversed(stack[stack.index(frame):]))
+            candidate = text[frame.start:] + tail + closers
+            data = _loads(candidate, tuple(smart))
+            if isinstance(data, dict) and required <= data.keys():
+                return data
+            break
+    return None
+
+
+def _parse_candidate(text: str, frame: _Frame, end: int, required: set) -> Optional[Dict[str, Any]]:
+    smart = tuple(p - frame.start for p in frame.smart)
+    data = _loads(text[frame.start:end], smart)
+    if isinstance(data, dict) and required <= data.keys():
+        return data
+    return None
+
+
+# ======== 基准对比 ========
+
+def legacy_extract(content: str) -> Optional[Dict[str, Any]]:
+    """旧版 _extract_json_content 的正则级联 + _clean_json_content，仅用于基准对比"""
+    patterns = [
+        r"```json\s*(\{.*?\})\s*```",
+        r"```\s*(\{.*?\})\s*```",
+        r"(\{[^{}]*\"title\"[^{}]*\"body\"[^{}]*\"hashtags\"[^{}]*\"emojis\"[^{}]*\})",
+        r"(\{.*?\"title\".*?\})"
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, content, re.DOTALL | re.IGNORECASE)
+        if match:
+            try:
+                result = json.loads(match.group(1))
+                if all(key in result for key in REQUIRED_KEYS):
+                    return result
+            except json.JSONDecodeError:
+                continue
+
+    start_idx, end_idx = content.find("{"), content.rfind("}")
+    if start_idx == -1 or end_idx == -1 or start_idx >= end_idx:
+        return None
+    json_str = content[start_idx:end_idx + 1].strip()
+    for pattern, replacement in [(r'"\s*:\s*"([^"]*?)"\s*,?\s*\n', r'": "\1",\n'), (r',\s*}', r'}'), (r',\s*]', r']')]:
+        json_str = re.sub(pattern, replacement, json_str)
+    try:
+        result = json.loads(json_str)
+        if all(key in result for key in REQUIRED_KEYS):
+            return result
+    except json.JSONDecodeError:
+        pass
+    return None
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    """读取语料：每行 {name, text, expect_title}，expect_title 为 null 表示不应提取出结果"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run_benchmark(corpus: List[Dict[str, Any]], repeat: int = 100) -> List[Dict[str, Any]]:
+    """在语料上对比两种提取器的正确率和平均耗时"""
+    report = []
+    for name, extractor in (("regex-cascade", legacy_extract), ("single-pass", extract_json)):
+        correct = 0
+        failures = []
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for case in corpus:
+                extractor(case["text"])
+        elapsed = time.perf_counter() - start
+        for case in corpus:
+            result = extractor(case["text"])
+            got = result.get("title") if result else None
+            if got == case["expect_title"]:
+                correct += 1
+            else:
+                failures.append(case["name"])
+        report.append({
+            "extractor": name,
+            "accuracy": round(correct / len(corpus), 3),
+            "us_per_doc": round(elapsed / (repeat * len(corpus)) * 1e6, 1),
+            "failures": failures
+        })
+    return report
+
+
+def pathological_input(repeat: int = 200) -> str:
+    """反复出现未闭合的 {"title": …：旧正则会在每个 '{' 处回溯到文本末尾"""
+    return '{"title": "a", ' * repeat
+
+
+def time_worst_case(repeat: int = 200) -> List[Dict[str, Any]]:
+    """在病态输入上对比两种提取器的单次耗时"""
+    text = pathological_input(repeat)
+    report = []
+    for name, extractor in (("regex-cascade", legacy_extract), ("single-pass", extract_json)):
+        start = time.perf_counter()
+        extractor(text)
+        report.append({"extractor": name, "chars": len(text), "ms": round((time.perf_counter() - start) * 1000, 1)})
+    return report
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="对比 JSON 提取器的正确率与耗时")
+    parser.add_argument("--corpus", default="data/json_corpus.jsonl", help="语料 JSONL")
+    parser.add_argument("--repeat", type=int, default=100, help="计时重复次数")
+    parser.add_argument("--worst-case", type=int, default=200, help="病态输入的重复片段数，0 表示跳过")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    print(f"📚 语料: {len(corpus)} 条")
+    for row in run_benchmark(corpus, args.repeat):
+        print(f"{row['extractor']:<14} 正确率 {row['accuracy']:.0%}  平均 {row['us_per_doc']}µs/条")
+        if row["failures"]:
+            print(f"   ❌ 失败: {', '.join(row['failures'])}")
+
+    if args.worst_case:
+        print(f"\n🐢 病态输入（{args.worst_case} 个未闭合对象）:")
+        for row in time_worst_case(args.worst_case):
+            print(f"{row['extractor']:<14} {row['chars']} 字符  {row['ms']}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
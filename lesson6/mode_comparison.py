@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+生成模式对比
+把生成器配置中的某个开关分别关闭/开启，用同一批产品各生成一遍，
+统计平均每篇的 LLM 调用次数、成功率和耗时。structured_output 和 iteration_policy 的命令行都用它做对比。
+"""
+
+import time
+from typing import Dict, List, Any, Tuple
+
+
+def compare_modes(generator, items: List[Dict[str, Any]], attribute: str,
+                  labels: Tuple[str, str]) -> List[Dict[str, Any]]:
+    """
+    依次把 generator.config.<attribute> 设为 False / True 生成同一批文案，结束后恢复原值
+
+    Args:
+        attribute: 要切换的配置项，如 "structured_output"
+        labels: (关闭时的模式名, 开启时的模式名)
+    """
+    original = getattr(generator.config, attribute)
+    report = []
+    try:
+        for enabled in (False, True):
+            setattr(generator.config, attribute, enabled)
+            calls, successes, elapsed = [], 0, []
+            for item in items:
+                start = time.time()
+                result = generator.generate(**item, use_cache=False)
+                elapsed.append(time.time() - start)
+                calls.append(result.get("metadata", result).get("llm_calls", 0))
+                successes += 1 if result["success"] else 0
+            report.append({
+                "mode": labels[enabled],
+                "notes": len(items),
+                "avg_llm_calls": round(sum(calls) / len(items), 2),
+                "success_rate": round(successes / len(items), 3),
+                "avg_seconds": round(sum(elapsed) / len(items), 2)
+            })
+    finally:
+        setattr(generator.config, attribute, original)
+    return report
+
+
+def print_report(report: List[Dict[str, Any]]):
+    """打印对比结果"""
+    print(f"\n{'模式':<12}{'篇数':>6}{'平均调用':>10}{'成功率':>10}{'平均耗时(s)':>14}")
+    for row in report:
+        print(f"{row['mode']:<12}{row['notes']:>6}{row['avg_llm_calls']:>10}{row['success_rate']:>10}{row['avg_seconds']:>14}")
+    if len(report) == 2 and report[0]["avg_llm_calls"]:
+        reduction = 1 - report[1]["avg_llm_calls"] / report[0]["avg_llm_calls"]
+        print(f"\n📉 平均每篇 LLM 调用次数减少 {reduction:.0%}")
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Ollama 模型预热与常驻管理
+Ollama 在第一次请求时才把模型载入内存（deepseek-r1:8b 需要数秒到数十秒），
+空闲超过 keep_alive（默认 5 分钟）后又会卸载，批量生成中途就会出现随机的延迟尖峰。
+这里通过 Ollama 原生 API 管理模型的生命周期：
+- 预热：生成器初始化 / 切换模型时先发一个空 prompt 的 /api/generate 载入模型并记录加载耗时
+  （OLLAMA_PRELOAD_MODELS 可额外预热其他模型，逗号分隔；OLLAMA_PRELOAD=0 关闭预热和批量常驻）
+- 常驻：批量生成期间锁定所需模型，后台每 OLLAMA_PING_INTERVAL 秒发一次 keep-alive，
+  用有限的 OLLAMA_KEEP_ALIVE 而不是 -1，进程异常退出时模型也会按时卸载
+- 卸载：批量结束后卸载由批量锁定时载入的模型，释放内存（OLLAMA_UNLOAD_AFTER_BATCH=0 关闭）；
+  锁定前已驻留的模型（预热的、其他进程在用的）不会被卸载，之后的单篇生成不必重新载入。
+  模型名不带标签时按 :latest 比较
+同一端点的所有生成器共享一个管理器，锁定按模型计数，多个批量可以重叠。
+
+命令行:
+    python model_lifecycle.py --ps
+    python model_lifecycle.py --preload deepseek-r1:8b qwen2.5:7b
+    python model_lifecycle.py --unload deepseek-r1:8b
+"""
+
+import argparse
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any
+
+from client_pool import get_session
+
+DEFAULT_KEEP_ALIVE = "30m"       # 预热和锁定期间的 keep_alive
+DEFAULT_PING_INTERVAL = 60.0     # 锁定期间 keep-alive 的间隔（秒），需小于 keep_alive
+RELOAD_THRESHOLD_SECONDS = 0.5   # keep-alive 的加载耗时超过此值，说明模型已被卸载后重新载入
+
+_managers: Dict[str, "OllamaModelManager"] = {}
+_managers_lock = threading.Lock()
+
+
+def model_key(name: str) -> str:
+    """比较用的模型名：不带标签时补上 :latest（deepseek-r1 与 deepseek-r1:latest 是同一个模型）"""
+    return name if ":" in name else f"{name}:latest"
+
+
+def ollama_root_url(base_url: str) -> str:
+    """OpenAI 兼容地址（.../v1）对应的 Ollama 原生 API 地址"""
+    return base_url.rstrip("/").replace("/v1", "")
+
+
+class OllamaModelManager:
+    """一个 Ollama 端点上模型的预热、常驻和卸载"""
+
+    def __init__(self, root_url: str, keep_alive: str = DEFAULT_KEEP_ALIVE,
+                 ping_interval: float = DEFAULT_PING_INTERVAL, timeout: float = 300):
+        self.root_url = root_url.rstrip("/")
+        self.keep_alive = keep_alive
+        self.ping_interval = ping_interval
+        self.timeout = timeout
+        # 锁定计数、由本管理器载入的模型和统计都按 model_key() 归一后的模型名记录
+        self.stats: Dict[str, Dict[str, Any]] = {}
+        self._pins: Dict[str, int] = {}
+        self._managed: set = set()  # 由 pin 载入的模型，解除锁定后卸载；之前已驻留的模型不动
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pinger: Optional[threading.Thread] = None
+
+    def _model_stats(self, model: str) -> Dict[str, Any]:
+        return self.stats.setdefault(model_key(model), {"loads": 0, "load_seconds": [], "pings": 0, "reloads": 0,
+                                             "unloads": 0})
+
+    def _generate(self, model: str, keep_alive) -> Dict[str, Any]:
+        """不带 prompt 的 /api/generate：载入模型（或刷新 keep_alive），keep_alive=0 时卸载"""
+        response = get_session().post(f"{self.root_url}/api/generate",
+                                      json={"model": model, "keep_alive": keep_alive, "stream": False},
+                                      timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def loaded(self) -> List[Dict[str, Any]]:
+        """/api/ps：当前驻留在内存中的模型"""
+        response = get_session().get(f"{self.root_url}/api/ps", timeout=10)
+        response.raise_for_status()
+        return response.json().get("models", [])
+
+    def is_loaded(self, model: str) -> bool:
+        key = model_key(model)
+        return any(key in (model_key(entry.get("name") or ""), model_key(entry.get("model") or ""))
+                   for entry in self.loaded())
+
+    def _timed_load(self, model: str, keep_alive: Optional[str] = None) -> float:
+        """载入（或保活）模型，返回加载耗时（秒）：优先取 Ollama 返回的 load_duration，否则按请求耗时"""
+        start = time.time()
+        body = self._generate(model, keep_alive or self.keep_alive)
+        return body["load_duration"] / 1e9 if body.get("load_duration") is not None else time.time() - start
+
+    def load(self, model: str, keep_alive: Optional[str] = None) -> float:
+        """载入模型并记录加载耗时"""
+        seconds = self._timed_load(model, keep_alive)
+        with self._lock:
+            stats = self._model_stats(model)
+            stats["loads"] += 1
+            stats["load_seconds"].append(round(seconds, 3))
+        return seconds
+
+    def warm_up(self, models: List[str]) -> Dict[str, float]:
+        """
+        依次预热模型，失败的模型跳过，返回各模型的加载耗时；已驻留的模型只刷新 keep_alive，不计入载入次数。
+        预热的模型不记为由本管理器载入，批量结束后不会被卸载
+        """
+        load_times = {}
+        for model in models:
+            try:
+                if self.is_loaded(model):
+                    load_times[model] = self._timed_load(model)
+                    print(f"🔥 模型已驻留: {model}")
+                    continue
+                load_times[model] = self.load(model)
+                print(f"🔥 模型已预热: {model}（加载 {load_times[model]:.2f}s）")
+            except Exception as e:
+                print(f"⚠️ 模型预热失败 {model}: {e}")
+        return load_times
+
+    def unload(self, model: str):
+        """立即卸载模型"""
+        self._generate(model, 0)
+        with self._lock:
+            self._model_stats(model)["unloads"] += 1
+
+    def pin(self, models: List[str]):
+        """锁定模型：确保已载入，锁定期间定时 keep-alive"""
+        for model in models:
+            key = model_key(model)
+            with self._lock:
+                first = self._pins.get(key, 0) == 0
+                self._pins[key] = self._pins.get(key, 0) + 1
+            if not first:
+                continue
+            try:
+                if self.is_loaded(model):
+                    self._timed_load(model)  # 已驻留：只刷新 keep_alive，解除锁定后也不卸载
+                    continue
+                seconds = self.load(model)
+                with self._lock:
+                    self._managed.add(key)
+                print(f"📥 载入模型 {model}（{seconds:.2f}s）")
+            except Exception as e:
+                print(f"⚠️ 模型锁定失败 {model}: {e}")
+        self._start_pinger()
+
+    def release(self, models: List[str], unload: bool = True):
+        """解除锁定；没有其他锁定者时，卸载由 pin 载入的模型"""
+        for model in models:
+            key = model_key(model)
+            with self._lock:
+                self._pins[key] = self._pins.get(key, 1) - 1
+                idle = self._pins[key] <= 0
+                owned = idle and unload and key in self._managed
+                if idle:
+                    self._pins.pop(key)
+                if owned:
+                    self._managed.discard(key)
+            if owned:
+                try:
+                    self.unload(model)
+                    print(f"📤 已卸载模型 {model}，释放内存")
+                except Exception as e:
+                    print(f"⚠️ 模型卸载失败 {model}: {e}")
+
+    @contextmanager
+    def pinned(self, models: List[str], unload: bool = True):
+        self.pin(models)
+        try:
+            yield self
+        finally:
+            self.release(models, unload)
+
+    def _start_pinger(self):
+        with self._lock:
+            if self._pinger is not None:
+                return
+            self._stop.clear()
+            self._pinger = threading.Thread(target=self._ping_loop, name="ollama-keep-alive", daemon=True)
+            self._pinger.start()
+
+    def _ping_loop(self):
+        """锁定期间定时刷新 keep_alive，发现模型被卸载后重新载入时记为一次 reload"""
+        while not self._stop.wait(self.ping_interval):
+            with self._lock:
+                models = list(self._pins)
+                if not models:
+                    self._pinger = None
+                    return
+            for model in models:
+                try:
+                    seconds = self._timed_load(model)
+                except Exception as e:
+                    print(f"⚠️ keep-alive 失败 {model}: {e}")
+                    continue
+                with self._lock:
+                    stats = self._model_stats(model)
+                    stats["pings"] += 1
+                    if seconds > RELOAD_THRESHOLD_SECONDS:
+                        stats["reloads"] += 1
+                        stats["load_seconds"].append(round(seconds, 3))
+                if seconds > RELOAD_THRESHOLD_SECONDS:
+                    print(f"⚠️ 模型 {model} 曾被卸载，已重新载入（{seconds:.2f}s）")
+
+    def close(self):
+        """停止 keep-alive 线程（不卸载模型）"""
+        self._stop.set()
+        with self._lock:
+            pinger, self._pinger = self._pinger, None
+        if pinger:
+            pinger.join(timeout=5)
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """各模型的载入次数、加载耗时、keep-alive 次数和中途重新载入次数，模型名按 model_key() 归一"""
+        with self._lock:
+            return {model: {**stats, "load_seconds": list(stats["load_seconds"]), "pinned": self._pins.get(model, 0)}
+                    for model, stats in self.stats.items()}
+
+    def print_report(self):
+        print(f"\n{'模型':<24}{'载入':>6}{'加载(s)':>10}{'保活':>6}{'重载':>6}{'卸载':>6}")
+        for model, stats in self.report().items():
+            total = sum(stats["load_seconds"])
+            print(f"{model[:22]:<24}{stats['loads']:>6}{total:>10.2f}{stats['pings']:>6}{stats['reloads']:>6}"
+                  f"{stats['unloads']:>6}")
+
+
+def get_model_manager(base_url: str) -> OllamaModelManager:
+    """获取（或创建）某个 Ollama 端点共享的模型管理器，参数取自环境变量"""
+    root_url = ollama_root_url(base_url)
+    with _managers_lock:
+        manager = _managers.get(root_url)
+        if manager is None:
+            manager = OllamaModelManager(root_url, os.getenv("OLLAMA_KEEP_ALIVE", DEFAULT_KEEP_ALIVE),
+                                         float(os.getenv("OLLAMA_PING_INTERVAL", DEFAULT_PING_INTERVAL)))
+            _managers[root_url] = manager
+        return manager
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="Ollama 模型预热与卸载")
+    parser.add_argument("--base-url", default=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1"))
+    parser.add_argument("--preload", nargs="+", metavar="MODEL", help="预热模型")
+    parser.add_argument("--unload", nargs="+", metavar="MODEL", help="卸载模型")
+    parser.add_argument("--ps", action="store_true", help="列出驻留内存的模型")
+    args = parser.parse_args()
+
+    manager = get_model_manager(args.base_url)
+    if args.preload:
+        manager.warm_up(args.preload)
+    for model in args.unload or []:
+        manager.unload(model)
+        print(f"📤 已卸载模型 {model}")
+    if args.ps or not (args.preload or args.unload):
+        for entry in manager.loaded():
+            print(f"🧠 {entry.get('name')}  到期: {entry.get('expires_at', '-')}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Ollama 请求调度
+多个生成器同时请求同一个 ollama serve 时，请求在服务端排队，没有公平性可言：
+deepseek-r1 的长推理输出会长时间占住服务端的并行槽位，短请求被饿死。
+这里在客户端为每个 Ollama 端点维护一个调度器：
+- 同时发出的请求数不超过服务端的并行数（OLLAMA_MAX_IN_FLIGHT，默认取 OLLAMA_NUM_PARALLEL，再默认 1），
+  同一端点只有一个调度器，其他生成器配置了不同的并行数时原地调整上限
+- 有空槽时先放行预计最短的请求（SEJF）：预计输出来自同一模型、同类请求的历史输出 token 数，
+  不超过请求的 max_tokens，再加上按 PREFILL_WEIGHT 折算的提示词长度（长提示词的预填充也占槽位）
+- 排队越久优先级越高（每秒抵扣 AGING_TOKENS_PER_SECOND 个预计 token），长请求不会被无限推后
+排队等待时间单独记录为 queue_seconds，不计入 llm_seconds。
+
+命令行（模拟一个并行数为 1 的服务端，对比先到先服务与 SEJF 下短请求的等待）:
+    python ollama_scheduler.py --simulate
+"""
+
+import argparse
+import asyncio
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+AGING_TOKENS_PER_SECOND = 50.0  # 每排队 1 秒，预计长度抵扣的 token 数
+PRIOR_TOKENS = {"reasoning": 1500, "default": 500}  # 没有历史时的预计输出 token 数
+EWMA_ALPHA = 0.3
+PREFILL_WEIGHT = 0.1  # 预填充比逐个输出快一个数量级：每个提示词 token 折算的输出 token 数
+
+_schedulers: Dict[str, "OllamaScheduler"] = {}
+_schedulers_lock = threading.Lock()
+
+
+def request_kind(model: str, messages: List[Dict]) -> str:
+    """请求类别：首轮 / 后续轮（解析失败后的重试等），推理模型单独统计"""
+    turn = "followup" if any(message.get("role") == "assistant" for message in messages) else "first"
+    return f"{'reasoning' if 'r1' in model else 'default'}:{turn}"
+
+
+class OutputPredictor:
+    """按 (模型, 请求类别) 记录输出 token 数的指数平均，用于预测下一次的输出长度"""
+
+    def __init__(self):
+        self._ewma: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def predict(self, model: str, kind: str, max_tokens: Optional[int] = None, prompt_tokens: int = 0) -> int:
+        """预计占用槽位的长度（以输出 token 计）：历史输出不超过 max_tokens，加上提示词的预填充折算"""
+        with self._lock:
+            value = self._ewma.get((model, kind))
+        if value is None:
+            value = PRIOR_TOKENS[kind.split(":")[0]]
+        if max_tokens:
+            value = min(value, max_tokens)
+        return int(value + PREFILL_WEIGHT * prompt_tokens)
+
+    def observe(self, model: str, kind: str, tokens: Optional[int]):
+        if not tokens:
+            return
+        with self._lock:
+            previous = self._ewma.get((model, kind))
+            self._ewma[(model, kind)] = tokens if previous is None else EWMA_ALPHA * tokens + (1 - EWMA_ALPHA) * previous
+
+
+class Ticket:
+    """一个排队中的请求"""
+
+    def __init__(self, seq: int, predicted_tokens: int):
+        self.seq = seq
+        self.predicted_tokens = predicted_tokens
+        self.enqueued_at = time.monotonic()
+        self.granted_at: Optional[float] = None
+        self.event = threading.Event()
+        self.future: Optional[asyncio.Future] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def queue_seconds(self) -> float:
+        return (self.granted_at or time.monotonic()) - self.enqueued_at
+
+    def priority(self, now: float) -> Tuple[float, int]:
+        return self.predicted_tokens - AGING_TOKENS_PER_SECOND * (now - self.enqueued_at), self.seq
+
+
+class OllamaScheduler:
+    """限制同时在途的请求数，按预计输出长度（含排队老化）放行"""
+
+    def __init__(self, max_in_flight: int = 1, sejf: bool = True):
+        self.max_in_flight = max(1, max_in_flight)
+        self.sejf = sejf
+        self.predictor = OutputPredictor()
+        self._waiting: List[Ticket] = []
+        self._in_flight = 0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.stats = {"served": 0, "queued": 0, "queue_seconds": 0.0, "max_queue_seconds": 0.0, "peak_waiting": 0}
+
+    def _grant_locked(self):
+        """有空槽时放行优先级最高的请求（调用方需持有锁）"""
+        while self._waiting and self._in_flight < self.max_in_flight:
+            now = time.monotonic()
+            ticket = min(self._waiting, key=lambda t: t.priority(now)) if self.sejf else self._waiting[0]
+            self._waiting.remove(ticket)
+            self._in_flight += 1
+            ticket.granted_at = now
+            if ticket.future is not None:
+                ticket.loop.call_soon_threadsafe(_resolve, ticket.future)
+            else:
+                ticket.event.set()
+
+    def _enqueue(self, predicted_tokens: int) -> Ticket:
+        ticket = Ticket(next(self._seq), predicted_tokens)
+        with self._lock:
+            if self._in_flight < self.max_in_flight and not self._waiting:
+                self._in_flight += 1
+                ticket.granted_at = ticket.enqueued_at
+            else:
+                self._waiting.append(ticket)
+                self.stats["queued"] += 1
+                self.stats["peak_waiting"] = max(self.stats["peak_waiting"], len(self._waiting))
+        return ticket
+
+    def acquire(self, predicted_tokens: int) -> Ticket:
+        """阻塞直到获得槽位"""
+        ticket = self._enqueue(predicted_tokens)
+        if ticket.granted_at is None:
+            ticket.event.wait()
+        return ticket
+
+    async def acquire_async(self, predicted_tokens: int) -> Ticket:
+        """acquire 的协程版本，等待期间不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        ticket = Ticket(next(self._seq), predicted_tokens)
+        ticket.loop, ticket.future = loop, loop.create_future()
+        with self._lock:
+            self._waiting.append(ticket)
+            self.stats["queued"] += 1 if self._in_flight >= self.max_in_flight else 0
+            self.stats["peak_waiting"] = max(self.stats["peak_waiting"], len(self._waiting))
+            self._grant_locked()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    raise
+            self.release(ticket)  # 已放行但调用方被取消
+            raise
+        return ticket
+
+    def resize(self, max_in_flight: int):
+        """调整并行上限：调大时立即放行排队的请求，调小时等在途请求结束后生效"""
+        with self._lock:
+            self.max_in_flight = max(1, max_in_flight)
+            self._grant_locked()
+
+    def release(self, ticket: Ticket):
+        """请求结束，归还槽位并放行下一个"""
+        with self._lock:
+            self._in_flight -= 1
+            self.stats["served"] += 1
+            self.stats["queue_seconds"] += ticket.queue_seconds
+            self.stats["max_queue_seconds"] = max(self.stats["max_queue_seconds"], ticket.queue_seconds)
+            self._grant_locked()
+
+    @contextmanager
+    def slot(self, predicted_tokens: int):
+        ticket = self.acquire(predicted_tokens)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @property
+    def waiting(self) -> int:
+        with self._lock:
+            return len(self._waiting)
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+def get_ollama_scheduler(base_url: str, max_in_flight: int) -> OllamaScheduler:
+    """获取（或创建）某个 Ollama 端点共享的调度器，并行数不同时原地调整，已放行的请求仍计入上限"""
+    key = base_url.rstrip("/")
+    with _schedulers_lock:
+        scheduler = _schedulers.get(key)
+        if scheduler is None:
+            scheduler = OllamaScheduler(max_in_flight)
+            _schedulers[key] = scheduler
+        elif scheduler.max_in_flight != max(1, max_in_flight):
+            scheduler.resize(max_in_flight)
+        return scheduler
+
+
+# ======== 模拟 ========
+
+def simulate(sejf: bool, jobs: List[Tuple[str, int]], tokens_per_second: float = 2000.0,
+             max_in_flight: int = 1) -> Dict[str, float]:
+    """
+    模拟服务端按 tokens_per_second 输出：jobs 为 (类别, 实际输出 token 数)，几乎同时到达。
+    预测器先用同类历史预热，返回各类请求的平均和最大排队秒数
+    """
+    scheduler = OllamaScheduler(max_in_flight, sejf=sejf)
+    for kind, tokens in jobs:
+        scheduler.predictor.observe("deepseek-r1:8b", kind, tokens)
+    waits: Dict[str, List[float]] = {}
+
+    def run(kind: str, tokens: int):
+        predicted = scheduler.predictor.predict("deepseek-r1:8b", kind)
+        with scheduler.slot(predicted) as ticket:
+            time.sleep(tokens / tokens_per_second)
+        waits.setdefault(kind, []).append(ticket.queue_seconds)
+
+    threads = []
+    for kind, tokens in jobs:
+        thread = threading.Thread(target=run, args=(kind, tokens))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.002)  # 保持到达顺序
+    for thread in threads:
+        thread.join()
+    return {f"{kind}_{stat}": round(func(values), 3)
+            for kind, values in waits.items() for stat, func in (("avg", lambda v: sum(v) / len(v)), ("max", max))}
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="Ollama 请求调度模拟")
+    parser.add_argument("--simulate", action="store_true", help="对比先到先服务与 SEJF")
+    parser.add_argument("--long", type=int, default=4, help="长推理请求数（约 1500 token）")
+    parser.add_argument("--short", type=int, default=8, help="短请求数（约 150 token）")
+    parser.add_argument("--seed", type=int, default=0, help="到达顺序的随机种子")
+    args = parser.parse_args()
+    if not args.simulate:
+        parser.print_help()
+        return 1
+
+    jobs = [("reasoning:first", 1500)] * args.long + [("default:followup", 150)] * args.short
+    random.Random(args.seed).shuffle(jobs)
+    for name, sejf in (("先到先服务", False), ("SEJF", True)):
+        report = simulate(sejf, jobs)
+        print(f"{name:<8} 短请求平均等待 {report['default:followup_avg']:.2f}s（最长 {report['default:followup_max']:.2f}s），"
+              f"长请求平均等待 {report['reasoning:first_avg']:.2f}s（最长 {report['reasoning:first_max']:.2f}s）")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+静态请求前缀
+DeepSeek 的上下文硬盘缓存和 Ollama 的 KV 缓存都只对“与之前请求逐字节相同的开头”生效。
+每次请求开头的系统提示词 + 工具定义是固定不变的，这里把它们规范化后冻结为一份共享对象：
+- 同一服务商/模型的所有生成器、批量任务中的所有产品都使用同一份前缀
+- 对话中的用户请求、工具结果、重试引导只会追加在前缀之后，不会插入或改写前面的消息
+并从响应 usage 中读取缓存命中的 token 数，用于统计前缀缓存节省了多少输入。
+"""
+
+import hashlib
+import json
+import threading
+from typing import Dict, List, Optional, Any
+
+
+def _canonical(value: Any) -> Any:
+    """按键排序重建对象，保证序列化结果与定义时的字典顺序无关"""
+    return json.loads(json.dumps(value, ensure_ascii=False, sort_keys=True))
+
+
+class StaticPrefix:
+    """系统消息 + 工具定义，创建后不应再修改"""
+
+    def __init__(self, system_prompt: str, tools: Optional[List[Dict]] = None):
+        self.system_message = {"role": "system", "content": system_prompt.strip()}
+        self.tools = _canonical(tools) if tools else None
+        serialized = json.dumps([self.system_message, self.tools], ensure_ascii=False, sort_keys=True)
+        self.fingerprint = hashlib.sha256(serialized.encode("utf-8")).hexdigest()[:12]
+
+    def messages(self, user_content: str) -> List[Dict]:
+        """以前缀开头的新对话历史（系统消息对象本身共享，不要原地修改）"""
+        return [self.system_message, {"role": "user", "content": user_content}]
+
+
+_prefixes: Dict[tuple, StaticPrefix] = {}
+_lock = threading.Lock()
+
+
+def get_static_prefix(provider: str, model: str, system_prompt: str,
+                      tools: Optional[List[Dict]] = None) -> StaticPrefix:
+    """获取服务商/模型对应的共享前缀；内容变化（如修改了提示词）时重新生成"""
+    key = (provider, model)
+    with _lock:
+        prefix = _prefixes.get(key)
+        candidate = StaticPrefix(system_prompt, tools)
+        if prefix is None or prefix.fingerprint != candidate.fingerprint:
+            _prefixes[key] = prefix = candidate
+        return prefix
+
+
+def usage_counts(usage) -> Dict[str, Optional[int]]:
+    """
+    从响应 usage 中读取 token 数
+
+    cached_tokens 为命中前缀缓存的输入 token：DeepSeek 返回 prompt_cache_hit_tokens，
+    OpenAI 兼容格式返回 prompt_tokens_details.cached_tokens；Ollama 不返回时为 None。
+    """
+    if usage is None:
+        return {"prompt_tokens": None, "completion_tokens": None, "cached_tokens": None}
+    cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    if cached is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details else None
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "cached_tokens": cached
+    }
+
+
+def add_usage(stats: Dict[str, Any], usage):
+    """把一次响应的 token 数累加到生成统计中，服务端未返回的字段保持不变"""
+    for key, value in usage_counts(usage).items():
+        if value is not None:
+            stats[key] = stats.get(key, 0) + value
+
+
+def summarize_usage(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总一批生成结果的 token 数和前缀缓存命中率"""
+    totals = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+    reported = 0
+    for result in results:
+        metadata = result.get("metadata", result) if result else {}
+        if metadata.get("cached_tokens") is not None:
+            reported += 1
+        for key in totals:
+            totals[key] += metadata.get(key) or 0
+    totals["cache_hit_rate"] = round(totals["cached_tokens"] / totals["prompt_tokens"], 3) if totals["prompt_tokens"] else 0.0
+    totals["cache_reported"] = reported
+    return totals
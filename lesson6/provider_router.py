@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+多服务路由
+同时持有多个后端（如本地 Ollama 和 DeepSeek，或同一服务的不同模型），为每个后端记录实时的
+成功率和延迟，每篇文案交给预计最快的健康后端生成：
+- 对冲：主请求超过该后端的 p95 延迟仍未返回时，同时向下一个后端发起请求，取先成功的结果
+- 故障转移：请求失败（异常或生成失败）时立即换下一个后端，调用方只拿到最终结果
+- 熔断：连续失败 FAILURE_THRESHOLD 次的后端暂停 COOLDOWN_SECONDS 秒；到期后进入半开状态，
+  只放行一个试探请求，试探成功恢复，失败则重新熔断。熔断中的后端不会被选为主请求或对冲目标
+
+路由以整篇文案为单位：不同服务的对话格式不同（Ollama 不使用工具），一次生成内不切换后端。
+落后的对冲请求无法中断，会在后台跑完并计入统计，结果丢弃。
+
+环境变量:
+    ROUTER_BACKENDS    后端列表，默认 "ollama,deepseek"；可写 "ollama:qwen2.5,deepseek"
+    ROUTER_HEDGE_AFTER 样本不足时的对冲等待秒数，默认 45
+
+命令行:
+    python provider_router.py --backends ollama:qwen2.5,deepseek --repeat 3
+"""
+
+import argparse
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Dict, List, Optional, Any, Callable, Tuple
+
+FAILURE_THRESHOLD = 2       # 连续失败多少次后熔断
+COOLDOWN_SECONDS = 30.0     # 熔断时长
+MIN_SAMPLES = 5             # 样本数达到后才用 p95 作为对冲阈值
+LATENCY_WINDOW = 50         # 计算 p95 的最近样本数
+EWMA_ALPHA = 0.3            # 期望延迟的平滑系数
+
+
+class BackendStats:
+    """一个后端的实时健康和延迟统计（线程安全）"""
+
+    def __init__(self):
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.ewma: Optional[float] = None
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.probing = False  # 半开状态下是否已有试探请求在途
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def state(self) -> str:
+        """closed 正常 / open 熔断中 / half_open 熔断到期，等待或正在试探"""
+        if not self.open_until:
+            return "closed"
+        return "open" if time.monotonic() < self.open_until else "half_open"
+
+    def admit(self) -> bool:
+        """是否放行一个请求：半开状态下只放行一个试探，试探结束前其余请求视同熔断"""
+        with self._lock:
+            state = self.state()
+            if state == "open" or (state == "half_open" and self.probing):
+                return False
+            if state == "half_open":
+                self.probing = True
+            self.in_flight += 1
+            return True
+
+    def record_success(self, seconds: float):
+        with self._lock:
+            self.in_flight -= 1
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.open_until = 0.0
+            self.probing = False
+            self.latencies.append(seconds)
+            self.ewma = seconds if self.ewma is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.ewma
+
+    def record_failure(self):
+        with self._lock:
+            self.in_flight -= 1
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.probing or self.consecutive_failures >= FAILURE_THRESHOLD:
+                self.open_until = time.monotonic() + COOLDOWN_SECONDS
+            self.probing = False
+
+    def healthy(self) -> bool:
+        """可以接收请求：未熔断，或熔断已到期且还没有试探请求在途"""
+        state = self.state()
+        return state == "closed" or (state == "half_open" and not self.probing)
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self.latencies) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[math.ceil(0.95 * len(ordered)) - 1]
+
+    def snapshot(self) -> Dict[str, Any]:
+        p95 = self.p95()
+        return {
+            "successes": self.successes,
+            "failures": self.failures,
+            "in_flight": self.in_flight,
+            "ewma_seconds": round(self.ewma, 3) if self.ewma is not None else None,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+            "state": self.state(),
+            "healthy": self.healthy()
+        }
+
+
+class Backend:
+    """路由目标：名称 + 生成器（RedNoteGenerator 或任何有 generate(**kwargs) 的对象）"""
+
+    def __init__(self, name: str, generator):
+        self.name = name
+        self.generator = generator
+        self.stats = BackendStats()
+
+
+class ProviderRouter:
+    """按健康状况和延迟在多个后端之间路由生成请求"""
+
+    def __init__(self, backends: List[Tuple[str, Any]], hedge_after: Optional[float] = None,
+                 max_hedges: int = 1, max_workers: int = 32):
+        """
+        Args:
+            backends: [(名称, 生成器)]，顺序即没有统计数据时的优先级
+            hedge_after: 后端样本不足时的对冲等待秒数，默认取 ROUTER_HEDGE_AFTER
+            max_hedges: 每个请求最多额外发起的对冲请求数
+            max_workers: 执行请求的线程数（落后的对冲请求也占用线程）
+        """
+        if not backends:
+            raise ValueError("至少需要一个后端")
+        self.backends = [Backend(name, generator) for name, generator in backends]
+        self.hedge_after = hedge_after if hedge_after is not None else float(os.getenv("ROUTER_HEDGE_AFTER", "45"))
+        self.max_hedges = max_hedges
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="provider-router")
+
+    def ranked(self) -> List[Backend]:
+        """健康的后端按期望延迟排序（没有样本的优先，以便尽快测得延迟），熔断中的排在最后"""
+        order = {id(backend): index for index, backend in enumerate(self.backends)}
+
+        def key(backend: Backend):
+            ewma = backend.stats.ewma
+            return (not backend.stats.healthy(), ewma if ewma is not None else 0.0, order[id(backend)])
+
+        return sorted(self.backends, key=key)
+
+    def hedge_delay(self, backend: Backend) -> float:
+        """主请求等待多久后发起对冲：该后端的 p95，样本不足时用 hedge_after"""
+        p95 = backend.stats.p95()
+        return p95 if p95 is not None else self.hedge_after
+
+    def _run(self, backend: Backend, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """执行一次请求（调用方已通过 backend.stats.admit() 占用名额）"""
+        start = time.time()
+        try:
+            result = backend.generator.generate(**kwargs)
+        except Exception as e:
+            result = {"success": False, "error": f"{type(e).__name__}: {e}"}
+        if result.get("success"):
+            backend.stats.record_success(time.time() - start)
+        else:
+            backend.stats.record_failure()
+        return result
+
+    def generate(self, **kwargs) -> Dict[str, Any]:
+        """
+        生成一篇文案，参数同 RedNoteGenerator.generate
+
+        返回先成功的后端的结果，metadata（失败时为顶层）中的 route 记录
+        实际使用的后端、是否对冲、故障转移次数和总耗时
+        """
+        candidates = self.ranked()
+        start = time.time()
+        pending: Dict[Any, Backend] = {}
+        route = {"backend": None, "hedged": False, "failovers": 0, "tried": []}
+        hedges_left = self.max_hedges
+        next_index = 0
+        waiting: Tuple[str, float] = ("", 0.0)  # 最近发起的请求：(后端, 对冲等待秒数)
+        result: Dict[str, Any] = {"success": False, "error": "没有可用的后端"}
+
+        def has_next() -> bool:
+            return any(backend.stats.healthy() for backend in candidates[next_index:])
+
+        def launch() -> Optional[float]:
+            """向下一个放行的后端发起请求，跳过熔断中的后端；没有可用后端时返回 None"""
+            nonlocal next_index, waiting
+            while next_index < len(candidates):
+                backend = candidates[next_index]
+                next_index += 1
+                if not backend.stats.admit():
+                    continue
+                route["tried"].append(backend.name)
+                pending[self._executor.submit(self._run, backend, kwargs)] = backend
+                waiting = (backend.name, self.hedge_delay(backend))
+                return time.time() + waiting[1]
+            return None
+
+        deadline = launch()
+        while pending:
+            can_hedge = hedges_left > 0 and has_next()
+            timeout = max(0.0, deadline - time.time()) if can_hedge else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                stalled = waiting
+                hedge_deadline = launch()
+                if hedge_deadline is None:
+                    continue  # 候选在等待期间被熔断，只能继续等在途请求
+                print(f"🪁 {stalled[0]} 超过 {stalled[1]:.1f}s 未返回，同时请求 {waiting[0]}")
+                hedges_left -= 1
+                route["hedged"] = True
+                deadline = hedge_deadline
+                continue
+
+            for future in done:
+                backend = pending.pop(future)
+                result = future.result()
+                if result.get("success"):
+                    route["backend"] = backend.name
+                    route["seconds"] = round(time.time() - start, 3)
+                    result.setdefault("metadata", {})["route"] = route
+                    return result
+                print(f"🔀 {backend.name} 生成失败: {result.get('error')}")
+            if not pending and has_next():
+                deadline = launch()
+                if deadline is not None:
+                    route["failovers"] += 1
+
+        route["seconds"] = round(time.time() - start, 3)
+        return {**result, "route": route}
+
+    def generate_batch(self, items: List[Dict[str, Any]], concurrency: int = 4,
+                       on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+        """并发批量生成，参数与返回值同 RedNoteGenerator.generate_batch"""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        print(f"\n📦 路由批量生成 {len(items)} 条文案，并发数: {concurrency}")
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = {executor.submit(self.generate, **item): index for index, item in enumerate(items)}
+            for future in as_completed(futures):
+                index = futures[future]
+                results[index] = future.result()
+                if on_result:
+                    on_result(index, results[index])
+        return results
+
+    def report(self) -> List[Dict[str, Any]]:
+        """各后端的统计快照"""
+        return [{"backend": backend.name, **backend.stats.snapshot()} for backend in self.backends]
+
+    def print_report(self):
+        print(f"\n{'后端':<28}{'成功':>6}{'失败':>6}{'EWMA(s)':>10}{'p95(s)':>10}  状态")
+        for row in self.report():
+            ewma = f"{row['ewma_seconds']:.2f}" if row["ewma_seconds"] is not None else "-"
+            p95 = f"{row['p95_seconds']:.2f}" if row["p95_seconds"] is not None else "-"
+            status = {"closed": "✅", "open": "⛔ 熔断", "half_open": "🧪 半开"}[row["state"]]
+            print(f"{row['backend']:<28}{row['successes']:>6}{row['failures']:>6}{ewma:>10}{p95:>10}  {status}")
+
+    def close(self):
+        """不等待落后的对冲请求"""
+        self._executor.shutdown(wait=False)
+
+
+def build_router(specs: Optional[List[str]] = None, **router_kwargs) -> ProviderRouter:
+    """
+    按 "provider[:model]" 列表创建路由，默认读取 ROUTER_BACKENDS；
+    无法初始化的后端（未设置密钥、Ollama 未运行等）跳过
+    """
+    from rednote import Config, RedNoteGenerator
+
+    specs = specs or [spec.strip() for spec in os.getenv("ROUTER_BACKENDS", "ollama,deepseek").split(",") if spec.strip()]
+    backends = []
+    for spec in specs:
+        provider, _, model = spec.partition(":")
+        try:
+            config = Config(provider=provider, ollama_model=model or None)
+            backends.append((f"{provider}/{config.model}", RedNoteGenerator(config)))
+        except Exception as e:
+            print(f"⚠️ 跳过后端 {spec}: {e}")
+    return ProviderRouter(backends, **router_kwargs)
+
+
+def main():
+    """命令行入口：同一产品生成多次，观察路由和各后端统计"""
+    parser = argparse.ArgumentParser(description="多服务路由")
+    parser.add_argument("--backends", default=None, help="逗号分隔的 provider[:model]，默认读取 ROUTER_BACKENDS")
+    parser.add_argument("--product", default="深海蓝藻保湿面膜", help="产品名称")
+    parser.add_argument("--repeat", type=int, default=3, help="生成次数")
+    parser.add_argument("--hedge-after", type=float, default=None, help="样本不足时的对冲等待秒数")
+    args = parser.parse_args()
+
+    try:
+        router = build_router(args.backends.split(",") if args.backends else None, hedge_after=args.hedge_after)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    try:
+        for _ in range(args.repeat):
+            result = router.generate(product_name=args.product, use_cache=False)
+            route = result.get("metadata", result).get("route", {})
+            print(f"🧭 {route.get('backend')}，对冲: {route.get('hedged')}，故障转移: {route.get('failovers')}，"
+                  f"耗时 {route.get('seconds')}s")
+        router.print_report()
+    finally:
+        router.close()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
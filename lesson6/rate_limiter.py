@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+按服务商的请求/Token 速率限制
+令牌桶实现，同一进程内同一服务商的所有生成器共享一个限速器，
+批量并发生成时按 requests/min 和 tokens/min 平滑发送请求。
+"""
+
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+_limiters: Dict[Tuple[str, str], "RateLimiter"] = {}
+_limiters_lock = threading.Lock()
+
+
+def estimate_text_tokens(text: str) -> int:
+    """粗略估算文本的 token 数：中文约 1 字 1 token，其余约 4 字符 1 token"""
+    cjk = sum(1 for ch in text if "\u3000" <= ch <= "\u9fff" or "\uff00" <= ch <= "\uffef")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def estimate_message_tokens(messages: List[Dict]) -> int:
+    """粗略估算消息的 token 数"""
+    total = 0
+    for message in messages:
+        content = message.get("content") if isinstance(message, dict) else getattr(message, "content", None)
+        total += estimate_text_tokens(content or "") + 4  # 每条消息的角色等开销
+    return total
+
+
+class RateLimiter:
+    """令牌桶限速器，同时限制每分钟请求数和每分钟 token 数"""
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_allowance = float(requests_per_minute or 0)
+        self._token_allowance = float(tokens_per_minute or 0)
+        self._last_refill = time.monotonic()
+        self._cond = threading.Condition()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.requests_per_minute or self.tokens_per_minute)
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.requests_per_minute:
+            self._request_allowance = min(float(self.requests_per_minute),
+                                          self._request_allowance + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._token_allowance = min(float(self.tokens_per_minute),
+                                        self._token_allowance + elapsed * self.tokens_per_minute / 60)
+
+    def _wait_time(self, tokens: int) -> float:
+        """距离请求和 token 额度都满足还需等待的秒数"""
+        waits = [0.0]
+        if self.requests_per_minute and self._request_allowance < 1:
+            waits.append((1 - self._request_allowance) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute and self._token_allowance < tokens:
+            waits.append((tokens - self._token_allowance) * 60 / self.tokens_per_minute)
+        return max(waits)
+
+    def _clamp(self, tokens: int) -> int:
+        """单个请求超过桶容量时按容量计，避免永远等不到"""
+        return min(tokens, self.tokens_per_minute) if self.tokens_per_minute else tokens
+
+    def _try_acquire(self, tokens: int) -> float:
+        """尝试扣减额度：成功返回 0，否则返回还需等待的秒数（调用方需持有锁）"""
+        self._refill()
+        wait = self._wait_time(tokens)
+        if wait <= 0:
+            if self.requests_per_minute:
+                self._request_allowance -= 1
+            if self.tokens_per_minute:
+                self._token_allowance -= tokens
+        return wait
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        阻塞直到可以发送一个预计消耗 tokens 的请求
+
+        Returns:
+            实际等待的秒数
+        """
+        if not self.enabled:
+            return 0.0
+
+        tokens = self._clamp(tokens)
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                wait = self._try_acquire(tokens)
+                if wait <= 0:
+                    return time.monotonic() - start
+                self._cond.wait(wait)
+
+    async def acquire_async(self, tokens: int = 0) -> float:
+        """acquire 的协程版本，等待期间不阻塞事件循环"""
+        if not self.enabled:
+            return 0.0
+
+        tokens = self._clamp(tokens)
+        start = time.monotonic()
+        while True:
+            with self._cond:
+                wait = self._try_acquire(tokens)
+            if wait <= 0:
+                return time.monotonic() - start
+            await asyncio.sleep(wait)
+
+    def set_rates(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        """
+        原地修改限额：已扣减的额度保留（不超过新容量），新启用的限额从满桶开始，
+        正在等待的请求按新速率重新计算等待时间
+        """
+        with self._cond:
+            self._refill()
+            if requests_per_minute and not self.requests_per_minute:
+                self._request_allowance = float(requests_per_minute)
+            if tokens_per_minute and not self.tokens_per_minute:
+                self._token_allowance = float(tokens_per_minute)
+            self.requests_per_minute = requests_per_minute
+            self.tokens_per_minute = tokens_per_minute
+            self._request_allowance = min(self._request_allowance, float(requests_per_minute or 0))
+            self._token_allowance = min(self._token_allowance, float(tokens_per_minute or 0))
+            self._cond.notify_all()
+
+    def adjust(self, delta_tokens: int):
+        """请求完成后按实际用量修正 token 额度（delta 为实际值减预估值，可为负）"""
+        if not self.tokens_per_minute or not delta_tokens:
+            return
+        with self._cond:
+            self._token_allowance -= delta_tokens
+            self._cond.notify_all()
+
+
+def get_rate_limiter(provider: str, base_url: str, requests_per_minute: Optional[int] = None,
+                     tokens_per_minute: Optional[int] = None) -> RateLimiter:
+    """
+    获取（或创建）某个服务商端点共享的限速器
+
+    每个端点只有一个限速器：限额与已有限速器不同时原地修改，
+    不会另建一个新桶让新旧生成器各自按满额发送
+    """
+    key = (provider, base_url)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+            _limiters[key] = limiter
+        elif (limiter.requests_per_minute, limiter.tokens_per_minute) != (requests_per_minute, tokens_per_minute):
+            limiter.set_rates(requests_per_minute, tokens_per_minute)
+        return limiter
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+DeepSeek-R1 推理过程处理
+R1 的回答先输出很长的 <think> 推理块，再输出文案 JSON；推理与回答共用 max_tokens，
+推理过长时回答被截断，只能再追加一轮。这里把两者分开处理：
+- 流式接收时逐段拆分推理和回答，只把回答交给 JSON 解析器
+- 设置了推理预算（REDNOTE_THINK_BUDGET，默认 0 不限）时按流式接收，推理 token 超过预算时提前结束本轮，
+  由迭代策略按 think_only 追加"直接输出 JSON"的提示；max_tokens 额外预留推理预算，回答不再被推理挤占
+- 推理内容不进入结果元数据，按篇追加到 output/<日期>/reasoning_traces.jsonl 便于排查
+- 每轮记录 reasoning_tokens / answer_tokens（见 generation_trace）
+
+也兼容把推理放在独立字段的接口（deepseek-reasoner 的 reasoning_content、Ollama 的 reasoning）。
+"""
+
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from json_extractor import THINK_CLOSE, THINK_OPEN
+from rate_limiter import estimate_text_tokens
+
+DEFAULT_THINK_BUDGET = 0  # 每轮推理的 token 上限，0 表示不限（按需开启，如 1500）
+REASONING_FIELDS = ("reasoning_content", "reasoning")
+
+_write_lock = threading.Lock()
+
+
+def is_reasoning_model(model: str) -> bool:
+    """是否为输出推理过程的模型"""
+    return "deepseek-r1" in model or "reasoner" in model
+
+
+def reasoning_field(message) -> str:
+    """消息或流式增量中独立返回的推理内容"""
+    for field in REASONING_FIELDS:
+        value = getattr(message, field, None)
+        if isinstance(value, str) and value:
+            return value
+    return ""
+
+
+def _partial_tag(text: str, tag: str) -> int:
+    """text 末尾可能被截断的标签前缀长度"""
+    for size in range(min(len(tag) - 1, len(text)), 0, -1):
+        if tag.startswith(text[-size:]):
+            return size
+    return 0
+
+
+class ReasoningSplitter:
+    """逐段拆分推理和回答：feed() 返回本段中属于回答的文本"""
+
+    def __init__(self):
+        self.reasoning_parts: List[str] = []
+        self.answer_parts: List[str] = []
+        self.in_think = False
+        self.reasoning_tokens = 0  # 按增量累加的估算值，预算判断不必反复扫描全文
+        self._field_thinking = False
+        self._pending = ""
+
+    @property
+    def reasoning(self) -> str:
+        return "".join(self.reasoning_parts).strip()
+
+    @property
+    def answer(self) -> str:
+        return "".join(self.answer_parts + [self._pending]).strip()
+
+    def _add_reasoning(self, *parts: str):
+        for part in parts:
+            if part:
+                self.reasoning_parts.append(part)
+                self.reasoning_tokens += estimate_text_tokens(part)
+
+    def feed_reasoning(self, text: str):
+        """推理在独立字段中返回时直接记入"""
+        self._add_reasoning(text)
+        self._field_thinking = True
+
+    def feed(self, chunk: str) -> str:
+        text = self._pending + chunk
+        self._pending = ""
+        answer = []
+        while text:
+            if self.in_think:
+                end = text.find(THINK_CLOSE)
+                if end == -1:
+                    keep = _partial_tag(text, THINK_CLOSE)
+                    self._add_reasoning(text[:len(text) - keep])
+                    self._pending = text[len(text) - keep:]
+                    break
+                self._add_reasoning(text[:end])
+                self.in_think = False
+                text = text[end + len(THINK_CLOSE):]
+                continue
+
+            start, close = text.find(THINK_OPEN), text.find(THINK_CLOSE)
+            if close != -1 and (start == -1 or close < start):
+                # 模板省略了 <think>，只输出 </think>：之前的回答都是推理
+                self._add_reasoning(*self.answer_parts, *answer, text[:close])
+                self.answer_parts, answer = [], []
+                text = text[close + len(THINK_CLOSE):]
+            elif start != -1:
+                answer.append(text[:start])
+                self.in_think = True
+                text = text[start + len(THINK_OPEN):]
+            else:
+                keep = max(_partial_tag(text, THINK_OPEN), _partial_tag(text, THINK_CLOSE))
+                answer.append(text[:len(text) - keep])
+                self._pending = text[len(text) - keep:]
+                break
+
+        self.answer_parts.extend(answer)
+        answer_text = "".join(answer)
+        if answer_text.strip():
+            self._field_thinking = False
+        return answer_text
+
+    def over_budget(self, budget: Optional[int]) -> bool:
+        """推理尚未结束且已超出预算"""
+        thinking = self.in_think or self._field_thinking
+        return bool(budget) and thinking and self.reasoning_tokens > budget
+
+
+def split_reasoning(content: Optional[str], reasoning: str = "") -> Tuple[str, str]:
+    """非流式响应拆分为 (推理, 回答)"""
+    splitter = ReasoningSplitter()
+    if reasoning:
+        splitter.feed_reasoning(reasoning)
+    splitter.feed(content or "")
+    return splitter.reasoning, splitter.answer
+
+
+def reported_reasoning_tokens(usage) -> Optional[int]:
+    """服务端在 usage.completion_tokens_details 中返回的推理 token 数，没有时为 None"""
+    details = getattr(usage, "completion_tokens_details", None) if usage is not None else None
+    return getattr(details, "reasoning_tokens", None) if details else None
+
+
+def token_split(reasoning: str, answer: str, completion_tokens: Optional[int] = None,
+                reported_reasoning: Optional[int] = None) -> Dict[str, int]:
+    """
+    推理与回答的 token 数：优先使用服务端返回的推理 token 数；
+    有实际输出 token 数时按文本估算的比例分摊，否则直接估算
+    """
+    if completion_tokens and reported_reasoning is not None:
+        return {"reasoning_tokens": reported_reasoning, "answer_tokens": completion_tokens - reported_reasoning}
+    reasoning_estimate, answer_estimate = estimate_text_tokens(reasoning), estimate_text_tokens(answer)
+    if completion_tokens and reasoning_estimate + answer_estimate:
+        reasoning_tokens = round(completion_tokens * reasoning_estimate / (reasoning_estimate + answer_estimate))
+        return {"reasoning_tokens": reasoning_tokens, "answer_tokens": completion_tokens - reasoning_tokens}
+    return {"reasoning_tokens": reasoning_estimate, "answer_tokens": answer_estimate}
+
+
+class ReasoningTraceStore:
+    """按篇追加保存推理过程（JSONL），多个生成器可写同一文件"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def save(self, product_name: str, model: str, traces: List[Dict[str, Any]]) -> str:
+        """traces 为每轮的 {iteration, reasoning, reasoning_tokens, truncated}，返回文件路径"""
+        line = {
+            "product_name": product_name,
+            "model": model,
+            "saved_at": datetime.now().isoformat(),
+            "iterations": traces
+        }
+        with _write_lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        return str(self.path)
+
+    def load(self) -> List[Dict[str, Any]]:
+        if not self.path.exists():
+            return []
+        with open(self.path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
@@ -13,19 +13,44 @@ import os
 import json
 import re
 import time
-import random
+from contextlib import contextmanager
 import requests  # 用于验证 Ollama 服务连接
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Callable
 
 from openai import OpenAI
 from dotenv import load_dotenv
 
+from client_pool import get_openai_client, is_connection_verified, mark_connection_verified, probe_ollama_tags
+from emoji_engine import get_emoji_recommender
+from generation_trace import finish_stats, note_rate_limit_wait, record_llm_call, record_tool, start_iteration
+from iteration_policy import IterationPolicy
+from json_extractor import THINK_OPEN, extract_json
+from model_lifecycle import get_model_manager, model_key
+from ollama_scheduler import get_ollama_scheduler, request_kind
+from prompt_prefix import StaticPrefix, get_static_prefix
+from rate_limiter import estimate_message_tokens, estimate_text_tokens, get_rate_limiter
+from reasoning_trace import (DEFAULT_THINK_BUDGET, ReasoningTraceStore, is_reasoning_model, reasoning_field,
+                             reported_reasoning_tokens, split_reasoning, token_split)
+from search_backend import get_search_service
+from response_cache import ResponseCache, make_cache_key, prompt_version
+from stream_parser import NoteStream, assemble_message, merge_tool_call_delta
+from structured_output import is_valid_note, parse_structured, response_format_for
+from tool_memo import ToolMemo, get_shared_tool_cache, memo_key
+from tool_registry import ToolRegistry, ToolSpec, ToolTimeout
+
 # 加载环境变量
 load_dotenv()
 
 
+def _env_int(name: str) -> Optional[int]:
+    """读取整数环境变量，未设置时返回 None"""
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
 class Config:
     """配置管理类"""
     
@@ -35,7 +60,7 @@ class Config:
         
         # DeepSeek 配置
         self.deepseek_api_key = os.getenv("DEEPSEEK_API_KEY")
-        self.deepseek_base_url = "https://api.deepseek.com/v1"
+        self.deepseek_base_url = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1")
         self.deepseek_model = "deepseek-chat"
         
         # Ollama 配置 - 修复 URL 格式
@@ -46,6 +71,27 @@ class Config:
         self.max_iterations = 5 if self.provider == "ollama" and "deepseek-r1" in self.ollama_model else 3  # DeepSeek-R1 支持更多轮对话
         self.output_dir = Path("output")
         self.default_style = "活泼甜美"
+        self.batch_concurrency = int(os.getenv("BATCH_CONCURRENCY", "4"))  # 批量生成的默认并发数
+        self.structured_output = os.getenv("STRUCTURED_OUTPUT", "0") == "1"  # 使用 response_format 约束输出
+        self.adaptive_iterations = os.getenv("ADAPTIVE_ITERATIONS", "1") == "1"  # 解析失败时按失败类型决定修复/重试/停止
+        self.token_budget = _env_int("REDNOTE_TOKEN_BUDGET")  # 每篇文案的 token 上限，超出则不再重试
+        self.shared_tool_memo = os.getenv("TOOL_MEMO_SHARED", "0") == "1"  # 工具结果按 TTL 在多次生成间共享
+        
+        # Ollama 模型常驻：启动时预热，批量生成期间保活，结束后卸载（见 model_lifecycle）
+        self.ollama_preload = os.getenv("OLLAMA_PRELOAD", "1") == "1"
+        self.ollama_preload_models = [name.strip() for name in os.getenv("OLLAMA_PRELOAD_MODELS", "").split(",")
+                                      if name.strip()]
+        self.ollama_unload_after_batch = os.getenv("OLLAMA_UNLOAD_AFTER_BATCH", "1") == "1"
+        
+        # 推理模型（DeepSeek-R1）：每轮推理的 token 上限（0 表示不限），推理过程另存到 reasoning_traces.jsonl
+        think_budget = _env_int("REDNOTE_THINK_BUDGET")
+        self.think_budget = DEFAULT_THINK_BUDGET if think_budget is None else think_budget
+        self.save_reasoning = os.getenv("REDNOTE_SAVE_REASONING", "1") == "1"
+        
+        # 响应缓存：设置 REDNOTE_CACHE_DIR 后启用
+        self.cache_dir = os.getenv("REDNOTE_CACHE_DIR")
+        self.cache_ttl_hours = float(os.getenv("REDNOTE_CACHE_TTL_HOURS", "0")) or None
+        self.cache_variations = int(os.getenv("REDNOTE_CACHE_VARIATIONS", "1"))
         
         # 动态配置当前使用的服务
         self._configure_current_provider()
@@ -75,6 +121,13 @@ class Config:
             
         else:
             raise ValueError(f"不支持的服务提供商: {self.provider}，请选择 'deepseek' 或 'ollama'")
+        
+        # 速率限制：如 DEEPSEEK_RPM / DEEPSEEK_TPM，未设置则不限速
+        self.requests_per_minute = _env_int(f"{self.provider.upper()}_RPM")
+        self.tokens_per_minute = _env_int(f"{self.provider.upper()}_TPM")
+        
+        # Ollama 并行数：客户端同时在途的请求不超过服务端的 OLLAMA_NUM_PARALLEL
+        self.ollama_max_in_flight = _env_int("OLLAMA_MAX_IN_FLIGHT") or _env_int("OLLAMA_NUM_PARALLEL") or 1
     
     def _validate_ollama_service(self):
         """验证 Ollama 服务是否可用 - 改进版"""
@@ -83,7 +136,7 @@ class Config:
             tags_url = f"{self.ollama_base_url.replace('/v1', '')}/api/tags"
             print(f"🔍 检查 Ollama 服务: {tags_url}")
             
-            response = requests.get(tags_url, timeout=10)
+            response = probe_ollama_tags(tags_url)  # 同一端点的健康检查结果会被缓存复用
             if response.status_code == 200:
                 models_data = response.json()
                 available_models = [model["name"] for model in models_data.get("models", [])]
@@ -140,7 +193,7 @@ class Config:
         """获取可用的 Ollama 模型列表"""
         try:
             tags_url = f"{self.ollama_base_url.replace('/v1', '')}/api/tags"
-            response = requests.get(tags_url, timeout=10)
+            response = probe_ollama_tags(tags_url)
             if response.status_code == 200:
                 models_data = response.json()
                 return [model["name"] for model in models_data.get("models", [])]
@@ -159,23 +212,13 @@ class Config:
 
 
 class ToolManager:
-    """工具管理类 - 负责模拟外部API调用"""
+    """工具管理类 - 负责外部API调用（产品数据库仍为模拟数据）"""
     
     @staticmethod
     def search_web(query: str) -> str:
-        """模拟网页搜索工具"""
+        """网页搜索工具：由 search_backend 的共享服务处理（本地趋势索引或 HTTP 搜索，带缓存和请求合并）"""
         print(f"🔍 [Tool] 搜索网页: {query}")
-        time.sleep(1)  # 模拟网络延迟
-        
-        # 基于关键词返回相关信息
-        if "小红书" in query and "趋势" in query:
-            return "近期小红书流行趋势：'多巴胺穿搭'、'早C晚A'护肤、'伪素颜'妆容。热门关键词：#氛围感 #抗老 #屏障修复"
-        elif "保湿" in query and "面膜" in query:
-            return "保湿面膜用户痛点：卡粉、泛红、紧绷感。热门话题：沙漠干皮救星、熬夜急救面膜、水光肌养成"
-        elif "美白" in query and "精华" in query:
-            return "美白精华市场趋势：成分党关注烟酰胺和VC，用户关心淡斑效果和温和性。热门标签：#提亮肤色 #痘印救星"
-        else:
-            return f"关于'{query}'的市场反馈：用户普遍关注产品成分、功效和使用体验"
+        return get_search_service().search_sync(query)
     
     @staticmethod
     def query_product_database(product_name: str) -> str:
@@ -194,44 +237,24 @@ class ToolManager:
     
     @staticmethod
     def generate_emoji(context: str) -> List[str]:
-        """根据上下文生成表情符号"""
+        """根据上下文生成表情符号：关键词自动机给类别打分，再按权重抽样（见 emoji_engine）"""
         print(f"😊 [Tool] 生成表情符号，上下文: {context}")
-        time.sleep(0.2)
-        
-        emoji_mapping = {
-            "补水|保湿|水润": ["💦", "💧", "🌊", "✨", "💎"],
-            "美白|提亮|亮白": ["✨", "🌟", "💫", "🤍", "☀️"],
-            "惊喜|爱了|哇塞": ["💖", "😍", "🤩", "💯", "🔥"],
-            "熬夜|疲惫|急救": ["😭", "😮‍💨", "😴", "💡", "🆘"],
-            "推荐|好物|种草": ["✅", "👍", "⭐", "🛍️", "💝"],
-            "修复|舒缓|温和": ["🌿", "🍃", "💚", "🤲", "💆‍♀️"]
-        }
-        
-        # 匹配相关表情
-        for pattern, emojis in emoji_mapping.items():
-            if any(keyword in context for keyword in pattern.split("|")):
-                return random.sample(emojis, min(4, len(emojis)))
-        
-        # 默认表情
-        return random.sample(["✨", "🔥", "💖", "💯", "🎉", "👍", "🤩"], 4)
+        return get_emoji_recommender().suggest(context)
 
 
 class RedNoteGenerator:
     """小红书文案生成器核心类"""
     
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, response_cache: Optional[ResponseCache] = None):
         self.config = config
         self.client = self._init_client()
         self.tool_manager = ToolManager()
+        self.tool_registry = self._build_tool_registry()
         self.system_prompt = self._get_system_prompt()
         self.tools_definition = self._get_tools_definition()
-        
-        # 工具映射
-        self.available_tools = {
-            "search_web": self.tool_manager.search_web,
-            "query_product_database": self.tool_manager.query_product_database,
-            "generate_emoji": self.tool_manager.generate_emoji
-        }
+        self.prefix = self._static_prefix()
+        self.iteration_policy = IterationPolicy(config)
+        self.response_cache = response_cache or self._init_response_cache()
     
     def _init_client(self) -> OpenAI:
         """初始化OpenAI客户端 - 修复 Ollama 兼容性"""
@@ -239,17 +262,15 @@ class RedNoteGenerator:
             # 修复：为 Ollama 设置更合理的超时时间
             timeout_settings = 60.0 if self.config.provider == "ollama" else 30.0
             
-            client = OpenAI(
-                api_key=self.config.api_key,
-                base_url=self.config.base_url,
-                timeout=timeout_settings
-            )
+            # 同一端点复用进程级的客户端和连接池
+            client = get_openai_client(self.config.base_url, self.config.api_key, timeout=timeout_settings)
             
             # 测试连接
             print(f"🔗 连接到 {self.config.provider.upper()}: {self.config.base_url}")
             
-            # 修复：为 Ollama 进行连接测试
-            if self.config.provider == "ollama":
+            # 修复：为 Ollama 进行连接测试（同一模型近期已测试过则跳过）
+            if self.config.provider == "ollama" and not is_connection_verified(self.config.base_url, self.config.model):
+                self._warm_up_models()  # 先载入模型并记录加载耗时，连接测试和第一篇文案不再等待载入
                 self._test_ollama_connection(client)
                 
             return client
@@ -258,6 +279,14 @@ class RedNoteGenerator:
             print(f"❌ 客户端初始化失败: {e}")
             raise
     
+    def _init_response_cache(self) -> Optional[ResponseCache]:
+        """按配置创建响应缓存，未配置缓存目录时不启用"""
+        if not self.config.cache_dir:
+            return None
+        ttl_seconds = self.config.cache_ttl_hours * 3600 if self.config.cache_ttl_hours else None
+        print(f"🗄️ 启用响应缓存: {self.config.cache_dir}")
+        return ResponseCache(self.config.cache_dir, ttl_seconds=ttl_seconds, variations=self.config.cache_variations)
+    
     def _test_ollama_connection(self, client: OpenAI):
         """测试 Ollama 连接"""
         try:
@@ -272,6 +301,7 @@ class RedNoteGenerator:
             
             if response.choices[0].message.content:
                 print(f"✅ Ollama 连接测试成功！")
+                mark_connection_verified(self.config.base_url, self.config.model)
             else:
                 print(f"⚠️ Ollama 连接测试返回空内容")
                 
@@ -349,63 +379,48 @@ class RedNoteGenerator:
 在生成文案前，请务必先思考并收集足够的信息。
 """.strip()
         
+    def _build_tool_registry(self) -> ToolRegistry:
+        """声明可用工具：参数 schema、延迟预算、重试和并发上限（工具定义也由此生成）"""
+        return ToolRegistry([
+            ToolSpec(
+                "search_web", self.tool_manager.search_web,
+                "搜索互联网上的实时信息，用于获取最新趋势、用户评价、行业报告等",
+                {"query": {"type": "string", "description": "搜索关键词，如'小红书美妆趋势'或'保湿面膜用户评价'"}},
+                timeout=8.0, retries=1, max_concurrency=4, cacheable=True, cache_ttl=600,
+                degraded="搜索暂时不可用（超过 {timeout:g}s），请根据产品信息和常见的用户关注点继续创作，不要再次搜索。"
+            ),
+            ToolSpec(
+                "query_product_database", self.tool_manager.query_product_database,
+                "查询内部产品数据库，获取产品详细信息、卖点、成分等",
+                {"product_name": {"type": "string", "description": "产品名称"}},
+                timeout=5.0, retries=1, max_concurrency=2, cacheable=True, cache_ttl=3600,
+                degraded="产品数据库查询超时（{timeout:g}s），请根据产品名称和用户给出的特性撰写，不要编造具体成分含量。"
+            ),
+            ToolSpec(
+                "generate_emoji", self.tool_manager.generate_emoji,
+                "根据文本内容生成适合的表情符号",
+                {"context": {"type": "string", "description": "文案关键内容或情感，如'惊喜效果'、'补水保湿'"}},
+                timeout=1.0,  # 随机抽样，不缓存：模型重复调用通常是想换一组
+                degraded="表情生成超时，请自行挑选 3-5 个与内容相符的表情。"
+            )
+        ])
+
+    @property
+    def available_tools(self) -> ToolRegistry:
+        """工具名 -> 实现；可以按名称替换实现，声明（超时、重试等）保持不变"""
+        return self.tool_registry
+
+    @available_tools.setter
+    def available_tools(self, functions: Dict[str, Callable]):
+        self.tool_registry.update(functions)
+
     def _get_tools_definition(self) -> List[Dict]:
-        """获取工具定义"""
-        return [
-            {
-                "type": "function",
-                "function": {
-                    "name": "search_web",
-                    "description": "搜索互联网上的实时信息，用于获取最新趋势、用户评价、行业报告等",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "query": {
-                                "type": "string",
-                                "description": "搜索关键词，如'小红书美妆趋势'或'保湿面膜用户评价'"
-                            }
-                        },
-                        "required": ["query"]
-                    }
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "query_product_database",
-                    "description": "查询内部产品数据库，获取产品详细信息、卖点、成分等",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "product_name": {
-                                "type": "string",
-                                "description": "产品名称"
-                            }
-                        },
-                        "required": ["product_name"]
-                    }
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "generate_emoji",
-                    "description": "根据文本内容生成适合的表情符号",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "context": {
-                                "type": "string",
-                                "description": "文案关键内容或情感，如'惊喜效果'、'补水保湿'"
-                            }
-                        },
-                        "required": ["context"]
-                    }
-                }
-            }
-        ]
+        """获取工具定义：由工具注册表的声明生成"""
+        return self.tool_registry.definitions()
 
-    def generate(self, product_name: str, style: str = None, target_audience: str = None, key_features: List[str] = None) -> Dict[str, Any]:
+    def generate(self, product_name: str, style: str = None, target_audience: str = None, key_features: List[str] = None,
+                 stream: bool = False, on_field: Optional[Callable[[str, Any], None]] = None,
+                 use_cache: bool = True) -> Dict[str, Any]:
         """
         生成小红书文案
         
@@ -414,10 +429,63 @@ class RedNoteGenerator:
             style: 文案风格，如'活泼甜美'、'知性温柔'等
             target_audience: 目标受众，如'20-30岁女性'
             key_features: 产品关键特性列表
+            stream: 是否流式生成：边接收边解析，字段完整即回调，JSON 闭合后立即结束
+            on_field: 流式模式下每个字段完成时的回调 (字段名, 值)，默认打印
+            use_cache: 启用了响应缓存时是否读写缓存
             
         Returns:
-            包含文案内容和元信息的字典
+            包含文案内容和元信息的字典，流式模式下 metadata 含 stream_metrics
         """
+        messages = self._start_generation(product_name, style, target_audience, key_features)
+        note_stream = NoteStream(on_field or self._print_field, self._think_budget()) if stream else None
+        if note_stream is None and self._think_budget():
+            # 推理模型也按流式接收，推理超出预算时可以提前结束本轮
+            note_stream = NoteStream(lambda key, value: None, self._think_budget())
+        
+        cache_key = None
+        if self.response_cache and use_cache:
+            cache_key = self._cache_key(product_name, style, target_audience, key_features)
+            cached = self.response_cache.get(cache_key)
+            if cached:
+                print("🗄️ 命中响应缓存")
+                if note_stream:
+                    for key, value in cached.items():
+                        note_stream.on_field(key, value)
+                response = self._finish_generation(cached, product_name, style, target_audience, key_features,
+                                                   {"llm_calls": 0})
+                response["metadata"]["cached"] = True
+                return response
+        
+        # 执行生成循环
+        stats = {"llm_calls": 0}
+        result = self._generation_loop(messages, note_stream, stats)
+        if result and cache_key:
+            self.response_cache.put(cache_key, result)
+        
+        response = self._finish_generation(result, product_name, style, target_audience, key_features, stats)
+        if stream and response["success"]:
+            metrics = note_stream.metrics()
+            response["metadata"]["stream_metrics"] = metrics
+            print(f"⏱️ 首个标题耗时: {metrics['time_to_first_title']}s，总耗时: {metrics['total_time']}s")
+        return response
+
+    def _cache_key(self, product_name: str, style: str, target_audience: str, key_features: List[str]) -> str:
+        """缓存键：规范化的用户请求 + 提示词版本 + 模型 + 采样参数（特性顺序不影响结果）"""
+        features = sorted({feature.strip() for feature in key_features or [] if feature.strip()})
+        request_text = self._build_user_request(product_name.strip(), style, target_audience, features)
+        sampling = {k: v for k, v in self._build_request_kwargs([]).items()
+                    if k in ("temperature", "top_p", "max_tokens", "response_format")}
+        version = prompt_version(self.system_prompt, self.tools_definition if self._uses_tools() else None)
+        return make_cache_key(request_text, version, f"{self.config.provider}/{self.config.model}", sampling)
+
+    @staticmethod
+    def _print_field(key: str, value: Any):
+        """流式模式默认的字段回调"""
+        shown = " ".join(value) if isinstance(value, list) else str(value)
+        print(f"📝 [{key}] {shown[:80]}{'...' if len(shown) > 80 else ''}")
+
+    def _start_generation(self, product_name: str, style: str, target_audience: str, key_features: List[str]) -> List[Dict]:
+        """打印任务信息并初始化对话历史"""
         print(f"\n🚀 开始生成小红书文案...")
         print(f"📦 产品: {product_name}")
         print(f"🎨 风格: {style or self.config.default_style}")
@@ -426,15 +494,23 @@ class RedNoteGenerator:
         # 构建用户请求
         user_request = self._build_user_request(product_name, style, target_audience, key_features)
         
-        # 初始化对话历史
-        messages = [
-            {"role": "system", "content": self.system_prompt},
-            {"role": "user", "content": user_request}
-        ]
-        
-        # 执行生成循环
-        result = self._generation_loop(messages)
-        
+        # 初始化对话历史：共享的静态前缀 + 本次请求
+        return self.prefix.messages(user_request)
+
+    def _static_prefix(self) -> StaticPrefix:
+        """当前服务商/模型共享的系统消息 + 工具定义，保证每次请求开头逐字节一致以命中前缀缓存"""
+        tools = self.tools_definition if self._uses_tools() else None
+        return get_static_prefix(self.config.provider, self.config.model, self.system_prompt, tools)
+
+    def _finish_generation(self, result: Optional[Dict], product_name: str, style: str,
+                           target_audience: str, key_features: List[str],
+                           stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """将生成循环的结果包装为返回值，stats 为生成循环的统计（字段见 generation_trace）"""
+        traces = stats.pop("reasoning_traces", None) if stats else None
+        stats = finish_stats(stats)
+        trace_file = self._save_reasoning(product_name, traces)
+        if trace_file:
+            stats["reasoning_trace"] = trace_file
         if result:
             print("✅ 文案生成成功！")
             return {
@@ -447,12 +523,106 @@ class RedNoteGenerator:
                     "key_features": key_features,
                     "generated_at": datetime.now().isoformat(),
                     "provider": self.config.provider,
-                    "model": self.config.model
+                    "model": self.config.model,
+                    "prompt_prefix": self.prefix.fingerprint,
+                    **stats
                 }
             }
         else:
             print("❌ 文案生成失败")
-            return {"success": False, "error": "生成失败"}
+            return {"success": False, "error": "生成失败", **stats}
+
+    def generate_batch(self, items: List[Dict[str, Any]], concurrency: int = None,
+                       on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+        """
+        并发批量生成文案
+        
+        Args:
+            items: generate 的参数字典列表，如 {"product_name": ..., "style": ...}
+            concurrency: 最大并发数，默认取 config.batch_concurrency
+            on_result: 每完成一条即回调 (序号, 结果)，可用于边生成边保存；回调出错只打印，不中断整批
+            
+        Returns:
+            与 items 顺序一致的结果列表，单条失败不影响其他条目
+        """
+        concurrency = max(1, concurrency or self.config.batch_concurrency)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        print(f"\n📦 批量生成 {len(items)} 条文案，并发数: {concurrency}")
+        start_time = time.time()
+        
+        with self._models_pinned():
+            executor = ThreadPoolExecutor(max_workers=concurrency)
+            futures = {executor.submit(self.generate, **item): index for index, item in enumerate(items)}
+            interrupted = False
+            try:
+                for future in as_completed(futures):
+                    index = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"success": False, "error": f"{type(e).__name__}: {e}"}
+                    results[index] = result
+                    if on_result:
+                        try:
+                            on_result(index, result)
+                        except Exception as e:
+                            print(f"⚠️ 第 {index + 1} 条结果回调失败: {type(e).__name__}: {e}")
+            except KeyboardInterrupt:
+                # 取消尚未开始的条目，不再等整批跑完；正在生成的条目结束后直接丢弃
+                interrupted = True
+                executor.shutdown(wait=False, cancel_futures=True)
+                pending = sum(1 for future in futures if future.cancelled())
+                print(f"\n⏸️ 批量生成已中断，取消 {pending} 条未开始的文案")
+                raise
+            finally:
+                # 其他异常退出时也取消未开始的条目，并等正在生成的条目结束后再解除模型锁定
+                executor.shutdown(wait=not interrupted, cancel_futures=True)
+        
+        success_count = sum(1 for result in results if result["success"])
+        print(f"🏁 批量生成完成: 成功 {success_count}/{len(items)}，耗时 {time.time() - start_time:.1f}s")
+        return results
+
+    def _model_manager(self):
+        """当前 Ollama 端点的模型管理器，其他服务商或关闭预热时返回 None"""
+        if self.config.provider != "ollama" or not self.config.ollama_preload:
+            return None
+        return get_model_manager(self.config.base_url)
+
+    def _warm_up_models(self, models: Optional[List[str]] = None) -> Dict[str, float]:
+        """预热当前模型和 OLLAMA_PRELOAD_MODELS 中的模型，返回各模型的加载耗时"""
+        manager = self._model_manager()
+        if manager is None:
+            return {}
+        return manager.warm_up(models or list(dict.fromkeys([self.config.model] + self.config.ollama_preload_models)))
+
+    def _pin_batch_models(self) -> List[str]:
+        """批量生成前锁定所需模型，返回锁定的模型列表"""
+        manager = self._model_manager()
+        if manager is None:
+            return []
+        manager.pin([self.config.model])
+        return [self.config.model]
+
+    def _release_batch_models(self, models: List[str]):
+        """批量结束后解除锁定（按配置卸载模型）并打印加载耗时"""
+        manager = self._model_manager()
+        if manager is None or not models:
+            return
+        manager.release(models, unload=self.config.ollama_unload_after_batch)
+        keys = {model_key(model) for model in models}
+        for model, stats in manager.report().items():
+            if model in keys and stats["load_seconds"]:
+                print(f"⏱️ 模型 {model}: 载入 {stats['loads']} 次，共 {sum(stats['load_seconds']):.2f}s，"
+                      f"保活 {stats['pings']} 次，中途重新载入 {stats['reloads']} 次")
+
+    @contextmanager
+    def _models_pinned(self):
+        """批量生成期间锁定 Ollama 模型：保持常驻，避免中途被卸载造成延迟尖峰"""
+        models = self._pin_batch_models()
+        try:
+            yield models
+        finally:
+            self._release_batch_models(models)
 
     def _build_user_request(self, product_name: str, style: str, target_audience: str, key_features: List[str]) -> str:
         """构建用户请求文本"""
@@ -476,135 +646,317 @@ class RedNoteGenerator:
         
         return " ".join(request_parts)
 
-    def _generation_loop(self, messages: List[Dict]) -> Optional[Dict]:
+    def _generation_loop(self, messages: List[Dict], note_stream: Optional[NoteStream] = None,
+                         stats: Optional[Dict[str, Any]] = None) -> Optional[Dict]:
         """执行生成循环（ReAct模式）- 修复 Ollama 兼容性"""
+        stats = stats if stats is not None else {}
+        stats.setdefault("llm_calls", 0)
+        stats.setdefault("parse_retries", 0)
+        memo = self._new_tool_memo()
         iteration_count = 0
         
         while iteration_count < self.config.max_iterations:
             iteration_count += 1
             print(f"\n--- 第 {iteration_count} 轮推理 ---")
+            record = start_iteration(stats, iteration_count)
             
             try:
-                # 根据 provider 决定是否使用工具
-                use_tools = self.config.provider == "deepseek"
-                
-                # 对于 DeepSeek-R1 模型，即使在 Ollama 中也启用多轮推理
-                enable_multi_turn = (self.config.provider == "deepseek" or 
-                                    (self.config.provider == "ollama" and "deepseek-r1" in self.config.model))
-                
-                if use_tools:
-                    # DeepSeek 支持工具调用
-                    response = self.client.chat.completions.create(
-                        model=self.config.model,
-                        messages=messages,
-                        tools=self.tools_definition,
-                        tool_choice="auto",
-                        temperature=0.7,
-                        max_tokens=2000
-                    )
-                else:
-                    # Ollama 不支持工具调用，使用简化的方式
-                    simplified_messages = self._simplify_messages_for_ollama(messages)
-                    
-                    # 修复：为 Ollama 添加更多参数
-                    response = self.client.chat.completions.create(
-                        model=self.config.model,
-                        messages=simplified_messages,
-                        temperature=0.7,
-                        max_tokens=2000,
-                        stream=False  # 确保不使用流式输出
-                    )
-                
-                response_message = response.choices[0].message
+                request_kwargs = self._build_request_kwargs(messages)
+                stats["llm_calls"] += 1
+                with self._scheduled(request_kwargs, record):
+                    call_start = time.time()
+                    if note_stream:
+                        response_message, usage = self._stream_message(request_kwargs, note_stream, record)
+                    else:
+                        response = self._chat_completion(record, **request_kwargs)
+                        response_message = response.choices[0].message
+                        usage = getattr(response, "usage", None)
+                    record_llm_call(stats, record, time.time() - call_start, usage)
+                    self._record_reasoning(stats, record, response_message, note_stream, usage)
                 
                 # 处理工具调用（仅 DeepSeek）
-                if use_tools and response_message.tool_calls:
-                    print("🤖 Agent决定调用工具...")
-                    messages.append({
-                        "role": "assistant",
-                        "content": response_message.content,
-                        "tool_calls": [
-                            {
-                                "id": tool_call.id,
-                                "type": "function",
-                                "function": {
-                                    "name": tool_call.function.name,
-                                    "arguments": tool_call.function.arguments
-                                }
-                            } for tool_call in response_message.tool_calls
-                        ]
-                    })
+                if self._uses_tools() and response_message.tool_calls:
+                    record["outcome"] = "tool_calls"
+                    self._append_tool_call_message(messages, response_message)
                     
                     # 执行所有工具调用
-                    tool_outputs = self._execute_tool_calls(response_message.tool_calls)
+                    tool_outputs = self._execute_tool_calls(response_message.tool_calls, record["tools"], memo)
                     messages.extend(tool_outputs)
                 
                 # 处理最终内容
                 elif response_message.content:
-                    if use_tools:
-                        print(f"💭 Agent生成内容")
-                    else:
-                        model_info = f"DeepSeek-R1 推理模式" if "deepseek-r1" in self.config.model else "Ollama 直接生成"
-                        print(f"🤖 {model_info}")
+                    # 流式解析出的对象与非流式一样校验字段类型，不合格时交给 _handle_content 修复或重试
+                    if note_stream and note_stream.parser.done and is_valid_note(note_stream.parser.result):
+                        print("✅ JSON流式解析成功")
+                        record["outcome"] = "parsed"
+                        self.iteration_policy.settle(stats, True)
+                        return note_stream.parser.result
                     
-                    # 尝试解析JSON内容
-                    result = self._extract_json_content(response_message.content)
+                    result = self._handle_content(messages, response_message.content, stats)
                     if result:
                         return result
-                    else:
-                        # 解析失败，根据模型能力决定是否继续多轮推理
-                        messages.append({
-                            "role": "assistant",
-                            "content": response_message.content
-                        })
-                        
-                        if enable_multi_turn:
-                            # 支持多轮推理的模型，提供更详细的引导
-                            if "deepseek-r1" in self.config.model:
-                                guidance = """让我重新分析和生成文案。请按照以下步骤：
-
-1. 分析产品的核心卖点和目标用户
-2. 构思吸引人的标题和生动的内容描述  
-3. 选择合适的标签和表情符号
-
-最终请以标准JSON格式输出：
-```json
-{
-  "title": "标题（包含表情符号）",
-  "body": "正文内容（真实体验分享）",
-  "hashtags": ["#标签1", "#标签2", "#标签3", "#标签4", "#标签5"],
-  "emojis": ["✨", "🔥", "💖", "💧"]
-}
-```"""
-                            else:
-                                guidance = "请重新分析产品特点，生成更高质量的小红书文案，确保以完整的JSON格式输出。"
-                        else:
-                            # 普通 Ollama 模型，简单重新生成
-                            guidance = "请确保以完整的JSON格式输出文案，格式为：```json\n{\"title\": \"...\", \"body\": \"...\", \"hashtags\": [...], \"emojis\": [...]}\n```"
-                        
-                        messages.append({
-                            "role": "user", 
-                            "content": guidance
-                        })
-                        print("⚠️ JSON解析失败，启用多轮推理优化...")
+                    if record.get("decision") == "stop":
+                        return None
                 
                 else:
                     print("❓ 未知响应类型")
+                    record["outcome"] = "empty"
                     break
-                    
+            
             except Exception as e:
-                print(f"❌ API调用错误: {e}")
-                # 修复：在 Ollama 失败时提供更详细的错误信息
-                if self.config.provider == "ollama":
-                    print("💡 Ollama 错误排查建议：")
-                    print("   1. 检查 Ollama 是否正在运行: ollama serve")
-                    print("   2. 检查模型是否已下载: ollama list")
-                    print(f"   3. 尝试拉取模型: ollama pull {self.config.model}")
+                self._report_api_error(e)
+                record["outcome"] = "error"
                 break
         
         print(f"\n⚠️ 达到最大迭代次数 ({self.config.max_iterations})，生成失败")
         return None
 
+    def _uses_tools(self) -> bool:
+        """根据 provider 决定是否使用工具（仅 DeepSeek 支持工具调用）"""
+        return self.config.provider == "deepseek"
+
+    def _think_budget(self) -> Optional[int]:
+        """推理模型每轮的推理 token 上限，其他模型或不限时返回 None"""
+        return (self.config.think_budget or None) if is_reasoning_model(self.config.model) else None
+
+    def _max_tokens(self) -> int:
+        """输出上限：推理模型在回答的 2000 之外预留推理预算，推理不再挤占回答"""
+        return 2000 + (self._think_budget() or 0)
+
+    def _record_reasoning(self, stats: Dict[str, Any], record: Dict[str, Any], message,
+                          note_stream: Optional[NoteStream] = None, usage=None):
+        """记录本轮推理与回答的 token 数，推理内容暂存在 stats 中，生成结束后另存"""
+        if note_stream:
+            reasoning, answer = note_stream.splitter.reasoning, note_stream.splitter.answer
+            truncated = note_stream.thinking_exhausted
+        else:
+            reasoning, answer = split_reasoning(message.content, reasoning_field(message))
+            truncated = False
+        record.update(token_split(reasoning, answer, record.get("completion_tokens"), reported_reasoning_tokens(usage)))
+        if reasoning:
+            stats.setdefault("reasoning_traces", []).append({
+                "iteration": record["iteration"],
+                "reasoning": reasoning,
+                "reasoning_tokens": record["reasoning_tokens"],
+                "truncated": truncated
+            })
+
+    def _save_reasoning(self, product_name: str, traces: Optional[List[Dict[str, Any]]]) -> Optional[str]:
+        """把一篇文案各轮的推理过程追加到当日的 reasoning_traces.jsonl"""
+        if not traces or not self.config.save_reasoning:
+            return None
+        store = ReasoningTraceStore(self.config.daily_dir / "reasoning_traces.jsonl")
+        return store.save(product_name, self.config.model, traces)
+
+    def _build_request_kwargs(self, messages: List[Dict]) -> Dict[str, Any]:
+        """构建本轮对话请求参数"""
+        if self._uses_tools():
+            # DeepSeek 支持工具调用
+            kwargs = {
+                "model": self.config.model,
+                "messages": messages,
+                "tools": self.prefix.tools,
+                "tool_choice": "auto",
+                "temperature": 0.7,
+                "max_tokens": self._max_tokens()
+            }
+        else:
+            # Ollama 不支持工具调用，使用简化的方式
+            # 修复：为 Ollama 添加更多参数
+            kwargs = {
+                "model": self.config.model,
+                "messages": self._simplify_messages_for_ollama(messages),
+                "temperature": 0.7,
+                "max_tokens": self._max_tokens(),
+                "stream": False  # 确保不使用流式输出
+            }
+        
+        # 结构化输出：JSON 模式 / JSON Schema 约束，第一次就返回合法对象
+        if self.config.structured_output:
+            kwargs["response_format"] = response_format_for(self.config.provider)
+        return kwargs
+
+    def _append_tool_call_message(self, messages: List[Dict], response_message):
+        """将助手的工具调用请求追加到对话历史"""
+        print("🤖 Agent决定调用工具...")
+        messages.append({
+            "role": "assistant",
+            "content": response_message.content,
+            "tool_calls": [
+                {
+                    "id": tool_call.id,
+                    "type": "function",
+                    "function": {
+                        "name": tool_call.function.name,
+                        "arguments": tool_call.function.arguments
+                    }
+                } for tool_call in response_message.tool_calls
+            ]
+        })
+
+    def _handle_content(self, messages: List[Dict], content: str, stats: Optional[Dict[str, Any]] = None) -> Optional[Dict]:
+        """解析最终内容；失败时由迭代策略决定本地修复、追加针对性提示重试或停止，后两者返回 None"""
+        stats = stats if stats is not None else {}
+        record = stats["iterations"][-1] if stats.get("iterations") else {}
+        
+        if self._uses_tools():
+            print(f"💭 Agent生成内容")
+        else:
+            model_info = f"DeepSeek-R1 推理模式" if "deepseek-r1" in self.config.model else "Ollama 直接生成"
+            print(f"🤖 {model_info}")
+        
+        # 尝试解析JSON内容（结构化输出下内容本身就是 JSON，先直接解析）
+        result = (self.config.structured_output and parse_structured(content)) or self._extract_json_content(content)
+        self.iteration_policy.settle(stats, bool(result))
+        if result:
+            record["outcome"] = "parsed"
+            return result
+        
+        # 解析失败，按失败类型、剩余轮次/预算和模型历史成功率决定下一步
+        decision = self.iteration_policy.decide(content, messages, stats)
+        record["failure"] = decision.failure
+        record["decision"] = decision.action
+        print(f"⚠️ JSON解析失败（{decision.failure}），{decision.action}: {decision.reason}")
+        
+        if decision.action == "repair":
+            record["outcome"] = "repaired"
+            print("🩹 本地修复成功")
+            return decision.result
+        
+        record["outcome"] = "parse_failed"
+        if decision.action == "retry":
+            stats["parse_retries"] = stats.get("parse_retries", 0) + 1
+            decision.apply(messages, content)
+        return None
+
+    def _report_api_error(self, error: Exception):
+        """打印 API 调用错误"""
+        print(f"❌ API调用错误: {error}")
+        # 修复：在 Ollama 失败时提供更详细的错误信息
+        if self.config.provider == "ollama":
+            print("💡 Ollama 错误排查建议：")
+            print("   1. 检查 Ollama 是否正在运行: ollama serve")
+            print("   2. 检查模型是否已下载: ollama list")
+            print(f"   3. 尝试拉取模型: ollama pull {self.config.model}")
+
+    def _chat_completion(self, record: Optional[Dict[str, Any]] = None, **kwargs):
+        """
+        发送一次对话请求，按当前服务商的速率限制排队，排队时间记入本轮的 rate_limit_seconds。
+        流式请求的用量在最后一个数据块中，由 _stream_message 接收完后修正
+        """
+        limiter = self._rate_limiter()
+        estimated_tokens = self._estimate_request_tokens(kwargs)
+        waited = limiter.acquire(estimated_tokens)
+        note_rate_limit_wait(record, waited)
+        
+        response = self.client.chat.completions.create(**kwargs)
+        if not kwargs.get("stream"):
+            self._settle_usage(limiter, getattr(response, "usage", None), estimated_tokens)
+        return response
+
+    def _stream_message(self, request_kwargs: Dict[str, Any], note_stream: NoteStream,
+                        record: Optional[Dict[str, Any]] = None):
+        """
+        流式发送请求并逐段解析，文案 JSON 闭合后立即停止接收。
+        返回 (消息, 用量)：用量来自 include_usage 的最后一个数据块，提前停止接收时为 None
+        """
+        note_stream.new_turn()
+        request_kwargs = {**request_kwargs, "stream": True, "stream_options": {"include_usage": True}}
+        response = self._chat_completion(record, **request_kwargs)
+        content_parts = []
+        tool_call_slots = {}
+        usage = None
+        
+        try:
+            for chunk in response:
+                usage = getattr(chunk, "usage", None) or usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                for tool_call_delta in delta.tool_calls or []:
+                    merge_tool_call_delta(tool_call_slots, tool_call_delta)
+                reasoning = reasoning_field(delta)
+                if reasoning:
+                    note_stream.feed_reasoning(reasoning)
+                if delta.content:
+                    content_parts.append(delta.content)
+                    if note_stream.feed(delta.content):
+                        break
+                if note_stream.thinking_exhausted:
+                    print(f"🧠 推理超出预算（约 {note_stream.splitter.reasoning_tokens} tokens），提前结束本轮")
+                    break
+        finally:
+            response.close()
+        
+        content = "".join(content_parts)
+        if note_stream.thinking_exhausted and not content:
+            # 推理在独立字段中返回：补上未闭合的 <think>，由迭代策略按 think_only 处理
+            content = THINK_OPEN + note_stream.splitter.reasoning
+        
+        estimated_tokens = self._estimate_request_tokens(request_kwargs)
+        if usage is None:
+            # 提前停止接收时没有用量块，按提示词和已接收的推理、回答估算
+            used = (estimate_message_tokens(request_kwargs["messages"]) + note_stream.splitter.reasoning_tokens
+                    + estimate_text_tokens("".join(content_parts)))
+            self._rate_limiter().adjust(used - estimated_tokens)
+        else:
+            self._settle_usage(self._rate_limiter(), usage, estimated_tokens)
+        return assemble_message(content, tool_call_slots), usage
+
+    def _ollama_scheduler(self):
+        """当前 Ollama 端点共享的调度器，其他服务商返回 None"""
+        if self.config.provider != "ollama":
+            return None
+        return get_ollama_scheduler(self.config.base_url, self.config.ollama_max_in_flight)
+
+    def _predict_output(self, scheduler, request_kwargs: Dict[str, Any]) -> tuple:
+        """本次请求的类别和预计长度（历史输出不超过 max_tokens，加上提示词折算）"""
+        kind = request_kind(request_kwargs["model"], request_kwargs["messages"])
+        return kind, scheduler.predictor.predict(request_kwargs["model"], kind, request_kwargs.get("max_tokens"),
+                                                 estimate_message_tokens(request_kwargs["messages"]))
+
+    @staticmethod
+    def _note_queue_wait(record: Dict[str, Any], ticket, predicted: int):
+        """记录本轮在调度器中的排队时间"""
+        record["queue_seconds"] = round(ticket.queue_seconds, 3)
+        record["predicted_tokens"] = predicted
+        if ticket.queue_seconds > 0.5:
+            print(f"🚦 Ollama 调度排队 {ticket.queue_seconds:.1f}s（预计 {predicted} tokens）")
+
+    @contextmanager
+    def _scheduled(self, request_kwargs: Dict[str, Any], record: Dict[str, Any]):
+        """Ollama 请求先在调度器中排队：在途请求数不超过服务端并行数，预计输出短的先发"""
+        scheduler = self._ollama_scheduler()
+        if scheduler is None:
+            yield
+            return
+        kind, predicted = self._predict_output(scheduler, request_kwargs)
+        with scheduler.slot(predicted) as ticket:
+            self._note_queue_wait(record, ticket, predicted)
+            yield
+        scheduler.predictor.observe(request_kwargs["model"], kind, self._observed_tokens(record))
+
+    @staticmethod
+    def _observed_tokens(record: Dict[str, Any]) -> Optional[int]:
+        """本轮实际输出 token 数：流式提前结束时服务端不返回用量，按推理和回答的估算值"""
+        return record.get("completion_tokens") or (record.get("reasoning_tokens") or 0) + (record.get("answer_tokens") or 0)
+
+    def _rate_limiter(self):
+        """当前服务商端点共享的限速器"""
+        return get_rate_limiter(self.config.provider, self.config.base_url,
+                                self.config.requests_per_minute, self.config.tokens_per_minute)
+
+    @staticmethod
+    def _estimate_request_tokens(kwargs: Dict[str, Any]) -> int:
+        """请求前预估的 token 数：提示词加上输出上限"""
+        return estimate_message_tokens(kwargs["messages"]) + kwargs.get("max_tokens", 0)
+
+    @staticmethod
+    def _settle_usage(limiter, usage, estimated_tokens: int):
+        """按实际用量修正预估"""
+        if usage and getattr(usage, "total_tokens", None):
+            limiter.adjust(usage.total_tokens - estimated_tokens)
+
     def _simplify_messages_for_ollama(self, messages: List[Dict]) -> List[Dict]:
         """为 Ollama 简化消息，移除工具相关内容"""
         simplified = []
@@ -621,115 +973,108 @@ class RedNoteGenerator:
         
         return simplified
 
-    def _execute_tool_calls(self, tool_calls) -> List[Dict]:
-        """执行工具调用"""
-        tool_outputs = []
+    def _new_tool_memo(self) -> ToolMemo:
+        """每次生成一个工具结果备忘，开启 shared_tool_memo 时挂接进程内共享缓存"""
+        return ToolMemo(self.tool_registry, get_shared_tool_cache() if self.config.shared_tool_memo else None)
+
+    def _execute_tool_calls(self, tool_calls, timings: Optional[List[Dict]] = None,
+                            memo: Optional[ToolMemo] = None) -> List[Dict]:
+        """
+        执行工具调用，timings 不为 None 时记录每个工具的耗时；memo 中已有的结果直接复用
+        
+        同一轮的工具先全部提交到注册表的线程池并发执行，再按各自声明的超时收集结果，
+        超时不会累加，超时后把降级结果交给模型，不再等待；同一轮中相同的调用只执行一次
+        """
+        tool_outputs: Dict[int, Dict] = {}
+        pending = []  # (序号, tool_call, 工具名, 参数, future, 开始时间, 是否为本轮首次调用)
+        submitted = {}  # 备忘键 -> (future, 开始时间)
         
-        for tool_call in tool_calls:
-            function_name = tool_call.function.name
-            function_args = json.loads(tool_call.function.arguments) if tool_call.function.arguments else {}
+        for index, tool_call in enumerate(tool_calls):
+            function_name, function_args = self._parse_tool_call(tool_call)
             
-            print(f"🔧 调用工具: {function_name}")
-            print(f"📝 参数: {function_args}")
+            if function_name not in self.available_tools:
+                error_msg = f"未知工具: {function_name}"
+                print(f"❌ {error_msg}")
+                tool_outputs[index] = self._tool_output(tool_call, error_msg)
+                continue
             
-            # 执行工具函数
-            if function_name in self.available_tools:
-                try:
-                    tool_function = self.available_tools[function_name]
-                    tool_result = tool_function(**function_args)
-                    print(f"📤 工具结果: {tool_result}")
-                    
-                    tool_outputs.append({
-                        "tool_call_id": tool_call.id,
-                        "role": "tool",
-                        "content": str(tool_result)
-                    })
-                except Exception as e:
-                    error_msg = f"工具执行错误: {e}"
-                    print(f"❌ {error_msg}")
-                    tool_outputs.append({
-                        "tool_call_id": tool_call.id,
-                        "role": "tool",
-                        "content": error_msg
-                    })
+            cached = memo.lookup(function_name, function_args) if memo else None
+            if cached:
+                tool_result, saved_seconds, source = cached
+                print(f"♻️ 复用工具结果（{source}），省下 {saved_seconds:.2f}s")
+                tool_outputs[index] = self._tool_output(tool_call, tool_result)
+                record_tool(timings, function_name, 0.0, True, cached=source, saved_seconds=saved_seconds)
+                continue
+            
+            key = memo_key(function_name, function_args) if memo and memo.cacheable(function_name) else None
+            owner = key not in submitted
+            if owner:
+                future, tool_start = self.tool_registry.submit(function_name, function_args), time.time()
+                if key:
+                    submitted[key] = (future, tool_start)
             else:
-                error_msg = f"未知工具: {function_name}"
+                future, tool_start = submitted[key]
+            pending.append((index, tool_call, function_name, function_args, future, tool_start, owner))
+        
+        for index, tool_call, function_name, function_args, future, tool_start, owner in pending:
+            try:
+                tool_result = self.tool_registry.result(function_name, future)
+                elapsed = time.time() - tool_start
+                tool_outputs[index] = self._tool_output(tool_call, str(tool_result))
+                if owner:
+                    print(f"📤 工具结果: {tool_result}")
+                    record_tool(timings, function_name, elapsed, True)
+                    if memo:
+                        memo.store(function_name, function_args, str(tool_result), elapsed)
+                else:
+                    print(f"♻️ 复用同一轮的工具调用: {function_name}")
+                    record_tool(timings, function_name, 0.0, True, cached="generation", saved_seconds=elapsed)
+            except ToolTimeout as e:
+                print(f"⏰ {e}，返回降级结果")
+                tool_outputs[index] = self._tool_output(tool_call, e.degraded)
+                record_tool(timings, function_name, time.time() - tool_start, False, timed_out=True)
+            except Exception as e:
+                error_msg = f"工具执行错误: {e}"
                 print(f"❌ {error_msg}")
-                tool_outputs.append({
-                    "tool_call_id": tool_call.id,
-                    "role": "tool",
-                    "content": error_msg
-                })
+                tool_outputs[index] = self._tool_output(tool_call, error_msg)
+                record_tool(timings, function_name, time.time() - tool_start, False)
         
-        return tool_outputs
+        return [tool_outputs[index] for index in range(len(tool_calls))]
+
+    def _parse_tool_call(self, tool_call) -> tuple:
+        """解析工具名称和参数"""
+        function_name = tool_call.function.name
+        function_args = json.loads(tool_call.function.arguments) if tool_call.function.arguments else {}
+        
+        print(f"🔧 调用工具: {function_name}")
+        print(f"📝 参数: {function_args}")
+        return function_name, function_args
+
+    @staticmethod
+    def _tool_output(tool_call, content: str) -> Dict:
+        """构建工具结果消息"""
+        return {
+            "tool_call_id": tool_call.id,
+            "role": "tool",
+            "content": content
+        }
 
     def _extract_json_content(self, content: str) -> Optional[Dict]:
-        """从响应中提取JSON内容 - 改进版"""
-        # 尝试多种JSON提取方式
-        extraction_patterns = [
-            # 标准markdown json代码块
-            r"```json\s*(\{.*?\})\s*```",
-            # 没有语言标识的代码块
-            r"```\s*(\{.*?\})\s*```",
-            # 直接的JSON对象
-            r"(\{[^{}]*\"title\"[^{}]*\"body\"[^{}]*\"hashtags\"[^{}]*\"emojis\"[^{}]*\})",
-            # 更宽松的JSON匹配
-            r"(\{.*?\"title\".*?\})"
-        ]
-        
-        for pattern in extraction_patterns:
-            json_match = re.search(pattern, content, re.DOTALL | re.IGNORECASE)
-            if json_match:
-                json_str = json_match.group(1)
-                try:
-                    result = json.loads(json_str)
-                    # 验证必要字段
-                    if all(key in result for key in ["title", "body", "hashtags", "emojis"]):
-                        print("✅ JSON解析成功")
-                        return result
-                except json.JSONDecodeError:
-                    continue
-        
-        # 如果所有正则都失败，尝试修复常见的JSON问题
-        cleaned_content = self._clean_json_content(content)
-        if cleaned_content:
-            try:
-                result = json.loads(cleaned_content)
-                if all(key in result for key in ["title", "body", "hashtags", "emojis"]):
-                    print("✅ JSON修复并解析成功")
-                    return result
-            except json.JSONDecodeError:
-                pass
+        """
+        从响应中提取JSON内容：单遍扫描，跳过推理块，并修复尾随逗号、弯引号、截断等问题。
+        字段类型不符合文案格式时返回 None，由迭代策略按 bad_types 修复或重试
+        """
+        result = extract_json(content)
+        if result is not None and is_valid_note(result):
+            print("✅ JSON解析成功")
+            return result
+        if result is not None:
+            print("❌ JSON字段类型不符合要求")
+            return None
         
         print(f"❌ JSON解析失败，原始内容: {content[:200]}...")
         return None
     
-    def _clean_json_content(self, content: str) -> Optional[str]:
-        """尝试清理和修复JSON内容"""
-        # 查找可能的JSON开始和结束
-        start_idx = content.find('{')
-        end_idx = content.rfind('}')
-        
-        if start_idx == -1 or end_idx == -1 or start_idx >= end_idx:
-            return None
-        
-        json_str = content[start_idx:end_idx + 1]
-        
-        # 基本清理
-        json_str = json_str.strip()
-        
-        # 修复常见问题
-        replacements = [
-            (r'"\s*:\s*"([^"]*?)"\s*,?\s*\n', r'": "\1",\n'),  # 修复引号问题
-            (r',\s*}', r'}'),  # 移除尾随逗号
-            (r',\s*]', r']'),  # 移除数组尾随逗号
-        ]
-        
-        for pattern, replacement in replacements:
-            json_str = re.sub(pattern, replacement, json_str)
-        
-        return json_str
-    
     def switch_model(self, model_name: str):
         """切换 Ollama 模型（仅在使用 Ollama 时有效）"""
         if self.config.provider == "ollama":
@@ -738,13 +1083,18 @@ class RedNoteGenerator:
             self.config.model = model_name
             print(f"🔄 Ollama 模型已切换: {old_model} → {model_name}")
             
-            # 重新初始化客户端以测试新模型
+            # 预热新模型后重新测试连接
             try:
+                self._warm_up_models([model_name])
                 self._test_ollama_connection(self.client)
             except Exception as e:
                 print(f"⚠️ 新模型测试失败，回滚到原模型: {e}")
                 self.config.ollama_model = old_model
                 self.config.model = old_model
+            
+            # 不同模型的系统提示词不同，重建静态前缀
+            self.system_prompt = self._get_system_prompt()
+            self.prefix = self._static_prefix()
         else:
             print("⚠️ 只有在使用 Ollama 时才能切换模型")
 
@@ -754,12 +1104,13 @@ class FileManager:
     def __init__(self, config: Config):
         self.config = config
 
-    def save_to_markdown(self, content_data: Dict[str, Any]) -> str:
+    def save_to_markdown(self, content_data: Dict[str, Any], index: Optional[int] = None) -> str:
         """
         保存文案到Markdown文件
         
         Args:
             content_data: 包含文案内容和元信息的字典
+            index: 批量中的序号，加入文件名，同一产品同一秒完成的多篇不会互相覆盖
             
         Returns:
             保存的文件路径
@@ -771,7 +1122,7 @@ class FileManager:
         metadata = content_data["metadata"]
         
         # 生成文件名
-        filename = self._generate_filename(metadata)
+        filename = self._generate_filename(metadata, index)
         filepath = self.config.daily_dir / filename
         
         # 生成Markdown内容
@@ -784,7 +1135,7 @@ class FileManager:
         print(f"💾 文件已保存: {filepath}")
         return str(filepath)
 
-    def _generate_filename(self, metadata: Dict) -> str:
+    def _generate_filename(self, metadata: Dict, index: Optional[int] = None) -> str:
         """生成文件名"""
         product_name = metadata["product_name"]
         provider = metadata.get("provider", "unknown")
@@ -793,7 +1144,8 @@ class FileManager:
         # 清理文件名中的特殊字符
         clean_product = re.sub(r'[<>:"/\\|?*]', '_', product_name)
         
-        return f"{clean_product}_{provider}_{timestamp}.md"
+        suffix = f"_{index}" if index is not None else ""
+        return f"{clean_product}_{provider}_{timestamp}{suffix}.md"
 
     def _format_markdown(self, content: Dict, metadata: Dict) -> str:
         """格式化Markdown内容"""
@@ -870,76 +1222,61 @@ def quick_test_ollama():
 
 
 def main():
-    """主函数 - 修复版本"""
+    """主函数：可用的 Ollama / DeepSeek 都加入路由，每次生成交给最快的健康后端，失败自动切换"""
+    from provider_router import build_router
+    
     try:
         print("🚀 小红书文案生成器 - 修复版")
         print("=" * 50)
         
-        # 首先测试 Ollama 连接
-        if not quick_test_ollama():
+        try:
+            router = build_router()
+        except ValueError:
+            print("❌ 没有可用的服务")
             print("\n💡 Ollama 故障排除建议:")
             print("1. 启动 Ollama 服务: ollama serve")
             print("2. 下载模型: ollama pull llama3.2")
             print("3. 检查模型列表: ollama list")
             print("4. 检查端口: 确保 11434 端口未被占用")
+            print("💡 或设置 DEEPSEEK_API_KEY 使用 DeepSeek API")
             return 1
         
-        # ======== 使用 Ollama 本地模型 ========
-        print(f"\n🤖 使用 Ollama 本地模型")
-        print("-" * 30)
-        
-        ollama_config = Config(provider="ollama")
-        ollama_generator = RedNoteGenerator(ollama_config)
-        ollama_file_manager = FileManager(ollama_config)
-        
-        # ======== 测试案例 ========
-        test_case = {
-            "product_name": "深海蓝藻保湿面膜",
-            "style": "活泼甜美",
-            "target_audience": "20-30岁女性",
-            "key_features": ["深层补水", "修护屏障", "温和不刺激"]
-        }
-        
-        print(f"\n🎯 开始测试文案生成")
-        print(f"📦 测试产品: {test_case['product_name']}")
-        
-        # ======== 测试 Ollama ========
-        result_ollama = ollama_generator.generate(**test_case)
-        
-        if result_ollama["success"]:
-            filepath_ollama = ollama_file_manager.save_to_markdown(result_ollama)
-            print(f"✅ Ollama 生成成功，文件: {filepath_ollama}")
+        try:
+            print(f"\n🧭 可用后端: {', '.join(backend.name for backend in router.backends)}")
+            
+            # ======== 测试案例 ========
+            test_case = {
+                "product_name": "深海蓝藻保湿面膜",
+                "style": "活泼甜美",
+                "target_audience": "20-30岁女性",
+                "key_features": ["深层补水", "修护屏障", "温和不刺激"]
+            }
+            
+            print(f"\n🎯 开始测试文案生成")
+            print(f"📦 测试产品: {test_case['product_name']}")
+            
+            result = router.generate(**test_case)
+            route = result.get("metadata", result)["route"]
+            print(f"🧭 路由: {' → '.join(route['tried'])}，对冲: {route['hedged']}，故障转移: {route['failovers']}")
+            
+            if not result["success"]:
+                print(f"❌ 生成失败: {result.get('error')}")
+                return 1
+            
+            file_manager = FileManager(router.backends[0].generator.config)
+            filepath = file_manager.save_to_markdown(result)
+            print(f"✅ {route['backend']} 生成成功，文件: {filepath}")
             
             # 显示生成的内容
-            content = result_ollama["content"]
+            content = result["content"]
             print(f"\n📝 生成的文案预览:")
             print(f"标题: {content['title']}")
             print(f"正文: {content['body'][:100]}...")
             print(f"标签: {' '.join(content['hashtags'])}")
             
-        else:
-            print(f"❌ Ollama 生成失败: {result_ollama.get('error')}")
-            return 1
-        
-        # ======== 测试 DeepSeek（如果可用） ========
-        try:
-            print(f"\n🌐 测试 DeepSeek API")
-            print("-" * 30)
-            
-            deepseek_config = Config(provider="deepseek")
-            deepseek_generator = RedNoteGenerator(deepseek_config)
-            deepseek_file_manager = FileManager(deepseek_config)
-            
-            result_deepseek = deepseek_generator.generate(**test_case)
-            
-            if result_deepseek["success"]:
-                filepath_deepseek = deepseek_file_manager.save_to_markdown(result_deepseek)
-                print(f"✅ DeepSeek 生成成功，文件: {filepath_deepseek}")
-            else:
-                print(f"❌ DeepSeek 生成失败: {result_deepseek.get('error')}")
-                
-        except ValueError as e:
-            print(f"⚠️ DeepSeek API 不可用: {e}")
+            router.print_report()
+        finally:
+            router.close()
         
         print(f"\n🏁 测试完成！输出文件保存在: output/")
         return 0
@@ -978,6 +1315,7 @@ def demo_usage():
     print("export AI_PROVIDER=ollama")
     print("export OLLAMA_MODEL=llama3.2")
     print("export OLLAMA_BASE_URL=http://localhost:11434/v1")
+    print("export ROUTER_BACKENDS=ollama,deepseek  # 路由的后端及优先级")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+文案响应缓存
+以规范化后的用户请求、系统提示词版本、模型和采样参数为键，将生成结果持久化到
+缓存目录下的 SQLite 文件中。支持过期时间、按容量淘汰最久未使用的条目，
+以及为同一请求缓存 N 个不同样本并轮流返回（variations）。
+SQLite 自带文件锁，多个批量生成线程/进程共享同一个缓存目录是安全的。
+
+示例:
+    python response_cache.py stats --dir .cache/rednote
+    python response_cache.py prune --dir .cache/rednote --ttl-hours 24
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import time
+import unicodedata
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional, Any
+
+DB_FILENAME = "responses.sqlite3"
+
+
+def normalize_request(text: str) -> str:
+    """规范化请求文本：统一全半角、合并空白"""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def prompt_version(system_prompt: str, tools_definition: Any = None) -> str:
+    """由系统提示词和工具定义计算版本号，提示词一改缓存自动失效"""
+    payload = system_prompt + json.dumps(tools_definition or [], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def make_cache_key(request_text: str, version: str, model: str, sampling: Dict[str, Any]) -> str:
+    """计算缓存键"""
+    payload = json.dumps({
+        "request": normalize_request(request_text),
+        "prompt_version": version,
+        "model": model,
+        "sampling": sampling
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """基于 SQLite 的持久化响应缓存"""
+
+    def __init__(self, cache_dir: str, ttl_seconds: Optional[float] = None,
+                 max_bytes: int = 50 * 1024 * 1024, variations: int = 1):
+        """
+        Args:
+            cache_dir: 缓存目录，可被多个进程共享
+            ttl_seconds: 条目过期时间，None 表示永不过期
+            max_bytes: 缓存内容总大小上限，超出后淘汰最久未访问的条目
+            variations: 每个请求缓存的样本数，攒够后轮流返回
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.cache_dir / DB_FILENAME
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.variations = max(1, variations)
+        self.hits = 0
+        self.misses = 0
+
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT NOT NULL,
+                    variant INTEGER NOT NULL,
+                    content TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (key, variant)
+                )
+            """)
+            conn.execute("CREATE TABLE IF NOT EXISTS rotation (key TEXT PRIMARY KEY, next_variant INTEGER NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses (last_access)")
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # 每次操作使用独立连接，线程间不共享；isolation_level=None 以便手动 BEGIN IMMEDIATE
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    @contextmanager
+    def _transaction(self):
+        """写事务：BEGIN IMMEDIATE 立即获取写锁，避免并发读改写冲突"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _expired_before(self, now: float) -> float:
+        return now - self.ttl_seconds if self.ttl_seconds else float("-inf")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        读取缓存
+
+        样本数未攒够 variations 时返回 None，让调用方生成新样本；
+        攒够后按顺序轮流返回各个样本。
+        """
+        now = time.time()
+        content = None
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM responses WHERE key = ? AND created_at < ?", (key, self._expired_before(now)))
+            rows = conn.execute("SELECT variant, content FROM responses WHERE key = ? ORDER BY variant",
+                                (key,)).fetchall()
+            if len(rows) >= self.variations:
+                row = conn.execute("SELECT next_variant FROM rotation WHERE key = ?", (key,)).fetchone()
+                index = (row[0] if row else 0) % len(rows)
+                variant, content = rows[index]
+                conn.execute("INSERT OR REPLACE INTO rotation (key, next_variant) VALUES (?, ?)",
+                             (key, (index + 1) % len(rows)))
+                conn.execute("UPDATE responses SET last_access = ? WHERE key = ? AND variant = ?",
+                             (now, key, variant))
+
+        if content is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(content)
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """写入一个新样本；该请求已有 variations 个样本时忽略"""
+        content = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._transaction() as conn:
+            count = conn.execute("SELECT COUNT(*) FROM responses WHERE key = ?", (key,)).fetchone()[0]
+            if count < self.variations:
+                variant = conn.execute("SELECT COALESCE(MAX(variant) + 1, 0) FROM responses WHERE key = ?",
+                                       (key,)).fetchone()[0]
+                conn.execute("INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                             (key, variant, content, len(content.encode("utf-8")), now, now))
+                self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        """超出容量时按最久未访问的顺序淘汰"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        victims = []
+        for key, variant, size in conn.execute("SELECT key, variant, size FROM responses ORDER BY last_access"):
+            victims.append((key, variant))
+            freed += size
+            if total - freed <= self.max_bytes:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ? AND variant = ?", victims)
+
+    def prune(self) -> int:
+        """删除所有过期条目，返回删除数"""
+        with self._transaction() as conn:
+            cursor = conn.execute("DELETE FROM responses WHERE created_at < ?", (self._expired_before(time.time()),))
+            conn.execute("DELETE FROM rotation WHERE key NOT IN (SELECT DISTINCT key FROM responses)")
+            return cursor.rowcount
+
+    def clear(self):
+        """清空缓存"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM responses")
+            conn.execute("DELETE FROM rotation")
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        with self._transaction() as conn:
+            keys, entries, size = conn.execute(
+                "SELECT COUNT(DISTINCT key), COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "keys": keys,
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None
+        }
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="管理文案响应缓存")
+    parser.add_argument("action", choices=["stats", "prune", "clear"], help="查看统计 / 删除过期条目 / 清空")
+    parser.add_argument("--dir", default=".cache/rednote", help="缓存目录")
+    parser.add_argument("--ttl-hours", type=float, default=None, help="prune 使用的过期时间（小时）")
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.dir, ttl_seconds=args.ttl_hours * 3600 if args.ttl_hours else None)
+    if args.action == "prune":
+        if not cache.ttl_seconds:
+            print("⚠️ prune 需要指定 --ttl-hours")
+            return 1
+        print(f"🧹 已删除 {cache.prune()} 个过期条目")
+    elif args.action == "clear":
+        cache.clear()
+        print("🗑️ 缓存已清空")
+
+    stats = cache.stats()
+    print(f"📦 缓存: {stats['keys']} 个请求，{stats['entries']} 个样本，{stats['bytes'] / 1024:.1f} KB")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+search_web 工具的搜索后端
+- LocalTrendsBackend: 离线使用，对 data/trends_corpus.jsonl 建倒排索引（中文按二元组切词，BM25 打分）
+- HttpSearchBackend:  生产环境使用，请求 JSON 搜索接口（默认兼容 SearxNG 的 /search?format=json）
+
+SearchService 在后端之外提供 TTL 缓存和请求合并：同一查询正在进行时，后来的调用直接等待同一个结果，
+批量生成中重复的趋势查询只会真正搜索一次。服务在独立的事件循环线程中运行，
+同步生成器（多线程）和异步生成器共用同一份缓存。
+
+环境变量:
+    SEARCH_BACKEND=local|http   默认 local
+    SEARCH_URL / SEARCH_API_KEY http 后端的地址和密钥
+    SEARCH_CACHE_TTL            缓存秒数，默认 600
+
+命令行:
+    python search_backend.py "保湿面膜 用户评价"
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+DEFAULT_CORPUS = Path(__file__).parent / "data" / "trends_corpus.jsonl"
+
+_CJK_RUN = re.compile(r"[\u4e00-\u9fff]+")
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize_query(query: str) -> str:
+    """缓存键：去掉首尾空白、合并空白、英文转小写"""
+    return " ".join(query.split()).lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """中文按二元组切分（单字词保留单字），英文和数字按单词切分"""
+    text = text.lower()
+    terms = _WORD.findall(text)
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def format_results(query: str, results: List[Dict[str, str]]) -> str:
+    """把搜索结果整理为交给模型的文本"""
+    if not results:
+        return f"关于'{query}'的市场反馈：用户普遍关注产品成分、功效和使用体验"
+    return "\n".join(f"{i}. {item['title']}：{item['snippet']}" for i, item in enumerate(results, 1))
+
+
+class SearchBackend:
+    """搜索后端接口：search 返回 [{title, snippet}]"""
+
+    name = "base"
+
+    async def search(self, query: str) -> List[Dict[str, str]]:
+        raise NotImplementedError
+
+    async def aclose(self):
+        """释放后端资源"""
+
+
+class LocalTrendsBackend(SearchBackend):
+    """基于本地趋势语料的 BM25 检索"""
+
+    name = "local"
+
+    def __init__(self, path: Path = DEFAULT_CORPUS, top_k: int = 3, k1: float = 1.5, b: float = 0.75):
+        self.top_k = top_k
+        self.k1 = k1
+        self.b = b
+        with open(path, "r", encoding="utf-8") as f:
+            self.documents = [json.loads(line) for line in f if line.strip()]
+
+        # 倒排索引：词 -> {文档序号: 词频}
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.lengths: List[int] = []
+        for doc_id, doc in enumerate(self.documents):
+            terms = tokenize(" ".join([doc["title"], doc["content"], *doc.get("tags", [])]))
+            self.lengths.append(len(terms))
+            for term in terms:
+                counts = self.postings.setdefault(term, {})
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    def query(self, query: str) -> List[Dict[str, str]]:
+        """同步检索，返回得分最高的 top_k 条"""
+        scores: Dict[int, float] = {}
+        total = len(self.documents)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / self.avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores, key=lambda doc_id: -scores[doc_id])[:self.top_k]
+        return [{"title": self.documents[i]["title"], "snippet": self.documents[i]["content"]} for i in ranked]
+
+    async def search(self, query: str) -> List[Dict[str, str]]:
+        return self.query(query)
+
+
+class HttpSearchBackend(SearchBackend):
+    """请求 JSON 搜索接口，结果取 results_key 下的列表（每项含 title 和 content/snippet）"""
+
+    name = "http"
+
+    def __init__(self, url: str, api_key: Optional[str] = None, top_k: int = 3, timeout: float = 10.0,
+                 query_param: str = "q", results_key: str = "results",
+                 extra_params: Optional[Dict[str, str]] = None, client: Optional[httpx.AsyncClient] = None):
+        self.url = url
+        self.api_key = api_key
+        self.top_k = top_k
+        self.timeout = timeout
+        self.query_param = query_param
+        self.results_key = results_key
+        self.extra_params = {"format": "json"} if extra_params is None else extra_params
+        self._client = client
+
+    async def search(self, query: str) -> List[Dict[str, str]]:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        response = await self._client.get(self.url, params={self.query_param: query, **self.extra_params},
+                                          headers=headers)
+        response.raise_for_status()
+        items = response.json().get(self.results_key) or []
+        return [
+            {"title": item.get("title", ""), "snippet": item.get("content") or item.get("snippet", "")}
+            for item in items[:self.top_k]
+        ]
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class SearchService:
+    """带 TTL 缓存和请求合并的搜索服务，所有请求在同一个后台事件循环中处理"""
+
+    def __init__(self, backend: SearchBackend, ttl_seconds: float = 600, max_entries: int = 512):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()  # 键 -> (过期时间, 结果文本)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="search-service", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def search_sync(self, query: str, timeout: Optional[float] = 30.0) -> str:
+        """同步接口，供 ToolManager 在任意线程中调用"""
+        future = asyncio.run_coroutine_threadsafe(self._search(query), self._ensure_loop())
+        return future.result(timeout)
+
+    async def search(self, query: str) -> str:
+        """异步接口，可在任意事件循环中 await"""
+        future = asyncio.run_coroutine_threadsafe(self._search(query), self._ensure_loop())
+        return await asyncio.wrap_future(future)
+
+    async def _search(self, query: str) -> str:
+        # 只在服务自己的事件循环中运行，缓存和进行中的请求不需要额外加锁
+        key = normalize_query(query)
+        cached = self._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            self.stats["hits"] += 1
+            print(f"♻️ 搜索缓存命中: {query}")
+            return cached[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["misses"] += 1
+            task = asyncio.ensure_future(self._fetch(key, query))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: str, query: str) -> str:
+        text = format_results(query, await self.backend.search(query))
+        self._cache[key] = (time.monotonic() + self.ttl_seconds, text)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return text
+
+    def close(self):
+        """关闭后端并停止事件循环线程"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.backend.aclose(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+
+def backend_from_env() -> SearchBackend:
+    """按 SEARCH_BACKEND 等环境变量创建后端"""
+    kind = os.getenv("SEARCH_BACKEND", "local").lower()
+    if kind == "http":
+        url = os.getenv("SEARCH_URL")
+        if not url:
+            raise ValueError("SEARCH_BACKEND=http 需要设置 SEARCH_URL 环境变量")
+        return HttpSearchBackend(url, api_key=os.getenv("SEARCH_API_KEY"))
+    if kind == "local":
+        return LocalTrendsBackend()
+    raise ValueError(f"不支持的搜索后端: {kind}，请选择 'local' 或 'http'")
+
+
+_service: Optional[SearchService] = None
+_service_lock = threading.Lock()
+
+
+def get_search_service() -> SearchService:
+    """进程内共享的搜索服务，首次使用时按环境变量创建"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = SearchService(backend_from_env(), ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL", "600")))
+        return _service
+
+
+def set_search_service(service: Optional[SearchService]):
+    """替换共享的搜索服务（旧服务会被关闭），传 None 则下次使用时重新创建"""
+    global _service
+    with _service_lock:
+        old, _service = _service, service
+    if old is not None and old is not service:
+        old.close()
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="测试 search_web 搜索后端")
+    parser.add_argument("query", help="搜索词")
+    args = parser.parse_args()
+
+    try:
+        service = get_search_service()
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    print(f"🔍 后端: {service.backend.name}")
+    start = time.time()
+    print(service.search_sync(args.query))
+    print(f"⏱️ 首次 {time.time() - start:.3f}s")
+    start = time.time()
+    service.search_sync(args.query)
+    print(f"⏱️ 再次 {time.time() - start:.4f}s（缓存）")
+    service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
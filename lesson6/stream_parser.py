@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+流式 JSON 增量解析
+逐段喂入模型输出的 token 增量，跳过 markdown 代码块标记
+（<think> 推理块由 NoteStream 先用 ReasoningSplitter 拆出，解析器只看到回答），
+在顶层字段（title / body / hashtags / emojis）的值完整时立即产出，
+遇到对象的右花括号即认为文案完成，调用方可以提前结束流式请求。
+"""
+
+import json
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from json_extractor import REQUIRED_KEYS
+from reasoning_trace import ReasoningSplitter
+
+
+class StreamingJSONParser:
+    """
+    增量解析器：feed() 返回本次新完成的 (字段名, 值) 列表
+
+    只解析第一个包含全部必需字段的顶层 JSON 对象；
+    不满足要求的对象（如推理过程中的示例）会被丢弃并继续向后查找，
+    但其中已产出的字段不会撤回。
+    """
+
+    def __init__(self, required_keys: Tuple[str, ...] = REQUIRED_KEYS):
+        self.required_keys = required_keys
+        self.text = ""
+        self.fields: Dict[str, Any] = {}
+        self.result: Optional[Dict[str, Any]] = None
+        self._pos = 0
+        self._reset_object()
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None
+
+    def _reset_object(self):
+        self.fields = {}
+        self._obj_start: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._str_start = 0
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+        self._value_done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """喂入一段增量文本，返回新完成的字段"""
+        if self.done or not chunk:
+            return []
+        self.text += chunk
+        events: List[Tuple[str, Any]] = []
+
+        while self._pos < len(self.text) and not self.done:
+            if self._obj_start is None:
+                if not self._seek_object():
+                    break
+            else:
+                self._scan_object(events)
+
+        return events
+
+    def _seek_object(self) -> bool:
+        """在对象外查找下一个 '{'，没有时返回 False"""
+        start = self.text.find("{", self._pos)
+        if start == -1:
+            self._pos = len(self.text)
+            return False
+        self._obj_start = start
+        self._depth = 1
+        self._pos = start + 1
+        return True
+
+    def _scan_object(self, events: List[Tuple[str, Any]]):
+        """扫描对象内部，跟踪顶层键值的起止位置"""
+        text = self.text
+        while self._pos < len(text):
+            i = self._pos
+            ch = text[i]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        if self._key is None:
+                            self._key = self._loads(text[self._str_start:i + 1])
+                        elif self._value_start == self._str_start:
+                            self._complete_value(i + 1, events)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._str_start = i
+                if self._awaiting_value():
+                    self._value_start = i
+            elif ch in "{[":
+                if self._awaiting_value():
+                    self._value_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None:
+                    self._complete_value(i + 1, events)
+                elif self._depth == 0:
+                    if self._value_start is not None:
+                        self._complete_value(i, events)  # 最后一个值是数字/布尔等
+                    self._finish_object(i + 1)
+                    return
+            elif self._depth == 1 and ch == ",":
+                if self._value_start is not None:
+                    self._complete_value(i, events)
+                self._key = None
+                self._value_done = False
+            elif self._awaiting_value() and ch not in ": \t\r\n":
+                self._value_start = i
+
+    def _awaiting_value(self) -> bool:
+        return self._depth == 1 and self._key is not None and self._value_start is None and not self._value_done
+
+    @staticmethod
+    def _loads(raw: str) -> Any:
+        # strict=False 允许字符串中出现模型常输出的未转义换行
+        try:
+            return json.loads(raw, strict=False)
+        except json.JSONDecodeError:
+            return raw.strip().strip('"')
+
+    def _complete_value(self, end: int, events: List[Tuple[str, Any]]):
+        value = self._loads(self.text[self._value_start:end].strip())
+        self.fields[self._key] = value
+        events.append((self._key, value))
+        self._value_start = None
+        self._value_done = True
+
+    def _finish_object(self, end: int):
+        """对象闭合：字段齐全则完成，否则丢弃并继续查找下一个对象"""
+        if all(key in self.fields for key in self.required_keys):
+            try:
+                self.result = json.loads(self.text[self._obj_start:end], strict=False)
+            except json.JSONDecodeError:
+                self.result = dict(self.fields)
+            self.fields = dict(self.result)
+        else:
+            self._reset_object()
+
+
+class NoteStream:
+    """一次流式生成的状态：每轮的推理拆分、解析器、字段回调和时延指标"""
+
+    def __init__(self, on_field: Optional[Callable[[str, Any], None]] = None, think_budget: Optional[int] = None):
+        self.on_field = on_field
+        self.think_budget = think_budget
+        self.start_time = time.time()
+        self.first_token_time: Optional[float] = None
+        self.first_title_time: Optional[float] = None
+        self.parser = StreamingJSONParser()
+        self.splitter = ReasoningSplitter()
+
+    def new_turn(self):
+        """每轮对话使用新的解析器"""
+        self.parser = StreamingJSONParser()
+        self.splitter = ReasoningSplitter()
+
+    @property
+    def thinking_exhausted(self) -> bool:
+        """本轮推理超出预算，应提前结束"""
+        return self.splitter.over_budget(self.think_budget)
+
+    def feed_reasoning(self, text: str):
+        """推理在独立字段中返回时记入本轮推理"""
+        if self.first_token_time is None:
+            self.first_token_time = time.time()
+        self.splitter.feed_reasoning(text)
+
+    def feed(self, chunk: str) -> bool:
+        """喂入增量文本，返回文案 JSON 是否已经闭合"""
+        now = time.time()
+        if self.first_token_time is None:
+            self.first_token_time = now
+        for key, value in self.parser.feed(self.splitter.feed(chunk)):
+            if key == "title" and self.first_title_time is None:
+                self.first_title_time = now
+            if self.on_field:
+                self.on_field(key, value)
+        return self.parser.done
+
+    def metrics(self) -> Dict[str, Optional[float]]:
+        """首 token、首个标题和总耗时（秒）"""
+        def since_start(t: Optional[float]) -> Optional[float]:
+            return round(t - self.start_time, 3) if t is not None else None
+
+        return {
+            "time_to_first_token": since_start(self.first_token_time),
+            "time_to_first_title": since_start(self.first_title_time),
+            "total_time": since_start(time.time())
+        }
+
+
+def merge_tool_call_delta(slots: Dict[int, Dict[str, str]], delta) -> None:
+    """将流式响应中的工具调用增量按 index 合并"""
+    slot = slots.setdefault(delta.index, {"id": "", "name": "", "arguments": ""})
+    if delta.id:
+        slot["id"] = delta.id
+    if delta.function:
+        slot["name"] += delta.function.name or ""
+        slot["arguments"] += delta.function.arguments or ""
+
+
+def assemble_message(content: str, slots: Dict[int, Dict[str, str]]) -> SimpleNamespace:
+    """把流式增量拼成与非流式响应相同结构的 message"""
+    tool_calls = [
+        SimpleNamespace(id=slot["id"], type="function",
+                        function=SimpleNamespace(name=slot["name"], arguments=slot["arguments"]))
+        for _, slot in sorted(slots.items())
+    ]
+    return SimpleNamespace(content=content or None, tool_calls=tool_calls or None)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+结构化输出（约束解码）
+为请求附加 response_format，让模型第一次就返回合法的 {title, body, hashtags, emojis} 对象，
+避免 JSON 解析失败后追加引导消息再花一整轮 LLM 调用：
+- DeepSeek API 支持 JSON 模式：{"type": "json_object"}
+- Ollama 支持 JSON Schema（服务端转换为语法约束）：{"type": "json_schema", ...}
+
+命令行用于对比开启前后平均每篇文案的 LLM 调用次数:
+    python structured_output.py data/batch_products.jsonl --provider ollama --limit 5
+"""
+
+import argparse
+import json
+from typing import Dict, List, Optional, Any
+
+from mode_comparison import compare_modes, print_report
+
+NOTE_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string", "minLength": 1},
+        "body": {"type": "string", "minLength": 1},
+        "hashtags": {"type": "array", "items": {"type": "string"}, "minItems": 3, "maxItems": 10},
+        "emojis": {"type": "array", "items": {"type": "string"}, "minItems": 1, "maxItems": 8}
+    },
+    "required": ["title", "body", "hashtags", "emojis"],
+    "additionalProperties": False
+}
+
+
+def response_format_for(provider: str) -> Dict[str, Any]:
+    """按服务商返回 response_format 参数"""
+    if provider == "ollama":
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": "rednote", "schema": NOTE_SCHEMA, "strict": True}
+        }
+    # DeepSeek 只支持 JSON 模式，提示词中需包含 "json" 字样（系统提示词已满足）
+    return {"type": "json_object"}
+
+
+def parse_structured(content: str) -> Optional[Dict[str, Any]]:
+    """结构化输出下内容本身就是 JSON：直接解析并校验字段类型，失败返回 None"""
+    try:
+        data = json.loads(content.strip(), strict=False)
+    except (json.JSONDecodeError, AttributeError):
+        return None
+    return data if is_valid_note(data) else None
+
+
+def is_valid_note(data: Any) -> bool:
+    """字段类型是否符合文案格式：title/body 为非空字符串，hashtags/emojis 为列表"""
+    if not isinstance(data, dict):
+        return False
+    if not all(isinstance(data.get(key), str) and data[key] for key in ("title", "body")):
+        return False
+    return all(isinstance(data.get(key), list) for key in ("hashtags", "emojis"))
+
+
+def compare(generator, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """分别在关闭/开启结构化输出时生成同一批文案，统计调用次数、成功率和耗时"""
+    return compare_modes(generator, items, "structured_output", ("free-text", "structured"))
+
+
+def main():
+    """命令行入口"""
+    from batch_generate import load_items
+    from rednote import Config, RedNoteGenerator
+
+    parser = argparse.ArgumentParser(description="对比结构化输出开启前后的 LLM 调用次数")
+    parser.add_argument("input", help="产品列表 JSONL")
+    parser.add_argument("--provider", choices=["deepseek", "ollama"], default=None, help="服务提供商")
+    parser.add_argument("--model", default=None, help="Ollama 模型名称")
+    parser.add_argument("--limit", type=int, default=5, help="最多使用的产品数")
+    args = parser.parse_args()
+
+    try:
+        items = load_items(args.input)[:args.limit]
+        generator = RedNoteGenerator(Config(provider=args.provider, ollama_model=args.model))
+    except Exception as e:
+        print(f"❌ 初始化失败: {e}")
+        return 1
+
+    if not items:
+        print("⚠️ 产品列表为空")
+        return 0
+
+    print_report(compare(generator, items))
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
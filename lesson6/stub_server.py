@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本地 OpenAI 兼容桩服务
+不需要 DEEPSEEK_API_KEY 或 ollama serve，就能在本机或 CI 中离线压测完整的生成流程。
+
+实现的接口:
+    POST /v1/chat/completions   普通响应和 stream=True 的 SSE 流（含 tool_calls 增量、include_usage）
+    GET  /v1/models             模型列表
+    GET  /api/tags              Ollama 模型列表（Config 的健康检查）
+    POST /api/generate          Ollama 模型载入 / keep-alive / 卸载（不带 prompt，keep_alive=0 卸载）
+    GET  /api/ps                Ollama 驻留内存的模型
+
+响应来源:
+- 自动模式（默认）：带 tools 的请求第一轮返回 search_web / query_product_database 调用，
+  收到工具结果后返回文案 JSON；不带 tools（Ollama）直接返回文案；r1 模型的回答带 <think> 推理块
+- 脚本模式：--script 指定 JSON 文件（列表，或 {"responses": [...]}），按对话轮次
+  （请求中 assistant 消息的条数）取第 n 条，并发的多个对话各自按脚本推进。每条可以是
+  {"content": ..., "tool_calls": [{"name": ..., "arguments": {...}}], "usage": {...}}，
+  {"status": 429, "error": "..."} 这样的错误，或直接是录制下来的完整 chat.completion 响应
+
+延迟模型：首 token 延迟（fixed / uniform / lognormal 分布）+ 按 token 速率输出，流式响应按块逐段发送。
+load_seconds 模拟 Ollama 载入模型的耗时：请求未驻留的模型时先等待载入，evict() 模拟空闲超时卸载。
+
+命令行:
+    python stub_server.py --port 8000 --ttft 0.3 --jitter 0.1 --tps 60
+    python stub_server.py --load-test 40 --concurrency 16 --ttft 0.2 --tps 200
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Any
+
+from rate_limiter import estimate_message_tokens, estimate_text_tokens
+
+DEFAULT_MODELS = ["deepseek-chat", "deepseek-r1:8b", "qwen2.5:7b", "llama3.2"]
+STREAM_CHUNK_CHARS = 8  # 流式响应每块的字符数
+
+
+class LatencyModel:
+    """首 token 延迟 + 按 token 速率输出的耗时"""
+
+    def __init__(self, ttft: float = 0.0, jitter: float = 0.0, tokens_per_second: float = 0.0,
+                 distribution: str = "uniform", seed: Optional[int] = None):
+        """
+        Args:
+            ttft: 首 token 延迟的中位数（秒）
+            jitter: uniform 分布为 ±jitter 秒，lognormal 分布为对数标准差
+            tokens_per_second: 输出速率，0 表示瞬间输出
+            distribution: fixed / uniform / lognormal
+            seed: 随机种子，固定后延迟序列可复现
+        """
+        if distribution not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"不支持的延迟分布: {distribution}")
+        self.ttft = ttft
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.distribution = distribution
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def first_token_delay(self) -> float:
+        if self.distribution == "fixed" or not self.jitter:
+            return self.ttft
+        with self._lock:
+            if self.distribution == "uniform":
+                return max(0.0, self.ttft + self._rng.uniform(-self.jitter, self.jitter))
+            return self.ttft * self._rng.lognormvariate(0.0, self.jitter)
+
+    def token_delay(self, tokens: int) -> float:
+        return tokens / self.tokens_per_second if self.tokens_per_second else 0.0
+
+
+def _product_name(messages: List[Dict[str, Any]]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            match = re.search(r"「(.+?)」", message.get("content") or "")
+            if match:
+                return match.group(1)
+    return "好物"
+
+
+def auto_response(request: Dict[str, Any]) -> Dict[str, Any]:
+    """自动模式：先调用工具，拿到工具结果后输出文案"""
+    messages = request.get("messages", [])
+    product = _product_name(messages)
+    tools = [tool["function"]["name"] for tool in request.get("tools") or []]
+    if tools and not any(message.get("role") == "tool" for message in messages):
+        wanted = {"search_web": {"query": f"{product} 用户评价"}, "query_product_database": {"product_name": product}}
+        calls = [{"name": name, "arguments": args} for name, args in wanted.items() if name in tools]
+        if calls:
+            return {"content": None, "tool_calls": calls}
+
+    note = {
+        "title": f"💧{product}真的绝了！熬夜党的急救神器✨",
+        "body": f"姐妹们！最近挖到宝了～{product}用完皮肤水润透亮，上妆也不卡粉，温和不刺激，敏感肌也能放心用！",
+        "hashtags": ["#好物推荐", "#护肤", "#补水保湿", "#熬夜急救", f"#{product}"],
+        "emojis": ["✨", "💧", "🔥", "💖"]
+    }
+    content = "```json\n" + json.dumps(note, ensure_ascii=False, indent=2) + "\n```"
+    if "r1" in str(request.get("model", "")):
+        content = f"<think>\n用户需要为{product}写一篇小红书文案，先确定卖点，再组织标题和正文。\n</think>\n\n" + content
+    return {"content": content}
+
+
+def _normalize_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """脚本条目统一为 {content, tool_calls, usage} 或 {status, error}；录制的完整响应取第一个 choice"""
+    if "choices" in item:
+        message = item["choices"][0]["message"]
+        calls = [{"name": call["function"]["name"], "arguments": call["function"]["arguments"], "id": call.get("id")}
+                 for call in message.get("tool_calls") or []]
+        return {"content": message.get("content"), "tool_calls": calls, "usage": item.get("usage")}
+    return item
+
+
+class StubServer:
+    """在后台线程中运行的桩服务，可用作上下文管理器"""
+
+    def __init__(self, script: Optional[List[Dict[str, Any]]] = None, latency: Optional[LatencyModel] = None,
+                 models: Optional[List[str]] = None, host: str = "127.0.0.1", port: int = 0,
+                 load_seconds: float = 0.0):
+        self.script = [_normalize_item(item) for item in script] if script else None
+        self.latency = latency or LatencyModel()
+        self.models = models or DEFAULT_MODELS
+        self.load_seconds = load_seconds
+        self.resident: List[str] = []
+        self.stats = {"requests": 0, "streamed": 0, "errors": 0, "in_flight": 0, "peak_in_flight": 0,
+                      "loads": 0, "keep_alives": 0, "unloads": 0}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+        stub = self
+
+        class Handler(_StubHandler):
+            server_stub = stub
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 256
+
+        self.server = Server((host, port), Handler)
+        self.host, self.port = self.server.server_address[:2]
+
+    @property
+    def root_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def url(self) -> str:
+        """OpenAI 兼容的 base_url"""
+        return f"{self.root_url}/v1"
+
+    def environ(self) -> Dict[str, str]:
+        """让 Config 的两种服务都指向本桩服务的环境变量"""
+        return {"DEEPSEEK_BASE_URL": self.url, "DEEPSEEK_API_KEY": "stub-key", "OLLAMA_BASE_URL": self.url}
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def respond(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """按脚本或自动模式决定本次的回复"""
+        if not self.script:
+            return auto_response(request)
+        turn = sum(1 for message in request.get("messages", []) if message.get("role") == "assistant")
+        return self.script[turn % len(self.script)]
+
+    def ensure_loaded(self, model: str) -> float:
+        """模型未驻留时模拟载入，返回载入耗时"""
+        with self._lock:
+            if model in self.resident:
+                return 0.0
+            self.resident.append(model)
+            self.stats["loads"] += 1
+        time.sleep(self.load_seconds)
+        return self.load_seconds
+
+    def evict(self, model: str):
+        """模拟空闲超时后被卸载"""
+        with self._lock:
+            if model in self.resident:
+                self.resident.remove(model)
+
+    def _enter(self, streamed: bool):
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["streamed"] += int(streamed)
+            self.stats["in_flight"] += 1
+            self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+
+    def _leave(self, error: bool = False):
+        with self._lock:
+            self.stats["in_flight"] -= 1
+            self.stats["errors"] += int(error)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_stub: StubServer = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict[str, Any]):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        models = self.server_stub.models
+        if self.path.rstrip("/") == "/api/ps":
+            self._send_json(200, {"models": [{"name": name, "model": name, "size": 0}
+                                             for name in list(self.server_stub.resident)]})
+        elif self.path.rstrip("/") == "/api/tags":
+            self._send_json(200, {"models": [{"name": name, "model": name, "size": 0} for name in models]})
+        elif self.path.rstrip("/") == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": name, "object": "model"} for name in models]})
+        else:
+            self._send_json(404, {"error": {"message": f"not found: {self.path}"}})
+
+    def _model_lifecycle(self, request: Dict[str, Any]):
+        """/api/generate 不带 prompt：载入并刷新 keep_alive，keep_alive=0 时卸载"""
+        stub, model = self.server_stub, request.get("model", "")
+        if str(request.get("keep_alive")) == "0":
+            stub.evict(model)
+            with stub._lock:
+                stub.stats["unloads"] += 1
+            self._send_json(200, {"model": model, "response": "", "done": True, "done_reason": "unload"})
+            return
+        seconds = stub.ensure_loaded(model)
+        with stub._lock:
+            stub.stats["keep_alives"] += int(not seconds)
+        self._send_json(200, {"model": model, "response": "", "done": True, "done_reason": "load",
+                              "load_duration": int(seconds * 1e9)})
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        if path not in ("/v1/chat/completions", "/api/generate"):
+            self._send_json(404, {"error": {"message": f"not found: {self.path}"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if path == "/api/generate":
+            self._model_lifecycle(request)
+            return
+        stub = self.server_stub
+        stream = bool(request.get("stream"))
+        stub._enter(stream)
+        error = False
+        try:
+            if stub.load_seconds:
+                stub.ensure_loaded(request.get("model", ""))
+            reply = stub.respond(request)
+            if reply.get("status", 200) != 200:
+                error = True
+                time.sleep(stub.latency.first_token_delay())
+                self._send_json(reply["status"], {"error": {"message": reply.get("error", "stub error"),
+                                                            "type": "stub_error"}})
+                return
+            content = reply.get("content")
+            tool_calls = [
+                {"id": call.get("id") or f"call_{index}", "type": "function",
+                 "function": {"name": call["name"],
+                              "arguments": call["arguments"] if isinstance(call["arguments"], str)
+                              else json.dumps(call["arguments"], ensure_ascii=False)}}
+                for index, call in enumerate(reply.get("tool_calls") or [])
+            ]
+            usage = reply.get("usage") or self._usage(request, content, tool_calls)
+            if stream:
+                self._stream(request, content, tool_calls, usage)
+            else:
+                completion_tokens = usage["completion_tokens"]
+                time.sleep(stub.latency.first_token_delay() + stub.latency.token_delay(completion_tokens))
+                message = {"role": "assistant", "content": content}
+                if tool_calls:
+                    message["tool_calls"] = tool_calls
+                self._send_json(200, {
+                    "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+                    "model": request.get("model", "stub"),
+                    "choices": [{"index": 0, "message": message,
+                                 "finish_reason": "tool_calls" if tool_calls else "stop"}],
+                    "usage": usage
+                })
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 客户端提前断开（如流式解析到完整 JSON 后停止接收）
+        finally:
+            stub._leave(error)
+
+    @staticmethod
+    def _usage(request: Dict[str, Any], content: Optional[str], tool_calls: List[Dict]) -> Dict[str, int]:
+        prompt_tokens = estimate_message_tokens(request.get("messages", []))
+        output = (content or "") + "".join(call["function"]["arguments"] for call in tool_calls)
+        completion_tokens = estimate_text_tokens(output) + 4 * len(tool_calls)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def _write_event(self, payload: Any):
+        data = ("data: " + (payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False))
+                + "\n\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, request: Dict[str, Any], content: Optional[str], tool_calls: List[Dict], usage: Dict[str, int]):
+        latency = self.server_stub.latency
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        base = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": request.get("model", "stub")}
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None):
+            self._write_event({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]})
+
+        time.sleep(latency.first_token_delay())
+        chunk({"role": "assistant", "content": ""})
+        text = content or ""
+        for start in range(0, len(text), STREAM_CHUNK_CHARS):
+            piece = text[start:start + STREAM_CHUNK_CHARS]
+            time.sleep(latency.token_delay(estimate_text_tokens(piece)))
+            chunk({"content": piece})
+        for index, call in enumerate(tool_calls):
+            chunk({"tool_calls": [{"index": index, "id": call["id"], "type": "function",
+                                   "function": {"name": call["function"]["name"], "arguments": ""}}]})
+            arguments = call["function"]["arguments"]
+            for start in range(0, len(arguments), STREAM_CHUNK_CHARS):
+                piece = arguments[start:start + STREAM_CHUNK_CHARS]
+                time.sleep(latency.token_delay(estimate_text_tokens(piece)))
+                chunk({"tool_calls": [{"index": index, "function": {"arguments": piece}}]})
+        chunk({}, "tool_calls" if tool_calls else "stop")
+        if (request.get("stream_options") or {}).get("include_usage"):
+            self._write_event({**base, "choices": [], "usage": usage})
+        self._write_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def load_script(path: str) -> List[Dict[str, Any]]:
+    """读取脚本文件：响应列表，或 {"responses": [...]}"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data["responses"] if isinstance(data, dict) else data
+
+
+def run_load_test(notes: int, concurrency: int, stub: StubServer, provider: str = "deepseek",
+                  stream: bool = False) -> Dict[str, Any]:
+    """让完整的 RedNoteGenerator 流程对着桩服务批量生成，返回吞吐统计"""
+    from rednote import Config, RedNoteGenerator
+
+    previous = {key: os.environ.get(key) for key in stub.environ()}
+    os.environ.update(stub.environ())
+    try:
+        generator = RedNoteGenerator(Config(provider=provider))
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+    products = ["深海蓝藻保湿面膜", "美白精华", "玻尿酸原液", "男士控油洁面", "木质香调香水"]
+    items = [{"product_name": products[i % len(products)], "use_cache": False, "stream": stream} for i in range(notes)]
+    requests_before = stub.stats["requests"]
+    start = time.time()
+    results = generator.generate_batch(items, concurrency=concurrency)
+    elapsed = time.time() - start
+    return {
+        "notes": notes,
+        "concurrency": concurrency,
+        "successes": sum(1 for result in results if result["success"]),
+        "seconds": round(elapsed, 3),
+        "notes_per_second": round(notes / elapsed, 2) if elapsed else None,
+        "requests": stub.stats["requests"] - requests_before,
+        "peak_in_flight": stub.stats["peak_in_flight"]
+    }
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容桩服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口（压测时自动选择）")
+    parser.add_argument("--script", default=None, help="脚本文件（JSON），不指定则使用自动模式")
+    parser.add_argument("--ttft", type=float, default=0.0, help="首 token 延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="首 token 延迟的抖动")
+    parser.add_argument("--distribution", choices=["fixed", "uniform", "lognormal"], default="uniform", help="延迟分布")
+    parser.add_argument("--tps", type=float, default=0.0, help="每秒输出 token 数，0 表示瞬间输出")
+    parser.add_argument("--seed", type=int, default=None, help="延迟的随机种子")
+    parser.add_argument("--load-seconds", type=float, default=0.0, help="模拟 Ollama 载入模型的耗时（秒）")
+    parser.add_argument("--load-test", type=int, default=0, metavar="N", help="对完整生成流程压测 N 篇文案后退出")
+    parser.add_argument("--concurrency", type=int, default=8, help="压测并发数")
+    parser.add_argument("--provider", choices=["deepseek", "ollama"], default="deepseek", help="压测使用的服务类型")
+    parser.add_argument("--stream", action="store_true", help="压测时使用流式生成")
+    args = parser.parse_args()
+
+    latency = LatencyModel(args.ttft, args.jitter, args.tps, args.distribution, args.seed)
+    script = load_script(args.script) if args.script else None
+
+    if args.load_test:
+        with StubServer(script, latency, host=args.host, load_seconds=args.load_seconds) as stub:
+            report = run_load_test(args.load_test, args.concurrency, stub, args.provider, args.stream)
+        print(f"\n📊 {report['successes']}/{report['notes']} 篇成功，耗时 {report['seconds']}s，"
+              f"{report['notes_per_second']} 篇/秒，{report['requests']} 次请求，服务端峰值并发 {report['peak_in_flight']}")
+        return 0 if report["successes"] == report["notes"] else 1
+
+    stub = StubServer(script, latency, host=args.host, port=args.port, load_seconds=args.load_seconds)
+    print(f"🧪 桩服务已启动: {stub.url}（{'脚本' if script else '自动'}模式）")
+    print(f"💡 export DEEPSEEK_BASE_URL={stub.url} DEEPSEEK_API_KEY=stub-key OLLAMA_BASE_URL={stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 已停止")
+    finally:
+        stub.server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,94 @@
+"""
+异步文案生成器的单元测试
+"""
+
+import asyncio
+import time
+import unittest
+from types import SimpleNamespace
+
+from async_rednote import AsyncRedNoteGenerator
+from testing_helpers import GeneratorTestCase, make_tool_call
+
+FINAL_JSON = '```json\n{"title": "补水面膜", "body": "好用", "hashtags": ["#补水"], "emojis": ["💧"]}\n```'
+
+
+def make_response(content=None, tool_calls=None):
+    message = SimpleNamespace(content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+class ScriptedClient:
+    """按顺序返回预设响应的异步客户端"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        self.requests.append(kwargs)
+        return self.responses.pop(0)
+
+    async def close(self):
+        pass
+
+
+class TestAsyncRedNoteGenerator(GeneratorTestCase):
+    """测试异步生成器"""
+
+    def setUp(self):
+        super().setUp()
+        self.generator = self.make_generator(AsyncRedNoteGenerator)
+
+        def slow_tool(name, delay):
+            def tool(**kwargs):
+                time.sleep(delay)
+                return f"{name}结果"
+            return tool
+
+        self.generator.available_tools = {
+            "search_web": slow_tool("搜索", 0.3),
+            "query_product_database": slow_tool("产品", 0.3),
+            "generate_emoji": slow_tool("表情", 0.3)
+        }
+
+    def tearDown(self):
+        asyncio.run(self.generator.aclose())
+        super().tearDown()
+
+    def test_tool_calls_run_concurrently(self):
+        """测试同一轮的三个工具并发执行，耗时约等于最慢的工具"""
+        tool_calls = [
+            make_tool_call("c1", "search_web", {"query": "保湿面膜"}),
+            make_tool_call("c2", "query_product_database", {"product_name": "深海蓝藻保湿面膜"}),
+            make_tool_call("c3", "generate_emoji", {"context": "补水"})
+        ]
+        start = time.time()
+        outputs = asyncio.run(self.generator._execute_tool_calls(tool_calls))
+        self.assertLess(time.time() - start, 0.6)
+        self.assertEqual([o["tool_call_id"] for o in outputs], ["c1", "c2", "c3"])
+        self.assertEqual(outputs[1]["content"], "产品结果")
+
+    def test_unknown_tool_and_bad_arguments(self):
+        """测试未知工具和参数错误返回错误信息而不是抛出"""
+        bad_args = SimpleNamespace(id="c2", function=SimpleNamespace(name="search_web", arguments="{oops"))
+        outputs = asyncio.run(self.generator._execute_tool_calls([make_tool_call("c1", "nope", {}), bad_args]))
+        self.assertIn("未知工具", outputs[0]["content"])
+        self.assertIn("参数解析错误", outputs[1]["content"])
+
+    def test_generate_with_tool_round(self):
+        """测试完整生成流程：工具轮 + 最终 JSON 轮"""
+        self.generator.client = ScriptedClient([
+            make_response(tool_calls=[make_tool_call("c1", "search_web", {"query": "保湿面膜"})]),
+            make_response(content=FINAL_JSON)
+        ])
+        result = asyncio.run(self.generator.generate("深海蓝藻保湿面膜"))
+        self.assertTrue(result["success"])
+        self.assertEqual(result["content"]["title"], "补水面膜")
+        second_request = self.generator.client.requests[1]["messages"]
+        self.assertEqual(second_request[-1], {"tool_call_id": "c1", "role": "tool", "content": "搜索结果"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+"""
+批量生成与速率限制的单元测试
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from batch_generate import ResultWriter
+from rate_limiter import RateLimiter, estimate_message_tokens, get_rate_limiter
+from rednote import Config, FileManager, RedNoteGenerator
+
+
+class TestRateLimiter(unittest.TestCase):
+    """测试令牌桶限速器"""
+
+    def test_unlimited_never_waits(self):
+        """测试未配置限额时不等待"""
+        limiter = RateLimiter()
+        self.assertEqual(limiter.acquire(10 ** 6), 0.0)
+
+    def test_token_limit_blocks_until_refill(self):
+        """测试 token 额度耗尽后按速率补充"""
+        limiter = RateLimiter(tokens_per_minute=6000)  # 每秒补充 100
+        self.assertLess(limiter.acquire(6000), 0.05)
+        waited = limiter.acquire(10)
+        self.assertGreater(waited, 0.05)
+        self.assertLess(waited, 0.5)
+
+    def test_adjust_refunds_overestimate(self):
+        """测试实际用量小于预估时归还额度"""
+        limiter = RateLimiter(tokens_per_minute=6000)
+        limiter.acquire(6000)
+        limiter.adjust(-3000)
+        self.assertLess(limiter.acquire(3000), 0.05)
+
+    def test_acquire_async_waits_without_blocking(self):
+        """测试协程版本同样按速率等待"""
+        limiter = RateLimiter(requests_per_minute=600)  # 每 0.1s 补充一次请求额度
+        for _ in range(600):
+            limiter.acquire()
+        waited = asyncio.run(limiter.acquire_async())
+        self.assertGreater(waited, 0.05)
+
+    def test_shared_limiter_updates_rates_in_place(self):
+        """测试同一端点限额变化时沿用同一个限速器，已用额度不被重置"""
+        limiter = get_rate_limiter("test", "http://rates.local", tokens_per_minute=6000)
+        limiter.acquire(6000)
+        self.assertIs(get_rate_limiter("test", "http://rates.local", tokens_per_minute=3000), limiter)
+        self.assertEqual(limiter.tokens_per_minute, 3000)
+        self.assertGreater(limiter.acquire(10), 0.05)
+
+    def test_estimate_message_tokens(self):
+        """测试中文按字计数"""
+        self.assertEqual(estimate_message_tokens([{"role": "user", "content": "补水面膜"}]), 8)
+
+
+class TestGenerateBatch(unittest.TestCase):
+    """测试并发批量生成"""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        with mock.patch.dict(os.environ, {"DEEPSEEK_API_KEY": "test-key"}):
+            self.generator = RedNoteGenerator(Config(provider="deepseek"))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_results_in_input_order_with_partial_failure(self):
+        """测试结果按输入顺序返回，失败条目不影响其他条目"""
+        def fake_generate(product_name, **kwargs):
+            time.sleep(0.05 * (3 - len(product_name)))  # 越靠前越慢
+            if product_name == "BB":
+                raise RuntimeError("boom")
+            return {"success": True, "content": {"title": product_name}}
+
+        self.generator.generate = fake_generate
+        finished = []
+        results = self.generator.generate_batch(
+            [{"product_name": "A"}, {"product_name": "BB"}, {"product_name": "CCC"}],
+            concurrency=3,
+            on_result=lambda index, result: finished.append(index)
+        )
+
+        self.assertEqual([r.get("content", {}).get("title") for r in results], ["A", None, "CCC"])
+        self.assertFalse(results[1]["success"])
+        self.assertIn("boom", results[1]["error"])
+        self.assertEqual(finished, [2, 1, 0])
+
+    def test_callback_error_does_not_abort_batch(self):
+        """测试某条结果回调出错（如保存失败）时其余条目照常生成和回调"""
+        self.generator.generate = lambda product_name, **kwargs: {"success": True, "content": {"title": product_name}}
+        finished = []
+
+        def on_result(index, result):
+            if index == 0:
+                raise OSError("磁盘已满")
+            finished.append(index)
+
+        results = self.generator.generate_batch([{"product_name": name} for name in "ABC"],
+                                                concurrency=1, on_result=on_result)
+        self.assertTrue(all(result["success"] for result in results))
+        self.assertEqual(sorted(finished), [1, 2])
+
+    def test_markdown_names_include_item_index(self):
+        """测试同一产品同一秒完成的两条结果保存为不同的 Markdown 文件"""
+        items = [{"product_name": "面膜"}, {"product_name": "面膜"}]
+        result = {"success": True, "content": {"title": "补水面膜", "body": "好用", "hashtags": [], "emojis": []},
+                  "metadata": {"product_name": "面膜", "provider": "deepseek", "style": "活泼",
+                               "generated_at": "2024-01-01T00:00:00"}}
+        writer = ResultWriter(Path("batch.jsonl"), items, FileManager(self.generator.config))
+        try:
+            writer(0, result)
+            writer(1, result)
+        finally:
+            writer.close()
+        paths = [json.loads(line)["markdown_path"] for line in Path("batch.jsonl").read_text(encoding="utf-8").splitlines()]
+        self.assertNotEqual(paths[0], paths[1])
+        self.assertTrue(all(Path(path).exists() for path in paths))
+
+    def test_interrupt_cancels_queued_items(self):
+        """测试中断时取消尚未开始的条目并立即向上抛出，不等整批跑完"""
+        started = []
+
+        def fake_generate(product_name, **kwargs):
+            started.append(product_name)
+            time.sleep(0.05)
+            return {"success": True, "content": {"title": product_name}}
+
+        def on_result(index, result):
+            raise KeyboardInterrupt
+
+        self.generator.generate = fake_generate
+        start = time.time()
+        with self.assertRaises(KeyboardInterrupt):
+            self.generator.generate_batch([{"product_name": f"产品{i}"} for i in range(10)],
+                                          concurrency=2, on_result=on_result)
+        self.assertLess(time.time() - start, 0.2)
+        time.sleep(0.1)
+        self.assertLessEqual(len(started), 4)
+
+    def test_chat_completion_adjusts_with_usage(self):
+        """测试请求完成后按实际 usage 修正限速额度"""
+        self.generator.config.tokens_per_minute = 100000
+        response = SimpleNamespace(usage=SimpleNamespace(total_tokens=10))
+        self.generator.client = SimpleNamespace(chat=SimpleNamespace(
+            completions=SimpleNamespace(create=lambda **kwargs: response)))
+
+        with mock.patch("rednote.get_rate_limiter") as get_limiter:
+            get_limiter.return_value.acquire.return_value = 0.0
+            self.generator._chat_completion(model="m", messages=[{"role": "user", "content": "你好"}], max_tokens=100)
+            get_limiter.return_value.acquire.assert_called_once_with(106)
+            get_limiter.return_value.adjust.assert_called_once_with(10 - 106)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+录制/回放的单元测试：对着本地桩服务录制，关闭桩服务后回放
+"""
+
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from cassette import Cassette, CassetteMiss, use_cassette
+from rednote import Config, RedNoteGenerator
+from stub_server import LatencyModel, StubServer
+
+
+class TestCassette(unittest.TestCase):
+    """测试录制与回放"""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        self.path = Path(self.tmp.name) / "run.jsonl.gz"
+        self.tool_calls = []
+        with StubServer(latency=LatencyModel(ttft=0.05)) as stub:
+            with mock.patch.dict(os.environ, stub.environ()):
+                self.generator = RedNoteGenerator(Config(provider="deepseek"))
+            self.generator.available_tools["query_product_database"] = self.product_tool
+            with use_cassette(self.generator, self.path, mode="record") as cassette:
+                self.recorded = [self.generator.generate("美白精华", use_cache=False),
+                                 self.generator.generate("玻尿酸原液", stream=True, on_field=lambda *_: None,
+                                                         use_cache=False)]
+        self.cassette = cassette
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def product_tool(self, product_name):
+        self.tool_calls.append(product_name)
+        return f"{product_name}：烟酰胺"
+
+    def test_cassette_contents(self):
+        """测试文件为压缩 JSONL，包含普通响应、流式分块和工具结果"""
+        loaded = Cassette.load(self.path)
+        kinds = [record["kind"] for record in loaded.interactions]
+        self.assertEqual(kinds.count("llm"), 4)
+        self.assertEqual(sum(1 for record in loaded.interactions if "chunks" in record), 2)
+        tool = next(record for record in loaded.interactions if record.get("name") == "query_product_database")
+        self.assertEqual(tool["result"], "美白精华：烟酰胺")
+        self.assertEqual(loaded.meta["provider"], "deepseek")
+
+    def test_replay_reproduces_results_offline(self):
+        """测试桩服务关闭后回放得到相同结果，工具不再真正执行"""
+        with use_cassette(self.generator, self.path):
+            replayed = [self.generator.generate("美白精华", use_cache=False),
+                        self.generator.generate("玻尿酸原液", stream=True, on_field=lambda *_: None,
+                                                use_cache=False)]
+        self.assertEqual([result["content"] for result in replayed], [result["content"] for result in self.recorded])
+        self.assertEqual(self.tool_calls, ["美白精华", "玻尿酸原液"])
+        self.assertEqual(replayed[0]["metadata"]["prompt_tokens"], self.recorded[0]["metadata"]["prompt_tokens"])
+
+    def test_original_timing(self):
+        """测试按原始耗时回放"""
+        start = time.time()
+        with use_cassette(self.generator, self.path, timing="original"):
+            self.generator.generate("美白精华", use_cache=False)
+        self.assertGreaterEqual(time.time() - start, 0.1)
+
+    def test_strict_and_loose_matching(self):
+        """测试请求变化时严格模式找不到记录，宽松模式按录制顺序回放"""
+        self.generator.prefix = self.generator.prefix.__class__("改过的系统提示词", self.generator.prefix.tools)
+        with use_cassette(self.generator, self.path) as cassette:
+            with self.assertRaises(CassetteMiss):
+                cassette.take("llm", "unknown")
+            self.assertFalse(self.generator.generate("美白精华", use_cache=False)["success"])
+        with use_cassette(self.generator, self.path, strict=False):
+            self.assertTrue(self.generator.generate("美白精华", use_cache=False)["success"])
+
+
+if __name__ == "__main__":
+    unittest.main()
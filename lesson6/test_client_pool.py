@@ -0,0 +1,84 @@
+"""
+共享客户端与健康检查缓存的单元测试
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import client_pool
+from rednote import Config, RedNoteGenerator
+
+TAGS = {"models": [{"name": "qwen2.5:7b"}]}
+
+
+class TestClientPool(unittest.TestCase):
+    """测试客户端复用"""
+
+    def setUp(self):
+        client_pool.reset()
+
+    def tearDown(self):
+        client_pool.reset()
+
+    def test_same_endpoint_shares_connection_pool(self):
+        """测试同一端点不同超时的客户端共用底层连接池"""
+        a = client_pool.get_openai_client("http://localhost:11434/v1", "ollama", timeout=60)
+        b = client_pool.get_openai_client("http://localhost:11434/v1/", "ollama", timeout=30)
+        self.assertIs(a._client, b._client)
+        self.assertEqual(b.timeout, 30)
+
+    def test_different_key_gets_own_pool(self):
+        """测试不同 api_key 使用不同客户端"""
+        a = client_pool.get_openai_client("https://api.deepseek.com/v1", "key-a")
+        b = client_pool.get_openai_client("https://api.deepseek.com/v1", "key-b")
+        self.assertIsNot(a._client, b._client)
+
+
+class TestProbeCache(unittest.TestCase):
+    """测试 Ollama 健康检查和连接测试只做一次"""
+
+    def setUp(self):
+        client_pool.reset()
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        response = mock.Mock(status_code=200)
+        response.json.return_value = TAGS
+        self.session = mock.Mock()
+        self.session.get.return_value = response
+        patcher = mock.patch("client_pool.get_session", return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        client_pool.reset()
+
+    def test_repeated_config_probes_once(self):
+        """测试重复创建 Config 只请求一次 /api/tags"""
+        for _ in range(3):
+            config = Config(provider="ollama", ollama_model="qwen2.5:7b")
+        self.assertEqual(self.session.get.call_count, 1)
+        self.assertEqual(config.list_available_ollama_models(), ["qwen2.5:7b"])
+        self.assertEqual(self.session.get.call_count, 1)
+
+    def test_repeated_generator_tests_connection_once(self):
+        """测试重复创建生成器只做一次连接测试"""
+        config = Config(provider="ollama", ollama_model="qwen2.5:7b")
+
+        def fake_test(generator, client):
+            client_pool.mark_connection_verified(generator.config.base_url, generator.config.model)
+
+        with mock.patch.object(RedNoteGenerator, "_test_ollama_connection", autospec=True,
+                               side_effect=fake_test) as test_connection:
+            first = RedNoteGenerator(config)
+            second = RedNoteGenerator(config)
+        self.assertEqual(test_connection.call_count, 1)
+        self.assertIs(first.client._client, second.client._client)
+
+
+if __name__ == "__main__":
+    unittest.main()
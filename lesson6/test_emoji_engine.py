@@ -0,0 +1,70 @@
+"""
+表情推荐引擎的单元测试
+"""
+
+import unittest
+from unittest import mock
+
+import emoji_engine
+from emoji_engine import EmojiRecommender, KeywordAutomaton
+from rednote import ToolManager
+
+
+class TestKeywordAutomaton(unittest.TestCase):
+    """测试多模式匹配"""
+
+    def test_reports_overlapping_matches(self):
+        """测试重叠和嵌套的关键词都被找到"""
+        automaton = KeywordAutomaton(["抗老", "抗初老", "初老", "老"])
+        found = sorted((end, automaton.keywords[keyword_id]) for end, keyword_id in automaton.scan("抗初老精华"))
+        self.assertEqual(found, [(2, "初老"), (2, "抗初老"), (2, "老")])
+
+    def test_matches_across_repeated_segments(self):
+        """测试缓存的片段在不同位置仍报告正确的位置"""
+        automaton = KeywordAutomaton(["补水", "面膜"])
+        matches = automaton.scan("补水面膜，真的补水面膜")
+        self.assertEqual([end for end, _ in matches], [1, 3, 8, 10])
+
+
+class TestEmojiRecommender(unittest.TestCase):
+    """测试类别打分与抽样"""
+
+    def setUp(self):
+        self.recommender = EmojiRecommender(seed=0)
+
+    def test_scores_expected_category(self):
+        """测试命中最多的类别得分最高，靠前的命中权重更大"""
+        scores = self.recommender.score("熬夜加班后的急救面膜")
+        self.assertEqual(max(scores, key=scores.get), "rescue")
+        self.assertGreater(self.recommender.score("防晒很好用，适合夏天")["sunscreen"],
+                           self.recommender.score("很好用，适合夏天的防晒")["sunscreen"])
+
+    def test_suggest_is_deterministic_with_seed(self):
+        """测试同一个 seed 下推荐结果相同"""
+        context = "敏感肌也能用的温和修复面霜"
+        first = self.recommender.suggest(context, seed=42)
+        self.assertEqual(first, self.recommender.suggest(context, seed=42))
+        self.assertEqual(len(set(first)), 4)
+        self.assertTrue(set(first) & set(self.recommender.categories["soothing"]))
+
+    def test_falls_back_to_default_emojis(self):
+        """测试没有命中时从默认表情中补足"""
+        picked = self.recommender.suggest("今天天气不错", k=5, seed=1)
+        self.assertEqual(len(set(picked)), 5)
+        self.assertTrue(set(picked) <= set(self.recommender.default))
+
+
+class TestToolManagerEmoji(unittest.TestCase):
+    """测试 ToolManager.generate_emoji 使用推荐器"""
+
+    def test_generate_emoji_uses_recommender(self):
+        """测试工具返回推荐器的结果"""
+        recommender = EmojiRecommender(seed=7)
+        with mock.patch.object(emoji_engine, "_recommender", recommender):
+            emojis = ToolManager.generate_emoji("男士控油洁面")
+        self.assertEqual(len(emojis), 4)
+        self.assertEqual(emojis, EmojiRecommender(seed=7).suggest("男士控油洁面"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+生成过程统计的单元测试
+"""
+
+import io
+import json
+import time
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from generation_trace import print_summary_table, summarize_batch, write_trace
+from testing_helpers import NOTE, GeneratorTestCase, fake_client, make_tool_call
+
+
+class TestGenerationTrace(GeneratorTestCase):
+    """测试工具轮 → 解析失败 → 成功 三轮的统计"""
+
+    def setUp(self):
+        super().setUp()
+        self.generator = self.make_generator()
+        self.generator.available_tools["search_web"] = lambda query: time.sleep(0.05) or "趋势"
+        replies = [
+            SimpleNamespace(content=None, tool_calls=[make_tool_call("c1", "search_web", {"query": "面膜"})]),
+            SimpleNamespace(content="我再想想", tool_calls=None),
+            SimpleNamespace(content=json.dumps(NOTE, ensure_ascii=False), tool_calls=None)
+        ]
+
+        def create(**kwargs):
+            message = replies.pop(0)
+            usage = SimpleNamespace(prompt_tokens=500, completion_tokens=50, prompt_cache_hit_tokens=256)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+        self.generator.client = fake_client(create)
+
+    def test_metadata_has_per_iteration_breakdown(self):
+        """测试元数据包含每轮结果、token、工具耗时和汇总"""
+        metadata = self.generator.generate("面膜", use_cache=False)["metadata"]
+        self.assertEqual(metadata["iteration_count"], 3)
+        self.assertEqual(metadata["llm_calls"], 3)
+        self.assertEqual(metadata["parse_retries"], 1)
+        self.assertEqual([record["outcome"] for record in metadata["iterations"]],
+                         ["tool_calls", "parse_failed", "parsed"])
+        self.assertEqual(metadata["prompt_tokens"], 1500)
+        self.assertEqual(metadata["iterations"][0]["cached_tokens"], 256)
+
+        tool = metadata["iterations"][0]["tools"][0]
+        self.assertEqual((tool["name"], tool["ok"]), ("search_web", True))
+        self.assertGreaterEqual(tool["seconds"], 0.05)
+        self.assertEqual(metadata["tool_seconds"], tool["seconds"])
+
+    def test_rate_limit_wait_recorded_separately(self):
+        """测试速率限制排队记入 rate_limit_seconds，不计入 llm_seconds"""
+        def acquire(tokens):
+            time.sleep(0.1)
+            return 0.1
+
+        limiter = SimpleNamespace(acquire=acquire, adjust=lambda delta: None)
+        with mock.patch.object(self.generator, "_rate_limiter", return_value=limiter):
+            metadata = self.generator.generate("面膜", use_cache=False)["metadata"]
+        self.assertAlmostEqual(metadata["rate_limit_seconds"], 0.3, places=3)
+        self.assertLess(metadata["llm_seconds"], 0.1)
+        self.assertEqual(metadata["iterations"][0]["rate_limit_seconds"], 0.1)
+
+    def test_batch_summary_and_trace(self):
+        """测试批量汇总与 JSONL 轨迹，失败结果的统计也被计入"""
+        items = [{"product_name": "面膜"}, {"product_name": "精华"}]
+        results = [self.generator.generate("面膜", use_cache=False),
+                   {"success": False, "error": "生成失败", "llm_calls": 2, "parse_retries": 2, "iterations": []}]
+        summary = summarize_batch(results)
+        self.assertEqual(summary["successes"], 1)
+        self.assertEqual(summary["totals"]["llm_calls"], 5)
+        self.assertEqual(summary["averages"]["parse_retries"], 1.5)
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            print_summary_table(items, results)
+        row = next(line for line in output.getvalue().splitlines() if line.startswith("面膜"))
+        self.assertEqual(row.split()[2:5], ["3", "3", "1"])
+        self.assertEqual(row.split()[-3:], ["1500", "150", "768"])
+
+        path = Path(self.tmp.name) / "trace.jsonl"
+        write_trace(path, items, results)
+        lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+        self.assertEqual([line["product_name"] for line in lines], ["面膜", "精华"])
+        self.assertEqual(len(lines[0]["iterations"]), 3)
+        self.assertFalse(lines[1]["success"])
+
+
+if __name__ == "__main__":
+    unittest.main()
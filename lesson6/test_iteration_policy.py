@@ -0,0 +1,136 @@
+"""
+自适应迭代策略的单元测试
+"""
+
+import json
+import os
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import iteration_policy
+from iteration_policy import IterationPolicy, classify_failure, compare, repair_locally
+from rednote import Config, RedNoteGenerator
+
+NOTE = {"title": "补水面膜💧", "body": "用了一周 #补水 #面膜 好用", "hashtags": ["#补水", "#面膜", "#护肤"], "emojis": ["💧"]}
+
+# 固定测试集：每个产品的模型回复序列（超出后重复最后一条）
+SCRIPTS = {
+    "少表情": [json.dumps({k: v for k, v in NOTE.items() if k != "emojis"}, ensure_ascii=False),
+              json.dumps(NOTE, ensure_ascii=False)],
+    "截断": ['{"title": "补水面膜", "body": "用了一周，皮肤', json.dumps(NOTE, ensure_ascii=False)],
+    "只有推理": ["<think>先分析一下产品卖点……", json.dumps(NOTE, ensure_ascii=False)],
+    "一直闲聊": ["这个面膜很好用哦～"]
+}
+
+
+def make_config(**overrides):
+    config = SimpleNamespace(provider="deepseek", model="test-model", max_iterations=3,
+                             adaptive_iterations=True, token_budget=None)
+    for key, value in overrides.items():
+        setattr(config, key, value)
+    return config
+
+
+class TestClassifyAndRepair(unittest.TestCase):
+    """测试失败分类与本地修复"""
+
+    def test_classify_failure(self):
+        """测试各类失败的识别"""
+        self.assertEqual(classify_failure("<think>还在想")[0], "think_only")
+        self.assertEqual(classify_failure('{"body": "正文", "title": "标')[0], "truncated")
+        failure, partial, missing = classify_failure('{"title": "标题", "body": "正文"}')
+        self.assertEqual((failure, missing), ("missing_keys", ["hashtags", "emojis"]))
+        self.assertEqual(classify_failure('{"a": 1} {"b"}')[0], "invalid_json")
+        self.assertEqual(classify_failure("好的，马上写")[0], "no_json")
+
+    def test_repair_from_title_and_body(self):
+        """测试从正文补出标签和表情，字符串形式的列表被拆开"""
+        repaired = repair_locally({"title": "补水💧", "body": "真好用 #补水 #面膜", "hashtags": "#a #b"}, ["emojis"])
+        self.assertEqual(repaired["hashtags"], ["#a", "#b"])
+        self.assertEqual(repaired["emojis"], ["💧"])
+        self.assertIsNone(repair_locally({"title": "补水", "body": "真好用"}, ["hashtags", "emojis"]))
+
+
+class TestDecide(unittest.TestCase):
+    """测试重试/停止决策"""
+
+    def setUp(self):
+        iteration_policy.reset()
+
+    def tearDown(self):
+        iteration_policy.reset()
+
+    def stats_for(self, *failures):
+        iterations = [{"iteration": i + 1, "failure": f, "decision": "retry"} for i, f in enumerate(failures)]
+        return {"iterations": iterations + [{"iteration": len(failures) + 1}]}
+
+    def test_targeted_retry_then_stop_on_repeat(self):
+        """测试第一次重试带针对性提示，同类失败再次出现时停止"""
+        policy = IterationPolicy(make_config(max_iterations=5))
+        decision = policy.decide('{"title": "标题", "body": "正文"}', [], self.stats_for())
+        self.assertEqual(decision.action, "retry")
+        self.assertIn("hashtags、emojis", decision.prompt)
+        self.assertEqual(policy.decide("好的", [], self.stats_for("no_json")).action, "stop")
+
+    def test_stop_on_low_model_success_rate(self):
+        """测试模型对某类失败的重试几乎从不成功时不再重试"""
+        policy = IterationPolicy(make_config())
+        for _ in range(iteration_policy.MIN_SAMPLES):
+            policy.model_stats.record("no_json", False)
+        self.assertEqual(policy.decide("好的", [], self.stats_for()).action, "stop")
+
+    def test_stop_when_token_budget_exhausted(self):
+        """测试下一轮会超出 token 预算时停止"""
+        policy = IterationPolicy(make_config(token_budget=1000))
+        stats = {"prompt_tokens": 700, "completion_tokens": 100,
+                 "iterations": [{"iteration": 1, "prompt_tokens": 700, "completion_tokens": 100}]}
+        self.assertEqual(policy.decide("好的", [], stats).action, "stop")
+
+    def test_fixed_mode_uses_legacy_guidance(self):
+        """测试关闭自适应时沿用固定引导，直到最大轮数"""
+        policy = IterationPolicy(make_config(adaptive_iterations=False))
+        self.assertEqual(policy.decide('{"title": "a💧", "body": "#b"}', [], self.stats_for()).action, "retry")
+        self.assertEqual(policy.decide("好的", [], self.stats_for("no_json", "no_json")).action, "stop")
+
+
+class TestCompareOnFixedSet(unittest.TestCase):
+    """在固定测试集上对比固定引导与自适应策略"""
+
+    def setUp(self):
+        iteration_policy.reset()
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        with mock.patch.dict(os.environ, {"DEEPSEEK_API_KEY": "test-key"}):
+            self.generator = RedNoteGenerator(Config(provider="deepseek"))
+
+        def create(**kwargs):
+            product = next(name for name in SCRIPTS if name in kwargs["messages"][1]["content"])
+            turn = sum(1 for message in kwargs["messages"] if message["role"] == "user") - 1
+            script = SCRIPTS[product]
+            time.sleep(0.05)  # 模拟模型耗时
+            message = SimpleNamespace(content=script[min(turn, len(script) - 1)], tool_calls=None)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+        self.generator.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        iteration_policy.reset()
+
+    def test_adaptive_uses_fewer_calls_with_same_success(self):
+        """测试自适应策略调用更少、耗时更短，成功率不降低"""
+        fixed, adaptive = compare(self.generator, [{"product_name": name} for name in SCRIPTS])
+        self.assertEqual((fixed["mode"], adaptive["mode"]), ("fixed", "adaptive"))
+        self.assertEqual(fixed["avg_llm_calls"], 2.25)     # 2 + 2 + 2 + 3
+        self.assertEqual(adaptive["avg_llm_calls"], 1.75)  # 1（本地修复）+ 2 + 2 + 2（闲聊只重试一次）
+        self.assertEqual(fixed["success_rate"], adaptive["success_rate"])
+        self.assertLess(adaptive["avg_seconds"], fixed["avg_seconds"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+单遍 JSON 提取器的单元测试
+"""
+
+import json
+import random
+import time
+import unittest
+from pathlib import Path
+
+from json_extractor import extract_json, load_corpus, pathological_input, repair_json, run_benchmark
+
+CORPUS = Path(__file__).parent / "data" / "json_corpus.jsonl"
+NOTE = {"title": "补水面膜", "body": "好用", "hashtags": ["#补水"], "emojis": ["💧"]}
+
+
+class TestExtractJson(unittest.TestCase):
+    """测试提取正确率和最坏情况耗时"""
+
+    def test_corpus_accuracy(self):
+        """测试语料全部提取正确，且优于旧正则级联"""
+        corpus = load_corpus(str(CORPUS))
+        for case in corpus:
+            result = extract_json(case["text"])
+            with self.subTest(case=case["name"]):
+                self.assertEqual(result.get("title") if result else None, case["expect_title"])
+
+        legacy, single = run_benchmark(corpus, repeat=1)
+        self.assertEqual(single["accuracy"], 1.0)
+        self.assertLess(legacy["accuracy"], single["accuracy"])
+
+    def test_skips_draft_inside_think(self):
+        """测试忽略 <think> 中的草稿对象"""
+        draft = json.dumps({**NOTE, "title": "草稿"}, ensure_ascii=False)
+        text = f"<think>{draft}</think>" + json.dumps(NOTE, ensure_ascii=False)
+        self.assertEqual(extract_json(text)["title"], "补水面膜")
+
+    def test_random_mutations_never_raise(self):
+        """测试随机截断和插入噪声字符不会抛异常"""
+        rng = random.Random(7)
+        texts = [case["text"] for case in load_corpus(str(CORPUS))]
+        for _ in range(300):
+            text = rng.choice(texts)
+            cut = rng.randint(0, len(text))
+            noise = "".join(rng.choice('{}[]",:\\“”<>') for _ in range(rng.randint(0, 5)))
+            result = extract_json(text[:cut] + noise + text[cut:])
+            self.assertTrue(result is None or isinstance(result, dict))
+
+    def test_pathological_input_is_linear(self):
+        """测试大量未闭合对象时仍在线性时间内完成"""
+        start = time.perf_counter()
+        self.assertIsNone(extract_json(pathological_input(5000)))
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+
+class TestRepairJson(unittest.TestCase):
+    """测试字符串感知的修复"""
+
+    def test_trailing_commas_outside_strings_only(self):
+        """测试只删除字符串外的尾随逗号"""
+        repaired = repair_json('{"a": [1, 2,], "b": ",}",}')
+        self.assertEqual(json.loads(repaired), {"a": [1, 2], "b": ",}"})
+
+    def test_newlines_inside_strings_escaped(self):
+        """测试字符串内的换行被转义"""
+        self.assertEqual(json.loads(repair_json('{"a": "x\ny"}')), {"a": "x\ny"})
+
+
+if __name__ == "__main__":
+    unittest.main()
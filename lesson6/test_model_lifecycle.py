@@ -0,0 +1,147 @@
+"""
+Ollama 模型预热与常驻管理的单元测试：桩服务模拟模型载入耗时和空闲卸载
+"""
+
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import model_lifecycle
+from model_lifecycle import OllamaModelManager, get_model_manager
+from rednote import Config, RedNoteGenerator
+from stub_server import StubServer
+
+MODEL = "deepseek-r1:8b"
+
+
+class TestOllamaModelManager(unittest.TestCase):
+    """测试预热、锁定、保活和卸载"""
+
+    def setUp(self):
+        self.stub = StubServer(load_seconds=0.2).start()
+        self.manager = OllamaModelManager(self.stub.root_url, ping_interval=0.05)
+
+    def tearDown(self):
+        self.manager.close()
+        self.stub.close()
+
+    def test_warm_up_reports_load_time(self):
+        """测试预热返回 Ollama 报告的加载耗时，已驻留的模型不再载入，也不计入载入次数"""
+        self.assertAlmostEqual(self.manager.warm_up([MODEL])[MODEL], 0.2, places=2)
+        self.assertTrue(self.manager.is_loaded(MODEL))
+        self.assertEqual(self.manager.warm_up([MODEL])[MODEL], 0)
+        self.assertEqual(self.stub.stats["loads"], 1)
+        self.assertEqual(self.manager.report()[MODEL]["loads"], 1)
+
+    def test_warmed_up_model_survives_release(self):
+        """测试预热的模型不记为由管理器载入，锁定结束后保持常驻"""
+        self.manager.warm_up([MODEL])
+        with self.manager.pinned([MODEL]):
+            pass
+        self.assertEqual(self.stub.resident, [MODEL])
+        self.assertEqual(self.stub.stats["unloads"], 0)
+
+    def test_latest_tag_matches_untagged_name(self):
+        """测试不带标签的模型名与 :latest 视为同一个模型，其他进程载入的模型不会被卸载"""
+        self.stub.ensure_loaded("llama3:latest")
+        self.assertTrue(self.manager.is_loaded("llama3"))
+        with self.manager.pinned(["llama3"]):
+            pass
+        self.assertIn("llama3:latest", self.stub.resident)
+        self.assertEqual(self.stub.stats["unloads"], 0)
+
+    def test_pin_and_release_unloads_managed_models(self):
+        """测试锁定计数归零后才卸载，且只卸载由管理器载入的模型"""
+        self.stub.ensure_loaded("qwen2.5:7b")  # 其他进程已在使用
+        self.manager.pin([MODEL, "qwen2.5:7b"])
+        self.manager.pin([MODEL])
+        self.manager.release([MODEL, "qwen2.5:7b"])
+        self.assertIn(MODEL, self.stub.resident)
+
+        self.manager.release([MODEL])
+        self.assertEqual(self.stub.resident, ["qwen2.5:7b"])
+        self.assertEqual(self.manager.report()[MODEL]["unloads"], 1)
+
+    def test_overlapping_pins_with_and_without_tag(self):
+        """测试带与不带 :latest 的锁定共用一个计数，先结束的批量不会卸载另一批仍在用的模型"""
+        self.manager.pin(["llama3"])
+        self.manager.pin(["llama3:latest"])
+        self.manager.release(["llama3"])
+        self.assertEqual(self.stub.stats["unloads"], 0)
+        self.assertEqual(self.manager.report()["llama3:latest"]["pinned"], 1)
+
+        self.manager.release(["llama3:latest"])
+        self.assertEqual(self.stub.stats["unloads"], 1)
+        self.assertEqual(self.manager.report()["llama3:latest"]["loads"], 1)
+
+    def test_keep_alive_pings_and_detects_reload(self):
+        """测试锁定期间定时保活，模型被卸载后重新载入时计入 reloads"""
+        with mock.patch.object(model_lifecycle, "RELOAD_THRESHOLD_SECONDS", 0.1), \
+                self.manager.pinned([MODEL], unload=False):
+            time.sleep(0.12)
+            self.stub.evict(MODEL)
+            time.sleep(0.35)
+        stats = self.manager.report()[MODEL]
+        self.assertGreaterEqual(stats["pings"], 2)
+        self.assertEqual(stats["reloads"], 1)
+        self.assertEqual(stats["loads"], 1)
+        self.assertIn(MODEL, self.stub.resident)
+        self.assertGreater(self.stub.stats["keep_alives"], 0)
+
+
+class TestGeneratorModelLifecycle(unittest.TestCase):
+    """测试生成器初始化时预热，批量生成期间锁定，结束后卸载"""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        self.stub = StubServer(load_seconds=0.3).start()
+
+    def tearDown(self):
+        get_model_manager(self.stub.url).close()
+        self.stub.close()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def generator(self, **env) -> RedNoteGenerator:
+        with mock.patch.dict(os.environ, {**self.stub.environ(), **env}):
+            return RedNoteGenerator(Config(provider="ollama"))
+
+    def test_warm_up_before_first_request(self):
+        """测试初始化时已载入模型，第一篇文案不再等待载入"""
+        generator = self.generator(OLLAMA_PRELOAD_MODELS="qwen2.5:7b")
+        self.assertEqual(sorted(self.stub.resident), [MODEL, "qwen2.5:7b"])
+        result = generator.generate("美白精华", use_cache=False)
+        self.assertLess(result["metadata"]["llm_seconds"], 0.3)
+        self.assertAlmostEqual(get_model_manager(self.stub.url).report()[MODEL]["load_seconds"][0], 0.3, places=2)
+
+    def test_batch_unloads_model_afterwards(self):
+        """测试预热的模型在批量后保持常驻；模型中途被卸载、由批量重新载入时，批量结束后卸载，关闭卸载时保持常驻"""
+        generator = self.generator()
+        items = [{"product_name": f"产品{i}", "use_cache": False} for i in range(2)]
+        self.assertTrue(all(result["success"] for result in generator.generate_batch(items)))
+        self.assertEqual(self.stub.resident, [MODEL])
+        self.assertEqual(self.stub.stats["unloads"], 0)
+
+        self.stub.evict(MODEL)
+        self.assertTrue(all(result["success"] for result in generator.generate_batch(items)))
+        self.assertEqual(self.stub.resident, [])
+        self.assertEqual(self.stub.stats["unloads"], 1)
+
+        generator.config.ollama_unload_after_batch = False
+        generator.generate_batch(items)
+        self.assertEqual(self.stub.resident, [MODEL])
+
+    def test_preload_disabled(self):
+        """测试 OLLAMA_PRELOAD=0 时不预热也不锁定"""
+        generator = self.generator(OLLAMA_PRELOAD="0")
+        self.assertEqual(self.stub.stats["keep_alives"] + self.stub.stats["unloads"], 0)
+        generator.generate_batch([{"product_name": "面膜", "use_cache": False}])
+        self.assertEqual(self.stub.stats["unloads"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
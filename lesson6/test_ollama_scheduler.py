@@ -0,0 +1,171 @@
+"""
+Ollama 请求调度的单元测试
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import ollama_scheduler
+from ollama_scheduler import OllamaScheduler, OutputPredictor, get_ollama_scheduler, request_kind
+from rednote import Config, RedNoteGenerator
+from stub_server import LatencyModel, StubServer
+
+
+class TestOllamaScheduler(unittest.TestCase):
+    """测试并发上限、SEJF 顺序和排队老化"""
+
+    def run_jobs(self, scheduler: OllamaScheduler, jobs, hold: float = 0.05):
+        """先占住所有槽位，再依次提交 jobs（名称, 预计 token 数），返回获得槽位的顺序"""
+        order, lock = [], threading.Lock()
+        blockers = [scheduler.acquire(0) for _ in range(scheduler.max_in_flight)]
+
+        def run(name, predicted):
+            with scheduler.slot(predicted):
+                with lock:
+                    order.append(name)
+                time.sleep(hold)
+
+        threads = [threading.Thread(target=run, args=job) for job in jobs]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        for ticket in blockers:
+            scheduler.release(ticket)
+        for thread in threads:
+            thread.join()
+        return order
+
+    def test_caps_in_flight_requests(self):
+        """测试同时在途的请求数不超过上限"""
+        scheduler = OllamaScheduler(max_in_flight=2)
+        active, peak, lock = [0], [0], threading.Lock()
+
+        def run():
+            with scheduler.slot(100):
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(0.05)
+                with lock:
+                    active[0] -= 1
+
+        threads = [threading.Thread(target=run) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak[0], 2)
+        self.assertEqual(scheduler.stats["served"], 6)
+        self.assertGreater(scheduler.stats["queue_seconds"], 0)
+
+    def test_shortest_expected_job_first(self):
+        """测试有空槽时先放行预计输出最短的请求"""
+        order = self.run_jobs(OllamaScheduler(1), [("long", 1500), ("medium", 500), ("short", 100)])
+        self.assertEqual(order, ["short", "medium", "long"])
+
+    def test_fifo_when_disabled(self):
+        """测试关闭 SEJF 时按到达顺序放行"""
+        order = self.run_jobs(OllamaScheduler(1, sejf=False), [("long", 1500), ("short", 100)])
+        self.assertEqual(order, ["long", "short"])
+
+    def test_aging_promotes_long_waiters(self):
+        """测试排队足够久的长请求优先于刚到的短请求"""
+        with mock.patch.object(ollama_scheduler, "AGING_TOKENS_PER_SECOND", 1000000):
+            order = self.run_jobs(OllamaScheduler(1), [("long", 1500), ("short", 100)])
+        self.assertEqual(order, ["long", "short"])
+
+    def test_async_acquire_and_cancel(self):
+        """测试协程排队按预计长度放行，取消的等待者不占槽位"""
+        scheduler = OllamaScheduler(1)
+
+        async def scenario():
+            order = []
+            blocker = await scheduler.acquire_async(0)
+
+            async def job(name, predicted):
+                ticket = await scheduler.acquire_async(predicted)
+                order.append(name)
+                await asyncio.sleep(0.01)
+                scheduler.release(ticket)
+
+            tasks = [asyncio.create_task(job(*spec)) for spec in (("long", 1500), ("cancelled", 10), ("short", 100))]
+            await asyncio.sleep(0.02)
+            tasks[1].cancel()
+            await asyncio.sleep(0.01)
+            scheduler.release(blocker)
+            await asyncio.gather(*tasks, return_exceptions=True)
+            return order
+
+        self.assertEqual(asyncio.run(scenario()), ["short", "long"])
+        self.assertEqual(scheduler.waiting, 0)
+
+    def test_resize_in_place(self):
+        """测试同一端点只有一个调度器，调大并行数时立即放行排队的请求"""
+        scheduler = get_ollama_scheduler("http://resize.test:11434/", 1)
+        held = scheduler.acquire(0)
+        granted = threading.Event()
+
+        def run():
+            with scheduler.slot(100):
+                granted.set()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.assertFalse(granted.wait(0.05))
+        self.assertIs(get_ollama_scheduler("http://resize.test:11434", 2), scheduler)
+        self.assertTrue(granted.wait(1))
+        thread.join()
+        scheduler.release(held)
+        self.assertEqual(scheduler.max_in_flight, 2)
+
+    def test_output_predictor(self):
+        """测试没有历史时按模型给出先验，之后按同类请求的历史输出长度预测"""
+        predictor = OutputPredictor()
+        first = request_kind("deepseek-r1:8b", [{"role": "user", "content": "hi"}])
+        retry = request_kind("qwen2.5:7b", [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "x"}])
+        self.assertEqual((first, retry), ("reasoning:first", "default:followup"))
+        self.assertEqual(predictor.predict("deepseek-r1:8b", first), 1500)
+        self.assertEqual(predictor.predict("deepseek-r1:8b", first, max_tokens=800), 800)
+        self.assertEqual(predictor.predict("deepseek-r1:8b", first, prompt_tokens=2000), 1700)
+        predictor.observe("qwen2.5:7b", retry, 100)
+        predictor.observe("qwen2.5:7b", retry, 200)
+        self.assertEqual(predictor.predict("qwen2.5:7b", retry), 130)
+
+
+class TestGeneratorScheduling(unittest.TestCase):
+    """测试生成器对着桩服务排队，排队时间与生成时间分开统计"""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        self.stub = StubServer(latency=LatencyModel(ttft=0.1)).start()
+
+    def tearDown(self):
+        self.stub.close()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_batch_queues_behind_server_parallelism(self):
+        """测试并发批量生成时在途请求不超过 OLLAMA_NUM_PARALLEL，排队时间记入 queue_seconds"""
+        with mock.patch.dict(os.environ, {**self.stub.environ(), "OLLAMA_NUM_PARALLEL": "1"}):
+            generator = RedNoteGenerator(Config(provider="ollama"))
+        items = [{"product_name": f"产品{i}", "use_cache": False} for i in range(3)]
+        results = generator.generate_batch(items, concurrency=3)
+
+        self.assertTrue(all(result["success"] for result in results))
+        queued = sorted(result["metadata"]["queue_seconds"] for result in results)
+        self.assertEqual(queued[0], 0)
+        self.assertGreaterEqual(queued[-1], 0.15)
+        for result in results:
+            self.assertLess(result["metadata"]["llm_seconds"], 0.2)
+            self.assertGreater(result["metadata"]["iterations"][0]["predicted_tokens"], 1500)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+静态请求前缀与缓存 token 统计的单元测试
+"""
+
+import copy
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from prompt_prefix import StaticPrefix, summarize_usage, usage_counts
+from rednote import Config, RedNoteGenerator
+
+NOTE = {"title": "补水面膜", "body": "好用", "hashtags": ["#补水", "#面膜", "#护肤"], "emojis": ["💧"]}
+
+
+def serialized_prefix(request):
+    """请求中应保持逐字节一致的部分：系统消息 + 工具定义"""
+    return json.dumps([request["messages"][0], request.get("tools")], ensure_ascii=False)
+
+
+class TestUsageCounts(unittest.TestCase):
+    """测试从不同服务商的 usage 中读取缓存 token"""
+
+    def test_deepseek_and_openai_fields(self):
+        """测试 DeepSeek 的 prompt_cache_hit_tokens 与 OpenAI 的 prompt_tokens_details"""
+        deepseek = SimpleNamespace(prompt_tokens=900, completion_tokens=100, prompt_cache_hit_tokens=640)
+        openai_style = SimpleNamespace(prompt_tokens=900, completion_tokens=100,
+                                       prompt_tokens_details=SimpleNamespace(cached_tokens=512))
+        ollama = SimpleNamespace(prompt_tokens=900, completion_tokens=100)
+        self.assertEqual(usage_counts(deepseek)["cached_tokens"], 640)
+        self.assertEqual(usage_counts(openai_style)["cached_tokens"], 512)
+        self.assertIsNone(usage_counts(ollama)["cached_tokens"])
+
+    def test_summarize_usage(self):
+        """测试批量汇总命中率，失败结果的统计在顶层"""
+        results = [
+            {"success": True, "metadata": {"prompt_tokens": 1000, "completion_tokens": 200, "cached_tokens": 600}},
+            {"success": False, "error": "生成失败", "prompt_tokens": 1000, "cached_tokens": 400}
+        ]
+        summary = summarize_usage(results)
+        self.assertEqual(summary["prompt_tokens"], 2000)
+        self.assertEqual(summary["cache_hit_rate"], 0.5)
+        self.assertEqual(summary["cache_reported"], 2)
+
+    def test_prefix_ignores_dict_order(self):
+        """测试工具定义的键顺序不影响前缀"""
+        tools = [{"type": "function", "function": {"name": "a", "parameters": {}}}]
+        reordered = [{"function": {"parameters": {}, "name": "a"}, "type": "function"}]
+        self.assertEqual(StaticPrefix("提示词", tools).fingerprint, StaticPrefix("提示词\n", reordered).fingerprint)
+
+
+class TestStablePrefix(unittest.TestCase):
+    """测试生成器每次请求的开头逐字节一致"""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        with mock.patch.dict(os.environ, {"DEEPSEEK_API_KEY": "test-key"}):
+            self.generators = [RedNoteGenerator(Config(provider="deepseek")) for _ in range(2)]
+        self.requests = []
+
+        def create(**kwargs):
+            # 第一次回复无法解析的文本，触发重试引导；之后返回文案
+            self.requests.append(copy.deepcopy(kwargs))
+            retry = kwargs["messages"][-1]["role"] == "user" and len(kwargs["messages"]) == 2
+            content = "稍等，我想一想……" if retry else json.dumps(NOTE, ensure_ascii=False)
+            usage = SimpleNamespace(prompt_tokens=800, completion_tokens=100, prompt_cache_hit_tokens=640)
+            message = SimpleNamespace(content=content, tool_calls=None)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+        for generator in self.generators:
+            generator.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_prefix_identical_across_generators_items_and_retries(self):
+        """测试不同实例、不同产品、重试轮次的请求前缀相同，历史只追加不改写"""
+        results = [generator.generate(product, use_cache=False)
+                   for generator in self.generators for product in ("面膜", "精华")]
+        self.assertTrue(all(result["success"] for result in results))
+        self.assertIs(self.generators[0].prefix, self.generators[1].prefix)
+        self.assertEqual(len({serialized_prefix(request) for request in self.requests}), 1)
+
+        first, retry = self.requests[0]["messages"], self.requests[1]["messages"]
+        self.assertEqual(retry[:len(first)], first)
+
+    def test_metadata_reports_tokens(self):
+        """测试元数据累加每轮的 token 数和缓存命中"""
+        metadata = self.generators[0].generate("面膜", use_cache=False)["metadata"]
+        self.assertEqual(metadata["llm_calls"], 2)
+        self.assertEqual(metadata["prompt_tokens"], 1600)
+        self.assertEqual(metadata["cached_tokens"], 1280)
+        self.assertEqual(metadata["prompt_prefix"], self.generators[0].prefix.fingerprint)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+"""
+多服务路由的单元测试：每个后端指向一个本地桩服务器
+"""
+
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import provider_router
+from provider_router import BackendStats, ProviderRouter
+from rednote import Config, RedNoteGenerator
+from stub_server import LatencyModel, StubServer
+
+NOTE = {"title": "补水面膜", "body": "好用", "hashtags": ["#补水", "#面膜", "#护肤"], "emojis": ["💧"]}
+
+
+class TestProviderRouter(unittest.TestCase):
+    """测试路由选择、对冲和故障转移"""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        self.servers = []
+        self.router = None
+
+    def tearDown(self):
+        if self.router:
+            self.router.close()
+        for server in self.servers:
+            server.close()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def backend(self, name: str, delay: float = 0.0, status: int = 200):
+        """指向一个新桩服务的后端：每次等待 delay 秒后返回文案，status 不为 200 时返回错误"""
+        reply = {"content": json.dumps(NOTE, ensure_ascii=False)} if status == 200 else {"status": status}
+        server = StubServer(script=[reply], latency=LatencyModel(ttft=delay)).start()
+        self.servers.append(server)
+        with mock.patch.dict(os.environ, {"DEEPSEEK_API_KEY": f"key-{name}", "DEEPSEEK_BASE_URL": server.url}):
+            return name, RedNoteGenerator(Config(provider="deepseek"))
+
+    def test_routes_to_fastest_backend(self):
+        """测试每个后端先试探一次，之后走延迟更低的后端"""
+        self.router = ProviderRouter([self.backend("fast", delay=0.02), self.backend("slow", delay=0.2)],
+                                     hedge_after=10)
+        routes = [self.router.generate(product_name="面膜", use_cache=False)["metadata"]["route"]["backend"]
+                  for _ in range(4)]
+        self.assertEqual(routes, ["fast", "slow", "fast", "fast"])
+        self.assertEqual(self.servers[1].stats["requests"], 1)
+
+    def test_hedges_slow_request(self):
+        """测试主请求超过对冲阈值后同时请求下一个后端，返回先完成的结果"""
+        self.router = ProviderRouter([self.backend("stalled", delay=1.0), self.backend("backup", delay=0.02)],
+                                     hedge_after=0.2)
+        start = time.time()
+        result = self.router.generate(product_name="面膜", use_cache=False)
+        self.assertLess(time.time() - start, 0.8)
+        route = result["metadata"]["route"]
+        self.assertEqual((route["backend"], route["hedged"], route["tried"]), ("backup", True, ["stalled", "backup"]))
+
+    def test_fails_over_and_opens_circuit(self):
+        """测试出错时自动切换，连续失败的后端被熔断并排到最后"""
+        self.router = ProviderRouter([self.backend("broken", status=400), self.backend("good")], hedge_after=10)
+        first = self.router.generate(product_name="面膜", use_cache=False)
+        self.assertTrue(first["success"])
+        self.assertEqual(first["metadata"]["route"]["failovers"], 1)
+
+        with mock.patch.object(provider_router, "COOLDOWN_SECONDS", 60):
+            # good 已有延迟样本，broken 没有，仍会先试 broken；再失败一次后熔断
+            self.router.generate(product_name="面膜", use_cache=False)
+        self.assertFalse(self.router.backends[0].stats.healthy())
+        self.assertEqual([backend.name for backend in self.router.ranked()], ["good", "broken"])
+        requests_before = self.servers[0].stats["requests"]
+        self.router.generate(product_name="面膜", use_cache=False)
+        self.assertEqual(self.servers[0].stats["requests"], requests_before)
+
+    def test_half_open_admits_single_probe(self):
+        """测试熔断到期后只放行一个试探请求，试探失败重新熔断，成功后恢复"""
+        stats = BackendStats()
+        with mock.patch.object(provider_router, "COOLDOWN_SECONDS", 0.05):
+            for _ in range(provider_router.FAILURE_THRESHOLD):
+                self.assertTrue(stats.admit())
+                stats.record_failure()
+            self.assertEqual(stats.state(), "open")
+            self.assertFalse(stats.admit())
+
+            time.sleep(0.06)
+            self.assertEqual(stats.state(), "half_open")
+            self.assertTrue(stats.admit())
+            self.assertFalse(stats.admit())
+            stats.record_failure()
+            self.assertEqual(stats.state(), "open")
+
+            time.sleep(0.06)
+            self.assertTrue(stats.admit())
+            stats.record_success(0.1)
+        self.assertEqual(stats.state(), "closed")
+        self.assertTrue(stats.admit() and stats.admit())
+
+    def test_does_not_hedge_to_open_backend(self):
+        """测试熔断中的后端不作为对冲或故障转移目标"""
+        self.router = ProviderRouter([self.backend("slow", delay=0.3), self.backend("broken", status=400)],
+                                     hedge_after=0.05)
+        self.router.backends[1].stats.open_until = time.monotonic() + 60
+        result = self.router.generate(product_name="面膜", use_cache=False)
+        route = result["metadata"]["route"]
+        self.assertEqual((route["tried"], route["hedged"]), (["slow"], False))
+        self.assertEqual(self.servers[1].stats["requests"], 0)
+
+    def test_reports_failure_when_all_backends_fail(self):
+        """测试所有后端都失败时返回失败结果和路由记录"""
+        self.router = ProviderRouter([self.backend("a", status=400), self.backend("b", status=400)], hedge_after=10)
+        result = self.router.generate(product_name="面膜", use_cache=False)
+        self.assertFalse(result["success"])
+        self.assertEqual(result["route"]["tried"], ["a", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
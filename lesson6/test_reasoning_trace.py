@@ -0,0 +1,169 @@
+"""
+R1 推理过程处理的单元测试
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from reasoning_trace import ReasoningSplitter, ReasoningTraceStore, split_reasoning, token_split
+from rednote import Config, RedNoteGenerator
+from stream_parser import NoteStream
+from stub_server import StubServer
+
+NOTE = {"title": "补水面膜", "body": "好用", "hashtags": ["#补水", "#面膜", "#护肤"], "emojis": ["💧"]}
+
+
+class FakeStream:
+    """流式响应：记录实际被读取的分块数"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.consumed += 1
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+def chunk(content=None, reasoning_content=None):
+    delta = SimpleNamespace(content=content, reasoning_content=reasoning_content, tool_calls=None)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+
+
+class TestReasoningSplitter(unittest.TestCase):
+    """测试推理与回答的拆分"""
+
+    def test_splits_tags_across_chunks(self):
+        """测试标签被切在两个分块之间时仍能正确拆分，回答增量不含推理"""
+        splitter = ReasoningSplitter()
+        text = "<think>先分析卖点</think>\n{\"title\": \"补水\"}"
+        answer = "".join(splitter.feed(text[i:i + 3]) for i in range(0, len(text), 3))
+        self.assertEqual(answer.strip(), '{"title": "补水"}')
+        self.assertEqual(splitter.reasoning, "先分析卖点")
+        self.assertFalse(splitter.in_think)
+
+    def test_close_tag_without_open(self):
+        """测试模板省略 <think> 时，</think> 之前的内容记为推理"""
+        self.assertEqual(split_reasoning("分析中……</think>{}"), ("分析中……", "{}"))
+        self.assertEqual(split_reasoning("{}", reasoning="独立字段的推理"), ("独立字段的推理", "{}"))
+
+    def test_budget(self):
+        """测试推理未结束且超出预算时才算超预算"""
+        splitter = ReasoningSplitter()
+        splitter.feed("<think>" + "分析" * 30)
+        self.assertTrue(splitter.over_budget(50))
+        self.assertFalse(splitter.over_budget(0))
+        splitter.feed("</think>{")
+        self.assertFalse(splitter.over_budget(50))
+
+    def test_token_split(self):
+        """测试优先使用服务端返回的推理 token 数，否则按文本比例分摊实际输出 token 数"""
+        self.assertEqual(token_split("推理" * 30, "回答" * 10, 100), {"reasoning_tokens": 75, "answer_tokens": 25})
+        self.assertEqual(token_split("推理", "回答", 100, reported_reasoning=90),
+                         {"reasoning_tokens": 90, "answer_tokens": 10})
+        self.assertEqual(token_split("推理", "", None), {"reasoning_tokens": 2, "answer_tokens": 0})
+
+
+class TestGeneratorReasoning(unittest.TestCase):
+    """测试生成器的推理预算、推理存档和 token 统计"""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_r1_note_records_reasoning(self):
+        """测试设置推理预算后 R1 模型按流式接收，回答不含推理，推理按篇另存，元数据记录两类 token 数"""
+        with StubServer() as stub:
+            with mock.patch.dict(os.environ, {**stub.environ(), "REDNOTE_THINK_BUDGET": "1500"}):
+                generator = RedNoteGenerator(Config(provider="ollama"))
+            result = generator.generate("美白精华", use_cache=False)
+            self.assertEqual(stub.stats["streamed"], 1)
+
+        self.assertTrue(result["success"])
+        metadata = result["metadata"]
+        self.assertGreater(metadata["reasoning_tokens"], 0)
+        self.assertGreater(metadata["answer_tokens"], metadata["reasoning_tokens"])
+        self.assertNotIn("stream_metrics", metadata)
+        traces = ReasoningTraceStore(metadata["reasoning_trace"]).load()
+        self.assertEqual(traces[0]["product_name"], "美白精华")
+        self.assertIn("美白精华", traces[0]["iterations"][0]["reasoning"])
+        self.assertEqual(generator._build_request_kwargs([])["max_tokens"], 3500)
+
+    def test_think_budget_is_opt_in(self):
+        """测试默认不限推理：R1 不强制流式，max_tokens 不额外预留，仍记录推理 token 数"""
+        with StubServer() as stub:
+            with mock.patch.dict(os.environ, stub.environ()):
+                generator = RedNoteGenerator(Config(provider="ollama"))
+            result = generator.generate("美白精华", use_cache=False)
+            self.assertEqual(stub.stats["streamed"], 0)
+
+        self.assertTrue(result["success"])
+        self.assertGreater(result["metadata"]["reasoning_tokens"], 0)
+        self.assertEqual(generator._build_request_kwargs([])["max_tokens"], 2000)
+
+    def test_stream_requests_usage(self):
+        """测试流式请求带 include_usage，收到最后的用量块时按实际用量修正限速额度"""
+        with mock.patch.dict(os.environ, {"DEEPSEEK_API_KEY": "test-key"}):
+            generator = RedNoteGenerator(Config(provider="deepseek"))
+        usage = SimpleNamespace(prompt_tokens=10, completion_tokens=20, total_tokens=30)
+        stream = FakeStream([chunk(reasoning_content="分析"), chunk(content="好的"),
+                             SimpleNamespace(choices=[], usage=usage)])
+        requests = []
+        generator.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+            create=lambda **kwargs: requests.append(kwargs) or stream)))
+        request_kwargs = {"model": "deepseek-reasoner", "messages": [{"role": "user", "content": "你好"}],
+                          "max_tokens": 100}
+
+        with mock.patch("rednote.get_rate_limiter") as get_limiter:
+            get_limiter.return_value.acquire.return_value = 0.0
+            message, received = generator._stream_message(request_kwargs, NoteStream(lambda key, value: None))
+            get_limiter.return_value.adjust.assert_called_once_with(30 - 106)
+
+        self.assertEqual(requests[0]["stream_options"], {"include_usage": True})
+        self.assertEqual(message.content, "好的")
+        self.assertIs(received, usage)
+
+    def test_think_budget_cuts_reasoning_and_retries(self):
+        """测试推理超出预算时提前结束本轮，下一轮追加直接输出 JSON 的提示"""
+        with mock.patch.dict(os.environ, {"DEEPSEEK_API_KEY": "test-key", "REDNOTE_THINK_BUDGET": "40",
+                                          "REDNOTE_SAVE_REASONING": "0"}):
+            generator = RedNoteGenerator(Config(provider="deepseek"))
+        generator.config.model = "deepseek-reasoner"
+        streams, requests = [
+            FakeStream([chunk(reasoning_content="分析卖点。" * 4) for _ in range(20)]),
+            FakeStream([chunk(reasoning_content="好的"), chunk(content=json.dumps(NOTE, ensure_ascii=False))])
+        ], []
+
+        def create(**kwargs):
+            requests.append(kwargs)
+            return streams[len(requests) - 1]
+
+        generator.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        result = generator.generate("补水面膜", use_cache=False)
+
+        self.assertTrue(result["success"])
+        self.assertLess(streams[0].consumed, 5)
+        self.assertTrue(streams[0].closed)
+        first, second = result["metadata"]["iterations"]
+        self.assertEqual(first["failure"], "think_only")
+        self.assertGreater(first["reasoning_tokens"], 40)
+        self.assertIn("直接输出最终 JSON", requests[1]["messages"][-1]["content"])
+        self.assertNotIn("reasoning_trace", result["metadata"])
+
+
+if __name__ == "__main__":
+    unittest.main()
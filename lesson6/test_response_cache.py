@@ -0,0 +1,114 @@
+"""
+响应缓存的单元测试
+"""
+
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+
+from rednote import Config, RedNoteGenerator
+from response_cache import ResponseCache, make_cache_key
+
+NOTE = {"title": "补水面膜", "body": "好用", "hashtags": ["#补水"], "emojis": ["💧"]}
+
+
+class TestResponseCache(unittest.TestCase):
+    """测试缓存读写、过期、淘汰和轮换"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key_normalizes_whitespace_and_width(self):
+        """测试全半角和多余空白不影响缓存键"""
+        sampling = {"temperature": 0.7}
+        self.assertEqual(make_cache_key("请为产品 ＳＰＦ５０  防晒霜", "v1", "m", sampling),
+                         make_cache_key("请为产品 SPF50 防晒霜 ", "v1", "m", sampling))
+        self.assertNotEqual(make_cache_key("a", "v1", "m", sampling), make_cache_key("a", "v2", "m", sampling))
+
+    def test_variations_rotate_after_filled(self):
+        """测试攒够 N 个样本前返回 None，之后轮流返回"""
+        cache = ResponseCache(self.tmp.name, variations=2)
+        self.assertIsNone(cache.get("k"))
+        cache.put("k", {"title": "一"})
+        self.assertIsNone(cache.get("k"))
+        cache.put("k", {"title": "二"})
+        cache.put("k", {"title": "三"})  # 已满，忽略
+        titles = [cache.get("k")["title"] for _ in range(4)]
+        self.assertEqual(titles, ["一", "二", "一", "二"])
+
+    def test_ttl_expiry(self):
+        """测试过期条目不再返回"""
+        cache = ResponseCache(self.tmp.name, ttl_seconds=60)
+        cache.put("k", NOTE)
+        self.assertEqual(cache.get("k"), NOTE)
+        with mock.patch("response_cache.time.time", return_value=time.time() + 120):
+            self.assertIsNone(cache.get("k"))
+
+    def test_size_bounded_eviction(self):
+        """测试超出容量时淘汰最久未访问的条目"""
+        cache = ResponseCache(self.tmp.name, max_bytes=250)
+        for i in range(3):
+            cache.put(f"k{i}", {"body": "x" * 100})
+            time.sleep(0.01)
+        self.assertIsNone(cache.get("k0"))
+        self.assertIsNotNone(cache.get("k2"))
+        self.assertLessEqual(cache.stats()["bytes"], 250)
+
+    def test_concurrent_writers_share_directory(self):
+        """测试多个缓存实例并发写同一目录，样本数不超过 variations"""
+        def worker(i):
+            cache = ResponseCache(self.tmp.name, variations=3)
+            cache.put("k", {"title": str(i)})
+            return cache.get("k")
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(worker, range(16)))
+        self.assertEqual(ResponseCache(self.tmp.name).stats()["entries"], 3)
+
+
+class TestGeneratorCache(unittest.TestCase):
+    """测试生成器使用缓存"""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        with mock.patch.dict(os.environ, {"DEEPSEEK_API_KEY": "test-key"}):
+            self.generator = RedNoteGenerator(Config(provider="deepseek"), response_cache=ResponseCache("cache"))
+        self.calls = 0
+
+        def create(**kwargs):
+            self.calls += 1
+            message = SimpleNamespace(content=f"```json\n{NOTE}\n```".replace("'", '"'), tool_calls=None)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+        self.generator.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_second_identical_request_hits_cache(self):
+        """测试相同请求（特性顺序不同）第二次命中缓存，不再调用 API"""
+        first = self.generator.generate("面膜", style="活泼", key_features=["补水", "修护"])
+        second = self.generator.generate("面膜 ", style="活泼", key_features=["修护", "补水"])
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(first["content"], second["content"])
+        self.assertTrue(second["metadata"]["cached"])
+
+    def test_use_cache_false_bypasses(self):
+        """测试 use_cache=False 时直接调用 API"""
+        self.generator.generate("面膜")
+        self.generator.generate("面膜", use_cache=False)
+        self.assertEqual(self.calls, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+"""
+搜索后端、缓存与请求合并的单元测试
+"""
+
+import asyncio
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+import search_backend
+from rednote import ToolManager
+from search_backend import HttpSearchBackend, LocalTrendsBackend, SearchBackend, SearchService
+
+
+class CountingBackend(SearchBackend):
+    """记录调用次数、每次搜索耗时 delay 秒的后端"""
+
+    def __init__(self, delay: float = 0.1):
+        self.delay = delay
+        self.calls = []
+
+    async def search(self, query):
+        self.calls.append(query)
+        await asyncio.sleep(self.delay)
+        return [{"title": query, "snippet": "结果"}]
+
+
+class TestLocalTrendsBackend(unittest.TestCase):
+    """测试本地趋势索引"""
+
+    def test_ranks_relevant_document_first(self):
+        """测试最相关的趋势排在第一"""
+        backend = LocalTrendsBackend()
+        self.assertEqual(backend.query("保湿面膜 用户痛点")[0]["title"], "保湿面膜用户痛点")
+        self.assertEqual(backend.query("男士 控油 洁面")[0]["title"], "男士控油洁面评价")
+        self.assertEqual(backend.query("zzz"), [])
+
+
+class TestSearchService(unittest.TestCase):
+    """测试缓存与请求合并"""
+
+    def setUp(self):
+        self.backend = CountingBackend()
+        self.service = SearchService(self.backend, ttl_seconds=0.3)
+
+    def tearDown(self):
+        self.service.close()
+
+    def test_identical_inflight_queries_are_coalesced(self):
+        """测试同时发起的相同查询（忽略空白和大小写）只搜索一次"""
+        async def run():
+            queries = ["小红书 趋势", " 小红书  趋势", "小红书 趋势", "小红书 趋势 ".upper()]
+            return await asyncio.gather(*(self.service.search(query) for query in queries))
+
+        results = asyncio.run(run())
+        self.assertEqual(len(self.backend.calls), 1)
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(self.service.stats["coalesced"], 3)
+
+    def test_sync_callers_in_threads_share_results(self):
+        """测试多线程同步调用也共用同一次搜索"""
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(self.service.search_sync, ["保湿面膜"] * 4))
+        self.assertEqual(len(self.backend.calls), 1)
+        self.assertEqual(len(set(results)), 1)
+
+    def test_ttl_cache(self):
+        """测试缓存期内直接返回，过期后重新搜索"""
+        self.service.search_sync("防晒")
+        start = time.time()
+        self.service.search_sync("防晒")
+        self.assertLess(time.time() - start, 0.05)
+        self.assertEqual(self.service.stats["hits"], 1)
+        time.sleep(0.35)
+        self.service.search_sync("防晒")
+        self.assertEqual(len(self.backend.calls), 2)
+
+    def test_errors_are_not_cached(self):
+        """测试搜索失败时所有等待者都收到异常，且不缓存"""
+        class FailingBackend(SearchBackend):
+            async def search(self, query):
+                raise RuntimeError("服务不可用")
+
+        self.service.backend = FailingBackend()
+        with self.assertRaises(RuntimeError):
+            self.service.search_sync("香水")
+        self.service.backend = self.backend
+        self.assertIn("香水", self.service.search_sync("香水"))
+
+
+class TestHttpSearchBackend(unittest.TestCase):
+    """测试 HTTP 后端的请求与结果解析"""
+
+    def test_parses_searxng_style_results(self):
+        """测试查询参数、鉴权头和结果字段"""
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, json={"results": [{"title": "趋势", "content": "多巴胺穿搭"}] * 5})
+
+        async def run():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            backend = HttpSearchBackend("https://search.example/search", api_key="k", client=client)
+            try:
+                return await backend.search("穿搭")
+            finally:
+                await backend.aclose()
+
+        results = asyncio.run(run())
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0], {"title": "趋势", "snippet": "多巴胺穿搭"})
+        self.assertEqual(requests[0].url.params["q"], "穿搭")
+        self.assertEqual(requests[0].headers["Authorization"], "Bearer k")
+
+
+class TestToolManagerSearch(unittest.TestCase):
+    """测试 ToolManager.search_web 使用共享服务"""
+
+    def tearDown(self):
+        search_backend.set_search_service(None)
+
+    def test_search_web_uses_shared_service(self):
+        """测试重复的趋势查询走缓存"""
+        backend = CountingBackend(delay=0)
+        search_backend.set_search_service(SearchService(backend))
+        first = ToolManager.search_web("小红书趋势")
+        second = ToolManager.search_web("小红书趋势")
+        self.assertEqual(first, second)
+        self.assertEqual(len(backend.calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
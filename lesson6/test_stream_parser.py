@@ -0,0 +1,153 @@
+"""
+流式 JSON 增量解析与流式生成的单元测试
+"""
+
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from rednote import Config, RedNoteGenerator
+from stream_parser import NoteStream, StreamingJSONParser
+
+NOTE = ('```json\n{"title": "补水 \\"神\\" 器✨", "body": "第一行\n第二行", '
+        '"hashtags": ["#补水", "#面膜"], "emojis": ["💧"]}\n```\n以上就是文案')
+
+
+def feed_in_chunks(text, size):
+    parser = StreamingJSONParser()
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i:i + size]))
+    return parser, events
+
+
+class TestStreamingJSONParser(unittest.TestCase):
+    """测试增量解析器"""
+
+    def test_fields_complete_in_order_for_any_chunking(self):
+        """测试任意切分方式下字段按顺序产出且结果一致"""
+        for size in (1, 2, 5, 17, len(NOTE)):
+            parser, events = feed_in_chunks(NOTE, size)
+            self.assertTrue(parser.done)
+            self.assertEqual([key for key, _ in events], ["title", "body", "hashtags", "emojis"])
+            self.assertEqual(parser.result["title"], '补水 "神" 器✨')
+            self.assertEqual(parser.result["body"], "第一行\n第二行")
+
+    def test_title_emitted_before_object_closes(self):
+        """测试标题的右引号到达即产出"""
+        parser = StreamingJSONParser()
+        self.assertEqual(parser.feed('{"title": "补水'), [])
+        self.assertEqual(parser.feed('面膜", "bo'), [("title", "补水面膜")])
+        self.assertFalse(parser.done)
+
+    def test_skips_think_block_split_across_chunks(self):
+        """测试 NoteStream 先拆出被切分的 <think> 块，其中的示例 JSON 不会交给解析器"""
+        text = '<thi' + 'nk>先想想 {"title": "草稿"} </th' + 'ink>' + NOTE
+        events = []
+        stream = NoteStream(lambda key, value: events.append((key, value)))
+        for i in range(0, len(text), 4):
+            stream.feed(text[i:i + 4])
+        self.assertEqual(events[0], ("title", '补水 "神" 器✨'))
+        self.assertTrue(stream.parser.done)
+
+    def test_incomplete_object_is_discarded(self):
+        """测试缺少必需字段的对象被丢弃，继续解析后面的对象"""
+        parser, _ = feed_in_chunks('示例: {"title": "a", "n": 1}\n' + NOTE, 3)
+        self.assertTrue(parser.done)
+        self.assertNotIn("n", parser.result)
+
+    def test_ignores_text_after_close(self):
+        """测试闭合后不再处理后续文本"""
+        parser = StreamingJSONParser()
+        parser.feed(NOTE)
+        self.assertEqual(parser.feed('{"title": "x"}'), [])
+
+
+def make_chunk(content=None, tool_calls=None):
+    delta = SimpleNamespace(content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+class FakeStream:
+    """模拟 openai.Stream：可迭代、可关闭，记录已消费的块数"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.consumed += 1
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class TestStreamingGenerate(unittest.TestCase):
+    """测试 generate(stream=True)"""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        with mock.patch.dict(os.environ, {"DEEPSEEK_API_KEY": "test-key"}):
+            self.generator = RedNoteGenerator(Config(provider="deepseek"))
+        self.generator.available_tools = {"search_web": lambda query: f"{query}趋势"}
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_stream_with_tool_round_and_early_stop(self):
+        """测试工具调用增量拼接、字段回调、闭合后提前停止和时延指标"""
+        tool_delta = [
+            SimpleNamespace(index=0, id="c1", function=SimpleNamespace(name="search_web", arguments='{"query": ')),
+            SimpleNamespace(index=0, id=None, function=SimpleNamespace(name=None, arguments='"面膜"}'))
+        ]
+        tool_stream = FakeStream([make_chunk(tool_calls=[d]) for d in tool_delta])
+        note_stream = FakeStream([make_chunk(NOTE[i:i + 8]) for i in range(0, len(NOTE), 8)] +
+                                 [make_chunk("不应被读取")] * 50)
+        streams = [tool_stream, note_stream]
+        requests = []
+
+        def create(**kwargs):
+            requests.append(kwargs)
+            return streams.pop(0)
+
+        self.generator.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        fields = []
+        result = self.generator.generate("深海蓝藻保湿面膜", stream=True, on_field=lambda k, v: fields.append(k))
+
+        self.assertTrue(result["success"])
+        self.assertTrue(all(r["stream"] for r in requests))
+        self.assertEqual(requests[1]["messages"][-1]["content"], "面膜趋势")
+        self.assertEqual(fields, ["title", "body", "hashtags", "emojis"])
+        self.assertTrue(note_stream.closed)
+        self.assertLess(note_stream.consumed, len(note_stream.chunks) - 50)
+        self.assertIsNotNone(result["metadata"]["stream_metrics"]["time_to_first_title"])
+
+    def test_streamed_note_is_type_checked(self):
+        """测试流式解析出的对象字段类型不对时与非流式一样不被接受，按 bad_types 重试"""
+        bad_note = '{"title": 1, "body": ["正文"], "hashtags": "x", "emojis": null}'
+        streams = [FakeStream([make_chunk(bad_note)]), FakeStream([make_chunk(NOTE)])]
+        requests = []
+
+        def create(**kwargs):
+            requests.append(kwargs)
+            return streams.pop(0)
+
+        self.generator.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        result = self.generator.generate("补水面膜", stream=True, on_field=lambda key, value: None, use_cache=False)
+
+        self.assertTrue(result["success"])
+        self.assertEqual(result["content"]["title"], '补水 "神" 器✨')
+        self.assertEqual(result["metadata"]["iterations"][0]["failure"], "bad_types")
+        self.assertEqual(len(requests), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+结构化输出的单元测试
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from rednote import Config, RedNoteGenerator
+from structured_output import compare, parse_structured, response_format_for
+
+NOTE = {"title": "补水面膜", "body": "好用", "hashtags": ["#补水", "#面膜", "#护肤"], "emojis": ["💧"]}
+
+
+class TestStructuredHelpers(unittest.TestCase):
+    """测试 response_format 和解析"""
+
+    def test_response_format_per_provider(self):
+        """测试 Ollama 使用 JSON Schema，DeepSeek 使用 JSON 模式"""
+        self.assertEqual(response_format_for("deepseek"), {"type": "json_object"})
+        ollama = response_format_for("ollama")
+        self.assertEqual(ollama["type"], "json_schema")
+        self.assertEqual(ollama["json_schema"]["schema"]["required"], ["title", "body", "hashtags", "emojis"])
+
+    def test_parse_structured_validates_types(self):
+        """测试字段类型不对时返回 None"""
+        self.assertEqual(parse_structured(json.dumps(NOTE)), NOTE)
+        self.assertIsNone(parse_structured(json.dumps({**NOTE, "hashtags": "#补水"})))
+        self.assertIsNone(parse_structured(json.dumps({**NOTE, "title": ""})))
+        self.assertIsNone(parse_structured("```json\n{}\n```"))
+
+
+class TestStructuredGenerate(unittest.TestCase):
+    """测试生成器的结构化输出模式"""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        with mock.patch.dict(os.environ, {"DEEPSEEK_API_KEY": "test-key"}):
+            self.generator = RedNoteGenerator(Config(provider="deepseek"))
+        self.requests = []
+
+        def create(**kwargs):
+            # 模拟服务端：带 response_format 时直接返回 JSON，否则第一次返回无法解析的文本
+            self.requests.append(kwargs)
+            if "response_format" in kwargs:
+                content = json.dumps(NOTE, ensure_ascii=False)
+            elif kwargs["messages"][-1]["role"] == "user" and len(kwargs["messages"]) == 2:
+                content = "好的，我来写一篇文案：标题是补水面膜……"
+            else:
+                content = "```json\n" + json.dumps(NOTE, ensure_ascii=False) + "\n```"
+            message = SimpleNamespace(content=content, tool_calls=None)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+        self.generator.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_structured_mode_sends_response_format(self):
+        """测试开启后请求带 response_format，一次调用即成功"""
+        self.generator.config.structured_output = True
+        result = self.generator.generate("面膜")
+        self.assertTrue(result["success"])
+        self.assertEqual(self.requests[0]["response_format"], {"type": "json_object"})
+        self.assertEqual(result["metadata"]["llm_calls"], 1)
+
+    def test_compare_reports_call_reduction(self):
+        """测试对比报告：自由文本需要重试，结构化一次完成"""
+        report = compare(self.generator, [{"product_name": "面膜"}, {"product_name": "精华"}])
+        self.assertEqual([row["mode"] for row in report], ["free-text", "structured"])
+        self.assertEqual(report[0]["avg_llm_calls"], 2)
+        self.assertEqual(report[1]["avg_llm_calls"], 1)
+        self.assertFalse(self.generator.config.structured_output)
+
+
+if __name__ == "__main__":
+    unittest.main()
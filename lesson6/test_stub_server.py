@@ -0,0 +1,128 @@
+"""
+本地桩服务的单元测试
+"""
+
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import httpx
+from openai import BadRequestError, OpenAI
+
+from rednote import Config, RedNoteGenerator
+from stub_server import LatencyModel, StubServer
+
+NOTE = {"title": "补水面膜", "body": "好用", "hashtags": ["#补水", "#面膜", "#护肤"], "emojis": ["💧"]}
+
+
+class TestStubServer(unittest.TestCase):
+    """测试接口格式、脚本和延迟"""
+
+    def setUp(self):
+        self.stub = None
+
+    def tearDown(self):
+        if self.stub:
+            self.stub.close()
+
+    def start(self, *args, **kwargs) -> OpenAI:
+        self.stub = StubServer(*args, **kwargs).start()
+        return OpenAI(api_key="stub-key", base_url=self.stub.url, max_retries=0)
+
+    def test_ollama_tags_and_models(self):
+        """测试 Ollama /api/tags 和 /v1/models"""
+        client = self.start(models=["qwen2.5:7b"])
+        tags = httpx.get(f"{self.stub.root_url}/api/tags").json()
+        self.assertEqual([model["name"] for model in tags["models"]], ["qwen2.5:7b"])
+        self.assertEqual([model.id for model in client.models.list()], ["qwen2.5:7b"])
+
+    def test_streams_tool_calls_and_usage(self):
+        """测试流式响应的工具调用增量和 include_usage"""
+        client = self.start(script=[{"tool_calls": [{"name": "search_web", "arguments": {"query": "保湿面膜用户评价"}}]}])
+        stream = client.chat.completions.create(model="deepseek-chat", messages=[{"role": "user", "content": "hi"}],
+                                                stream=True, stream_options={"include_usage": True})
+        arguments, name, usage = "", None, None
+        for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            for delta in (chunk.choices[0].delta.tool_calls or []) if chunk.choices else []:
+                name = delta.function.name or name
+                arguments += delta.function.arguments or ""
+        self.assertEqual(name, "search_web")
+        self.assertEqual(json.loads(arguments), {"query": "保湿面膜用户评价"})
+        self.assertGreater(usage.completion_tokens, 0)
+
+    def test_script_follows_conversation_turn(self):
+        """测试脚本按对话轮次取回复，错误条目返回对应状态码，录制的完整响应原样使用"""
+        recorded = {"choices": [{"message": {"role": "assistant", "content": "录制的回复"}}],
+                    "usage": {"prompt_tokens": 7, "completion_tokens": 3, "total_tokens": 10}}
+        client = self.start(script=[recorded, {"status": 400, "error": "脚本错误"}])
+        first = client.chat.completions.create(model="m", messages=[{"role": "user", "content": "1"}])
+        self.assertEqual(first.choices[0].message.content, "录制的回复")
+        self.assertEqual(first.usage.total_tokens, 10)
+
+        second_turn = [{"role": "user", "content": "1"}, {"role": "assistant", "content": "录制的回复"},
+                       {"role": "user", "content": "2"}]
+        with self.assertRaises(BadRequestError):
+            client.chat.completions.create(model="m", messages=second_turn)
+        self.assertEqual(self.stub.stats["errors"], 1)
+
+    def test_latency_model(self):
+        """测试首 token 延迟加输出耗时，以及固定种子的分布可复现"""
+        client = self.start(script=[{"content": "x" * 400}], latency=LatencyModel(ttft=0.1, tokens_per_second=1000))
+        start = time.time()
+        client.chat.completions.create(model="m", messages=[{"role": "user", "content": "hi"}])
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+        samples = [LatencyModel(0.5, 0.4, distribution="lognormal", seed=3).first_token_delay() for _ in range(2)]
+        self.assertEqual(samples[0], samples[1])
+
+
+class TestGeneratorAgainstStub(unittest.TestCase):
+    """测试完整的生成流程对着桩服务运行"""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        self.stub = StubServer().start()
+
+    def tearDown(self):
+        self.stub.close()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def generator(self, provider: str) -> RedNoteGenerator:
+        with mock.patch.dict(os.environ, self.stub.environ()):
+            generator = RedNoteGenerator(Config(provider=provider))
+        generator.available_tools["query_product_database"] = lambda product_name: f"{product_name}：补水"
+        return generator
+
+    def test_deepseek_tool_round_then_note(self):
+        """测试自动模式：先调用工具，再返回文案"""
+        result = self.generator("deepseek").generate("深海蓝藻保湿面膜", use_cache=False)
+        self.assertTrue(result["success"])
+        self.assertIn("深海蓝藻保湿面膜", result["content"]["title"])
+        self.assertEqual([record["outcome"] for record in result["metadata"]["iterations"]], ["tool_calls", "parsed"])
+
+    def test_streaming_batch(self):
+        """测试流式批量生成，服务端记录到并发请求"""
+        generator = self.generator("deepseek")
+        items = [{"product_name": f"产品{i}", "stream": True, "use_cache": False} for i in range(4)]
+        results = generator.generate_batch(items, concurrency=4)
+        self.assertTrue(all(result["success"] for result in results))
+        self.assertEqual(self.stub.stats["streamed"], 8)
+
+    def test_ollama_health_check_and_note(self):
+        """测试 Ollama 的模型检查、连接测试和不带工具的生成"""
+        generator = self.generator("ollama")
+        result = generator.generate("美白精华", use_cache=False)
+        self.assertTrue(result["success"])
+        self.assertEqual(result["metadata"]["model"], "deepseek-r1:8b")
+
+
+if __name__ == "__main__":
+    unittest.main()
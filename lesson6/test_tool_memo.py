@@ -0,0 +1,109 @@
+"""
+工具结果备忘的单元测试
+"""
+
+import asyncio
+import json
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from async_rednote import AsyncRedNoteGenerator
+from testing_helpers import NOTE, GeneratorTestCase, fake_client, make_tool_call
+from tool_memo import SharedToolCache, ToolMemo, memo_key
+from tool_registry import ToolRegistry, ToolSpec
+
+
+class TestToolMemo(unittest.TestCase):
+    """测试备忘键与缓存策略"""
+
+    def setUp(self):
+        self.registry = ToolRegistry([
+            ToolSpec("search_web", lambda query: query, cacheable=True, cache_ttl=600),
+            ToolSpec("generate_emoji", lambda context: context)
+        ])
+
+    def test_key_ignores_argument_order_and_whitespace(self):
+        """测试参数顺序和多余空白不影响备忘键"""
+        self.assertEqual(memo_key("search_web", {"query": " 保湿  面膜", "n": 3}),
+                         memo_key("search_web", {"n": 3, "query": "保湿 面膜"}))
+        self.assertNotEqual(memo_key("search_web", {"query": "面膜"}),
+                            memo_key("query_product_database", {"query": "面膜"}))
+
+    def test_uncacheable_tools_are_not_remembered(self):
+        """测试未声明可缓存的工具和未注册的工具不缓存"""
+        memo = ToolMemo(self.registry)
+        memo.store("generate_emoji", {"context": "补水"}, "💧", 0.1)
+        memo.store("unknown_tool", {}, "结果", 0.1)
+        self.assertIsNone(memo.lookup("generate_emoji", {"context": "补水"}))
+        self.assertIsNone(memo.lookup("unknown_tool", {}))
+
+    def test_shared_cache_respects_ttl(self):
+        """测试跨生成共享的结果按工具 TTL 过期"""
+        shared = SharedToolCache()
+        ToolMemo(self.registry, shared).store("search_web", {"query": "防晒"}, "趋势", 0.4)
+        self.assertEqual(ToolMemo(self.registry, shared).lookup("search_web", {"query": "防晒"}),
+                         ("趋势", 0.4, "shared"))
+        with mock.patch("tool_memo.time.monotonic", return_value=time.monotonic() + 601):
+            self.assertIsNone(ToolMemo(self.registry, shared).lookup("search_web", {"query": "防晒"}))
+
+
+class TestGeneratorToolMemo(GeneratorTestCase):
+    """测试生成循环中重复的工具调用只执行一次"""
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+
+    def slow_search(self, query):
+        self.calls.append(query)
+        time.sleep(0.05)
+        return f"{query}的趋势"
+
+    def test_repeated_call_across_turns_is_reused(self):
+        """测试相邻两轮相同的工具调用复用结果，并记录在轨迹中"""
+        generator = self.make_generator()
+        generator.available_tools["search_web"] = self.slow_search
+        replies = [
+            SimpleNamespace(content=None, tool_calls=[make_tool_call("c1", "search_web", {"query": "面膜"})]),
+            SimpleNamespace(content=None, tool_calls=[make_tool_call("c2", "search_web", {"query": "面膜 "})]),
+            SimpleNamespace(content=json.dumps(NOTE, ensure_ascii=False), tool_calls=None)
+        ]
+        requests = []
+
+        def create(**kwargs):
+            requests.append(kwargs)
+            return SimpleNamespace(choices=[SimpleNamespace(message=replies.pop(0))], usage=None)
+
+        generator.client = fake_client(create)
+        metadata = generator.generate("面膜", use_cache=False)["metadata"]
+
+        self.assertEqual(self.calls, ["面膜"])
+        reused = metadata["iterations"][1]["tools"][0]
+        self.assertEqual(reused["cached"], "generation")
+        self.assertGreaterEqual(reused["saved_seconds"], 0.05)
+        self.assertEqual(metadata["tool_cache_hits"], 1)
+        self.assertEqual(requests[2]["messages"][-1]["content"], "面膜的趋势")
+
+    def test_async_same_round_duplicates_run_once(self):
+        """测试异步版本同一轮并发的相同调用只执行一次"""
+        generator = self.make_generator(AsyncRedNoteGenerator)
+        generator.available_tools["search_web"] = self.slow_search
+        tool_calls = [make_tool_call(f"c{i}", "search_web", {"query": "面膜"}) for i in range(3)]
+        timings = []
+
+        async def run():
+            try:
+                return await generator._execute_tool_calls(tool_calls, timings, generator._new_tool_memo())
+            finally:
+                await generator.aclose()
+
+        outputs = asyncio.run(run())
+        self.assertEqual(self.calls, ["面膜"])
+        self.assertEqual([output["content"] for output in outputs], ["面膜的趋势"] * 3)
+        self.assertEqual(sum(1 for timing in timings if timing.get("cached")), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
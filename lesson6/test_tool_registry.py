@@ -0,0 +1,164 @@
+"""
+工具注册表的单元测试
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from async_rednote import AsyncRedNoteGenerator
+from testing_helpers import GeneratorTestCase, make_tool_call
+from tool_registry import ToolRegistry, ToolSpec, ToolTimeout
+
+
+class TestToolRegistry(unittest.TestCase):
+    """测试声明、超时、重试和并发上限"""
+
+    def setUp(self):
+        self.registry = ToolRegistry()
+
+    def tearDown(self):
+        self.registry.close()
+
+    def test_definition_is_generated_from_spec(self):
+        """测试 tools 定义来自声明，替换实现不影响声明"""
+        self.registry.register(ToolSpec("search_web", lambda query: query, "搜索",
+                                        {"query": {"type": "string"}}, timeout=3))
+        self.registry["search_web"] = lambda query: "新实现"
+        self.assertEqual(self.registry.definitions(), [{
+            "type": "function",
+            "function": {
+                "name": "search_web",
+                "description": "搜索",
+                "parameters": {"type": "object", "properties": {"query": {"type": "string"}}, "required": ["query"]}
+            }
+        }])
+        self.assertEqual(self.registry.spec("search_web").timeout, 3)
+        self.assertEqual(self.registry.call("search_web", {"query": "面膜"}), "新实现")
+
+    def test_timeout_returns_without_waiting(self):
+        """测试超时后立即抛出带降级结果的 ToolTimeout"""
+        self.registry.register(ToolSpec("slow", lambda: time.sleep(1), timeout=0.1, degraded="{name} 降级"))
+        start = time.time()
+        with self.assertRaises(ToolTimeout) as caught:
+            self.registry.call("slow", {})
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(caught.exception.degraded, "slow 降级")
+
+    def test_retries_errors(self):
+        """测试抛出异常后按声明重试"""
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 2:
+                raise ConnectionError("断开")
+            return "ok"
+
+        self.registry.register(ToolSpec("flaky", flaky, retries=1, retry_backoff=0))
+        self.assertEqual(self.registry.call("flaky", {}), "ok")
+        self.assertEqual(len(attempts), 2)
+
+    def test_concurrency_limit(self):
+        """测试同时执行的数量不超过上限"""
+        running, peak, lock = [0], [0], threading.Lock()
+
+        def tool():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+
+        self.registry.register(ToolSpec("limited", tool, max_concurrency=2))
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            list(executor.map(lambda _: self.registry.call("limited", {}), range(6)))
+        self.assertEqual(peak[0], 2)
+
+    def test_submitted_coroutine_tools_respect_concurrency_limit(self):
+        """测试提交到线程池的协程工具各自运行事件循环，并发上限仍然生效且全部返回"""
+        running, peak, lock = [0], [0], threading.Lock()
+
+        async def tool():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return "ok"
+
+        self.registry.register(ToolSpec("limited", tool, timeout=2, max_concurrency=1))
+        futures = [self.registry.submit("limited", {}) for _ in range(4)]
+        self.assertEqual([self.registry.result("limited", future) for future in futures], ["ok"] * 4)
+        self.assertEqual(peak[0], 1)
+
+
+class TestGeneratorToolTimeout(GeneratorTestCase):
+    """测试生成器在工具超时时把降级结果交给模型"""
+
+    def test_sync_generator_degrades_slow_tool(self):
+        """测试同步版本超时返回降级结果并记录在轨迹中"""
+        generator = self.make_generator()
+        self.assertEqual([tool["function"]["name"] for tool in generator.tools_definition],
+                         ["search_web", "query_product_database", "generate_emoji"])
+        generator.available_tools["query_product_database"] = lambda product_name: time.sleep(1)
+        generator.tool_registry.spec("query_product_database").timeout = 0.1
+        timings = []
+
+        start = time.time()
+        outputs = generator._execute_tool_calls(
+            [make_tool_call("c1", "query_product_database", {"product_name": "面膜"})], timings)
+        self.assertLess(time.time() - start, 0.5)
+        self.assertIn("产品数据库查询超时", outputs[0]["content"])
+        self.assertEqual((timings[0]["ok"], timings[0]["timed_out"]), (False, True))
+
+    def test_sync_generator_runs_round_concurrently(self):
+        """测试同步版本同一轮的工具并发执行，两个超时工具的等待不累加"""
+        generator = self.make_generator()
+        generator.available_tools = {"search_web": lambda query: time.sleep(1),
+                                     "query_product_database": lambda product_name: time.sleep(1),
+                                     "generate_emoji": lambda context: time.sleep(0.1) or ["💧"]}
+        generator.tool_registry.spec("search_web").timeout = 0.2
+        generator.tool_registry.spec("query_product_database").timeout = 0.2
+        tool_calls = [make_tool_call("c1", "search_web", {"query": "面膜"}),
+                      make_tool_call("c2", "query_product_database", {"product_name": "面膜"}),
+                      make_tool_call("c3", "generate_emoji", {"context": "补水"})]
+
+        start = time.time()
+        outputs = generator._execute_tool_calls(tool_calls, [])
+        self.assertLess(time.time() - start, 0.35)
+        self.assertIn("搜索暂时不可用", outputs[0]["content"])
+        self.assertIn("产品数据库查询超时", outputs[1]["content"])
+        self.assertEqual(outputs[2]["content"], "['💧']")
+
+    def test_async_generator_degrades_slow_tool(self):
+        """测试异步版本超时不拖慢同一轮的其他工具"""
+        generator = self.make_generator(AsyncRedNoteGenerator)
+
+        async def slow_search(query):
+            await asyncio.sleep(1)
+
+        generator.available_tools = {"search_web": slow_search, "generate_emoji": lambda context: ["💧"]}
+        generator.tool_registry.spec("search_web").timeout = 0.1
+        tool_calls = [make_tool_call("c1", "search_web", {"query": "面膜"}),
+                      make_tool_call("c2", "generate_emoji", {"context": "补水"})]
+
+        async def run():
+            try:
+                return await generator._execute_tool_calls(tool_calls)
+            finally:
+                await generator.aclose()
+
+        start = time.time()
+        outputs = asyncio.run(run())
+        self.assertLess(time.time() - start, 0.5)
+        self.assertIn("搜索暂时不可用", outputs[0]["content"])
+        self.assertEqual(outputs[1]["content"], "['💧']")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+"""
+单元测试共用的辅助函数：工具调用替身，以及在临时目录中创建生成器的测试基类
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from rednote import Config, RedNoteGenerator
+
+NOTE = {"title": "补水面膜", "body": "好用", "hashtags": ["#补水", "#面膜", "#护肤"], "emojis": ["💧"]}
+
+
+def make_tool_call(call_id: str, name: str, arguments: dict):
+    """模型返回的一次工具调用"""
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=json.dumps(arguments)))
+
+
+def fake_client(create):
+    """只有 chat.completions.create 的客户端替身"""
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+class GeneratorTestCase(unittest.TestCase):
+    """在临时目录中运行（输出和缓存不落到仓库里），用测试密钥创建 DeepSeek 生成器"""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    @staticmethod
+    def make_generator(generator_cls=RedNoteGenerator, **env):
+        """创建生成器，env 为额外的环境变量"""
+        with mock.patch.dict(os.environ, {"DEEPSEEK_API_KEY": "test-key", **env}):
+            return generator_cls(Config(provider="deepseek"))
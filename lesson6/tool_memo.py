@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+工具结果备忘
+模型经常在相邻几轮中用同样的参数重复调用 query_product_database / search_web，
+一次生成内按“工具名 + 规范化参数”记住成功的结果，重复调用直接复用；
+开启 TOOL_MEMO_SHARED=1 后，结果还会按各工具的 TTL 在多次生成之间共享。
+
+是否可缓存和缓存时长由工具注册表中各工具的声明决定（ToolSpec.cacheable / cache_ttl）；
+未声明可缓存的工具不缓存，失败的结果不缓存。
+复用记录在轨迹中（工具明细的 cached / saved_seconds，汇总的 tool_cache_hits / tool_seconds_saved）。
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Any, Tuple
+
+from tool_registry import ToolRegistry
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def memo_key(name: str, args: Dict[str, Any]) -> str:
+    """备忘键：工具名 + 参数（键排序、字符串合并空白）"""
+    canonical = json.dumps(_normalize(args), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return f"{name}:{canonical}"
+
+
+class SharedToolCache:
+    """跨生成共享的工具结果缓存（线程安全，按工具 TTL 过期，超出容量时淘汰最久未用的）"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str, float]]" = OrderedDict()  # 键 -> (过期时间, 结果, 原耗时)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """返回 (结果, 原耗时)，不存在或已过期时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self._entries.pop(key, None)
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1], entry[2]
+
+    def put(self, key: str, result: str, seconds: float, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, result, seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ToolMemo:
+    """一次生成内的工具结果备忘，缓存策略取自工具注册表，可挂接共享缓存"""
+
+    def __init__(self, registry: ToolRegistry, shared: Optional[SharedToolCache] = None):
+        self.registry = registry
+        self.shared = shared
+        self._entries: Dict[str, Tuple[str, float]] = {}
+        self.inflight: Dict[str, Any] = {}  # 异步版本：同一轮中相同调用共用的任务
+
+    def cacheable(self, name: str) -> bool:
+        """工具声明了可缓存，未注册的工具不缓存"""
+        spec = self.registry.spec(name)
+        return bool(spec and spec.cacheable)
+
+    def _shared_ttl(self, name: str) -> float:
+        """跨生成共享的秒数，未挂接共享缓存时为 0"""
+        return self.registry.spec(name).cache_ttl if self.shared is not None else 0
+
+    def lookup(self, name: str, args: Dict[str, Any]) -> Optional[Tuple[str, float, str]]:
+        """返回 (结果, 原耗时, 来源 generation/shared)，未命中返回 None"""
+        if not self.cacheable(name):
+            return None
+        key = memo_key(name, args)
+        if key in self._entries:
+            return (*self._entries[key], "generation")
+        if self._shared_ttl(name) > 0:
+            entry = self.shared.get(key)
+            if entry is not None:
+                self._entries[key] = entry
+                return (*entry, "shared")
+        return None
+
+    def store(self, name: str, args: Dict[str, Any], result: str, seconds: float):
+        """记住一次成功的工具结果"""
+        if not self.cacheable(name):
+            return
+        key = memo_key(name, args)
+        self._entries[key] = (result, seconds)
+        ttl = self._shared_ttl(name)
+        if ttl > 0:
+            self.shared.put(key, result, seconds, ttl)
+
+
+_shared_cache: Optional[SharedToolCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_tool_cache() -> SharedToolCache:
+    """进程内共享的工具结果缓存"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = SharedToolCache()
+        return _shared_cache
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+工具注册表
+每个工具声明自己的参数 schema、延迟预算（timeout）、重试次数和并发上限，
+发给模型的 tools 定义由同一份声明生成，执行和定义不会对不上。
+
+超时是整次调用（含排队和重试）的总预算：到时直接返回降级结果（ToolTimeout.degraded），
+不再等待工具本身；同步工具无法被强行中断，会在后台线程里跑完后丢弃结果。
+
+示例:
+    registry = ToolRegistry()
+    registry.register(ToolSpec("search_web", search, "搜索互联网", {"query": {"type": "string"}},
+                               timeout=8, retries=1, max_concurrency=4))
+    registry.definitions()                 # 传给 chat.completions 的 tools
+    registry.call("search_web", {"query": "保湿面膜"})
+"""
+
+import asyncio
+import functools
+import inspect
+import threading
+import time
+import weakref
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional, Any, Callable, Iterable, Tuple
+
+DEFAULT_DEGRADED = "工具 {name} 暂时不可用（超过 {timeout:g}s 未返回），请根据已有信息继续创作，不要再次调用该工具。"
+
+
+class ToolTimeout(Exception):
+    """工具超过延迟预算未返回，degraded 为交给模型的降级结果"""
+
+    def __init__(self, name: str, timeout: float, degraded: str):
+        super().__init__(f"工具 {name} 超时（{timeout:g}s）")
+        self.name = name
+        self.timeout = timeout
+        self.degraded = degraded
+
+
+class ToolSpec:
+    """一个工具的声明：实现、schema 和执行约束"""
+
+    def __init__(self, name: str, function: Callable, description: str = "",
+                 properties: Optional[Dict[str, Dict[str, Any]]] = None, required: Optional[List[str]] = None,
+                 timeout: float = 10.0, retries: int = 0, retry_backoff: float = 0.2,
+                 max_concurrency: Optional[int] = None, degraded: str = DEFAULT_DEGRADED,
+                 cacheable: bool = False, cache_ttl: float = 0):
+        """
+        Args:
+            name: 工具名
+            function: 实现，普通函数或协程函数
+            description: 给模型看的说明
+            properties: 参数的 JSON Schema properties
+            required: 必填参数，默认全部必填
+            timeout: 整次调用的延迟预算（秒）
+            retries: 抛出异常后的重试次数（超时不重试）
+            retry_backoff: 第 n 次重试前等待 retry_backoff × 2^(n-1) 秒
+            max_concurrency: 同时执行的上限，None 表示不限
+            degraded: 超时后的降级结果，可使用 {name} {timeout} 占位
+            cacheable: 一次生成内相同参数的调用是否复用结果（见 tool_memo）
+            cache_ttl: 结果跨生成共享的秒数，0 表示不共享
+        """
+        self.name = name
+        self.function = function
+        self.description = description
+        self.properties = properties or {}
+        self.required = list(self.properties) if required is None else required
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.max_concurrency = max_concurrency
+        self.degraded = degraded
+        self.cacheable = cacheable
+        self.cache_ttl = cache_ttl
+        self._semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        # asyncio.Semaphore 绑定创建它的事件循环，每个事件循环各用一个
+        self._async_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
+
+    def definition(self) -> Dict[str, Any]:
+        """OpenAI tools 格式的定义"""
+        return {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": {
+                    "type": "object",
+                    "properties": self.properties,
+                    "required": self.required
+                }
+            }
+        }
+
+    def timeout_error(self) -> ToolTimeout:
+        return ToolTimeout(self.name, self.timeout, self.degraded.format(name=self.name, timeout=self.timeout))
+
+    def invoke(self, args: Dict[str, Any]) -> Any:
+        """在当前线程中执行同步实现（含并发限制和重试）"""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            try:
+                if self._semaphore is None:
+                    return self.function(**args)
+                with self._semaphore:
+                    return self.function(**args)
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                print(f"🔁 工具 {self.name} 出错，第 {attempt + 1} 次重试: {e}")
+
+    async def ainvoke(self, args: Dict[str, Any]) -> Any:
+        """执行协程实现（含并发限制和重试），并发上限按当前事件循环计算"""
+        semaphore = None
+        if self.max_concurrency:
+            semaphore = self._async_semaphores.setdefault(asyncio.get_running_loop(),
+                                                          asyncio.Semaphore(self.max_concurrency))
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            try:
+                if semaphore is None:
+                    return await self.function(**args)
+                async with semaphore:
+                    return await self.function(**args)
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                print(f"🔁 工具 {self.name} 出错，第 {attempt + 1} 次重试: {e}")
+
+
+class ToolRegistry:
+    """
+    按名称管理 ToolSpec
+
+    也可以像 dict 一样按名称读写实现函数（registry["search_web"] = func），
+    替换实现时保留原有的声明；未声明过的名称按默认约束注册。
+    """
+
+    def __init__(self, specs: Iterable[ToolSpec] = (), max_workers: int = 16):
+        self._specs: Dict[str, ToolSpec] = {}
+        self._max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        for spec in specs:
+            self.register(spec)
+
+    def register(self, spec: ToolSpec) -> ToolSpec:
+        self._specs[spec.name] = spec
+        return spec
+
+    def spec(self, name: str) -> Optional[ToolSpec]:
+        return self._specs.get(name)
+
+    def definitions(self) -> List[Dict[str, Any]]:
+        """所有工具的 tools 定义，顺序与注册顺序一致"""
+        return [spec.definition() for spec in self._specs.values()]
+
+    # ---- dict 风格的实现函数读写 ----
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._specs
+
+    def __getitem__(self, name: str) -> Callable:
+        return self._specs[name].function
+
+    def __setitem__(self, name: str, function: Callable):
+        spec = self._specs.get(name)
+        if spec is None:
+            self.register(ToolSpec(name, function))
+        else:
+            spec.function = function
+
+    def get(self, name: str, default: Any = None) -> Any:
+        spec = self._specs.get(name)
+        return spec.function if spec else default
+
+    def items(self) -> List[Tuple[str, Callable]]:
+        return [(name, spec.function) for name, spec in self._specs.items()]
+
+    def update(self, functions: Dict[str, Callable]):
+        for name, function in functions.items():
+            self[name] = function
+
+    # ---- 执行 ----
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="tool-registry")
+            return self._executor
+
+    def submit(self, name: str, args: Dict[str, Any]) -> Future:
+        """
+        提交到注册表的线程池后立即返回，延迟预算从提交时开始计算；用 result() 取结果
+
+        同一轮的多个工具先全部提交再逐个取结果，各自按自己的预算等待，超时不会累加。
+        协程工具在工作线程中各自用新的事件循环运行，并发上限由线程信号量跨事件循环控制
+        """
+        spec = self._specs[name]
+        if inspect.iscoroutinefunction(spec.function):
+            future = self._get_executor().submit(self._run_coroutine_tool, spec, args)
+        else:
+            future = self._get_executor().submit(spec.invoke, args)
+        future.deadline = time.monotonic() + spec.timeout
+        return future
+
+    @staticmethod
+    def _run_coroutine_tool(spec: ToolSpec, args: Dict[str, Any]) -> Any:
+        if spec._semaphore is None:
+            return asyncio.run(asyncio.wait_for(spec.ainvoke(args), spec.timeout))
+        with spec._semaphore:
+            return asyncio.run(asyncio.wait_for(spec.ainvoke(args), spec.timeout))
+
+    def result(self, name: str, future: Future) -> Any:
+        """等待 submit() 返回的 future，超过其延迟预算抛出 ToolTimeout；工具自身的异常原样抛出"""
+        spec = self._specs[name]
+        try:
+            return future.result(timeout=max(future.deadline - time.monotonic(), 0))
+        except (FutureTimeoutError, asyncio.TimeoutError):
+            future.cancel()
+            raise spec.timeout_error() from None
+
+    def call(self, name: str, args: Dict[str, Any]) -> Any:
+        """同步执行，超过 timeout 抛出 ToolTimeout；工具自身的异常原样抛出"""
+        return self.result(name, self.submit(name, args))
+
+    async def acall(self, name: str, args: Dict[str, Any], executor: Optional[Executor] = None) -> Any:
+        """异步执行：协程工具直接 await，同步工具放到 executor（默认注册表自己的线程池）"""
+        spec = self._specs[name]
+        if inspect.iscoroutinefunction(spec.function):
+            awaitable = spec.ainvoke(args)
+        else:
+            loop = asyncio.get_running_loop()
+            awaitable = loop.run_in_executor(executor or self._get_executor(), functools.partial(spec.invoke, args))
+        try:
+            return await asyncio.wait_for(awaitable, spec.timeout)
+        except asyncio.TimeoutError:
+            raise spec.timeout_error() from None
+
+    def close(self):
+        """关闭线程池，不等待仍在运行的超时工具"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)